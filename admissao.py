@@ -0,0 +1,202 @@
+# 1 - Importa módulos para o controle de admissão das requisições de processamento
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from fastapi import HTTPException
+from inicializacao import ler_inteiro, ler_decimal
+
+# 1.1 - Liga/desliga o controle e limites da carga em andamento
+ADMISSAO = os.getenv("ADMISSAO", "true").lower() in ("1", "true", "sim")
+ADMISSAO_MAX_PAGINAS = ler_inteiro("ADMISSAO_MAX_PAGINAS", 150, minimo=1)
+ADMISSAO_MAX_TOKENS = ler_inteiro("ADMISSAO_MAX_TOKENS", 400000, minimo=1)
+ADMISSAO_MAX_MEMORIA_MB = ler_inteiro("ADMISSAO_MAX_MEMORIA_MB", 300, minimo=1)
+
+# 1.2 - Estimativas de custo por documento
+ADMISSAO_TOKENS_POR_PAGINA = ler_inteiro("ADMISSAO_TOKENS_POR_PAGINA", 2000, minimo=0)  # entrada + saída, texto ou imagem
+ADMISSAO_MEMORIA_POR_PAGINA_MB = ler_decimal("ADMISSAO_MEMORIA_POR_PAGINA_MB", 2, minimo=0)  # layout do pdfplumber/PyMuPDF
+ADMISSAO_FATOR_MEMORIA_PDF = ler_decimal("ADMISSAO_FATOR_MEMORIA_PDF", 3, minimo=0)  # cópias do PDF (bytes, fitz, pdfplumber)
+ADMISSAO_BYTES_POR_PAGINA = ler_inteiro("ADMISSAO_BYTES_POR_PAGINA", 100000, minimo=1)  # páginas de um upload antes de abrir
+
+# 1.3 - Fila: tamanho por prioridade, espera máxima e Retry-After mínimo
+ADMISSAO_MAX_FILA = ler_inteiro("ADMISSAO_MAX_FILA", 20, minimo=0)
+ADMISSAO_MAX_FILA_LOTE = ler_inteiro("ADMISSAO_MAX_FILA_LOTE", 100, minimo=0)
+ADMISSAO_ESPERA_MAX_S = ler_decimal("ADMISSAO_ESPERA_MAX_S", 30, minimo=0)
+ADMISSAO_RETRY_AFTER_S = ler_inteiro("ADMISSAO_RETRY_AFTER_S", 5, minimo=1)
+
+# 1.4 - Prioridade por endpoint (menor = atendido antes)
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_CONTINUACAO = 1
+PRIORIDADE_LOTE = 2
+PRIORIDADES_ENDPOINT = {
+    "/processar-extrato/": PRIORIDADE_INTERATIVA,
+    "/processar-extrato-base64/": PRIORIDADE_INTERATIVA,
+    "/processar-extrato-stream/": PRIORIDADE_INTERATIVA,
+    "/processar-extrato-base64-stream/": PRIORIDADE_INTERATIVA,
+    "/continuar-extrato/": PRIORIDADE_CONTINUACAO,
+    "/processar-extrato-url/": PRIORIDADE_LOTE,
+    "/processar-lote/": PRIORIDADE_LOTE,
+    "/reprocessar/": PRIORIDADE_LOTE,
+}
+RECURSOS = ("paginas", "tokens", "memoria_mb")
+
+
+def custo_documento(tamanho_bytes: int, paginas: int) -> dict:
+    """
+    Custo estimado de processar um documento: páginas, tokens do Gemini e
+    memória (cópias do PDF + estruturas de layout por página).
+    """
+    return {
+        "paginas": paginas,
+        "tokens": paginas * ADMISSAO_TOKENS_POR_PAGINA,
+        "memoria_mb": round(tamanho_bytes / 2**20 * ADMISSAO_FATOR_MEMORIA_PDF + paginas * ADMISSAO_MEMORIA_POR_PAGINA_MB, 2),
+    }
+
+
+def custo_upload(tamanho_bytes: int) -> dict:
+    """
+    Custo estimado de um upload ainda não lido nem aberto: as páginas saem
+    do tamanho (ADMISSAO_BYTES_POR_PAGINA) até serem contadas ao abrir o PDF.
+    """
+    return custo_documento(tamanho_bytes, max(1, math.ceil(tamanho_bytes / ADMISSAO_BYTES_POR_PAGINA)))
+
+
+# 2 - Controle de admissão com fila por prioridade
+class ControleAdmissao:
+    """
+    Mantém a carga em andamento (páginas, tokens estimados e memória) abaixo
+    dos limites. Uma requisição que não cabe espera na fila, ordenada por
+    prioridade do endpoint e depois por chegada; só a primeira da fila pode
+    entrar (uma requisição grande não é ultrapassada indefinidamente pelas
+    pequenas). Requisições maiores que o limite entram sozinhas, quando não
+    há nada em andamento.
+    Fila cheia -> HTTPException 429; espera acima de ADMISSAO_ESPERA_MAX_S ->
+    503. As duas trazem Retry-After estimado pela duração média das requisições.
+    """
+
+    def __init__(self, limites: dict | None = None, max_fila: dict | None = None,
+                 espera_max_s: float | None = ADMISSAO_ESPERA_MAX_S):
+        self.limites = limites or {"paginas": ADMISSAO_MAX_PAGINAS, "tokens": ADMISSAO_MAX_TOKENS,
+                                   "memoria_mb": ADMISSAO_MAX_MEMORIA_MB}
+        self.max_fila = max_fila or {PRIORIDADE_INTERATIVA: ADMISSAO_MAX_FILA, PRIORIDADE_CONTINUACAO: ADMISSAO_MAX_FILA,
+                                     PRIORIDADE_LOTE: ADMISSAO_MAX_FILA_LOTE}
+        self.espera_max_s = espera_max_s
+        self.em_uso = {recurso: 0 for recurso in RECURSOS}
+        self.ativas = 0
+        self._fila = []
+        self._na_fila = {prioridade: 0 for prioridade in self.max_fila}
+        self._sequencia = itertools.count()
+        self.duracao_media_s = 10.0
+        self.contadores = {"admitidas": 0, "enfileiradas": 0, "rejeitadas_429": 0, "rejeitadas_503": 0}
+
+    # 2.1 - Capacidade
+    def _cabe(self, custo: dict) -> bool:
+        if self.ativas == 0:
+            return True
+        return all(self.em_uso[r] + custo[r] <= self.limites[r] for r in RECURSOS)
+
+    def _ocupar(self, custo: dict):
+        for recurso in RECURSOS:
+            self.em_uso[recurso] += custo[recurso]
+        self.ativas += 1
+        self.contadores["admitidas"] += 1
+
+    def _despachar(self):
+        while self._fila:
+            _, _, custo, futuro = self._fila[0]
+            if futuro.done():
+                heapq.heappop(self._fila)
+                continue
+            if not self._cabe(custo):
+                break
+            heapq.heappop(self._fila)
+            self._ocupar(custo)
+            futuro.set_result(True)
+
+    def retry_after(self, prioridade: int = PRIORIDADE_INTERATIVA) -> int:
+        """
+        Segundos sugeridos para tentar de novo: requisições à frente (mesma
+        prioridade ou maior) vezes a duração média, dividido pelas que rodam juntas.
+        """
+        a_frente = sum(n for p, n in self._na_fila.items() if p <= prioridade) + 1
+        estimativa = self.duracao_media_s * a_frente / max(1, self.ativas)
+        return max(ADMISSAO_RETRY_AFTER_S, math.ceil(estimativa))
+
+    def _rejeitar(self, status: int, detalhe: str, prioridade: int):
+        self.contadores[f"rejeitadas_{status}"] += 1
+        segundos = self.retry_after(prioridade)
+        print(f"AVISO: Admissão recusada ({status}): {detalhe}. Retry-After: {segundos}s")
+        raise HTTPException(status_code=status, detail=detalhe, headers={"Retry-After": str(segundos)})
+
+    # 2.2 - Admissão e liberação
+    def verificar_fila(self, prioridade: int):
+        """
+        Recusa já na chegada (429) quando a fila da prioridade está cheia.
+        """
+        if self._na_fila.get(prioridade, 0) >= self.max_fila.get(prioridade, ADMISSAO_MAX_FILA):
+            self._rejeitar(429, "Serviço ocupado: fila de processamento cheia", prioridade)
+
+    async def admitir(self, custo: dict, prioridade: int = PRIORIDADE_INTERATIVA,
+                      espera_max_s: float | None = -1) -> float:
+        """
+        Espera a vez da requisição e reserva o custo dela. Retorna o instante
+        da admissão (para liberar). espera_max_s=None espera sem limite
+        (processamento em background); -1 usa o padrão do controle.
+        """
+        espera_max_s = self.espera_max_s if espera_max_s == -1 else espera_max_s
+        if not self._fila and self._cabe(custo):
+            self._ocupar(custo)
+            return time.monotonic()
+
+        self.verificar_fila(prioridade)
+        futuro = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._fila, (prioridade, next(self._sequencia), custo, futuro))
+        self._na_fila[prioridade] = self._na_fila.get(prioridade, 0) + 1
+        self.contadores["enfileiradas"] += 1
+        self._despachar()
+        print(f"DEBUG: Requisição na fila de admissão (prioridade {prioridade}, {len(self._fila)} na fila, custo {custo})")
+        try:
+            concluidos, _ = await asyncio.wait({futuro}, timeout=espera_max_s)
+        except asyncio.CancelledError:
+            if futuro.done():
+                self.liberar(custo, time.monotonic())
+            else:
+                futuro.cancel()
+                self._despachar()
+            raise
+        finally:
+            self._na_fila[prioridade] -= 1
+        if not concluidos:
+            futuro.cancel()
+            self._despachar()
+            self._rejeitar(503, f"Serviço sobrecarregado: espera na fila acima de {espera_max_s:g}s", prioridade)
+        return time.monotonic()
+
+    def ajustar(self, custo: dict, novo_custo: dict):
+        """
+        Troca a carga reservada de uma requisição já admitida pela real (as
+        páginas contadas ao abrir o PDF admitido pelo tamanho). Não espera nem
+        recusa: a diferença só pesa para as próximas da fila.
+        """
+        for recurso in RECURSOS:
+            self.em_uso[recurso] += novo_custo[recurso] - custo[recurso]
+        self._despachar()
+
+    def liberar(self, custo: dict, admitida_em: float):
+        for recurso in RECURSOS:
+            self.em_uso[recurso] -= custo[recurso]
+        self.ativas -= 1
+        self.duracao_media_s = 0.8 * self.duracao_media_s + 0.2 * (time.monotonic() - admitida_em)
+        self._despachar()
+
+    def metricas(self) -> dict:
+        return {
+            **self.contadores,
+            "ativas": self.ativas,
+            "na_fila": sum(self._na_fila.values()),
+            "em_uso": {r: round(v, 2) for r, v in self.em_uso.items()},
+            "limites": self.limites,
+            "duracao_media_s": round(self.duracao_media_s, 2),
+        }
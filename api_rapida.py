@@ -1,31 +1,89 @@
 # 1 - Importa módulos para diferentes funcionalidades
+# (os SDKs do Gemini e do Supabase só são importados no primeiro uso ou no aquecimento: ver inicializacao.py)
+import time
+INICIO_IMPORTACAO = time.perf_counter()
 import os
-import uvicorn
 import asyncio
 import io
-import time
 import json
 import base64
+import hashlib
 import re
+import secrets
+import zipfile
 from datetime import datetime
+from collections import Counter
+from contextlib import aclosing, asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from google import genai
-import pdfplumber
-import fitz
 import httpx
-from prompt_e_schema import PROMPT_SISTEMA, CATEGORIAS_COMPLETAS
-from supabase import create_client, Client
+from concurrent.futures import ProcessPoolExecutor
+from prompt_e_schema import (
+    PROMPT_SISTEMA, CATEGORIAS_COMPLETAS, PROMPT_EXTRACAO, PROMPT_CATEGORIZACAO,
+    PROMPT_SISTEMA_TABULAR, PROMPT_EXTRACAO_TABULAR, PROMPT_CATEGORIZACAO_TABULAR, CATEGORIAS_CODIFICADAS
+)
+from saida_tabular import interpretar_saida_tabular, interpretar_categorias_tabular, VERSAO_PROMPT
+from documento_pdf import DocumentHandle, extrair_textos_intervalo, estrategia_pagina, indice_digitalizacao
+from rasterizacao import (
+    rasterizar_paginas, renderizar_com_orcamento, renderizar_pagina, renderizar_paginas_intervalo,
+    estimar_bytes_renderizacao, estimar_dimensoes, escolher_dpi, orcamento_memoria, DPI_RETENTATIVA
+)
+from empacotamento import (
+    estimar_tokens, estimar_tokens_imagem, estimar_tokens_saida, empacotar_paginas, dividir_pacote,
+    separar_texto_por_pagina, EMPACOTAMENTO, EMPACOTAMENTO_TOKENS, EMPACOTAMENTO_OCR_TOKENS, LIMITE_TOKENS_SAIDA,
+    TOKENS_SAIDA_POR_TRANSACAO, TOKENS_SAIDA_POR_TRANSACAO_TABULAR
+)
+from cache_estabelecimentos import CacheEstabelecimentos, CACHE_ESTABELECIMENTOS
+from categorizacao_local import categorizador_local, CATEGORIZACAO_LOCAL
+from preprocessamento import (
+    remover_boilerplate, posicoes_linhas, prefiltrar_transacoes, normalizar_linha, REMOVER_BOILERPLATE, PREFILTRO_TRANSACOES
+)
+from reconstrucao_tabelas import (
+    reconstruir_pagina, resultado_deterministico, periodo_documento, periodo_atual, EXTRACAO_COLUNAS, PARSER_DETERMINISTICO
+)
+from modelos_layout import impressao_digital, registro_modelos, MODELOS_LAYOUT
+from prazos import Prazo, criar_prazo, prazo_atual, aguardar_no_prazo, timeout_chamada, TIMEOUT_GEMINI_MS
+from continuacoes import ArmazemContinuacoes, ContinuacoesCompartilhadas
+from admissao import ControleAdmissao, custo_documento, custo_upload, ADMISSAO, PRIORIDADES_ENDPOINT
+from escalonador import EscalonadorJusto, usuario_atual, ESCALONADOR_GEMINI_CONCORRENCIA
+from cotas import CotasUsuarios
+from artefatos import ArmazemArtefatos, saidas_llm_atuais, ARTEFATOS, RESULTADOS_PARSER, RESULTADOS_MULTIMODAL
+from livro_transacoes import LivroTransacoes, LIVRO_TRANSACOES
+from inicializacao import Preguicoso, ler_inteiro, ler_decimal, AQUECIMENTO
+from encerramento import GerenciadorEncerramento, ENCERRAMENTO_PRAZO_S
+from compartilhado import (
+    BancoCompartilhado, LimiteGemini, RespostaEmCache, WORKERS, COMPARTILHADO, CACHE_RESPOSTAS_TTL_S, CATEGORIZACOES_TTL_S,
+    limites_gemini
+)
 
 # 2 - Carrega variáveis de ambiente do arquivo .env
 load_dotenv()
 
-# 3 - Configura aplicação FastAPI
+# 3 - Ciclo de vida: a aplicação é dona dos clientes e pools. Na subida, valida a configuração,
+# retoma o que o último encerramento interrompeu e aquece os clientes; na parada, drena o
+# trabalho em andamento, conclui as gravações pendentes e fecha os clientes e pools
+@asynccontextmanager
+async def ciclo_de_vida(app: FastAPI):
+    for problema in validar_configuracao():
+        print(problema)
+    recuperadas = armazem_continuacoes.carregar(ARQUIVO_CONTINUACOES)
+    if recuperadas:
+        print(f"INFO: {recuperadas} continuações recuperadas do último encerramento.")
+    gerenciador_encerramento.retomar_trabalhos({"processar_e_enviar_webhook": processar_e_enviar_webhook})
+    if AQUECIMENTO:
+        asyncio.create_task(asyncio.to_thread(aquecer))
+    # Recusa documentos novos já no sinal, também nos workers de WEB_CONCURRENCY
+    with gerenciador_encerramento.capturar_sinais():
+        yield
+    await encerrar()
+
+# 3.1 - Configura aplicação FastAPI
 app = FastAPI(
     title="Quartavia OCR API",
-    description="v2.0 - Processamento com Paralelismo por Página"
+    description="v2.0 - Processamento com Paralelismo por Página",
+    lifespan=ciclo_de_vida
 )
 
 # 4 - Verifica se a chave do Gemini existe
@@ -39,57 +97,383 @@ MODEL_GEMINI = os.getenv("MODEL_GEMINI", "gemini-2.5-flash-lite")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-TOKENFILE_LIMIT=int(os.getenv("TOKENFILE_LIMIT"))
+TOKENFILE_LIMIT = ler_inteiro("TOKENFILE_LIMIT", 100000, minimo=1)
+
+def criar_cliente_supabase():
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
 
 if not SUPABASE_URL or not SUPABASE_KEY:
     print("AVISO: Variáveis do Supabase não configuradas. Funcionalidade de categorização personalizada desabilitada.")
     supabase = None
 else:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    supabase = Preguicoso("supabase", criar_cliente_supabase)
+
+# 6 - Inicializa clientes HTTP e Gemini (o Gemini no primeiro uso: o SDK leva ~1,5 s para importar)
+def criar_cliente_gemini():
+    from google import genai
+    return genai.Client(api_key=GEMINI_API_KEY, http_options={"timeout": TIMEOUT_GEMINI_MS})
 
-# 6 - Inicializa clientes HTTP e Gemini
 http_client = httpx.AsyncClient(timeout=30.0)
-gemini_client = genai.Client(api_key=GEMINI_API_KEY)
+gemini_client = Preguicoso("gemini", criar_cliente_gemini)
+
+# 6.1 - Pool de processos para extração de texto (CPU), com os núcleos repartidos entre os workers
+CPU_WORKERS = ler_inteiro("CPU_WORKERS", max(1, (os.cpu_count() or 1) // WORKERS), minimo=1)
+executor_cpu = ProcessPoolExecutor(max_workers=CPU_WORKERS) if CPU_WORKERS > 1 else None
+
+# 6.1.1 - Vários workers (WEB_CONCURRENCY): respostas da LLM, categorizações dos usuários, cotas e
+# continuações ficam em um banco SQLite (WAL) comum aos processos, e as chamadas ao Gemini
+# respeitam o limite do projeto (GEMINI_RPM/GEMINI_TPM, ou o do nível 1 do modelo) somado entre todos eles
+banco_compartilhado = BancoCompartilhado()
+limite_gemini = LimiteGemini(banco_compartilhado, *limites_gemini(MODEL_GEMINI))
+CACHE_RESPOSTAS = COMPARTILHADO and CACHE_RESPOSTAS_TTL_S > 0
+CATEGORIZACOES_COMPARTILHADAS = COMPARTILHADO and CATEGORIZACOES_TTL_S > 0
+
+# 6.2 - OCR especulativo: renderiza (e opcionalmente faz OCR) enquanto a extração nativa roda
+ESPECULACAO_OCR = os.getenv("ESPECULACAO_OCR", "false").lower() in ("1", "true", "sim")
+ESPECULACAO_LIMIAR = ler_decimal("ESPECULACAO_LIMIAR", 0.5, minimo=0)
+ESPECULACAO_CHAMADAS_OCR = os.getenv("ESPECULACAO_CHAMADAS_OCR", "false").lower() in ("1", "true", "sim")
+
+# 6.2.1 - Modo do pipeline: duas etapas (OCR -> texto -> categorização) ou multimodal (imagem -> JSON)
+MODOS_PIPELINE = ("duas_etapas", "multimodal", "auto")
+MODO_PIPELINE = os.getenv("MODO_PIPELINE", "duas_etapas").lower()
+MULTIMODAL_MAX_TOKENS_IMAGEM = ler_inteiro("MULTIMODAL_MAX_TOKENS_IMAGEM", 1032, minimo=1)
+
+# 6.2.2 - Extração e categorização separadas: as páginas só extraem as transações e
+# as descrições únicas do documento são categorizadas depois, em lote
+CATEGORIZACAO_SEPARADA = os.getenv("CATEGORIZACAO_SEPARADA", "true").lower() in ("1", "true", "sim")
+CATEGORIZACAO_LOTE = ler_inteiro("CATEGORIZACAO_LOTE", 150, minimo=1)
+
+# 6.2.3 - Cache global estabelecimento -> categoria, carregado do disco na inicialização
+cache_estabelecimentos = CacheEstabelecimentos()
+if CACHE_ESTABELECIMENTOS:
+    cache_estabelecimentos.carregar()
+
+def salvar_cache_estabelecimentos():
+    if CACHE_ESTABELECIMENTOS:
+        cache_estabelecimentos.salvar()
+
+# 6.2.4 - Documentos com páginas pendentes (respostas parciais por prazo), por token de continuação
+armazem_continuacoes = ContinuacoesCompartilhadas(banco_compartilhado) if COMPARTILHADO else ArmazemContinuacoes()
+
+# 6.2.5 - Controle de admissão: limita páginas, tokens e memória em andamento e enfileira o excedente
+controle_admissao = ControleAdmissao()
+
+# 6.2.6 - Cotas por usuário (páginas/minuto, tokens/dia) e fila justa ponderada das chamadas
+# ao Gemini e ao pool de CPU: um usuário com muitos extratos não ocupa todas as vagas
+cotas_usuarios = CotasUsuarios(banco=banco_compartilhado if COMPARTILHADO else None)
+escalonador_gemini = EscalonadorJusto(ESCALONADOR_GEMINI_CONCORRENCIA, cotas_usuarios.peso)
+escalonador_cpu = EscalonadorJusto(CPU_WORKERS, cotas_usuarios.peso)
+
+# 6.2.7 - Lotes: máximo de documentos por requisição, documentos processados ao mesmo tempo
+# e tamanho máximo descompactado de um zip
+LOTE_MAX_DOCUMENTOS = ler_inteiro("LOTE_MAX_DOCUMENTOS", 50, minimo=1)
+LOTE_DOCUMENTOS_SIMULTANEOS = ler_inteiro("LOTE_DOCUMENTOS_SIMULTANEOS", 4, minimo=1)
+LOTE_MAX_MB_ZIP = ler_inteiro("LOTE_MAX_MB_ZIP", 200, minimo=1)
+
+# 6.2.8 - Artefatos intermediários por hash do PDF (textos, renderização, respostas da LLM),
+# para reprocessar só as etapas finais sem refazer extração e OCR
+armazem_artefatos = ArmazemArtefatos()
+
+# 6.2.9 - Encerramento gracioso: trabalhos de background, gravações pendentes e checkpoint das continuações
+gerenciador_encerramento = GerenciadorEncerramento()
+ARQUIVO_CONTINUACOES = os.path.join(gerenciador_encerramento.diretorio, "continuacoes.json.gz")
+
+# 6.3 - Métricas em memória expostas em /metricas/
+METRICAS = {
+    "especulacao": {
+        "documentos_especulados": 0,
+        "paginas_especuladas": 0,
+        "vitorias_nativo": 0,
+        "vitorias_ocr": 0,
+        "rasterizacoes_desperdicadas": 0,
+        "chamadas_ocr_desperdicadas": 0,
+        "tarefas_canceladas": 0,
+        "nativas_canceladas": 0,
+    },
+    "rasterizacao": {
+        "paginas_renderizadas": 0,
+        "bytes_enviados": 0,
+        "retentativas_dpi": 0,
+        "retentativas_com_sucesso": 0,
+    },
+    "empacotamento": {
+        "chamadas_ocr": 0,
+        "paginas_ocr": 0,
+        "chamadas_categorizacao": 0,
+        "paginas_categorizacao": 0,
+        "pacotes_divididos": 0,
+    },
+    "multimodal": {
+        "documentos": 0,
+        "chamadas": 0,
+        "paginas": 0,
+        "paginas_duas_etapas": 0,
+        "pacotes_divididos": 0,
+        "fallbacks_duas_etapas": 0,
+    },
+    "categorizacao": {
+        "transacoes": 0,
+        "descricoes_unicas": 0,
+        "descricoes_cache": 0,
+        "descricoes_locais": 0,
+        "descricoes_llm": 0,
+        "chamadas": 0,
+        "descricoes_sem_categoria": 0,
+    },
+    "boilerplate": {
+        "documentos": 0,
+        "linhas_removidas": 0,
+        "tokens_antes": 0,
+        "tokens_depois": 0,
+        "tokens_economizados": 0,
+    },
+    "prefiltro": {
+        "paginas_filtradas": 0,
+        "paginas_inteiras": 0,
+        "tokens_antes": 0,
+        "tokens_depois": 0,
+        "tokens_economizados": 0,
+    },
+    "saida_llm": {
+        "versao_prompt": VERSAO_PROMPT,
+        "respostas": 0,
+        "tokens_saida": 0,
+        "respostas_invalidas": 0,
+    },
+    "colunas": {
+        "paginas_reconstruidas": 0,
+        "linhas_tabulares": 0,
+        "tokens_antes": 0,
+        "tokens_depois": 0,
+        "paginas_deterministicas": 0,
+        "transacoes_deterministicas": 0,
+    },
+    "streaming": {
+        "requisicoes": 0,
+        "eventos": 0,
+        "paginas_emitidas": 0,
+        "segundos_ate_primeira_pagina": 0.0,
+    },
+    "prazos": {
+        "requisicoes_com_prazo": 0,
+        "respostas_parciais": 0,
+        "paginas_pendentes": 0,
+        "continuacoes": 0,
+    },
+    "inicializacao": {
+        "segundos_importacao": 0.0,
+        "segundos_aquecimento": None,
+    },
+    "lotes": {
+        "lotes": 0,
+        "documentos": 0,
+        "documentos_com_erro": 0,
+        "transacoes_duplicadas": 0,
+    },
+}
+
+
+# 6.4 - Validação da configuração e aquecimento
+def validar_configuracao() -> list[str]:
+    """
+    Confere combinações de configuração que só falhariam no meio de uma
+    requisição e retorna as mensagens (ERRO/AVISO) para o log da subida.
+    """
+    problemas = []
+    if not GEMINI_API_KEY:
+        problemas.append("ERRO CRÍTICO: GOOGLE_API_KEY não definida; nenhum extrato poderá ser processado.")
+    if bool(SUPABASE_URL) != bool(SUPABASE_KEY):
+        problemas.append("AVISO: Só uma de SUPABASE_URL/SUPABASE_KEY está definida; categorizações personalizadas desabilitadas.")
+    if WORKERS > 1 and not COMPARTILHADO:
+        problemas.append(f"AVISO: WEB_CONCURRENCY={WORKERS} com COMPARTILHADO desligado: cotas, continuações e "
+                         "caches valem por worker, e uma continuação pode cair em um worker que não a conhece.")
+    if WORKERS > 1 and not limite_gemini.ativo:
+        problemas.append(f"AVISO: WEB_CONCURRENCY={WORKERS} sem limite do Gemini (GEMINI_RPM/GEMINI_TPM, sem padrão conhecido "
+                         f"para {MODEL_GEMINI!r}): os workers só se coordenam depois de um 429.")
+    if MODO_PIPELINE not in MODOS_PIPELINE:
+        problemas.append(f"ERRO: MODO_PIPELINE={MODO_PIPELINE!r} inválido (use {', '.join(MODOS_PIPELINE)}); "
+                         "as requisições sem modo_pipeline serão recusadas.")
+    return problemas
+
+def aquecer():
+    """
+    Executado em uma thread na subida: importa os SDKs, cria os clientes e
+    sobe os processos do pool de CPU, para que a primeira requisição depois
+    que a instância acorda não pague esse custo.
+    """
+    inicio = time.perf_counter()
+    try:
+        gemini_client.obter()
+        if supabase is not None:
+            supabase.obter()
+        if executor_cpu is not None:
+            list(executor_cpu.map(abs, range(CPU_WORKERS)))
+    except Exception as e:
+        print(f"AVISO: Aquecimento incompleto (os clientes serão criados no primeiro uso): {e}")
+    METRICAS["inicializacao"]["segundos_aquecimento"] = round(time.perf_counter() - inicio, 3)
+    print(f"INFO: Aquecimento concluído em {time.perf_counter() - inicio:.2f}s")
 
+async def encerrar():
+    """
+    Encerramento do processo (SIGTERM em deploys): recusa novos documentos,
+    espera os trabalhos de background até ENCERRAMENTO_PRAZO_S (os que não
+    terminam são salvos para retomar), conclui as gravações pendentes
+    (categorizações no Supabase, artefatos, livro de transações), grava o
+    cache e as continuações e fecha o cliente HTTP, o Gemini e o pool de CPU.
+    """
+    resumo = await gerenciador_encerramento.drenar()
+    print(f"INFO: Encerramento: {resumo}")
+    salvar_cache_estabelecimentos()
+    try:
+        gravadas = armazem_continuacoes.gravar(ARQUIVO_CONTINUACOES)
+        if gravadas:
+            print(f"INFO: {gravadas} continuações gravadas para depois do reinício.")
+    except Exception as e:
+        print(f"ERRO ao gravar as continuações: {e}")
+    await http_client.aclose()
+    if gemini_client.metricas()["criado"] and hasattr(gemini_client.obter(), "close"):
+        gemini_client.obter().close()
+    if executor_cpu is not None:
+        await asyncio.to_thread(executor_cpu.shutdown, True, cancel_futures=True)
 
-# 7 - Função para desbloquear PDF com senha
-def desbloquear_pdf_com_senha(pdf_bytes: bytes, senha: str | None) -> bytes:
+# 7 - Abre o PDF uma única vez (desbloqueando com senha, se houver)
+def abrir_documento(pdf_bytes: bytes, senha: str | None) -> DocumentHandle:
     """
-    Tenta desbloquear um PDF protegido por senha.
-    Se não há senha ou o PDF não está protegido, retorna os bytes originais.
+    Abre o PDF e, se estiver protegido, autentica com a senha fornecida.
+    O documento aberto é compartilhado por todas as etapas do pipeline,
+    sem regravar o PDF desbloqueado.
     """
     if not senha:
         print("DEBUG: Nenhuma senha fornecida, processando PDF normalmente.")
-        return pdf_bytes
-    
-    try:
-        # Tenta abrir com PyMuPDF (fitz) primeiro
+    else:
         print("DEBUG: Tentando desbloquear PDF com a senha fornecida...")
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        
-        if doc.is_encrypted:
-            print("DEBUG: PDF está criptografado, aplicando senha...")
-            if doc.authenticate(senha):
-                print("DEBUG: Senha correta! PDF desbloqueado com sucesso.")
-                # Salva o PDF desbloqueado em bytes
-                pdf_desbloqueado = doc.write()
-                doc.close()
-                return pdf_desbloqueado
-            else:
-                doc.close()
-                print("ERRO: Senha incorreta para o PDF.")
-                raise HTTPException(status_code=400, detail="Senha incorreta para o PDF protegido.")
-        else:
-            print("DEBUG: PDF não está criptografado, processando normalmente.")
-            doc.close()
-            return pdf_bytes
-            
-    except fitz.FileDataError:
-        print("ERRO: Arquivo PDF corrompido ou inválido.")
-        raise HTTPException(status_code=400, detail="Arquivo PDF corrompido ou inválido.")
-    except Exception as e:
-        print(f"ERRO inesperado ao desbloquear PDF: {e}")
-        raise HTTPException(status_code=500, detail=f"Erro ao processar PDF protegido: {e}")
+    return DocumentHandle.abrir(pdf_bytes, senha)
+
+# 7.0.1 - Executa trabalho pesado de CPU no pool de processos
+async def executar_cpu(funcao, *args):
+    """
+    Executa 'funcao' no pool de processos, ou em uma thread quando o pool
+    está desabilitado (CPU_WORKERS <= 1). As vagas do pool são repartidas
+    entre os usuários pela fila justa.
+    """
+    if executor_cpu is None:
+        return await asyncio.to_thread(funcao, *args)
+    loop = asyncio.get_running_loop()
+    async with escalonador_cpu.vez(usuario_atual.get()):
+        return await loop.run_in_executor(executor_cpu, funcao, *args)
+
+# 7.0.2 - Funções auxiliares para respostas do Gemini
+def limpar_json_resposta(json_text: str) -> str:
+    """
+    Remove blocos de markdown (```json) que o modelo às vezes adiciona em volta do JSON.
+    """
+    json_text = re.sub(r'```json\s*', '', json_text)
+    json_text = re.sub(r'```\s*$', '', json_text)
+    return json_text.strip()
+
+def interpretar_resposta(texto: str, extracao: bool) -> dict:
+    """
+    Converte a resposta de extração da LLM no JSON de transações, conforme o
+    contrato de saída de VERSAO_PROMPT (v1: JSON, v2: linhas delimitadas).
+    Levanta ValueError se a resposta não respeitar o contrato.
+    """
+    metricas = METRICAS["saida_llm"]
+    metricas["respostas"] += 1
+    metricas["tokens_saida"] += estimar_tokens(texto or "")
+    try:
+        if VERSAO_PROMPT == "v2":
+            return interpretar_saida_tabular(texto, com_categoria=not extracao)
+        return json.loads(limpar_json_resposta(texto))
+    except ValueError:
+        metricas["respostas_invalidas"] += 1
+        raise
+
+# Tokens de uma página A4 renderizada a 150 DPI
+TOKENS_POR_IMAGEM = estimar_tokens_imagem(1240, 1754)
+
+def estimar_tokens_conteudo(contents) -> int:
+    """
+    Estimativa dos tokens de entrada de uma chamada (prompt em texto ou lista de partes).
+    """
+    if isinstance(contents, str):
+        return estimar_tokens(contents)
+    return sum(estimar_tokens(parte["text"]) if "text" in parte else TOKENS_POR_IMAGEM for parte in contents)
+
+def tokens_consumidos(response, tokens_entrada: int) -> int:
+    """
+    Tokens cobrados pela chamada (usage_metadata), ou a estimativa de entrada + saída.
+    """
+    total = getattr(getattr(response, "usage_metadata", None), "total_token_count", None)
+    return total if isinstance(total, int) else tokens_entrada + estimar_tokens(getattr(response, "text", None) or "")
+
+def chave_resposta_llm(contents) -> str | None:
+    """
+    Chave do prompt no cache compartilhado de respostas (só prompts em texto:
+    páginas do pipeline de duas etapas e lotes de categorização).
+    """
+    if not CACHE_RESPOSTAS or not isinstance(contents, str):
+        return None
+    return hashlib.sha256(f"{MODEL_GEMINI}\n{contents}".encode("utf-8")).hexdigest()
+
+def erro_cota_gemini(erro: Exception) -> bool:
+    return getattr(erro, "code", None) == 429 or "RESOURCE_EXHAUSTED" in str(erro)
+
+async def chamar_gemini(contents):
+    """
+    Chama o Gemini em uma thread, limitado a TIMEOUT_GEMINI_MS e ao fim do
+    prazo da requisição em andamento (levanta TimeoutError). O mesmo limite
+    vai como timeout da requisição HTTP, porque a thread não é interrompida:
+    a vaga na fila só volta quando ela termina, mesmo que quem chamou já
+    tenha desistido (timeout ou cancelamento).
+    A vez da chamada vem da fila justa entre usuários (custo = tokens de
+    entrada estimados) e os tokens consumidos saem da cota diária do usuário.
+    Com vários workers, um prompt já respondido por qualquer um deles sai do
+    cache compartilhado, sem chamada, e as chamadas esperam o limite do projeto
+    (e a pausa de todos os workers depois de um 429).
+    """
+    usuario = usuario_atual.get()
+    tokens_entrada = estimar_tokens_conteudo(contents)
+    chave_cache = chave_resposta_llm(contents)
+    texto_cache = await asyncio.to_thread(banco_compartilhado.obter, "respostas_llm", chave_cache) if chave_cache else None
+    if texto_cache is not None:
+        response = RespostaEmCache(texto_cache)
+    else:
+        async with escalonador_gemini.vez(usuario, tokens_entrada) as vaga:
+            if COMPARTILHADO:
+                await asyncio.wait_for(limite_gemini.aguardar(tokens_entrada), timeout_chamada())
+            timeout = timeout_chamada()
+            if timeout <= 0:
+                raise TimeoutError("prazo da requisição esgotado")
+            try:
+                vaga.ate = asyncio.ensure_future(asyncio.to_thread(
+                    gemini_client.models.generate_content, model=MODEL_GEMINI, contents=contents,
+                    config={"http_options": {"timeout": max(1, int(timeout * 1000))}}))
+                response = await asyncio.wait_for(asyncio.shield(vaga.ate), timeout)
+            except Exception as e:
+                if COMPARTILHADO and erro_cota_gemini(e):
+                    await limite_gemini.registrar_429()
+                raise
+        cotas_usuarios.consumir_tokens(usuario, tokens_consumidos(response, tokens_entrada))
+        if chave_cache and getattr(response, "text", None) and not resposta_truncada(response):
+            gerenciador_encerramento.gravar_depois(asyncio.to_thread(
+                banco_compartilhado.guardar, "respostas_llm", chave_cache, response.text, CACHE_RESPOSTAS_TTL_S))
+    saidas = saidas_llm_atuais.get()
+    if saidas is not None:
+        saidas.append({"modelo": MODEL_GEMINI, "tokens_entrada": tokens_entrada, "resposta": getattr(response, "text", None)})
+    return response
+
+def instrucao_retorno() -> str:
+    return "Retorne apenas as linhas no formato tabular pedido." if VERSAO_PROMPT == "v2" else "Retorne apenas um JSON válido com o resultado."
+
+def resposta_truncada(response) -> bool:
+    """
+    Indica se a geração parou por atingir o limite de tokens de saída.
+    """
+    try:
+        return "MAX_TOKENS" in str(response.candidates[0].finish_reason)
+    except (AttributeError, IndexError, TypeError):
+        return False
 
 # 7.1 - Função para decodificar base64
 def decodificar_base64_para_bytes(base64_string: str) -> bytes:
@@ -194,36 +578,29 @@ async def contar_tokens_base64(base64_string: str) -> dict:
         raise HTTPException(status_code=500, detail=f"Erro ao contar tokens: {e}")
 
 # 7.3 - Função auxiliar para extrair texto de PDF
-async def extrair_texto_pdf_bytes(pdf_bytes: bytes) -> str:
+async def extrair_texto_pdf_bytes(pdf_bytes: bytes | DocumentHandle) -> str:
     """
-    Extrai texto de um PDF em bytes para contagem de tokens.
+    Extrai texto de um PDF para contagem de tokens.
+    Aceita os bytes ou um DocumentHandle já aberto (reaproveitando o cache de texto).
     """
+    doc = pdf_bytes if isinstance(pdf_bytes, DocumentHandle) else abrir_documento(pdf_bytes, None)
     try:
-        texto_extraido = ""
-        
-        # Usa pdfplumber para extrair texto
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for pagina in pdf.pages:
-                texto_pagina = pagina.extract_text()
-                if texto_pagina:
-                    texto_extraido += texto_pagina + "\n"
-        
-        return texto_extraido.strip()
+        # Usa o texto do pdfplumber (em cache, se o pipeline já extraiu)
+        textos = await asyncio.to_thread(lambda: [doc.texto(i) for i in doc.paginas])
+        return "\n".join(t for t in textos if t).strip()
         
     except Exception as e:
         print(f"ERRO ao extrair texto do PDF: {e}")
         # Se falhar com pdfplumber, tenta com PyMuPDF
         try:
-            doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-            texto_extraido = ""
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                texto_extraido += page.get_text() + "\n"
-            doc.close()
-            return texto_extraido.strip()
+            textos = await asyncio.to_thread(lambda: [doc.texto_fitz(i) for i in doc.paginas])
+            return "\n".join(textos).strip()
         except Exception as e2:
             print(f"ERRO ao extrair texto com PyMuPDF: {e2}")
             raise HTTPException(status_code=500, detail="Erro ao extrair texto do PDF para contagem de tokens")
+    finally:
+        if doc is not pdf_bytes:
+            doc.close()
 
 # 7.4 - Função para contar tokens de UploadFile
 async def contar_tokens_upload_file(file: UploadFile) -> dict:
@@ -342,6 +719,7 @@ class URLPayload(BaseModel):
     webhook_url: str
     user_id: int
     senha_do_pdf: str | None = None
+    modo_pipeline: str | None = None
 
 class FilePayload(BaseModel):
     user_id: int
@@ -352,6 +730,14 @@ class Base64Payload(BaseModel):
     filename: str | None = None
     user_id: int
     senha_do_pdf: str | None = None
+    modo_pipeline: str | None = None
+    timeout_ms: int | None = None
+
+class LotePayload(BaseModel):
+    file_urls: list[str]
+    user_id: int
+    senha_do_pdf: str | None = None
+    modo_pipeline: str | None = None
 
 class TokenCountPayload(BaseModel):
     file_base64: str
@@ -366,6 +752,11 @@ async def buscar_categorizacoes_usuario(user_id: int) -> dict[str, dict]:
     """
     if not supabase:
         return {}
+    if CATEGORIZACOES_COMPARTILHADAS:
+        categorizacoes = await asyncio.to_thread(banco_compartilhado.obter, "categorizacoes", str(user_id))
+        if categorizacoes is not None:
+            print(f"DEBUG: {len(categorizacoes)} categorizações personalizadas do cache compartilhado.")
+            return categorizacoes
     
     try:
         print(f"DEBUG: Buscando categorizações para usuário {user_id}...")
@@ -382,6 +773,9 @@ async def buscar_categorizacoes_usuario(user_id: int) -> dict[str, dict]:
                 }
         
         print(f"DEBUG: Encontradas {len(categorizacoes)} categorizações personalizadas.")
+        if CATEGORIZACOES_COMPARTILHADAS:
+            await asyncio.to_thread(banco_compartilhado.guardar, "categorizacoes", str(user_id), categorizacoes,
+                                    CATEGORIZACOES_TTL_S)
         return categorizacoes
         
     except Exception as e:
@@ -440,6 +834,9 @@ def limpar_descricao_para_match(descricao: str) -> str:
     descricao = re.sub(r'\s+', ' ', descricao)
     return descricao.strip().lower()
 
+# 10.1 - Livro das transações já vistas de cada usuário (extratos com dias repetidos)
+livro_transacoes = LivroTransacoes(limpar_descricao_para_match)
+
 # 11 - Salva novas categorizações
 async def inserir_categorizacoes_usuario(user_id: int, transacoes_para_inserir: list[dict]):
     """
@@ -465,34 +862,67 @@ async def inserir_categorizacoes_usuario(user_id: int, transacoes_para_inserir:
         )
         
         print(f"DEBUG: Categorizações inseridas com sucesso para usuário {user_id}.")
+        if CATEGORIZACOES_COMPARTILHADAS:
+            # A próxima busca (em qualquer worker) já vê as novas
+            await asyncio.to_thread(banco_compartilhado.remover, "categorizacoes", str(user_id))
         
     except Exception as e:
         print(f"ERRO ao inserir categorizações no Supabase: {e}")
 
 
 # 12 - Extrai texto nativo por página
-async def extrair_texto_nativo_por_paginas(pdf_bytes: bytes) -> list[str]:
+async def extrair_texto_nativo_por_paginas(doc: DocumentHandle, indices: list[int] | None = None,
+                                           ao_extrair=None) -> list[str]:
     """
     Extrai texto nativo de cada página do PDF separadamente.
+    Com o pool de processos, as páginas são divididas em intervalos e os
+    textos voltam para o cache do handle; sem ele, saem do próprio handle.
+    Se 'indices' for informado, extrai apenas essas páginas.
+    'ao_extrair' (assíncrona) recebe os índices de cada intervalo (ou página, sem o
+    pool) assim que ele termina.
     Retorna uma lista com o texto de cada página.
     """
     print("DEBUG: Iniciando extração nativa por páginas...")
     paginas_texto = []
     
     try:
-        with io.BytesIO(pdf_bytes) as f:
-            with pdfplumber.open(f) as pdf:
-                if not pdf.pages:
-                    print("DEBUG: PDF sem páginas.")
-                    return []
-                
-                for i, page in enumerate(pdf.pages):
-                    texto_pagina = page.extract_text(x_tolerance=2)
-                    if texto_pagina and len(texto_pagina.strip()) > 50:
-                        paginas_texto.append(texto_pagina.strip())
-                        print(f"DEBUG: Página {i+1} extraída: {len(texto_pagina)} caracteres")
-                    else:
-                        print(f"DEBUG: Página {i+1} vazia ou com pouco texto")
+        if not len(doc):
+            print("DEBUG: PDF sem páginas.")
+            return []
+        
+        indices = list(doc.paginas) if indices is None else indices
+        if executor_cpu is None:
+            # Sem pool, extrai do próprio handle (uma fatia reabriria o PDF a partir dos bytes),
+            # página a página: cancelada, a extração para na página seguinte
+            for i in indices:
+                await asyncio.to_thread(doc.texto, i)
+                if ao_extrair:
+                    await ao_extrair([i])
+        else:
+            tarefas = []
+            for fatia in doc.dividir(CPU_WORKERS):
+                indices_fatia = [i for i in indices if i in fatia.paginas]
+                if indices_fatia:
+                    tarefas.append(asyncio.ensure_future(executar_cpu(extrair_textos_intervalo, fatia, indices_fatia)))
+            # Cada intervalo entra no cache ao terminar: se o prazo acabar (ou o OCR especulativo vencer),
+            # os prontos são aproveitados e os que ainda esperam o pool são cancelados
+            try:
+                for tarefa in asyncio.as_completed(tarefas):
+                    textos = await tarefa
+                    doc.registrar_textos(textos)
+                    if ao_extrair:
+                        await ao_extrair(sorted(textos))
+            finally:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+        
+        for i in indices:
+            texto_pagina = doc.texto(i)
+            if texto_pagina and len(texto_pagina.strip()) > 50:
+                paginas_texto.append(texto_pagina.strip())
+                print(f"DEBUG: Página {i+1} extraída: {len(texto_pagina)} caracteres")
+            else:
+                print(f"DEBUG: Página {i+1} vazia ou com pouco texto")
         
         print(f"DEBUG: Extração nativa concluída: {len(paginas_texto)} páginas com texto válido")
         return paginas_texto
@@ -501,15 +931,37 @@ async def extrair_texto_nativo_por_paginas(pdf_bytes: bytes) -> list[str]:
         print(f"ERRO na extração nativa por páginas: {e}")
         return []
 
+# 12.1 - Pré-classifica as páginas (texto nativo, OCR ou vazia) via PyMuPDF
+def classificar_paginas(doc: DocumentHandle) -> dict[int, str]:
+    """
+    Decide por página, a partir de metadados baratos do PyMuPDF (fontes, spans,
+    cobertura de imagem, caracteres ilegíveis e desenhos vetoriais), se a camada
+    de texto é utilizável.
+    Evita rodar o pdfplumber em páginas digitalizadas e detecta camadas de texto
+    corrompidas que passariam no limite de 50 caracteres.
+    """
+    inicio = time.time()
+    estrategias = {}
+    for i in doc.paginas:
+        perfil = doc.perfil(i)
+        estrategias[i] = estrategia_pagina(perfil)
+        print(f"DEBUG: Página {i+1} classificada como '{estrategias[i]}' "
+              f"(fontes={perfil['fontes']}, spans={perfil['spans']}, "
+              f"imagem={perfil['cobertura_imagem']:.0%}, lixo={perfil['razao_lixo']:.0%}, desenhos={perfil['desenhos']})")
+    print(f"DEBUG: Classificação de {len(estrategias)} páginas em {(time.time() - inicio) * 1000:.1f} ms")
+    return estrategias
+
 # 13 - Tenta extração nativa primeiro (versão antiga - mantida para compatibilidade)
-async def extrair_texto_nativo(pdf_bytes: bytes) -> str | None:
+async def extrair_texto_nativo(doc: DocumentHandle) -> str | None:
     """
     Tenta extrair texto nativo do PDF. 
     Agora usa processamento por páginas em paralelo.
     """
     print("DEBUG: Iniciando Tentativa 1: Extração Nativa...")
     
-    paginas_texto = await extrair_texto_nativo_por_paginas(pdf_bytes)
+    estrategias = await asyncio.to_thread(classificar_paginas, doc)
+    indices_nativos = [i for i, estrategia in estrategias.items() if estrategia == "nativo"]
+    paginas_texto = await extrair_texto_nativo_por_paginas(doc, indices_nativos) if indices_nativos else []
     
     if not paginas_texto:
         print("DEBUG: Extração nativa falhou (nenhuma página com texto válido).")
@@ -526,29 +978,33 @@ async def extrair_texto_nativo(pdf_bytes: bytes) -> str | None:
     return "\n\n--- NOVA PÁGINA ---\n\n".join(paginas_texto)
 
 # 14 - Converte PDF para imagens base64 por página
-def pdf_para_imagens_individuais(pdf_bytes: bytes) -> list[dict]:
+def montar_imagem_part(pagina: dict) -> dict:
+    """
+    Monta a entrada de imagem de uma página renderizada no formato esperado pela API do Gemini.
+    """
+    return {
+        "pagina": pagina["pagina"],
+        "imagem": {
+            "inline_data": {
+                "mime_type": pagina["mime_type"],
+                "data": base64.b64encode(pagina["dados"]).decode('utf-8')
+            }
+        }
+    }
+
+# 14.1 - Converte todas as páginas de uma vez (versão antiga - mantida para compatibilidade)
+def pdf_para_imagens_individuais(doc: DocumentHandle, indices: list[int] | None = None) -> list[dict]:
     """
-    Converte cada página do PDF em uma imagem separada
-    no formato esperado pela API do Gemini.
+    Converte cada página do PDF (ou só as páginas em 'indices') em uma imagem
+    separada no formato esperado pela API do Gemini.
+    O pipeline usa rasterizar_paginas, que renderiza sob demanda dentro do orçamento de memória.
     """
     imagens_individuais = []
     try:
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        for i, page in enumerate(doc):
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))
-            img_bytes = pix.tobytes("png")
-            b64_data = base64.b64encode(img_bytes).decode('utf-8')
-            imagem_part = {
-                "inline_data": {
-                    "mime_type": "image/png",
-                    "data": b64_data
-                }
-            }
-            imagens_individuais.append({
-                "pagina": i + 1,
-                "imagem": imagem_part
-            })
-        doc.close()
+        for i in (doc.paginas if indices is None else indices):
+            pagina = renderizar_pagina(doc, i)
+            if pagina is not None:
+                imagens_individuais.append(montar_imagem_part(pagina))
         return imagens_individuais
     except Exception as e:
         print(f"ERRO ao converter PDF para imagens individuais: {e}")
@@ -567,11 +1023,7 @@ async def processar_ocr_pagina_individual(imagem_data: dict, pagina_num: int) ->
     ]
     
     try:
-        response = await asyncio.to_thread(
-            gemini_client.models.generate_content,
-            model=MODEL_GEMINI,
-            contents=contents
-        )
+        response = await chamar_gemini(contents)
         
         texto_pagina = response.text
         
@@ -599,149 +1051,955 @@ async def processar_ocr_pagina_individual(imagem_data: dict, pagina_num: int) ->
             "erro": str(e)
         }
 
-# 16 - Se extração nativa falhar, usa OCR paralelo por página
-async def extrair_texto_ocr(pdf_bytes: bytes) -> str | None:
+# 15.1 - Processa OCR de várias páginas em uma única chamada
+async def processar_ocr_pacote(paginas: list[dict]) -> dict[int, str] | None:
     """
-    Processa OCR de cada página em paralelo e junta os resultados.
+    Envia várias imagens de página em uma única chamada de OCR.
+    Retorna {numero_pagina: texto}, ou None se a resposta foi cortada
+    ou não trouxe o marcador de todas as páginas (o pacote deve ser dividido).
     """
-    print("DEBUG: Iniciando Tentativa 2: Extração OCR por páginas...")
+    numeros = [p["pagina"] for p in paginas]
+    print(f"DEBUG: Processando OCR do pacote com páginas {numeros}...")
+    METRICAS["empacotamento"]["chamadas_ocr"] += 1
+    METRICAS["empacotamento"]["paginas_ocr"] += len(paginas)
     
-    imagens_individuais = await asyncio.to_thread(pdf_para_imagens_individuais, pdf_bytes)
+    contents = [
+        {"text": f"Extraia todo o texto visível destas {len(paginas)} páginas de extrato bancário. "
+                 "Cada imagem é precedida pelo seu número de página. Antes do texto de cada página, "
+                 "escreva uma linha '=== PÁGINA N ===' com o número correspondente. Retorne apenas o texto bruto."}
+    ]
+    for pagina in paginas:
+        contents.append({"text": f"Página {pagina['pagina']}:"})
+        contents.append(montar_imagem_part(pagina)["imagem"])
     
-    if not imagens_individuais:
-        print("ERRO: OCR falhou na conversão de imagem.")
+    response = await chamar_gemini(contents)
+    if resposta_truncada(response):
         return None
+    textos = separar_texto_por_pagina(response.text or "")
+    if set(textos) != set(numeros):
+        return None
+    return textos
 
-    print(f"DEBUG: Convertidas {len(imagens_individuais)} páginas para OCR paralelo...")
-
-    # Processa todas as páginas em paralelo
-    tasks = [
-        processar_ocr_pagina_individual(img_data, img_data["pagina"])
-        for img_data in imagens_individuais
+async def _ocr_pacote_com_divisao(paginas: list[dict]) -> list[dict]:
+    """
+    OCR de um pacote de páginas, dividindo ao meio enquanto a resposta vier incompleta.
+    """
+    if len(paginas) == 1:
+        return [await processar_ocr_pagina_individual(montar_imagem_part(paginas[0]), paginas[0]["pagina"])]
+    
+    try:
+        textos = await processar_ocr_pacote(paginas)
+    except Exception as e:
+        print(f"ERRO no OCR do pacote {[p['pagina'] for p in paginas]}: {e}")
+        return [{"pagina": p["pagina"], "texto": "", "sucesso": False, "erro": str(e)} for p in paginas]
+    
+    if textos is None:
+        print(f"DEBUG: OCR do pacote {[p['pagina'] for p in paginas]} incompleto, dividindo...")
+        METRICAS["empacotamento"]["pacotes_divididos"] += 1
+        metade_a, metade_b = dividir_pacote(paginas)
+        resultados = await asyncio.gather(_ocr_pacote_com_divisao(metade_a), _ocr_pacote_com_divisao(metade_b))
+        return resultados[0] + resultados[1]
+    
+    return [
+        {"pagina": n, "texto": texto, "sucesso": len(texto) >= 50}
+        for n, texto in sorted(textos.items())
     ]
+
+# 16 - Se extração nativa falhar, usa OCR paralelo por página
+async def ocr_pacote_renderizado(doc: DocumentHandle | None, paginas: list[dict]) -> list[dict]:
+    """
+    Faz o OCR de um pacote de páginas já renderizadas e libera a memória reservada.
+    Páginas cujo texto volta curto (sem erro da API) são renderizadas de novo
+    em DPI maior e refeitas individualmente.
+    """
+    for pagina in paginas:
+        METRICAS["rasterizacao"]["paginas_renderizadas"] += 1
+        METRICAS["rasterizacao"]["bytes_enviados"] += len(pagina["dados"])
+    try:
+        resultados = await _ocr_pacote_com_divisao(paginas)
+    finally:
+        for pagina in paginas:
+            await orcamento_memoria.liberar(pagina.get("reserva", 0))
+    
+    if doc is None:
+        return resultados
+    
+    por_numero = {p["pagina"]: p for p in paginas}
+    retentativas = []
+    for i, resultado in enumerate(resultados):
+        pagina = por_numero[resultado["pagina"]]
+        if resultado.get("sucesso") or "erro" in resultado or pagina["dpi"] >= DPI_RETENTATIVA:
+            continue
+        retentativas.append((i, pagina))
+    
+    async def retentar(pagina: dict) -> dict | None:
+        print(f"DEBUG: OCR da página {pagina['pagina']} curto a {pagina['dpi']} DPI, renderizando a {DPI_RETENTATIVA} DPI...")
+        METRICAS["rasterizacao"]["retentativas_dpi"] += 1
+        nova = await renderizar_com_orcamento(doc, pagina["indice"], DPI_RETENTATIVA)
+        if nova is None:
+            return None
+        resultado = (await ocr_pacote_renderizado(None, [nova]))[0]
+        if resultado.get("sucesso"):
+            METRICAS["rasterizacao"]["retentativas_com_sucesso"] += 1
+        return resultado
     
+    novos = await asyncio.gather(*[retentar(pagina) for _, pagina in retentativas])
+    for (i, _), novo in zip(retentativas, novos):
+        if novo is not None:
+            resultados[i] = novo
+    return resultados
+
+def empacotar_paginas_ocr(doc: DocumentHandle, indices: list[int]) -> list[list[int]]:
+    """
+    Agrupa páginas consecutivas para o OCR pelo orçamento de tokens de imagem
+    (EMPACOTAMENTO_OCR_TOKENS), sem que um pacote sozinho ocupe mais memória
+    que o orçamento de renderização.
+    """
+    if not EMPACOTAMENTO:
+        return [[i] for i in indices]
+    return empacotar_paginas(
+        indices,
+        (EMPACOTAMENTO_OCR_TOKENS, lambda i: estimar_tokens_imagem(*estimar_dimensoes(doc, i))),
+        (orcamento_memoria.limite_bytes, lambda i: estimar_bytes_renderizacao(doc, i)),
+    )
+
+async def ocr_pacote_avisando(doc: DocumentHandle | None, paginas: list[dict], ao_extrair) -> list[dict]:
+    """
+    ocr_pacote_renderizado que avisa 'ao_extrair' de cada página com texto assim que o pacote termina.
+    """
+    resultados = await ocr_pacote_renderizado(doc, paginas)
+    for resultado in resultados:
+        if resultado.get("sucesso", False) and resultado.get("texto"):
+            await ao_extrair(resultado["pagina"] - 1)
+    return resultados
+
+async def extrair_paginas_ocr(doc: DocumentHandle | None, indices: list[int] | None = None, paginas_renderizadas: list[dict] | None = None,
+                              ao_extrair=None) -> dict[int, str]:
+    """
+    Processa OCR das páginas em paralelo.
+    As páginas são agrupadas em pacotes e renderizadas sob demanda (DPI adaptativo,
+    orçamento global de memória); cada OCR começa assim que seu pacote fica pronto.
+    Aceita páginas já renderizadas (ex: pela especulação) para não renderizar de novo.
+    Com prazo, os pacotes que não terminam até o marco do OCR são cancelados e
+    suas páginas ficam pendentes. 'ao_extrair' (assíncrona) recebe o índice
+    de cada página com texto assim que o pacote dela termina.
+    Retorna {indice_pagina: texto} apenas para as páginas com texto válido.
+    """
+    tasks, paginas_tasks = [], []
+    prazo = prazo_atual.get()
+    ocr_pacote = (lambda d, paginas: ocr_pacote_avisando(d, paginas, ao_extrair)) if ao_extrair else ocr_pacote_renderizado
     try:
-        resultados_ocr = await asyncio.gather(*tasks, return_exceptions=True)
+        if paginas_renderizadas is not None:
+            tasks = [asyncio.create_task(ocr_pacote(doc, [p])) for p in paginas_renderizadas]
+            paginas_tasks = [[p["pagina"]] for p in paginas_renderizadas]
+        else:
+            indices = list(doc.paginas) if indices is None else indices
+            pacotes = await asyncio.to_thread(empacotar_paginas_ocr, doc, indices)
+            for pacote in pacotes:
+                if prazo and prazo.esgotado("ocr"):
+                    prazo.registrar_pendentes(i + 1 for i in pacote)
+                    continue
+                renderizadas = [pagina async for pagina in rasterizar_paginas(doc, pacote)]
+                if renderizadas:
+                    tasks.append(asyncio.create_task(ocr_pacote(doc, renderizadas)))
+                    paginas_tasks.append([p["pagina"] for p in renderizadas])
         
-        textos_validos = []
-        for resultado in resultados_ocr:
-            if isinstance(resultado, Exception):
-                print(f"ERRO em página durante OCR: {resultado}")
+        if not tasks:
+            if not (prazo and prazo.esgotado("ocr")):
+                print("ERRO: OCR falhou na conversão de imagem.")
+            return {}
+
+        print(f"DEBUG: {len(tasks)} chamadas de OCR em paralelo...")
+        _, pendentes = await aguardar_no_prazo(tasks, "ocr")
+        if pendentes:
+            paginas = [n for task, numeros in zip(tasks, paginas_tasks) if task in pendentes for n in numeros]
+            print(f"AVISO: Prazo do OCR esgotado, páginas {paginas} ficam pendentes")
+            prazo.registrar_pendentes(paginas)
+        
+        textos_validos = {}
+        for task in tasks:
+            if task in pendentes:
+                continue
+            resultados_pacote = task.exception() or task.result()
+            if isinstance(resultados_pacote, Exception):
+                print(f"ERRO em página durante OCR: {resultados_pacote}")
                 continue
             
-            if resultado.get("sucesso", False) and resultado.get("texto"):
-                textos_validos.append(resultado["texto"])
+            for resultado in resultados_pacote:
+                if resultado.get("sucesso", False) and resultado.get("texto"):
+                    textos_validos[resultado["pagina"] - 1] = resultado["texto"]
         
-        if not textos_validos:
-            print("DEBUG: OCR falhou - nenhuma página com texto válido")
-            return None
-        
-        texto_completo = "\n\n--- NOVA PÁGINA ---\n\n".join(textos_validos)
-        print(f"DEBUG: OCR SUCESSO - {len(textos_validos)} páginas processadas ({len(texto_completo)} caracteres total)")
-        return texto_completo
+        return textos_validos
         
     except Exception as e:
+        for task in tasks:
+            task.cancel()
         print(f"ERRO na coordenação do OCR paralelo: {e}")
-        return None
+        return {}
 
-# 17 - Processa página individual
-async def processar_pagina_individual(texto_pagina: str, pagina_num: int) -> dict:
+async def extrair_texto_ocr(doc: DocumentHandle, indices: list[int] | None = None) -> str | None:
     """
-    Processa uma página individual de texto e retorna as transações encontradas.
+    Processa OCR de cada página em paralelo e junta os resultados.
     """
-    print(f"DEBUG: Processando página {pagina_num} ({len(texto_pagina)} caracteres)...")
+    print("DEBUG: Iniciando Tentativa 2: Extração OCR por páginas...")
     
-    prompt_completo = f"""
-{PROMPT_SISTEMA}
+    textos_validos = await extrair_paginas_ocr(doc, indices)
+    
+    if not textos_validos:
+        print("DEBUG: OCR falhou - nenhuma página com texto válido")
+        return None
+    
+    texto_completo = "\n\n--- NOVA PÁGINA ---\n\n".join(textos_validos[i] for i in sorted(textos_validos))
+    print(f"DEBUG: OCR SUCESSO - {len(textos_validos)} páginas processadas ({len(texto_completo)} caracteres total)")
+    return texto_completo
 
-Analise esta página {pagina_num} de extrato financeiro e extraia TODAS as transações.
+# 16.1 - OCR especulativo em paralelo com a extração nativa
+async def _especular_intervalo(fatia: DocumentHandle, indices: list[int]) -> dict:
+    """
+    Renderiza um intervalo de páginas no pool de processos e, se habilitado,
+    já dispara o OCR de cada página.
+    """
+    imagens = await executar_cpu(renderizar_paginas_intervalo, fatia, indices)
+    ocr = {}
+    if ESPECULACAO_CHAMADAS_OCR:
+        for i, pagina in imagens.items():
+            ocr[i] = asyncio.create_task(ocr_pacote_renderizado(None, [pagina]))
+    return {"imagens": imagens, "ocr": ocr}
 
-**REGRAS DE CATEGORIZAÇÃO:**
-{CATEGORIAS_COMPLETAS}
+def iniciar_especulacao_ocr(doc: DocumentHandle, indices: list[int]) -> list[tuple[list[int], asyncio.Task]]:
+    """
+    Dispara a renderização (e opcionalmente o OCR) das páginas em paralelo
+    com a extração nativa. Retorna [(indices_do_intervalo, tarefa)].
+    """
+    METRICAS["especulacao"]["documentos_especulados"] += 1
+    METRICAS["especulacao"]["paginas_especuladas"] += len(indices)
+    especulacao = []
+    for fatia in doc.dividir(CPU_WORKERS * 2):
+        indices_fatia = [i for i in indices if i in fatia.paginas]
+        if indices_fatia:
+            especulacao.append((indices_fatia, asyncio.create_task(_especular_intervalo(fatia, indices_fatia))))
+    print(f"DEBUG: OCR especulativo iniciado para {len(indices)} páginas em {len(especulacao)} tarefas")
+    return especulacao
 
-**TEXTO DA PÁGINA {pagina_num}:**
-{texto_pagina}
+class CorridaEspeculativa:
+    """
+    Corrida, página a página, entre a extração nativa e o OCR especulativo
+    (iniciar_especulacao_ocr). A primeira estratégia com texto válido vence
+    a página e o trabalho da outra é cancelado na hora:
+    - página nativa com texto: a chamada de OCR dela é cancelada (e o
+      intervalo, se ainda renderizando e todas as páginas dele já venceram);
+    - OCR especulado com texto antes da página nativa: quando todas as
+      páginas têm vencedor, a extração nativa registrada em 'nativa' é cancelada;
+    - páginas em que a nativa falhou ficam com o OCR especulado ou com o OCR
+      das imagens já renderizadas (resolver).
+    'ao_extrair' (assíncrona) recebe cada página vencida pelo OCR.
+    Contabiliza vitórias e trabalho desperdiçado em METRICAS["especulacao"].
+    """
 
-Retorne apenas um JSON válido com o resultado.
-"""
+    def __init__(self, especulacao: list[tuple[list[int], asyncio.Task]], indices: list[int], ao_extrair=None):
+        self.especulacao = especulacao
+        self.indices = set(indices)
+        self.ao_extrair = ao_extrair
+        self.nativa: asyncio.Task | None = None
+        self.textos: dict[int, str] = {}
+        self.vencedor: dict[int, str] = {}
+        self.falhas: set[int] = set()
+        self._ocr: dict[int, asyncio.Task] = {}
+        self._avisos: list[asyncio.Task] = []
+        self.metricas = METRICAS["especulacao"]
+        for _, tarefa in especulacao:
+            tarefa.add_done_callback(self._intervalo_renderizado)
 
-    try:
-        response = await asyncio.to_thread(
-            gemini_client.models.generate_content,
-            model=MODEL_GEMINI,
-            contents=prompt_completo
-        )
-        
-        json_text = response.text
-        # Remove markdown code blocks se existirem
-        json_text = re.sub(r'```json\s*', '', json_text)
-        json_text = re.sub(r'```\s*$', '', json_text)
-        json_text = json_text.strip()
-        
-        resultado = json.loads(json_text)
-        
-        print(f"DEBUG: Página {pagina_num} processada: {len(resultado.get('transactions', []))} transações encontradas.")
-        return resultado
+    def _vencer(self, indice: int, texto: str, estrategia: str):
+        self.textos[indice] = texto
+        self.vencedor[indice] = estrategia
+        if estrategia == "nativo":
+            self.metricas["vitorias_nativo"] += 1
+            ocr = self._ocr.pop(indice, None)
+            if ocr is not None and not ocr.done():
+                ocr.cancel()
+                self.metricas["chamadas_ocr_desperdicadas"] += 1
+            for indices, tarefa in self.especulacao:
+                if not tarefa.done() and all(self.vencedor.get(i) == "nativo" for i in indices):
+                    tarefa.cancel()
+                    self.metricas["tarefas_canceladas"] += 1
+        else:
+            self.metricas["vitorias_ocr"] += 1
+            if self.nativa is not None and not self.nativa.done() and self.indices <= self.vencedor.keys():
+                self.nativa.cancel()
+                self.metricas["nativas_canceladas"] += 1
+
+    # 16.1.1 - Resultados de cada lado
+    def nativas_extraidas(self, doc: DocumentHandle, indices: list[int]) -> list[int]:
+        """
+        Registra as páginas nativas prontas e retorna as que venceram.
+        """
+        vencidas = []
+        for i in indices:
+            if i in self.vencedor:
+                continue
+            texto = doc.texto(i).strip()
+            if len(texto) > 50:
+                self._vencer(i, texto, "nativo")
+                vencidas.append(i)
+            else:
+                self.falhas.add(i)
+        return vencidas
+
+    def _intervalo_renderizado(self, tarefa: asyncio.Task):
+        if tarefa.cancelled() or tarefa.exception():
+            return
+        for i, ocr in tarefa.result()["ocr"].items():
+            if self.vencedor.get(i) == "nativo":
+                ocr.cancel()
+                self.metricas["chamadas_ocr_desperdicadas"] += 1
+            else:
+                self._ocr[i] = ocr
+                ocr.add_done_callback(lambda ocr, i=i: self._ocr_terminou(i, ocr))
+
+    def _ocr_terminou(self, indice: int, ocr: asyncio.Task):
+        if ocr.cancelled():
+            return
+        if ocr.exception():
+            print(f"ERRO no OCR especulativo: {ocr.exception()}")
+            return
+        if indice in self.vencedor:
+            return
+        texto = next((r["texto"] for r in ocr.result() if r.get("sucesso") and r.get("texto")), None)
+        if texto:
+            self._vencer(indice, texto, "ocr")
+            if self.ao_extrair:
+                self._avisos.append(asyncio.ensure_future(self.ao_extrair(indice)))
+
+    # 16.1.2 - Desfecho
+    async def resolver(self) -> dict[int, str]:
+        """
+        Depois da extração nativa (terminada, cancelada ou interrompida pelo
+        prazo): espera o OCR das páginas em que a nativa falhou, cancela o
+        resto e retorna {indice_pagina: texto} de todas as páginas vencidas.
+        """
+        imagens_falhas = []
+        ocr_falhas = []
+        for indices, tarefa in self.especulacao:
+            faltam = [i for i in indices if i in self.falhas and i not in self.vencedor]
+            if not faltam:
+                if not tarefa.done():
+                    tarefa.cancel()
+                    self.metricas["tarefas_canceladas"] += 1
+                    continue
+            if tarefa.cancelled():
+                continue
+            try:
+                resultado = await tarefa
+            except Exception as e:
+                print(f"ERRO no OCR especulativo: {e}")
+                continue
+            for i, pagina in resultado["imagens"].items():
+                if self.vencedor.get(i) == "nativo":
+                    self.metricas["rasterizacoes_desperdicadas"] += 1
+                if i not in faltam:
+                    ocr = resultado["ocr"].get(i)
+                    if ocr is not None and not ocr.done():
+                        ocr.cancel()  # página que já tem vencedor ou ficou pendente pelo prazo
+                elif i in resultado["ocr"]:
+                    ocr_falhas.append((i, resultado["ocr"][i]))
+                else:
+                    imagens_falhas.append(pagina)
         
-    except Exception as e:
-        print(f"ERRO no processamento da página {pagina_num}: {e}")
-        return {
-            "success": False,
-            "transactions": [],
-            "error_message": f"Erro na página {pagina_num}: {str(e)}"
-        }
+        if imagens_falhas:
+            for i, texto in (await extrair_paginas_ocr(None, paginas_renderizadas=imagens_falhas, ao_extrair=self.ao_extrair)).items():
+                self._vencer(i, texto, "ocr")
+        await asyncio.gather(*(ocr for _, ocr in ocr_falhas), return_exceptions=True)
+        for i, ocr in ocr_falhas:
+            self._ocr_terminou(i, ocr)
+        await asyncio.gather(*self._avisos)
+        return dict(self.textos)
 
-# 17.5 - Função auxiliar para extrair meses das transações
-def extrair_meses_transacoes(transacoes: list[dict]) -> tuple[str, str]:
+    def cancelar(self):
+        for tarefa in [tarefa for _, tarefa in self.especulacao] + list(self._ocr.values()) + self._avisos:
+            tarefa.cancel()
+
+# 16.2 - Extrai o texto do documento escolhendo a estratégia por página
+async def extrair_paginas_documento(doc: DocumentHandle, estrategias: dict[int, str] | None = None,
+                                    ao_extrair=None) -> dict[int, str]:
     """
-    Extrai o mês da transação mais antiga (start_month) e mais nova (end_month).
-    Retorna uma tupla (start_month, end_month) no formato "YYYY-MM".
+    Classifica as páginas (ou usa a classificação recebida) e extrai cada uma
+    pela estratégia adequada: texto nativo (pdfplumber) nas páginas com camada
+    de texto utilizável e OCR nas digitalizadas ou com texto ilegível. Páginas
+    nativas que ainda assim voltam com pouco texto também caem para o OCR.
+    Páginas com outra estratégia (ex: "multimodal") são ignoradas aqui.
+    'ao_extrair' (assíncrona) recebe o índice de cada página assim que o
+    texto dela fica pronto (ex: para o evento "pagina_extraida").
+    Retorna {indice_pagina: texto} das páginas com texto válido.
     """
-    if not transacoes:
-        return None, None
+    if estrategias is None:
+        estrategias = await asyncio.to_thread(classificar_paginas, doc)
+    indices_nativos = [i for i, estrategia in estrategias.items() if estrategia == "nativo"]
+    indices_ocr = [i for i, estrategia in estrategias.items() if estrategia == "ocr"]
+    textos = {}
     
-    datas_validas = []
+    corrida = None
+    if ESPECULACAO_OCR and indices_nativos:
+        digitalizacao = indice_digitalizacao([doc.perfil(i) for i in doc.paginas])
+        if digitalizacao >= ESPECULACAO_LIMIAR:
+            print(f"DEBUG: Documento provavelmente digitalizado ({digitalizacao:.0%}), especulando OCR...")
+            corrida = CorridaEspeculativa(iniciar_especulacao_ocr(doc, indices_nativos), indices_nativos, ao_extrair)
     
-    for transacao in transacoes:
-        data_str = transacao.get('data', '')
-        if not data_str:
-            continue
-            
+    async def nativas_extraidas(indices: list[int]):
+        # Páginas com pouco texto só são avisadas se o OCR der certo
+        vencidas = corrida.nativas_extraidas(doc, indices) if corrida else [i for i in indices if len(doc.texto(i).strip()) > 50]
+        if ao_extrair:
+            for i in vencidas:
+                await ao_extrair(i)
+    
+    prazo = prazo_atual.get()
+    if indices_nativos:
+        print(f"DEBUG: Extração nativa em {len(indices_nativos)} páginas...")
+        nativa = asyncio.create_task(extrair_texto_nativo_por_paginas(doc, indices_nativos, nativas_extraidas))
+        if corrida:
+            corrida.nativa = nativa
         try:
-            # Tenta diferentes formatos de data
-            formatos = [
-                '%Y-%m-%d',    # 2024-01-15
-                '%d/%m/%Y',    # 15/01/2024
-                '%d-%m-%Y',    # 15-01-2024
-                '%m/%d/%Y',    # 01/15/2024
-                '%Y/%m/%d',    # 2024/01/15
-                '%d/%m/%y',    # 15/01/24
-                '%m/%d/%y',    # 01/15/24
-                '%y-%m-%d',    # 24-01-15
-            ]
-            
-            data_parseada = None
-            for formato in formatos:
-                try:
-                    data_parseada = datetime.strptime(data_str, formato)
-                    break
-                except ValueError:
-                    continue
+            await asyncio.wait([nativa], timeout=prazo.restante("extracao") if prazo else None)
+            if not nativa.done():
+                # As páginas já extraídas seguem; só as demais ficam pendentes
+                nativa.cancel()
+                await asyncio.gather(nativa, return_exceptions=True)
+                pendentes = [i for i in indices_nativos if not doc.tem_texto(i) and not (corrida and i in corrida.vencedor)]
+                print(f"AVISO: Prazo da extração nativa esgotado, {len(pendentes)} páginas ficam pendentes")
+                prazo.registrar_pendentes(i + 1 for i in pendentes)
+                indices_nativos = [i for i in indices_nativos if i not in pendentes]
+            elif nativa.cancelled():
+                print("DEBUG: OCR especulativo venceu todas as páginas, extração nativa cancelada")
+            else:
+                nativa.result()
             
-            if data_parseada:
-                datas_validas.append(data_parseada)
-                
-        except Exception as e:
-            print(f"DEBUG: Erro ao parsear data '{data_str}': {e}")
-            continue
+            if corrida:
+                textos.update(await corrida.resolver())
+            else:
+                for i in indices_nativos:
+                    texto_pagina = doc.texto(i).strip()
+                    if len(texto_pagina) > 50:
+                        textos[i] = texto_pagina
+                    else:
+                        indices_ocr.append(i)
+        except BaseException:
+            nativa.cancel()
+            if corrida:
+                corrida.cancelar()
+            raise
     
-    if not datas_validas:
-        return None, None
+    if indices_ocr:
+        print(f"DEBUG: Extração OCR em {len(indices_ocr)} páginas...")
+        textos.update(await extrair_paginas_ocr(doc, sorted(indices_ocr), ao_extrair=ao_extrair))
     
-    # Ordena as datas para encontrar a mais antiga e mais nova
-    datas_validas.sort()
+    print(f"DEBUG: Extração concluída: {len(textos)} páginas com texto ({len(indices_nativos)} nativas, {len(indices_ocr)} OCR)")
+    return textos
+
+async def extrair_texto_documento(doc: DocumentHandle) -> str | None:
+    """
+    Extrai o texto de todas as páginas (nativo ou OCR, por página).
+    Retorna o texto das páginas, na ordem original, separado por marcador.
+    """
+    textos = await extrair_paginas_documento(doc)
     
-    data_mais_antiga = datas_validas[0]
+    if not textos:
+        print("DEBUG: Extração falhou (nenhuma página com texto válido, nativo e OCR).")
+        return None
+    
+    texto_completo = "\n\n--- NOVA PÁGINA ---\n\n".join(textos[i] for i in sorted(textos))
+    print(f"DEBUG: Extração SUCESSO ({len(texto_completo)} caracteres).")
+    return texto_completo
+
+# 16.2.1 - Identifica o layout do emissor pela primeira página
+def identificar_modelo_layout(doc: DocumentHandle, textos: dict[int, str], estrategias: dict[int, str]) -> dict | None:
+    """
+    Monta a impressão digital da primeira página (texto, fontes e posição das
+    colunas, essas duas só em página nativa) e consulta o registro de modelos.
+    """
+    if not MODELOS_LAYOUT or not textos:
+        return None
+    
+    primeira = min(textos)
+    palavras, largura, fontes = None, None, ()
+    if estrategias.get(primeira) == "nativo":
+        try:
+            palavras = doc.palavras(primeira)
+            largura = doc.plumber.pages[primeira].width
+            fontes = doc.perfil(primeira).get("nomes_fontes", ())
+        except Exception as e:
+            print(f"ERRO ao ler o layout da página {primeira + 1}: {e}")
+    
+    modelo = registro_modelos.identificar(impressao_digital(textos[primeira], palavras, largura, fontes))
+    if modelo:
+        print(f"DEBUG: Layout identificado: {modelo['nome']} ({modelo['tipo']})")
+    return modelo
+
+# 16.2.2 - Remonta as tabelas das páginas nativas pelas coordenadas das palavras
+def reconstruir_paginas_nativas(doc: DocumentHandle, textos: dict[int, str], estrategias: dict[int, str],
+                                modelo: dict | None = None,
+                                periodo: tuple[int, int] | None = None) -> tuple[dict[int, str], dict[int, dict], list[dict]]:
+    """
+    Troca o texto de cada página nativa pela versão reconstruída por coordenadas
+    (colunas lado a lado separadas e lançamentos no formato 'data|descricao|valor').
+    Com PARSER_DETERMINISTICO ou um modelo de layout do tipo "parser", as páginas
+    sem ambiguidade já saem convertidas em transações e deixam de ir para a LLM,
+    com as datas sem ano no 'periodo' do documento.
+    Retorna (textos, posições das linhas reconstruídas para o boilerplate, resultados determinísticos).
+    """
+    if not EXTRACAO_COLUNAS:
+        return textos, {}, []
+    
+    usar_parser = PARSER_DETERMINISTICO or (modelo is not None and modelo["tipo"] == "parser")
+    extras = {"document_type": modelo["document_type"], "bank_name": modelo["banco"]} if modelo else {}
+    extras["periodo"] = periodo
+    
+    textos = dict(textos)
+    posicoes = {}
+    resultados = []
+    primeira = textos[min(textos)] if textos else ""
+    metricas = METRICAS["colunas"]
+    for indice in sorted(textos):
+        if estrategias.get(indice) != "nativo":
+            continue
+        try:
+            pagina = doc.plumber.pages[indice]
+            compacto, linhas = reconstruir_pagina(doc.palavras(indice), pagina.width)
+        except Exception as e:
+            print(f"ERRO ao reconstruir colunas da página {indice + 1}: {e}")
+            continue
+        tabulares = sum(1 for linha in linhas if linha["data"] and linha["valores"])
+        if not tabulares:
+            continue
+        
+        if usar_parser:
+            resultado = resultado_deterministico(linhas, f"{primeira}\n{textos[indice]}", indice + 1, **extras)
+            if resultado:
+                metricas["paginas_deterministicas"] += 1
+                metricas["transacoes_deterministicas"] += len(resultado["transactions"])
+                resultados.append(resultado)
+                del textos[indice]
+                continue
+        
+        metricas["paginas_reconstruidas"] += 1
+        metricas["linhas_tabulares"] += tabulares
+        metricas["tokens_antes"] += estimar_tokens(textos[indice])
+        metricas["tokens_depois"] += estimar_tokens(compacto)
+        altura = pagina.height or 1.0
+        posicoes[indice] = {}
+        for linha in linhas:
+            posicoes[indice].setdefault(normalizar_linha(linha["compacto"]), linha["top"] / altura)
+        textos[indice] = compacto
+    
+    if resultados:
+        print(f"DEBUG: Parser determinístico: {len(resultados)} páginas convertidas sem LLM")
+    return textos, posicoes, resultados
+
+# 16.3 - Remove cabeçalhos, rodapés e textos repetidos antes da categorização
+def limpar_boilerplate(doc: DocumentHandle, textos: dict[int, str], estrategias: dict[int, str],
+                       posicoes: dict[int, dict] | None = None) -> dict[int, str]:
+    """
+    Remove as linhas repetidas entre páginas (ver preprocessamento.remover_boilerplate),
+    usando as caixas de palavras do pdfplumber para posicionar as linhas das páginas nativas.
+    'posicoes' traz as posições já conhecidas (páginas reconstruídas por colunas).
+    Registra os tokens de entrada economizados no documento em METRICAS["boilerplate"].
+    """
+    if not REMOVER_BOILERPLATE or len(textos) < 2:
+        return textos
+    
+    posicoes = dict(posicoes or {})
+    def posicao_linha(indice: int, chave: str) -> float | None:
+        if estrategias.get(indice) != "nativo":
+            return None
+        if indice not in posicoes:
+            try:
+                posicoes[indice] = posicoes_linhas(doc, indice)
+            except Exception as e:
+                print(f"ERRO ao posicionar linhas da página {indice + 1}: {e}")
+                posicoes[indice] = {}
+        return posicoes[indice].get(chave)
+    
+    limpos, relatorio = remover_boilerplate(textos, posicao_linha)
+    
+    metricas = METRICAS["boilerplate"]
+    metricas["documentos"] += 1
+    for chave in ("linhas_removidas", "tokens_antes", "tokens_depois", "tokens_economizados"):
+        metricas[chave] += relatorio[chave]
+    print(f"DEBUG: Boilerplate: {relatorio['linhas_removidas']} linhas repetidas removidas, "
+          f"~{relatorio['tokens_economizados']} de {relatorio['tokens_antes']} tokens de entrada economizados")
+    return limpos
+
+# 16.4 - Envia à categorização só as linhas candidatas a transação
+def aplicar_prefiltro(textos: dict[int, str]) -> dict[int, str]:
+    """
+    Reduz cada página às linhas com data e valor (mais contexto), voltando para
+    a página inteira quando o filtro parece perder transações.
+    Registra a redução de tokens em METRICAS["prefiltro"].
+    """
+    if not PREFILTRO_TRANSACOES or not textos:
+        return textos
+    
+    filtrados, relatorio = prefiltrar_transacoes(textos)
+    
+    metricas = METRICAS["prefiltro"]
+    for chave in ("paginas_filtradas", "paginas_inteiras", "tokens_antes", "tokens_depois", "tokens_economizados"):
+        metricas[chave] += relatorio[chave]
+    print(f"DEBUG: Pré-filtro: {relatorio['paginas_filtradas']} páginas filtradas, {relatorio['paginas_inteiras']} inteiras, "
+          f"~{relatorio['tokens_depois']} de {relatorio['tokens_antes']} tokens de entrada")
+    return filtrados
+
+# 17 - Processa página individual
+def instrucao_periodo() -> str:
+    """
+    Período do documento em processamento para o prompt, com a mesma regra de
+    converter_data_periodo (parser e livro de transações); vazio se desconhecido.
+    """
+    periodo = periodo_atual.get()
+    if periodo is None:
+        return ""
+    ano, mes = periodo
+    return (f"\n**PERÍODO DO DOCUMENTO:** a data completa mais recente do documento é de {mes:02d}/{ano}. "
+            f"Nas datas sem ano, os meses até {mes:02d} são de {ano} e os meses depois de {mes:02d} são de {ano - 1}.\n")
+
+def blocos_prompt(extracao: bool, modelo: dict | None = None) -> tuple[str, str]:
+    """
+    Prompt de sistema e bloco de regras de categorização de cada etapa:
+    só extração (sem as categorias) ou extração + categorização, no contrato
+    de saída de VERSAO_PROMPT (v2: linhas delimitadas e códigos de subcategoria).
+    Com um modelo de layout identificado, acrescenta ao prompt de sistema o
+    banco, o tipo de documento e as instruções curtas do modelo; com o período
+    do documento conhecido, o ano das datas sem ano.
+    """
+    tabular = VERSAO_PROMPT == "v2"
+    if extracao:
+        sistema = PROMPT_EXTRACAO_TABULAR if tabular else PROMPT_EXTRACAO
+    else:
+        sistema = PROMPT_SISTEMA_TABULAR if tabular else PROMPT_SISTEMA
+    if modelo:
+        sistema += (f"\n**LAYOUT IDENTIFICADO:** banco {modelo['banco']}, documento {modelo['document_type']}. "
+                    f"Use esse banco e esse tipo de documento na resposta.\n"
+                    f"{modelo.get('instrucoes', '')}\n")
+    sistema += instrucao_periodo()
+    if extracao:
+        return sistema, ""
+    return sistema, f"**REGRAS DE CATEGORIZAÇÃO:**\n{CATEGORIAS_CODIFICADAS if tabular else CATEGORIAS_COMPLETAS}\n"
+
+async def processar_pagina_individual(texto_pagina: str, pagina_num: int, extracao: bool = False,
+                                      modelo: dict | None = None) -> dict:
+    """
+    Processa uma página individual de texto e retorna as transações encontradas.
+    Com extracao=True, as transações vêm sem categoria (categorizadas depois, em lote).
+    """
+    print(f"DEBUG: Processando página {pagina_num} ({len(texto_pagina)} caracteres)...")
+    sistema, regras = blocos_prompt(extracao, modelo)
+    
+    prompt_completo = f"""
+{sistema}
+
+Analise esta página {pagina_num} de extrato financeiro e extraia TODAS as transações.
+
+{regras}
+**TEXTO DA PÁGINA {pagina_num}:**
+{texto_pagina}
+
+{instrucao_retorno()}
+"""
+
+    try:
+        response = await chamar_gemini(prompt_completo)
+        
+        resultado = interpretar_resposta(response.text, extracao)
+        for transacao in resultado.get("transactions", []):
+            transacao["pagina"] = pagina_num
+        
+        print(f"DEBUG: Página {pagina_num} processada: {len(resultado.get('transactions', []))} transações encontradas.")
+        return resultado
+        
+    except Exception as e:
+        print(f"ERRO no processamento da página {pagina_num}: {e}")
+        return {
+            "success": False,
+            "transactions": [],
+            "error_message": f"Erro na página {pagina_num}: {str(e)}"
+        }
+
+# 17.1 - Processa um pacote de páginas consecutivas em uma única chamada
+async def processar_pacote_paginas(pacote: list[tuple[int, str]], extracao: bool = False,
+                                   modelo: dict | None = None) -> list[dict]:
+    """
+    Envia várias páginas em um único prompt (economizando a repetição do prompt
+    de sistema) e mantém a página de origem em cada transação.
+    Se a resposta estourar o limite de saída ou vier inválida, divide o pacote
+    ao meio e tenta de novo. Retorna a lista de resultados (um por chamada).
+    """
+    if len(pacote) == 1:
+        pagina_num, texto_pagina = pacote[0]
+        return [await processar_pagina_individual(texto_pagina, pagina_num, extracao, modelo)]
+    
+    numeros = [n for n, _ in pacote]
+    print(f"DEBUG: Processando pacote com páginas {numeros}...")
+    METRICAS["empacotamento"]["chamadas_categorizacao"] += 1
+    METRICAS["empacotamento"]["paginas_categorizacao"] += len(pacote)
+    
+    paginas_formatadas = "\n\n".join(f"=== PÁGINA {n} ===\n{texto}" for n, texto in pacote)
+    sistema, regras = blocos_prompt(extracao, modelo)
+    prompt_completo = f"""
+{sistema}
+
+Analise estas {len(pacote)} páginas de extrato financeiro e extraia TODAS as transações de TODAS as páginas.
+Cada página começa com uma linha "=== PÁGINA N ===".
+Inclua em cada transação o campo "pagina" com o número N da página de onde ela foi extraída.
+
+{regras}
+**TEXTO DAS PÁGINAS:**
+{paginas_formatadas}
+
+{instrucao_retorno()}
+"""
+
+    try:
+        response = await chamar_gemini(prompt_completo)
+    except Exception as e:
+        print(f"ERRO no processamento do pacote {numeros}: {e}")
+        return [{
+            "success": False,
+            "transactions": [],
+            "error_message": f"Erro nas páginas {numeros[0]}-{numeros[-1]}: {str(e)}"
+        }]
+    
+    try:
+        if resposta_truncada(response):
+            raise ValueError("resposta excedeu o limite de tokens de saída")
+        resultado = interpretar_resposta(response.text, extracao)
+    except ValueError as e:
+        # Saída cortada ou JSON inválido: divide o pacote e tenta com menos páginas
+        print(f"DEBUG: Pacote {numeros} falhou ({e}), dividindo...")
+        METRICAS["empacotamento"]["pacotes_divididos"] += 1
+        metade_a, metade_b = dividir_pacote(pacote)
+        resultados = await asyncio.gather(processar_pacote_paginas(metade_a, extracao, modelo), processar_pacote_paginas(metade_b, extracao, modelo))
+        return resultados[0] + resultados[1]
+    
+    for transacao in resultado.get("transactions", []):
+        if transacao.get("pagina") not in numeros:
+            transacao["pagina"] = numeros[0]
+    
+    print(f"DEBUG: Pacote {numeros} processado: {len(resultado.get('transactions', []))} transações encontradas.")
+    return [resultado]
+
+def empacotar_paginas_texto(paginas: list[tuple[int, str]]) -> list[list[tuple[int, str]]]:
+    """
+    Agrupa páginas de texto consecutivas pelo orçamento de tokens de entrada
+    (EMPACOTAMENTO_TOKENS) e pela saída estimada (LIMITE_TOKENS_SAIDA).
+    Com EMPACOTAMENTO desligado, mantém uma página por chamada.
+    """
+    if not EMPACOTAMENTO:
+        return [[pagina] for pagina in paginas]
+    por_transacao = TOKENS_SAIDA_POR_TRANSACAO_TABULAR if VERSAO_PROMPT == "v2" else TOKENS_SAIDA_POR_TRANSACAO
+    return empacotar_paginas(
+        paginas,
+        (EMPACOTAMENTO_TOKENS, lambda p: estimar_tokens(p[1])),
+        (LIMITE_TOKENS_SAIDA, lambda p: estimar_tokens_saida(p[1], por_transacao)),
+    )
+
+# 17.2 - Modo multimodal: OCR e categorização na mesma chamada por página digitalizada
+def validar_modo_pipeline(modo_pipeline: str | None) -> str:
+    """
+    Retorna o modo do pipeline pedido (ou o padrão MODO_PIPELINE).
+    Levanta HTTPException 400 para um modo desconhecido.
+    """
+    modo = (modo_pipeline or MODO_PIPELINE).lower()
+    if modo not in MODOS_PIPELINE:
+        raise HTTPException(status_code=400, detail=f"modo_pipeline inválido: '{modo}'. Use um de: {', '.join(MODOS_PIPELINE)}.")
+    return modo
+
+def rotear_paginas_multimodal(doc: DocumentHandle, estrategias: dict[int, str], modo: str) -> dict[int, str]:
+    """
+    Marca como "multimodal" as páginas de OCR que irão direto da imagem para o JSON.
+    - "multimodal": todas as páginas que precisariam de OCR
+    - "auto": só as páginas cuja imagem cabe em MULTIMODAL_MAX_TOKENS_IMAGEM; páginas
+      grandes e densas continuam em duas etapas, em que o texto é categorizado em pacotes
+    - "duas_etapas": nenhuma
+    """
+    if modo == "duas_etapas":
+        return estrategias
+    roteadas = dict(estrategias)
+    for i, estrategia in estrategias.items():
+        if estrategia != "ocr":
+            continue
+        if modo == "auto" and estimar_tokens_imagem(*estimar_dimensoes(doc, i)) > MULTIMODAL_MAX_TOKENS_IMAGEM:
+            METRICAS["multimodal"]["paginas_duas_etapas"] += 1
+            continue
+        roteadas[i] = "multimodal"
+    return roteadas
+
+async def processar_pacote_multimodal(paginas: list[dict]) -> list[dict]:
+    """
+    Envia as imagens de um pacote de páginas junto com o prompt de categorização
+    e recebe direto o JSON de transações, sem a etapa intermediária de texto.
+    Se a resposta estourar o limite de saída ou vier inválida, divide o pacote.
+    Retorna a lista de resultados (um por chamada); em caso de falha, o resultado
+    traz "paginas_falhas" para que essas páginas sigam pelo caminho em duas etapas.
+    """
+    numeros = [p["pagina"] for p in paginas]
+    print(f"DEBUG: Processando páginas {numeros} no modo multimodal...")
+    METRICAS["multimodal"]["chamadas"] += 1
+    METRICAS["multimodal"]["paginas"] += len(paginas)
+    
+    contents = [{"text": f"""
+{PROMPT_SISTEMA}
+{instrucao_periodo()}
+As imagens a seguir são {len(paginas)} página(s) de extrato financeiro digitalizado.
+Leia cada imagem, extraia TODAS as transações e categorize-as.
+Cada imagem é precedida pelo seu número de página.
+Inclua em cada transação o campo "pagina" com o número da página de onde ela foi extraída.
+
+**REGRAS DE CATEGORIZAÇÃO:**
+{CATEGORIAS_COMPLETAS}
+
+Retorne apenas um JSON válido com o resultado.
+"""}]
+    for pagina in paginas:
+        contents.append({"text": f"Página {pagina['pagina']}:"})
+        contents.append(montar_imagem_part(pagina)["imagem"])
+    
+    try:
+        response = await chamar_gemini(contents)
+        if resposta_truncada(response):
+            raise ValueError("resposta excedeu o limite de tokens de saída")
+        resultado = json.loads(limpar_json_resposta(response.text))
+    except ValueError as e:
+        if len(paginas) > 1:
+            print(f"DEBUG: Pacote multimodal {numeros} falhou ({e}), dividindo...")
+            METRICAS["multimodal"]["pacotes_divididos"] += 1
+            metade_a, metade_b = dividir_pacote(paginas)
+            resultados = await asyncio.gather(processar_pacote_multimodal(metade_a), processar_pacote_multimodal(metade_b))
+            return resultados[0] + resultados[1]
+        print(f"ERRO no modo multimodal da página {numeros[0]}: {e}")
+        return [{"success": False, "transactions": [], "paginas_falhas": numeros,
+                 "error_message": f"Erro na página {numeros[0]}: {str(e)}"}]
+    except Exception as e:
+        print(f"ERRO no modo multimodal das páginas {numeros}: {e}")
+        return [{"success": False, "transactions": [], "paginas_falhas": numeros,
+                 "error_message": f"Erro nas páginas {numeros[0]}-{numeros[-1]}: {str(e)}"}]
+    
+    for transacao in resultado.get("transactions", []):
+        if transacao.get("pagina") not in numeros:
+            transacao["pagina"] = numeros[0]
+    
+    print(f"DEBUG: Páginas {numeros} (multimodal): {len(resultado.get('transactions', []))} transações encontradas.")
+    return [resultado]
+
+async def processar_paginas_multimodal(doc: DocumentHandle, indices: list[int], notificar=None) -> list[dict]:
+    """
+    Renderiza as páginas sob demanda (mesmo empacotamento e orçamento de memória
+    do OCR) e processa cada pacote no modo multimodal assim que fica pronto.
+    Páginas em que a chamada multimodal falhou são refeitas em duas etapas
+    (OCR + categorização do texto), se ainda houver prazo.
+    Com 'notificar', emite os eventos de cada pacote assim que ele termina.
+    """
+    async def processar_e_liberar(renderizadas: list[dict]) -> list[dict]:
+        for pagina in renderizadas:
+            METRICAS["rasterizacao"]["paginas_renderizadas"] += 1
+            METRICAS["rasterizacao"]["bytes_enviados"] += len(pagina["dados"])
+        try:
+            resultados = await processar_pacote_multimodal(renderizadas)
+        finally:
+            for pagina in renderizadas:
+                await orcamento_memoria.liberar(pagina.get("reserva", 0))
+        if notificar:
+            falhas = {n for r in resultados for n in r.get("paginas_falhas", [])}
+            numeros = [p["pagina"] for p in renderizadas if p["pagina"] not in falhas]
+            if numeros:
+                await notificar_paginas(notificar, numeros, [r for r in resultados if "paginas_falhas" not in r])
+        return resultados
+    
+    tasks, paginas_tasks = [], []
+    prazo = prazo_atual.get()
+    pacotes = await asyncio.to_thread(empacotar_paginas_ocr, doc, indices)
+    for pacote in pacotes:
+        if prazo and prazo.esgotado("llm"):
+            prazo.registrar_pendentes(i + 1 for i in pacote)
+            continue
+        renderizadas = [pagina async for pagina in rasterizar_paginas(doc, pacote)]
+        if renderizadas:
+            tasks.append(asyncio.create_task(processar_e_liberar(renderizadas)))
+            paginas_tasks.append([p["pagina"] for p in renderizadas])
+    
+    resultados = []
+    _, pendentes = await aguardar_no_prazo(tasks, "llm")
+    for task, numeros in zip(tasks, paginas_tasks):
+        if task in pendentes:
+            print(f"AVISO: Prazo esgotado no modo multimodal, páginas {numeros} ficam pendentes")
+            prazo.registrar_pendentes(numeros)
+        else:
+            resultados.extend(task.result())
+    
+    falhas = sorted(n - 1 for r in resultados for n in r.pop("paginas_falhas", []))
+    if falhas and prazo and prazo.esgotado("llm"):
+        prazo.registrar_pendentes(i + 1 for i in falhas)
+        resultados = [r for r in resultados if r.get("success", True)]
+    elif falhas:
+        print(f"DEBUG: {len(falhas)} páginas falharam no modo multimodal, refazendo em duas etapas...")
+        METRICAS["multimodal"]["fallbacks_duas_etapas"] += len(falhas)
+        textos = await extrair_paginas_ocr(doc, falhas)
+        if textos:
+            resultados = [r for r in resultados if r.get("success", True)]
+            try:
+                resultados.append(await categorizar_com_llm([(i + 1, textos[i]) for i in sorted(textos)], notificar=notificar))
+            except HTTPException as e:
+                resultados.append({"success": False, "transactions": [], "error_message": e.detail})
+    return resultados
+
+# 17.5 - Função auxiliar para extrair meses das transações
+def extrair_meses_transacoes(transacoes: list[dict]) -> tuple[str, str]:
+    """
+    Extrai o mês da transação mais antiga (start_month) e mais nova (end_month).
+    Retorna uma tupla (start_month, end_month) no formato "YYYY-MM".
+    """
+    if not transacoes:
+        return None, None
+    
+    datas_validas = []
+    
+    for transacao in transacoes:
+        data_str = transacao.get('data', '')
+        if not data_str:
+            continue
+            
+        try:
+            # Tenta diferentes formatos de data
+            formatos = [
+                '%Y-%m-%d',    # 2024-01-15
+                '%d/%m/%Y',    # 15/01/2024
+                '%d-%m-%Y',    # 15-01-2024
+                '%m/%d/%Y',    # 01/15/2024
+                '%Y/%m/%d',    # 2024/01/15
+                '%d/%m/%y',    # 15/01/24
+                '%m/%d/%y',    # 01/15/24
+                '%y-%m-%d',    # 24-01-15
+            ]
+            
+            data_parseada = None
+            for formato in formatos:
+                try:
+                    data_parseada = datetime.strptime(data_str, formato)
+                    break
+                except ValueError:
+                    continue
+            
+            if data_parseada:
+                datas_validas.append(data_parseada)
+                
+        except Exception as e:
+            print(f"DEBUG: Erro ao parsear data '{data_str}': {e}")
+            continue
+    
+    if not datas_validas:
+        return None, None
+    
+    # Ordena as datas para encontrar a mais antiga e mais nova
+    datas_validas.sort()
+    
+    data_mais_antiga = datas_validas[0]
     data_mais_nova = datas_validas[-1]
     
     start_month = data_mais_antiga.strftime('%Y-%m')
@@ -812,83 +2070,271 @@ def consolidar_resultados_paginas(resultados_paginas: list[dict]) -> dict:
     return resultado_final
 
 # 18 - Decide estratégia baseada no tamanho do texto
-async def categorizar_com_llm(texto_bruto: str) -> dict:
+async def categorizar_com_llm(texto_bruto: str | list[tuple[int, str]], modelo: dict | None = None,
+                              notificar=None) -> dict:
     """
     Recebe o texto bruto e processa usando páginas paralelas para melhor performance
     e captura mais completa de transações.
+    Aceita também a lista [(numero_pagina, texto)], preservando a numeração real das páginas.
+    'modelo' é o modelo de layout identificado (instruções específicas do emissor no prompt).
+    Com 'notificar' (streaming), cada pacote é categorizado e emitido assim que
+    termina, em vez de esperar o lote único de descrições do documento.
+    Com prazo, os pacotes que não terminam até o marco da LLM são cancelados e
+    suas páginas ficam pendentes.
     """
     print("DEBUG: Iniciando Etapa 3: Análise e Categorização (Processamento Paralelo por Páginas)...")
     
     # Verifica se o texto contém múltiplas páginas
-    paginas = texto_bruto.split("\n\n--- NOVA PÁGINA ---\n\n")
+    if isinstance(texto_bruto, str):
+        paginas = [(i + 1, pagina.strip()) for i, pagina in enumerate(texto_bruto.split("\n\n--- NOVA PÁGINA ---\n\n"))]
+    else:
+        paginas = texto_bruto
+    paginas_validas = [(n, pagina) for n, pagina in paginas if pagina]
+    
+    extracao = CATEGORIZACAO_SEPARADA
     
-    if len(paginas) <= 1:
+    if len(paginas_validas) <= 1:
         print("DEBUG: Texto pequeno ou página única, processamento direto...")
+        pagina_num, texto_bruto = paginas_validas[0] if paginas_validas else (1, "")
+        sistema, regras = blocos_prompt(extracao, modelo)
+        tarefa = "extraia TODAS as transações" if extracao else "extraia TODAS as transações, categorize-as"
         
         prompt_completo = f"""
-{PROMPT_SISTEMA}
+{sistema}
 
 Aqui está o texto bruto extraído de um documento financeiro.
-Analise-o, extraia TODAS as transações, categorize-as e retorne o JSON formatado.
-
-**REGRAS DE CATEGORIZAÇÃO:**
-{CATEGORIAS_COMPLETAS}
+Analise-o, {tarefa} e retorne o resultado formatado.
 
+{regras}
 **TEXTO BRUTO PARA ANÁLISE:**
 {texto_bruto}
 
-Retorne apenas um JSON válido com o resultado.
+{instrucao_retorno()}
 """
 
         try:
-            response = await asyncio.to_thread(
-                gemini_client.models.generate_content,
-                model=MODEL_GEMINI,
-                contents=prompt_completo
-            )
-            
-            json_text = response.text
-            # Remove markdown code blocks se existirem
-            json_text = re.sub(r'```json\s*', '', json_text)
-            json_text = re.sub(r'```\s*$', '', json_text)
-            json_text = json_text.strip()
+            response = await chamar_gemini(prompt_completo)
             
-            json_output = json.loads(json_text) 
+            json_output = interpretar_resposta(response.text, extracao)
+            for transacao in json_output.get("transactions", []):
+                transacao["pagina"] = pagina_num
             
             print("DEBUG: Análise direta concluída com SUCESSO.")
-            return json_output
             
+        except TimeoutError as e:
+            prazo = prazo_atual.get()
+            if not prazo:
+                print(f"ERRO na análise direta: {e}")
+                raise HTTPException(status_code=504, detail="Tempo esgotado na chamada à LLM")
+            print(f"AVISO: Prazo esgotado na análise direta, página {pagina_num} fica pendente")
+            prazo.registrar_pendentes([pagina_num])
+            return {"success": False, "transactions": [], "error_message": f"Prazo esgotado na página {pagina_num}"}
         except Exception as e:
             print(f"ERRO na análise direta: {e}")
             raise HTTPException(status_code=500, detail=f"Erro na LLM: {e}")
+        
+        if extracao:
+            await categorizar_transacoes(json_output.get("transactions", []))
+        if notificar:
+            await notificar_paginas(notificar, [pagina_num], [json_output])
+        return json_output
     
     else:
-        print(f"DEBUG: Múltiplas páginas detectadas ({len(paginas)}), usando processamento paralelo por página...")
+        print(f"DEBUG: Múltiplas páginas detectadas ({len(paginas_validas)}), usando processamento paralelo por página...")
+        
+        pacotes = empacotar_paginas_texto(paginas_validas)
+        print(f"DEBUG: {len(paginas_validas)} páginas agrupadas em {len(pacotes)} chamadas.")
+        
+        async def processar_e_notificar(pacote: list[tuple[int, str]]) -> list[dict]:
+            numeros = [n for n, _ in pacote]
+            try:
+                resultados = await processar_pacote_paginas(pacote, extracao, modelo)
+            except Exception as e:
+                await notificar({"evento": "erro_pagina", "paginas": numeros, "error_message": str(e)})
+                raise
+            if extracao:
+                await categorizar_transacoes([t for r in resultados for t in r.get("transactions", [])])
+            await notificar_paginas(notificar, numeros, resultados)
+            return resultados
         
-        tasks = [
-            processar_pagina_individual(pagina.strip(), i + 1) 
-            for i, pagina in enumerate(paginas) if pagina.strip()
-        ]
+        if notificar:
+            tasks = [asyncio.create_task(processar_e_notificar(pacote)) for pacote in pacotes]
+        else:
+            tasks = [asyncio.create_task(processar_pacote_paginas(pacote, extracao, modelo)) for pacote in pacotes]
         
-        resultados_paginas = await asyncio.gather(*tasks, return_exceptions=True)
+        _, pendentes = await aguardar_no_prazo(tasks, "llm")
         
         resultados_validos = []
-        for i, resultado in enumerate(resultados_paginas):
+        for pacote, task in zip(pacotes, tasks):
+            if task in pendentes:
+                numeros = [n for n, _ in pacote]
+                print(f"AVISO: Prazo esgotado, página(s) {numeros} ficam pendentes")
+                prazo_atual.get().registrar_pendentes(numeros)
+                continue
+            resultado = task.exception() or task.result()
             if isinstance(resultado, Exception):
-                print(f"ERRO na página {i + 1}: {resultado}")
+                numeros = ", ".join(str(n) for n, _ in pacote)
+                print(f"ERRO na(s) página(s) {numeros}: {resultado}")
                 resultados_validos.append({
                     "success": False,
                     "transactions": [],
-                    "error_message": f"Erro na página {i + 1}: {str(resultado)}"
+                    "error_message": f"Erro na(s) página(s) {numeros}: {str(resultado)}"
                 })
             else:
-                resultados_validos.append(resultado)
+                resultados_validos.extend(resultado)
         
         resultado_final = consolidar_resultados_paginas(resultados_validos)
+        if extracao and not notificar:
+            await categorizar_transacoes(resultado_final["transactions"])
         
         print(f"DEBUG: Processamento paralelo por páginas concluído. Total de transações: {resultado_final['transactions_count']}")
         return resultado_final
 
+# 18.1 - Categoriza uma vez cada descrição única do documento
+def agrupar_por_descricao(transacoes: list[dict]) -> dict[str, list[dict]]:
+    """
+    Agrupa as transações pela descrição normalizada (limpar_descricao_para_match),
+    para que "IFOOD *RESTAURANTE" repetido dezenas de vezes seja categorizado uma vez só.
+    """
+    grupos = {}
+    for transacao in transacoes:
+        chave = limpar_descricao_para_match(transacao.get("descricao", "")) or transacao.get("descricao", "").strip().lower()
+        grupos.setdefault(chave, []).append(transacao)
+    return grupos
+
+async def categorizar_lote_descricoes(descricoes: list[str]) -> dict[int, dict]:
+    """
+    Categoriza uma lista de descrições em uma única chamada.
+    Retorna {posicao_na_lista: {"categoria", "subcategoria"}}; descrições que a
+    resposta não trouxer ficam de fora.
+    """
+    METRICAS["categorizacao"]["chamadas"] += 1
+    lista = "\n".join(f"{i + 1}. {descricao}" for i, descricao in enumerate(descricoes))
+    tabular = VERSAO_PROMPT == "v2"
+    prompt_completo = f"""
+{PROMPT_CATEGORIZACAO_TABULAR if tabular else PROMPT_CATEGORIZACAO}
+
+**REGRAS DE CATEGORIZAÇÃO:**
+{CATEGORIAS_CODIFICADAS if tabular else CATEGORIAS_COMPLETAS}
+
+**DESCRIÇÕES PARA CATEGORIZAR ({len(descricoes)}):**
+{lista}
+
+{instrucao_retorno()}
+"""
+    try:
+        response = await chamar_gemini(prompt_completo)
+        if resposta_truncada(response):
+            raise ValueError("resposta excedeu o limite de tokens de saída")
+        if tabular:
+            itens = [{"id": i, **c} for i, c in interpretar_categorias_tabular(response.text).items()]
+        else:
+            itens = json.loads(limpar_json_resposta(response.text)).get("categorias", [])
+    except ValueError as e:
+        if len(descricoes) > 1:
+            print(f"DEBUG: Lote de {len(descricoes)} descrições falhou ({e}), dividindo...")
+            meio = len(descricoes) // 2
+            parte_a, parte_b = await asyncio.gather(
+                categorizar_lote_descricoes(descricoes[:meio]), categorizar_lote_descricoes(descricoes[meio:])
+            )
+            return {**parte_a, **{meio + i: c for i, c in parte_b.items()}}
+        print(f"ERRO na categorização da descrição '{descricoes[0]}': {e}")
+        return {}
+    except Exception as e:
+        print(f"ERRO na categorização em lote: {e}")
+        return {}
+    
+    categorias = {}
+    for item in itens:
+        try:
+            posicao = int(item.get("id")) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= posicao < len(descricoes) and item.get("categoria"):
+            categorias[posicao] = {"categoria": item["categoria"], "subcategoria": item.get("subcategoria", "Outros")}
+    return categorias
+
+def aplicar_categoria(transacoes: list[dict], categoria: dict):
+    """
+    Aplica {"categoria", "subcategoria"} a todas as ocorrências de uma descrição.
+    """
+    for transacao in transacoes:
+        transacao.setdefault("uuid", "1")
+        transacao["categoria"] = categoria["categoria"]
+        transacao["subcategoria"] = categoria["subcategoria"]
+
+async def categorizar_transacoes(transacoes: list[dict]):
+    """
+    Preenche categoria e subcategoria das transações extraídas: deduplica as
+    descrições, consulta o cache global de estabelecimentos e o categorizador
+    local por palavras-chave, e categoriza na LLM só as descrições desconhecidas
+    ou ambíguas, uma vez cada (em lotes paralelos de CATEGORIZACAO_LOTE),
+    aplicando o resultado a todas as ocorrências.
+    As respostas da LLM alimentam o cache. Descrições sem resposta ficam em DIVERSOS > Outros.
+    """
+    grupos = agrupar_por_descricao(transacoes)
+    if not grupos:
+        return
+    
+    chaves = []
+    no_cache = locais = 0
+    for chave, grupo in grupos.items():
+        categoria = cache_estabelecimentos.consultar(chave) if CACHE_ESTABELECIMENTOS else None
+        if categoria:
+            no_cache += 1
+        elif CATEGORIZACAO_LOCAL:
+            categoria = categorizador_local.categorizar(grupo[0].get("descricao", chave))
+            locais += 1 if categoria else 0
+        if categoria:
+            aplicar_categoria(grupo, categoria)
+        else:
+            chaves.append(chave)
+    
+    print(f"DEBUG: {len(grupos)} descrições únicas ({len(transacoes)} transações): "
+          f"{no_cache} no cache, {locais} por palavra-chave, {len(chaves)} para a LLM...")
+    metricas = METRICAS["categorizacao"]
+    metricas["transacoes"] += len(transacoes)
+    metricas["descricoes_unicas"] += len(grupos)
+    metricas["descricoes_cache"] += no_cache
+    metricas["descricoes_locais"] += locais
+    metricas["descricoes_llm"] += len(chaves)
+    if not chaves:
+        return
+    
+    descricoes = [grupos[chave][0].get("descricao", chave) for chave in chaves]
+    inicios = range(0, len(descricoes), CATEGORIZACAO_LOTE)
+    lotes = await asyncio.gather(*[categorizar_lote_descricoes(descricoes[i:i + CATEGORIZACAO_LOTE]) for i in inicios])
+    
+    for inicio, categorias in zip(inicios, lotes):
+        for posicao, chave in enumerate(chaves[inicio:inicio + CATEGORIZACAO_LOTE]):
+            categoria = categorias.get(posicao)
+            if categoria is None:
+                METRICAS["categorizacao"]["descricoes_sem_categoria"] += 1
+                categoria = {"categoria": "DIVERSOS", "subcategoria": "Outros"}
+            elif CACHE_ESTABELECIMENTOS:
+                cache_estabelecimentos.registrar(chave, categoria["categoria"], categoria["subcategoria"])
+            aplicar_categoria(grupos[chave], categoria)
+    
+    if CACHE_ESTABELECIMENTOS and cache_estabelecimentos.precisa_salvar():
+        gerenciador_encerramento.gravar_depois(asyncio.to_thread(cache_estabelecimentos.salvar))
+
+# 18.2 - Eventos de página para o streaming
+async def notificar_paginas(notificar, numeros: list[int], resultados: list[dict]):
+    """
+    Emite um evento "pagina_categorizada" por página (mesmo sem transações) com
+    as transações dela, e "erro_pagina" para os resultados que falharam por
+    outro motivo que não a ausência de transações.
+    """
+    por_pagina = {n: [] for n in numeros}
+    for resultado in resultados:
+        for transacao in resultado.get("transactions", []):
+            por_pagina.setdefault(transacao.get("pagina", numeros[0]), []).append(transacao)
+        erro = resultado.get("error_message")
+        if not resultado.get("success", True) and erro and "Nenhuma transação encontrada" not in erro:
+            await notificar({"evento": "erro_pagina", "paginas": numeros, "error_message": erro})
+    for numero in sorted(por_pagina):
+        await notificar({"evento": "pagina_categorizada", "pagina": numero, "transactions": por_pagina[numero]})
+
 # 19 - Aplica categorização personalizada
 async def categorizar_com_llm_personalizado(texto_bruto: str, user_id: int) -> dict:
     """
@@ -901,6 +2347,13 @@ async def categorizar_com_llm_personalizado(texto_bruto: str, user_id: int) -> d
     
     categorizacoes_usuario, resultado_llm = await asyncio.gather(task_categorizacoes, task_llm)
     
+    return aplicar_personalizacao(resultado_llm, categorizacoes_usuario, user_id)
+
+def aplicar_personalizacao(resultado_llm: dict, categorizacoes_usuario: dict[str, dict], user_id: int) -> dict:
+    """
+    Aplica as categorizações do usuário ao resultado da LLM e agenda a
+    inserção das novas categorizações no Supabase.
+    """
     if resultado_llm.get("success", False) and resultado_llm.get("transactions"):
         transacoes_atualizadas, transacoes_para_inserir = aplicar_categorizacoes_personalizadas(
             resultado_llm["transactions"], 
@@ -911,37 +2364,613 @@ async def categorizar_com_llm_personalizado(texto_bruto: str, user_id: int) -> d
         resultado_llm["transactions_count"] = len(transacoes_atualizadas)
         
         if transacoes_para_inserir:
-            asyncio.create_task(inserir_categorizacoes_usuario(user_id, transacoes_para_inserir))
+            # Os próximos documentos do mesmo lote reconhecem as novas categorizações sem inseri-las de novo
+            for item in transacoes_para_inserir:
+                if item["treated_name"]:
+                    categorizacoes_usuario.setdefault(item["treated_name"], {"categoria": item["category"], "subcategoria": item["subcategory"]})
+            gerenciador_encerramento.gravar_depois(inserir_categorizacoes_usuario(user_id, transacoes_para_inserir))
     
     return resultado_llm
 
+# 19.0.1 - Resultado final do documento a partir das partes
+def montar_resultado_documento(resultado_texto: dict | None, resultados_outros: list[dict], modelo: dict | None,
+                               consolidar: bool = False) -> dict:
+    """
+    Junta o resultado das páginas de texto com os das páginas do parser e do
+    multimodal (o de texto sai como está se for o único e 'consolidar' for
+    falso) e completa banco e tipo de documento pelo modelo de layout.
+    """
+    if not resultados_outros and not consolidar:
+        resultado = resultado_texto
+    else:
+        resultado = consolidar_resultados_paginas(([resultado_texto] if resultado_texto else []) + resultados_outros)
+    
+    if modelo:
+        if resultado.get("bank_name") in (None, "", "TBD"):
+            resultado["bank_name"] = modelo["banco"]
+        if resultado.get("document_type") in (None, "", "unknown"):
+            resultado["document_type"] = modelo["document_type"]
+    return resultado
+
+# 19.0.2 - Artefatos intermediários do processamento
+def coletar_artefatos(doc: DocumentHandle, estrategias: dict[int, str], textos_extraidos: dict[int, str],
+                      textos_llm: dict[int, str], resultados_parser: list[dict], resultados_multimodal: list[dict],
+                      modelo: dict | None, saidas_llm: list[dict], user_id: int) -> tuple[str, dict]:
+    """
+    Monta (em uma thread) os artefatos do documento no formato de
+    ArmazemArtefatos.salvar, com as páginas a partir de 1, e retorna
+    (sha256 do PDF, artefatos). Os resultados saem já serializados, porque
+    as transações ainda são alteradas depois (categorizações do usuário).
+    """
+    renderizacao = {}
+    for i, estrategia in estrategias.items():
+        if estrategia in ("ocr", "multimodal"):
+            with doc.trava_fitz:
+                rect = doc.fitz[i].rect
+                dpi = escolher_dpi(rect, doc.perfil(i))
+            renderizacao[i + 1] = {"estrategia": estrategia, "dpi": dpi, "largura_px": int(rect.width / 72 * dpi),
+                                   "altura_px": int(rect.height / 72 * dpi)}
+    return hashlib.sha256(doc.pdf_bytes).hexdigest(), {
+        "user_id": user_id,
+        "paginas": len(doc),
+        "tamanho_bytes": len(doc.pdf_bytes),
+        "modelo_layout": modelo["nome"] if modelo else None,
+        "estrategias": {i + 1: estrategia for i, estrategia in estrategias.items()},
+        "textos_extraidos": {i + 1: texto for i, texto in textos_extraidos.items()},
+        "textos_llm": {i + 1: texto for i, texto in textos_llm.items()},
+        "renderizacao": renderizacao,
+        RESULTADOS_PARSER: json.dumps(resultados_parser, ensure_ascii=False),
+        RESULTADOS_MULTIMODAL: json.dumps(resultados_multimodal, ensure_ascii=False),
+        "versao_prompt": VERSAO_PROMPT,
+        "saidas_llm": list(saidas_llm),
+    }
+
+# 19.1 - Executa o pipeline completo sobre o documento aberto
+async def processar_documento(doc: DocumentHandle, user_id: int | None = None, modo_pipeline: str | None = None,
+                              notificar=None, paginas: list[int] | None = None, prazo: Prazo | None = None,
+                              categorizacoes: asyncio.Task | None = None) -> dict:
+    """
+    Classifica as páginas e roteia cada uma: texto nativo e OCR em duas etapas
+    (extração de texto + categorização) ou multimodal (imagem direto para o JSON).
+    Os dois caminhos rodam em paralelo e os resultados são consolidados.
+    Com user_id, aplica as categorizações personalizadas do usuário, pula a
+    LLM nas páginas com todos os lançamentos já vistos por ele (livro de
+    transações) e marca cada transação com "nova" (True/False).
+    'notificar' é uma corrotina opcional que recebe os eventos de progresso
+    (ver eventos_documento). 'paginas' restringe o processamento a esses índices.
+    Com 'prazo', cada etapa respeita seu marco: o resultado traz o que ficou
+    pronto, com "partial" e "missing_pages" se alguma página foi cancelada.
+    'categorizacoes' é a busca das categorizações do usuário já iniciada por
+    quem chama (compartilhada entre os documentos de um lote).
+    Levanta HTTPException 400 se nenhuma página tiver texto ou transações.
+    """
+    modo = validar_modo_pipeline(modo_pipeline)
+    token_prazo = prazo_atual.set(prazo)
+    token_usuario = usuario_atual.set(user_id)
+    # Só o processamento completo do documento de um usuário vira artefato (continuações, respostas
+    # parciais e documentos sem dono não: ninguém poderia reprocessá-los)
+    saidas_llm = [] if ARTEFATOS and paginas is None and user_id is not None else None
+    token_saidas = saidas_llm_atuais.set(saidas_llm)
+    token_periodo = periodo_atual.set(None)
+    if prazo:
+        METRICAS["prazos"]["requisicoes_com_prazo"] += 1
+    task_categorizacoes = categorizacoes
+    if task_categorizacoes is None and user_id is not None:
+        task_categorizacoes = asyncio.create_task(buscar_categorizacoes_usuario(user_id))
+    
+    emitir = None
+    if notificar:
+        async def emitir(evento: dict):
+            # As transações emitidas já saem com as categorizações do usuário
+            if evento["evento"] == "pagina_categorizada" and task_categorizacoes is not None and evento["transactions"]:
+                aplicar_categorizacoes_personalizadas(evento["transactions"], await task_categorizacoes)
+            await notificar(evento)
+    
+    async def categorizar_deterministicos(resultados: list[dict]):
+        await categorizar_transacoes([t for r in resultados for t in r["transactions"]])
+        if emitir:
+            for resultado in resultados:
+                await notificar_paginas(emitir, [resultado["transactions"][0]["pagina"]], [resultado])
+    
+    try:
+        estrategias = await asyncio.to_thread(classificar_paginas, doc)
+        if paginas is not None:
+            estrategias = {i: estrategia for i, estrategia in estrategias.items() if i in set(paginas)}
+        if modo != "duas_etapas":
+            estrategias = await asyncio.to_thread(rotear_paginas_multimodal, doc, estrategias, modo)
+        indices_multimodal = [i for i, estrategia in estrategias.items() if estrategia == "multimodal"]
+        if emitir:
+            await emitir({"evento": "inicio", "paginas": len(estrategias), "estrategias": dict(Counter(estrategias.values()))})
+        
+        task_multimodal = task_deterministicos = task_auditoria = None
+        if indices_multimodal:
+            print(f"DEBUG: Modo {modo}: {len(indices_multimodal)} páginas seguem direto da imagem para a categorização")
+            METRICAS["multimodal"]["documentos"] += 1
+            task_multimodal = asyncio.create_task(processar_paginas_multimodal(doc, indices_multimodal, emitir))
+        
+        async def pagina_extraida(i: int):
+            await emitir({"evento": "pagina_extraida", "pagina": i + 1, "estrategia": estrategias.get(i)})
+        
+        try:
+            textos = await extrair_paginas_documento(doc, estrategias, pagina_extraida if emitir else None)
+            textos_extraidos = dict(textos)
+            # Ano das datas sem ano: o mesmo para o parser, o livro de transações e os prompts
+            periodo = periodo_documento("\n".join(textos_extraidos[i] for i in sorted(textos_extraidos)))
+            periodo_atual.set(periodo)
+            modelo = await asyncio.to_thread(identificar_modelo_layout, doc, textos, estrategias)
+            textos, posicoes, resultados_deterministicos = await asyncio.to_thread(reconstruir_paginas_nativas, doc, textos, estrategias, modelo, periodo)
+            if modelo and resultados_deterministicos and prazo is None and registro_modelos.auditar(modelo):
+                # Amostra do acerto do parser: as mesmas páginas também vão para a LLM, fora do resultado
+                task_auditoria = asyncio.create_task(categorizar_com_llm(
+                    [(r["transactions"][0]["pagina"], textos_extraidos[r["transactions"][0]["pagina"] - 1])
+                     for r in resultados_deterministicos], modelo))
+            if resultados_deterministicos:
+                # Páginas resolvidas pelo parser não esperam a LLM
+                task_deterministicos = asyncio.create_task(categorizar_deterministicos(resultados_deterministicos))
+            textos = await asyncio.to_thread(limpar_boilerplate, doc, textos, estrategias, posicoes)
+            textos = aplicar_prefiltro(textos)
+            resultados_livro = {}
+            if LIVRO_TRANSACOES and user_id is not None and textos:
+                # Páginas com todos os lançamentos já vistos pelo usuário não vão para a LLM
+                resultados_livro = await asyncio.to_thread(
+                    livro_transacoes.paginas_conhecidas, user_id, textos,
+                    "\n".join(textos_extraidos[i] for i in sorted(textos_extraidos)), modelo["document_type"] if modelo else None,
+                    periodo)
+                if resultados_livro:
+                    print(f"DEBUG: Livro de transações: {len(resultados_livro)} páginas já conhecidas, sem LLM")
+                    if emitir:
+                        await notificar_paginas(emitir, [i + 1 for i in sorted(resultados_livro)], list(resultados_livro.values()))
+            textos_llm = {i: texto for i, texto in textos.items() if i not in resultados_livro}
+            resultado_texto = None
+            if textos_llm:
+                resultado_texto = await categorizar_com_llm([(i + 1, textos_llm[i]) for i in sorted(textos_llm)], modelo, emitir)
+            resultado_auditoria = None
+            if task_auditoria:
+                try:
+                    resultado_auditoria = await task_auditoria
+                    if resultado_auditoria.get("success"):
+                        registro_modelos.registrar_auditoria(modelo, resultados_deterministicos, resultado_auditoria.get("transactions") or [])
+                except Exception as e:
+                    print(f"ERRO na auditoria do modelo de layout '{modelo['nome']}': {e}")
+            if modelo:
+                registro_modelos.registrar_paginas(modelo, parser=len(resultados_deterministicos), llm=len(textos_llm))
+                if resultado_texto or resultado_auditoria:
+                    registro_modelos.registrar_resultado(modelo, resultado_texto or resultado_auditoria)
+            if task_deterministicos:
+                await task_deterministicos
+            resultados_multimodal = await task_multimodal if task_multimodal else []
+            resultados_outros = resultados_deterministicos + resultados_multimodal + list(resultados_livro.values())
+        except BaseException:
+            for task in (task_multimodal, task_deterministicos, task_auditoria):
+                if task:
+                    task.cancel()
+            raise
+        
+        pendentes = sorted(prazo.paginas_pendentes) if prazo else []
+        if resultado_texto is None and not any(r.get("success") for r in resultados_outros) and not pendentes:
+            print("DEBUG: Extração falhou (nenhuma página com texto válido, nativo e OCR).")
+            raise HTTPException(status_code=400, detail="Falha ao extrair texto do PDF (Nativo e OCR).")
+        
+        resultado = montar_resultado_documento(resultado_texto, resultados_outros, modelo, consolidar=bool(pendentes))
+        if saidas_llm is not None and not pendentes:
+            hash_documento, artefatos = await asyncio.to_thread(
+                coletar_artefatos, doc, estrategias, textos_extraidos, textos, resultados_deterministicos,
+                resultados_multimodal, modelo, saidas_llm, user_id)
+            gerenciador_encerramento.gravar_depois(asyncio.to_thread(armazem_artefatos.salvar, hash_documento, artefatos))
+            resultado["document_hash"] = hash_documento
+        
+        usar_livro = LIVRO_TRANSACOES and user_id is not None and bool(resultado.get("transactions"))
+        if usar_livro:
+            await asyncio.to_thread(livro_transacoes.conciliar, user_id, resultado["transactions"])
+        if task_categorizacoes is not None:
+            resultado = aplicar_personalizacao(resultado, await task_categorizacoes, user_id)
+        if usar_livro:
+            gerenciador_encerramento.gravar_depois(asyncio.to_thread(
+                livro_transacoes.registrar, user_id, resultado["transactions"],
+                resultado.get("bank_name") if resultado.get("bank_name") not in ("", "TBD") else None,
+                resultado.get("document_type") if resultado.get("document_type") != "unknown" else None))
+        if pendentes:
+            print(f"AVISO: Prazo de {prazo.timeout_ms} ms esgotado, resposta parcial sem as páginas {pendentes}")
+            METRICAS["prazos"]["respostas_parciais"] += 1
+            METRICAS["prazos"]["paginas_pendentes"] += len(pendentes)
+            resultado.update(partial=True, missing_pages=pendentes)
+        return resultado
+    finally:
+        prazo_atual.reset(token_prazo)
+        usuario_atual.reset(token_usuario)
+        saidas_llm_atuais.reset(token_saidas)
+        periodo_atual.reset(token_periodo)
+        if categorizacoes is None and task_categorizacoes is not None and not task_categorizacoes.done():
+            task_categorizacoes.cancel()
+
+# 19.2 - Executa o pipeline emitindo eventos à medida que as páginas ficam prontas
+async def eventos_documento(doc: DocumentHandle, user_id: int | None = None, modo_pipeline: str | None = None,
+                            prazo: Prazo | None = None):
+    """
+    Gerador assíncrono dos eventos do processamento, na ordem em que acontecem:
+    - "inicio": total de páginas e contagem por estratégia;
+    - "pagina_extraida": texto da página pronto (nativo ou OCR);
+    - "pagina_categorizada": transações da página, já categorizadas;
+    - "erro_pagina": falha em uma ou mais páginas (as demais seguem);
+    - "resumo" (último): o mesmo JSON de /processar-extrato/, com banco, meses
+      e deduplicação entre páginas, ou "erro" com status_code e error_message.
+    As transações dos eventos por página ainda não foram deduplicadas entre
+    páginas: o resultado final é o do "resumo". Se o consumidor parar de ler
+    (cliente desconectou), o processamento é cancelado.
+    """
+    fila = asyncio.Queue()
+    task = asyncio.create_task(processar_documento(doc, user_id, modo_pipeline, fila.put, prazo=prazo))
+    task.add_done_callback(lambda _: fila.put_nowait(None))
+    try:
+        while (evento := await fila.get()) is not None:
+            yield evento
+        resultado = task.result()
+        if isinstance(resultado.get("transactions"), list):
+            resultado["transactions_count"] = len(resultado["transactions"])
+        yield {"evento": "resumo", **resultado}
+    except HTTPException as e:
+        yield {"evento": "erro", "status_code": e.status_code, "success": False, "error_message": e.detail}
+    except Exception as e:
+        print(f"ERRO Inesperado no pipeline (streaming): {e}")
+        yield {"evento": "erro", "status_code": 500, "success": False, "error_message": f"Erro inesperado: {e}"}
+    finally:
+        if not task.done():
+            task.cancel()
+            # O documento só pode ser fechado depois que o processamento parar de usá-lo
+            await asyncio.gather(task, return_exceptions=True)
+
+# 19.3 - Respostas parciais: guarda as páginas pendentes para continuar depois
+def prazo_requisicao(timeout_ms: int | None, x_timeout_ms: int | None) -> Prazo | None:
+    """
+    Prazo da requisição pelo parâmetro timeout_ms ou, na falta dele, pelo
+    cabeçalho X-Timeout-Ms (ou TIMEOUT_PADRAO_MS).
+    """
+    return criar_prazo(timeout_ms if timeout_ms is not None else x_timeout_ms)
+
+def registrar_continuacao(resultado: dict, pdf_bytes: bytes, senha_do_pdf: str | None, user_id: int | None,
+                          modo_pipeline: str | None) -> dict:
+    """
+    Se o resultado ficou parcial, guarda o documento no armazém de continuações
+    e inclui o "continuation_token" para buscar as páginas pendentes em
+    /continuar-extrato/{token}.
+    """
+    if resultado.get("missing_pages"):
+        resultado["continuation_token"] = armazem_continuacoes.salvar(
+            pdf_bytes, senha_do_pdf, user_id, modo_pipeline, resultado["missing_pages"], resultado
+        )
+    return resultado
+
+async def continuar_processamento(token: str, user_id: int | None, prazo: Prazo | None = None) -> dict:
+    """
+    Processa as páginas pendentes de uma resposta parcial e devolve o resultado
+    consolidado com o que já tinha sido entregue (deduplicado, com os meses
+    recalculados). Se o novo prazo também acabar, o token continua válido
+    com as páginas que ainda faltam. O token só vale com o user_id da
+    requisição original.
+    Levanta HTTPException 404 se o token não existir, tiver expirado ou for de outro usuário.
+    """
+    trabalho = armazem_continuacoes.obter(token)
+    if trabalho is None or trabalho["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Token de continuação inválido ou expirado")
+    METRICAS["prazos"]["continuacoes"] += 1
+    print(f"INFO: Continuando o processamento das páginas {trabalho['paginas']}...")
+    
+    doc = abrir_documento(trabalho["pdf_bytes"], trabalho["senha_do_pdf"])
+    try:
+        admissao = await admitir_documento(doc, trabalho["pdf_bytes"], "/continuar-extrato/",
+                                           paginas=len(trabalho["paginas"]), user_id=trabalho["user_id"])
+    except HTTPException:
+        doc.close()
+        raise
+    try:
+        novo = await processar_documento(doc, trabalho["user_id"], trabalho["modo_pipeline"],
+                                         paginas=[p - 1 for p in trabalho["paginas"]], prazo=prazo)
+    except HTTPException as e:
+        if e.status_code != 400:
+            raise
+        novo = {"success": False, "transactions": [], "error_message": "Nenhuma transação encontrada no documento"}
+    finally:
+        doc.close()
+        liberar_documento(admissao)
+    
+    anterior = trabalho["resultado"]
+    resultado = consolidar_resultados_paginas(([anterior] if anterior.get("transactions") else []) + [novo])
+    for campo in ("bank_name", "document_type"):
+        if resultado[campo] in ("TBD", "unknown") and anterior.get(campo) not in (None, "", "TBD", "unknown"):
+            resultado[campo] = anterior[campo]
+    
+    if novo.get("missing_pages"):
+        resultado.update(partial=True, missing_pages=novo["missing_pages"], continuation_token=token)
+        armazem_continuacoes.atualizar(token, novo["missing_pages"], resultado)
+    else:
+        armazem_continuacoes.concluir(token)
+    return resultado
+
+# 19.4 - Controle de admissão por documento
+async def admitir_upload(tamanho_bytes: int | None, endpoint: str) -> tuple[dict, float] | None:
+    """
+    Admissão prévia de um upload pelo tamanho, antes de ler e abrir o PDF:
+    sob carga, a requisição espera ou é recusada sem trazer o arquivo para a
+    memória. As páginas são estimadas por custo_upload até admitir_documento
+    (com 'previa') trocá-las pelas reais.
+    Levanta HTTPException 429 ou 503 (fila cheia, espera longa, encerramento).
+    """
+    gerenciador_encerramento.verificar_admissao()
+    if not ADMISSAO or not tamanho_bytes:
+        return None
+    custo = custo_upload(tamanho_bytes)
+    return custo, await controle_admissao.admitir(custo, PRIORIDADES_ENDPOINT[endpoint])
+
+async def ler_upload(file: UploadFile, endpoint: str) -> tuple[bytes, tuple[dict, float] | None]:
+    """
+    Admite o upload pelo tamanho (admitir_upload) e só então lê os bytes.
+    Retorna (pdf_bytes, admissão prévia para _processar_bytes_sync/_stream).
+    """
+    previa = await admitir_upload(file.size, endpoint)
+    try:
+        return await file.read(), previa
+    except BaseException:
+        liberar_documento(previa)
+        raise
+
+async def admitir_documento(doc: DocumentHandle | None, pdf_bytes: bytes, endpoint: str, espera_max_s: float | None = -1,
+                            paginas: int | None = None, user_id: int | None = None,
+                            previa: tuple[dict, float] | None = None) -> tuple[dict, float] | None:
+    """
+    Reserva as páginas na cota do usuário e a carga estimada do documento (ou só
+    de 'paginas' páginas dele; sem o documento aberto, 'paginas' é
+    obrigatório) no controle de admissão, esperando na fila com
+    a prioridade do endpoint. Levanta HTTPException 429 (cota excedida ou
+    fila cheia) ou 503, com Retry-After; com espera_max_s=None (background)
+    espera a cota se recompor em vez de recusar.
+    Durante o encerramento, recusa com 503 os documentos interativos (os de
+    background são drenados ou salvos para retomar pelo GerenciadorEncerramento).
+    Com a admissão 'previa' do upload (admitir_upload), não espera de novo:
+    só troca a carga estimada pela real. Se levantar, 'previa' continua
+    reservada (quem chamou a libera).
+    Retorna o que liberar_documento precisa.
+    """
+    if espera_max_s is not None:
+        gerenciador_encerramento.verificar_admissao()
+    custo = custo_documento(len(pdf_bytes), len(doc) if paginas is None else paginas)
+    if espera_max_s is None:
+        await cotas_usuarios.aguardar(user_id, custo["paginas"], custo["tokens"])
+    else:
+        cotas_usuarios.verificar(user_id, custo["paginas"], custo["tokens"])
+    try:
+        if previa is not None:
+            controle_admissao.ajustar(previa[0], custo)
+            return (custo, previa[1])
+        return (custo, await controle_admissao.admitir(custo, PRIORIDADES_ENDPOINT[endpoint], espera_max_s)) if ADMISSAO else None
+    except BaseException:
+        # Recusado (ou cancelado) na fila: as páginas reservadas na cota voltam para o usuário
+        cotas_usuarios.devolver_paginas(user_id, custo["paginas"])
+        raise
+
+def liberar_documento(admissao: tuple[dict, float] | None):
+    if admissao:
+        controle_admissao.liberar(*admissao)
+
+# 19.5 - Processamento em lote (vários extratos do mesmo usuário)
+def expandir_zip(nome: str, dados: bytes) -> list[tuple[str, bytes]]:
+    """
+    Extrai os PDFs de um arquivo zip, recusando (HTTPException 400) zips
+    inválidos ou que descompactados passem de LOTE_MAX_MB_ZIP.
+    """
+    try:
+        with zipfile.ZipFile(io.BytesIO(dados)) as arquivo:
+            entradas = [e for e in arquivo.infolist() if not e.is_dir() and e.filename.lower().endswith(".pdf")
+                        and not os.path.basename(e.filename).startswith(".")]
+            if sum(e.file_size for e in entradas) > LOTE_MAX_MB_ZIP * 2**20:
+                raise HTTPException(status_code=400, detail=f"{nome}: conteúdo descompactado acima de {LOTE_MAX_MB_ZIP} MB")
+            return [(f"{nome}/{e.filename}", arquivo.read(e)) for e in entradas]
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"{nome}: arquivo zip inválido ({e})")
+
+async def baixar_pdf(url: str) -> bytes:
+    try:
+        response = await http_client.get(url)
+        response.raise_for_status()
+        return await response.aread()
+    except httpx.HTTPError as e:
+        print(f"ERRO: Falha ao baixar a URL {url}: {e}")
+        raise HTTPException(status_code=400, detail=f"Falha ao baixar o PDF da URL: {e}")
+
+async def processar_item_lote(nome: str, origem: bytes | str, user_id: int | None, senha_do_pdf: str | None,
+                              modo_pipeline: str | None, categorizacoes: asyncio.Task | None) -> dict:
+    """
+    Baixa (se 'origem' for uma URL), admite e processa um documento do lote.
+    Erros viram o resultado do documento, com o status HTTP que ele teria sozinho.
+    """
+    try:
+        pdf_bytes = await baixar_pdf(origem) if isinstance(origem, str) else origem
+        doc = abrir_documento(pdf_bytes, senha_do_pdf)
+        try:
+            admissao = await admitir_documento(doc, pdf_bytes, "/processar-lote/", user_id=user_id)
+            try:
+                resultado = await processar_documento(doc, user_id, modo_pipeline, categorizacoes=categorizacoes)
+            finally:
+                liberar_documento(admissao)
+        finally:
+            doc.close()
+    except HTTPException as e:
+        falha = {"filename": nome, "status_code": e.status_code, "success": False, "transactions_count": 0,
+                 "transactions": [], "error_message": e.detail}
+        if e.headers and "Retry-After" in e.headers:
+            falha["retry_after"] = int(e.headers["Retry-After"])
+        return falha
+    except Exception as e:
+        print(f"ERRO Inesperado no documento {nome} do lote: {e}")
+        return {"filename": nome, "status_code": 500, "success": False, "transactions_count": 0,
+                "transactions": [], "error_message": f"Erro inesperado: {e}"}
+    resultado["transactions_count"] = len(resultado.get("transactions", []))
+    return {"filename": nome, "status_code": 200, **resultado}
+
+async def processar_lote(documentos: list[tuple[str, bytes | str]], user_id: int | None = None,
+                         senha_do_pdf: str | None = None, modo_pipeline: str | None = None) -> dict:
+    """
+    Processa vários extratos do mesmo usuário numa requisição: 'documentos'
+    são pares (nome, bytes do PDF ou URL). As categorizações do usuário são
+    buscadas uma vez para todo o lote; até LOTE_DOCUMENTOS_SIMULTANEOS
+    documentos rodam juntos e as páginas de todos disputam o Gemini pela
+    mesma fila justa do usuário.
+    Retorna o resultado de cada documento e as transações de todos,
+    deduplicadas entre documentos, com o período total.
+    Levanta HTTPException 400 para lote vazio, grande demais ou modo inválido.
+    """
+    validar_modo_pipeline(modo_pipeline)
+    if not documentos:
+        raise HTTPException(status_code=400, detail="Nenhum PDF enviado no lote")
+    if len(documentos) > LOTE_MAX_DOCUMENTOS:
+        raise HTTPException(status_code=400, detail=f"Lote com {len(documentos)} documentos; o máximo é {LOTE_MAX_DOCUMENTOS}")
+    print(f"INFO: Processando lote de {len(documentos)} documentos para usuário {user_id}")
+    
+    task_categorizacoes = asyncio.create_task(buscar_categorizacoes_usuario(user_id)) if user_id is not None else None
+    semaforo = asyncio.Semaphore(LOTE_DOCUMENTOS_SIMULTANEOS)
+    
+    async def processar(nome: str, origem: bytes | str) -> dict:
+        async with semaforo:
+            return await processar_item_lote(nome, origem, user_id, senha_do_pdf, modo_pipeline, task_categorizacoes)
+    
+    try:
+        resultados = await asyncio.gather(*(processar(nome, origem) for nome, origem in documentos))
+    finally:
+        if task_categorizacoes is not None and not task_categorizacoes.done():
+            task_categorizacoes.cancel()
+    return consolidar_lote(resultados)
+
+def consolidar_lote(resultados: list[dict]) -> dict:
+    """
+    Junta as transações dos documentos (cada uma com o "filename" de origem),
+    remove as repetidas entre documentos (mesma data, descrição e valor, como
+    em extratos com períodos sobrepostos) e calcula o período total.
+    """
+    transacoes = []
+    vistas = set()
+    for resultado in resultados:
+        for transacao in resultado.get("transactions", []):
+            chave = (transacao.get("data", ""), transacao.get("descricao", ""), transacao.get("valor", 0))
+            if chave not in vistas:
+                vistas.add(chave)
+                transacoes.append({**transacao, "filename": resultado["filename"]})
+    duplicadas = sum(len(r.get("transactions", [])) for r in resultados) - len(transacoes)
+    falhas = sum(1 for r in resultados if r["status_code"] != 200)
+    start_month, end_month = extrair_meses_transacoes(transacoes)
+    
+    metricas = METRICAS["lotes"]
+    metricas["lotes"] += 1
+    metricas["documentos"] += len(resultados)
+    metricas["documentos_com_erro"] += falhas
+    metricas["transacoes_duplicadas"] += duplicadas
+    print(f"INFO: Lote concluído: {len(resultados) - falhas}/{len(resultados)} documentos, "
+          f"{len(transacoes)} transações ({duplicadas} repetidas entre documentos)")
+    return {
+        "success": len(transacoes) > 0,
+        "documents_count": len(resultados),
+        "documents_failed": falhas,
+        "start_month": start_month,
+        "end_month": end_month,
+        "transactions_count": len(transacoes),
+        "duplicates_removed": duplicadas,
+        "transactions": transacoes,
+        "documents": resultados,
+    }
+
+# 19.6 - Reprocessamento a partir dos artefatos guardados
+async def reprocessar_documento(hash_documento: str, user_id: int, espera_max_s: float | None = -1) -> dict:
+    """
+    Refaz só as etapas finais de um documento já processado, a partir dos
+    artefatos do armazém: a LLM sobre o texto guardado de cada página (com o
+    prompt atual) e a categorização das transações do parser e do multimodal.
+    O PDF não é baixado, aberto, renderizado nem passa por OCR de novo.
+    Só encontra os documentos processados com o mesmo user_id (que não é
+    autenticado aqui) e usa as categorizações personalizadas dele; a carga
+    passa pelo controle de admissão com a prioridade de lote (espera_max_s
+    como em admitir_documento).
+    Levanta HTTPException 404 se o armazém estiver desligado (ARTEFATOS) ou o
+    documento não estiver nele com esse user_id.
+    """
+    if not ARTEFATOS:
+        raise HTTPException(status_code=404, detail="Armazém de artefatos desligado (ARTEFATOS).")
+    artefatos = await asyncio.to_thread(armazem_artefatos.carregar, hash_documento, user_id)
+    if artefatos is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado no armazém de artefatos (processe o PDF de novo).")
+    admissao = await admitir_documento(None, b"", "/reprocessar/", espera_max_s, paginas=len(artefatos["textos_llm"]),
+                                       user_id=user_id)
+    try:
+        return await _reprocessar_artefatos(hash_documento, artefatos, user_id)
+    finally:
+        liberar_documento(admissao)
+
+async def _reprocessar_artefatos(hash_documento: str, artefatos: dict, user_id: int) -> dict:
+    """
+    Etapas finais do reprocessamento, já com o documento admitido.
+    """
+    modelo = next((m for m in registro_modelos.modelos if m["nome"] == artefatos["modelo_layout"]), None)
+    token_usuario = usuario_atual.set(user_id)
+    saidas_llm = []
+    token_saidas = saidas_llm_atuais.set(saidas_llm)
+    extraidos = artefatos.get("textos_extraidos") or {}
+    token_periodo = periodo_atual.set(periodo_documento("\n".join(extraidos[p] for p in sorted(extraidos, key=int))))
+    task_categorizacoes = asyncio.create_task(buscar_categorizacoes_usuario(user_id))
+    try:
+        resultados_outros = artefatos.get(RESULTADOS_PARSER, []) + artefatos.get(RESULTADOS_MULTIMODAL, [])
+        transacoes = [t for r in resultados_outros for t in r.get("transactions", [])]
+        for transacao in transacoes:
+            transacao.pop("categoria", None)
+            transacao.pop("subcategoria", None)
+        textos = artefatos["textos_llm"]
+        print(f"DEBUG: Reprocessando {hash_documento[:12]}: {len(textos)} páginas na LLM, {len(transacoes)} transações já extraídas")
+        task_texto = categorizar_com_llm([(p, textos[p]) for p in sorted(textos)], modelo) if textos else asyncio.sleep(0)
+        resultado_texto, _ = await asyncio.gather(task_texto, categorizar_transacoes(transacoes))
+        if resultado_texto is None and not any(r.get("success") for r in resultados_outros):
+            raise HTTPException(status_code=400, detail="Nenhuma transação no reprocessamento do documento.")
+        
+        resultado = montar_resultado_documento(resultado_texto, resultados_outros, modelo)
+        if saidas_llm:
+            gerenciador_encerramento.gravar_depois(
+                asyncio.to_thread(armazem_artefatos.salvar_saidas_llm, hash_documento, VERSAO_PROMPT, saidas_llm))
+        resultado = aplicar_personalizacao(resultado, await task_categorizacoes, user_id)
+        resultado.update(document_hash=hash_documento, reprocessed=True)
+        return resultado
+    finally:
+        usuario_atual.reset(token_usuario)
+        saidas_llm_atuais.reset(token_saidas)
+        periodo_atual.reset(token_periodo)
+        if not task_categorizacoes.done():
+            task_categorizacoes.cancel()
+
 # 20 - Pipeline de processamento síncrono
-async def _processar_bytes_sync(pdf_bytes: bytes, user_id: int = None, senha_do_pdf: str | None = None) -> JSONResponse:
+async def _processar_bytes_sync(pdf_bytes: bytes, user_id: int = None, senha_do_pdf: str | None = None,
+                               modo_pipeline: str | None = None, prazo: Prazo | None = None,
+                               endpoint: str = "/processar-extrato/", previa: tuple[dict, float] | None = None) -> JSONResponse:
     """
     Função interna que executa o pipeline principal e retorna o resultado.
-    Usada pelo endpoint de upload de arquivo (síncrono).
+    Usada pelo endpoint de upload de arquivo (síncrono). 'previa' é a
+    admissão do upload pelo tamanho (ler_upload), liberada aqui.
     """
     start_time = time.time()
     
-    # Tenta desbloquear o PDF se uma senha foi fornecida
+    # Abre o PDF uma única vez (desbloqueando se uma senha foi fornecida) e espera a vez na admissão
     try:
-        pdf_bytes = desbloquear_pdf_com_senha(pdf_bytes, senha_do_pdf)
+        doc = abrir_documento(pdf_bytes, senha_do_pdf)
     except HTTPException as e:
+        liberar_documento(previa)
         return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail})
+    try:
+        admissao = await admitir_documento(doc, pdf_bytes, endpoint, user_id=user_id, previa=previa)
+    except HTTPException as e:
+        doc.close()
+        liberar_documento(previa)
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
     
-    texto_bruto = await extrair_texto_nativo(pdf_bytes)
-    
-    if texto_bruto is None:
-        texto_bruto = await extrair_texto_ocr(pdf_bytes)
-        
-    if texto_bruto is None:
-        raise HTTPException(status_code=400, detail="Falha ao extrair texto do PDF (Nativo e OCR).")
-        
     try:
-        if user_id is not None:
-            json_final = await categorizar_com_llm_personalizado(texto_bruto, user_id)
-        else:
-            json_final = await categorizar_com_llm(texto_bruto)
+        try:
+            json_final = await processar_documento(doc, user_id, modo_pipeline, prazo=prazo)
+        finally:
+            doc.close()
+            liberar_documento(admissao)
+        registrar_continuacao(json_final, pdf_bytes, senha_do_pdf, user_id, modo_pipeline)
         
         end_time = time.time()
         print(f"SUCESSO: Processamento concluído em {end_time - start_time:.2f} segundos.")
@@ -957,18 +2986,100 @@ async def _processar_bytes_sync(pdf_bytes: bytes, user_id: int = None, senha_do_
         print(f"ERRO Inesperado no pipeline: {e}")
         return JSONResponse(status_code=500, content={"success": False, "error_message": f"Erro inesperado: {e}"})
 
-# 21 - Pipeline de processamento assíncrono
-async def processar_e_enviar_webhook(file_url: str, webhook_url: str, user_id: int, senha_do_pdf: str | None = None):
+# 20.1 - Pipeline de processamento em streaming (NDJSON ou Server-Sent Events)
+FORMATOS_STREAMING = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+class RespostaStreaming(StreamingResponse):
     """
-    Worker de background: baixa, processa e envia o resultado para o webhook.
+    StreamingResponse que chama 'ao_fim' (assíncrona) quando o envio termina,
+    com ou sem erro, inclusive se o corpo nem começou a ser lido (cliente que
+    desconectou antes): o gerador sozinho não libera o que não iniciou.
+    """
+
+    def __init__(self, conteudo, ao_fim, **kwargs):
+        super().__init__(conteudo, **kwargs)
+        self.ao_fim = ao_fim
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.ao_fim()
+
+def formatar_evento(evento: dict, formato: str) -> str:
+    dados = json.dumps(evento, ensure_ascii=False)
+    if formato == "sse":
+        return f"event: {evento['evento']}\ndata: {dados}\n\n"
+    return dados + "\n"
+
+async def _processar_bytes_stream(pdf_bytes: bytes, user_id: int = None, senha_do_pdf: str | None = None,
+                                  modo_pipeline: str | None = None, formato: str = "ndjson", prazo: Prazo | None = None,
+                                  endpoint: str = "/processar-extrato-stream/", previa: tuple[dict, float] | None = None):
+    """
+    Versão em streaming de _processar_bytes_sync: responde assim que o PDF abre
+    (e é admitido) e envia um evento por linha (NDJSON) ou por mensagem SSE (ver eventos_documento).
+    Erros de entrada (formato, modo, senha) e de admissão ainda voltam como JSON com o status HTTP.
+    O documento e a admissão são liberados ao fim do envio, mesmo que o corpo nunca seja lido.
     """
     start_time = time.time()
-    print(f"INFO [BG]: Iniciando processamento para usuário {user_id}: {file_url}")
-    print(f"INFO [BG]: Webhook de destino: {webhook_url}")
-    if senha_do_pdf:
-        print("INFO [BG]: PDF protegido por senha detectado.")
-    json_resultado = {}
+    try:
+        if formato not in FORMATOS_STREAMING:
+            raise HTTPException(status_code=400, detail=f"formato inválido: {formato}. Use 'ndjson' ou 'sse'.")
+        validar_modo_pipeline(modo_pipeline)
+        doc = abrir_documento(pdf_bytes, senha_do_pdf)
+    except HTTPException as e:
+        liberar_documento(previa)
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail})
+    try:
+        admissao = await admitir_documento(doc, pdf_bytes, endpoint, user_id=user_id, previa=previa)
+    except HTTPException as e:
+        doc.close()
+        liberar_documento(previa)
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    
+    METRICAS["streaming"]["requisicoes"] += 1
+    liberado = False
+    
+    def liberar():
+        nonlocal liberado
+        if not liberado:
+            liberado = True
+            doc.close()
+            liberar_documento(admissao)
     
+    async def gerar():
+        primeira_pagina = False
+        try:
+            async with aclosing(eventos_documento(doc, user_id, modo_pipeline, prazo)) as eventos:
+                async for evento in eventos:
+                    METRICAS["streaming"]["eventos"] += 1
+                    if evento["evento"] == "resumo":
+                        registrar_continuacao(evento, pdf_bytes, senha_do_pdf, user_id, modo_pipeline)
+                    if evento["evento"] == "pagina_categorizada":
+                        METRICAS["streaming"]["paginas_emitidas"] += 1
+                        if not primeira_pagina:
+                            primeira_pagina = True
+                            METRICAS["streaming"]["segundos_ate_primeira_pagina"] += round(time.time() - start_time, 3)
+                            print(f"DEBUG: Primeira página emitida em {time.time() - start_time:.2f} segundos.")
+                    yield formatar_evento(evento, formato)
+        finally:
+            liberar()
+            print(f"SUCESSO: Streaming concluído em {time.time() - start_time:.2f} segundos.")
+    
+    async def encerrar():
+        await corpo.aclose()
+        liberar()
+    
+    corpo = gerar()
+    return RespostaStreaming(corpo, encerrar, media_type=FORMATOS_STREAMING[formato],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# 21 - Pipeline de processamento assíncrono
+async def baixar_e_processar(file_url: str, user_id: int, senha_do_pdf: str | None, modo_pipeline: str | None) -> dict:
+    """
+    Baixa e processa o PDF do job de URL. Retorna o resultado, ou o JSON de
+    erro do pipeline se algo falhar.
+    """
     try:
         try:
             response = await http_client.get(file_url)
@@ -978,32 +3089,35 @@ async def processar_e_enviar_webhook(file_url: str, webhook_url: str, user_id: i
             print(f"ERRO [BG]: Falha ao baixar a URL: {e}")
             raise HTTPException(status_code=400, detail=f"Falha ao baixar o PDF da URL: {e}")
 
-        # Tenta desbloquear o PDF se uma senha foi fornecida
+        # Abre o PDF uma única vez (desbloqueando se uma senha foi fornecida)
         try:
-            pdf_bytes = desbloquear_pdf_com_senha(pdf_bytes, senha_do_pdf)
+            doc = abrir_documento(pdf_bytes, senha_do_pdf)
         except HTTPException as e:
             print(f"ERRO [BG]: Falha ao desbloquear PDF: {e.detail}")
             raise e
 
-        texto_bruto = await extrair_texto_nativo(pdf_bytes)
-        
-        if texto_bruto is None:
-            texto_bruto = await extrair_texto_ocr(pdf_bytes)
-            
-        if texto_bruto is None:
-            raise HTTPException(status_code=400, detail="Falha ao extrair texto do PDF (Nativo e OCR).")
-        
-        json_resultado = await categorizar_com_llm_personalizado(texto_bruto, user_id)
+        # Jobs de URL esperam a vez sem limite de tempo, atrás das requisições interativas
+        try:
+            admissao = await admitir_documento(doc, pdf_bytes, "/processar-extrato-url/", espera_max_s=None, user_id=user_id)
+        except BaseException:
+            doc.close()
+            raise
+        try:
+            json_resultado = await processar_documento(doc, user_id, modo_pipeline)
+        finally:
+            doc.close()
+            liberar_documento(admissao)
         
         if "transactions" in json_resultado and isinstance(json_resultado["transactions"], list):
             json_resultado["transactions_count"] = len(json_resultado["transactions"])
 
         print(f"SUCESSO [BG]: Processamento concluído para usuário {user_id}")
+        return json_resultado
 
     except Exception as e:
         print(f"ERRO [BG]: Falha no pipeline: {e}")
         detail = e.detail if isinstance(e, HTTPException) else str(e)
-        json_resultado = {
+        return {
             "success": False,
             "bank_name": "TBD",
             "document_type": "unknown",
@@ -1013,10 +3127,37 @@ async def processar_e_enviar_webhook(file_url: str, webhook_url: str, user_id: i
             "transactions": [],
             "error_message": f"Erro no processamento em background: {detail}"
         }
+
+async def processar_e_enviar_webhook(file_url: str, webhook_url: str, user_id: int, senha_do_pdf: str | None = None,
+                                     modo_pipeline: str | None = None, chave_idempotencia: str | None = None,
+                                     resultado: dict | None = None):
+    """
+    Worker de background: baixa, processa e envia o resultado para o webhook.
+    O resultado fica registrado no trabalho antes do envio: se o encerramento
+    interromper o POST, a retomada (com 'resultado') só reenvia, sem
+    processar de novo. O envio leva o cabeçalho Idempotency-Key com
+    'chave_idempotencia', a mesma em toda retomada, para o destino
+    reconhecer o reenvio.
+    """
+    start_time = time.time()
+    print(f"INFO [BG]: Iniciando processamento para usuário {user_id}: {file_url}")
+    print(f"INFO [BG]: Webhook de destino: {webhook_url}")
+    if senha_do_pdf:
+        print("INFO [BG]: PDF protegido por senha detectado.")
+    if chave_idempotencia is None:
+        chave_idempotencia = secrets.token_urlsafe(16)
+        gerenciador_encerramento.registrar_progresso(chave_idempotencia=chave_idempotencia)
+    
+    if resultado is None:
+        json_resultado = await baixar_e_processar(file_url, user_id, senha_do_pdf, modo_pipeline)
+        gerenciador_encerramento.registrar_progresso(resultado=json_resultado)
+    else:
+        print("INFO [BG]: Resultado já processado antes do último encerramento, só reenviando.")
+        json_resultado = resultado
     
     try:
         print(f"INFO [BG]: Enviando resultado para o webhook: {webhook_url}")
-        await http_client.post(webhook_url, json=json_resultado, timeout=10.0)
+        await http_client.post(webhook_url, json=json_resultado, headers={"Idempotency-Key": chave_idempotencia}, timeout=10.0)
         
         end_time = time.time()
         tempo_total = end_time - start_time
@@ -1029,21 +3170,129 @@ async def processar_e_enviar_webhook(file_url: str, webhook_url: str, user_id: i
 
 # 22 - Endpoint de upload direto
 @app.post("/processar-extrato/")
-async def processar_extrato_endpoint(file: UploadFile = File(...), user_id: int = 1, senha_do_pdf: str | None = None):
+async def processar_extrato_endpoint(file: UploadFile = File(...), user_id: int = 1, senha_do_pdf: str | None = None,
+                                     modo_pipeline: str | None = None, timeout_ms: int | None = None,
+                                     x_timeout_ms: int | None = Header(None)):
     """
     Recebe um PDF via upload de arquivo (form-data), 
     executa o pipeline otimizado e retorna o JSON.
-    Aceita um parâmetro opcional 'senha_do_pdf' para PDFs protegidos.
+    Aceita um parâmetro opcional 'senha_do_pdf' para PDFs protegidos e
+    'modo_pipeline' ("duas_etapas", "multimodal" ou "auto").
+    'timeout_ms' (ou o cabeçalho X-Timeout-Ms) define o prazo: o que não
+    terminar a tempo vem em "missing_pages", com um "continuation_token".
     """
     print(f"INFO: Recebido arquivo: {file.filename} para usuário {user_id}")
     if senha_do_pdf:
         print("INFO: Senha do PDF fornecida.")
-    pdf_bytes = await file.read()
-    return await _processar_bytes_sync(pdf_bytes, user_id, senha_do_pdf)
+    prazo = prazo_requisicao(timeout_ms, x_timeout_ms)
+    try:
+        pdf_bytes, previa = await ler_upload(file, "/processar-extrato/")
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    return await _processar_bytes_sync(pdf_bytes, user_id, senha_do_pdf, modo_pipeline, prazo, previa=previa)
+
+# 22.1 - Endpoint de upload direto em streaming
+@app.post("/processar-extrato-stream/")
+async def processar_extrato_stream_endpoint(file: UploadFile = File(...), user_id: int = 1, senha_do_pdf: str | None = None,
+                                            modo_pipeline: str | None = None, formato: str = "ndjson",
+                                            timeout_ms: int | None = None, x_timeout_ms: int | None = Header(None)):
+    """
+    Igual a /processar-extrato/, mas envia os eventos de progresso e as
+    transações de cada página assim que ficam prontas, terminando com o
+    evento "resumo" (resultado consolidado).
+    'formato': "ndjson" (padrão, um JSON por linha) ou "sse" (text/event-stream).
+    """
+    print(f"INFO: Recebido arquivo (streaming {formato}): {file.filename} para usuário {user_id}")
+    if senha_do_pdf:
+        print("INFO: Senha do PDF fornecida.")
+    prazo = prazo_requisicao(timeout_ms, x_timeout_ms)
+    try:
+        pdf_bytes, previa = await ler_upload(file, "/processar-extrato-stream/")
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    return await _processar_bytes_stream(pdf_bytes, user_id, senha_do_pdf, modo_pipeline, formato, prazo, previa=previa)
+
+# 22.2 - Endpoint de continuação das respostas parciais
+@app.post("/continuar-extrato/{token}")
+async def continuar_extrato_endpoint(token: str, user_id: int = 1, timeout_ms: int | None = None,
+                                     x_timeout_ms: int | None = Header(None)):
+    """
+    Processa as páginas que ficaram pendentes em uma resposta parcial
+    ("continuation_token") e retorna o resultado completo do documento.
+    'user_id' deve ser o mesmo da requisição original (404 com outro).
+    Aceita um novo prazo ('timeout_ms' ou X-Timeout-Ms); se ele também
+    acabar, a resposta é parcial de novo, com o mesmo token.
+    """
+    print(f"INFO: Recebida continuação {token[:8]}...")
+    try:
+        resultado = await continuar_processamento(token, user_id, prazo_requisicao(timeout_ms, x_timeout_ms))
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    resultado["transactions_count"] = len(resultado.get("transactions", []))
+    return JSONResponse(content=resultado)
+
+# 22.3 - Endpoint de lote: vários PDFs (e/ou zips com PDFs) no mesmo upload
+@app.post("/processar-lote/")
+async def processar_lote_endpoint(files: list[UploadFile] = File(...), user_id: int = 1, senha_do_pdf: str | None = None,
+                                  modo_pipeline: str | None = None):
+    """
+    Recebe vários arquivos no campo 'files' (form-data): PDFs ou arquivos
+    zip com PDFs dentro. Retorna o resultado de cada documento e as
+    transações de todos, deduplicadas, com start_month/end_month do lote.
+    """
+    print(f"INFO: Recebido lote de {len(files)} arquivos para usuário {user_id}")
+    try:
+        documentos = []
+        for arquivo in files:
+            dados = await arquivo.read()
+            nome = arquivo.filename or f"arquivo{len(documentos) + 1}"
+            if dados[:4] == b"PK\x03\x04":
+                documentos.extend(expandir_zip(nome, dados))
+            else:
+                documentos.append((nome, dados))
+        return JSONResponse(content=await processar_lote(documentos, user_id, senha_do_pdf, modo_pipeline))
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail})
+
+# 22.4 - Endpoint de lote por URLs
+@app.post("/processar-lote-url/")
+async def processar_lote_url_endpoint(payload: LotePayload):
+    """
+    Recebe um JSON com 'file_urls', 'user_id' e opcionalmente 'senha_do_pdf'
+    e 'modo_pipeline'; baixa e processa os PDFs como um lote e retorna o
+    mesmo resultado de /processar-lote/.
+    """
+    print(f"INFO: Recebido lote de {len(payload.file_urls)} URLs para usuário {payload.user_id}")
+    try:
+        documentos = [(url, url) for url in payload.file_urls]
+        return JSONResponse(content=await processar_lote(documentos, payload.user_id, payload.senha_do_pdf, payload.modo_pipeline))
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail})
+
+# 22.5 - Endpoint de reprocessamento a partir dos artefatos
+@app.post("/reprocessar/{document_hash}")
+async def reprocessar_endpoint(document_hash: str, user_id: int):
+    """
+    Reaplica a LLM e a categorização a um documento já processado
+    ("document_hash" da resposta), sem reenviar nem reextrair o PDF.
+    Útil depois de mudar o prompt, os modelos de layout ou as categorias.
+    'user_id' é obrigatório e deve ser o do processamento original (404 com
+    outro). Ele não é autenticado: a API deve ficar atrás de quem autentica.
+    """
+    print(f"INFO: Recebido reprocessamento do documento {document_hash[:12]}")
+    try:
+        resultado = await reprocessar_documento(document_hash, user_id)
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    except Exception as e:
+        print(f"ERRO Inesperado no reprocessamento: {e}")
+        return JSONResponse(status_code=500, content={"success": False, "error_message": f"Erro inesperado: {e}"})
+    resultado["transactions_count"] = len(resultado.get("transactions", []))
+    return JSONResponse(content=resultado)
 
 # 23 - Endpoint de URL assíncrona
 @app.post("/processar-extrato-url/")
-async def processar_extrato_url_endpoint(payload: URLPayload, background_tasks: BackgroundTasks):
+async def processar_extrato_url_endpoint(payload: URLPayload):
     """
     Recebe um JSON com uma 'file_url', 'webhook_url', 'user_id' e opcionalmente 'senha_do_pdf',
     inicia o processamento em background e retorna as transações
@@ -1053,17 +3302,30 @@ async def processar_extrato_url_endpoint(payload: URLPayload, background_tasks:
     if payload.senha_do_pdf:
         print("INFO: Senha do PDF fornecida na requisição.")
     
-    background_tasks.add_task(
-        processar_e_enviar_webhook, 
-        file_url=payload.file_url, 
+    try:
+        gerenciador_encerramento.verificar_admissao()
+        validar_modo_pipeline(payload.modo_pipeline)
+        if ADMISSAO:
+            controle_admissao.verificar_fila(PRIORIDADES_ENDPOINT["/processar-extrato-url/"])
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    
+    # Fora do ciclo da requisição: no encerramento, o job é drenado ou salvo para retomar
+    chave_idempotencia = secrets.token_urlsafe(16)
+    gerenciador_encerramento.iniciar_trabalho(
+        processar_e_enviar_webhook,
+        file_url=payload.file_url,
         webhook_url=payload.webhook_url,
         user_id=payload.user_id,
-        senha_do_pdf=payload.senha_do_pdf
+        senha_do_pdf=payload.senha_do_pdf,
+        modo_pipeline=payload.modo_pipeline,
+        chave_idempotencia=chave_idempotencia
     )
     
     return JSONResponse(
         status_code=202,
-        content={"status": "processamento_iniciado", "user_id": payload.user_id, "file_url": payload.file_url}
+        content={"status": "processamento_iniciado", "user_id": payload.user_id, "file_url": payload.file_url,
+                 "idempotency_key": chave_idempotencia}
     )
 
 # 23.5 - Endpoint para contagem de tokens
@@ -1188,32 +3450,114 @@ async def contar_tokens_upload_endpoint(file: UploadFile = File(...)):
             }
         )
 
+# 23.7 - Endpoint de métricas internas
+@app.get("/metricas/")
+async def metricas_endpoint():
+    """
+    Retorna os contadores internos do processo (ex: trabalho desperdiçado pelo OCR especulativo).
+    """
+    return JSONResponse(content={
+        **METRICAS,
+        "cache_estabelecimentos": cache_estabelecimentos.metricas(),
+        "modelos_layout": registro_modelos.metricas(),
+        "continuacoes": armazem_continuacoes.metricas(),
+        "admissao": controle_admissao.metricas(),
+        "cotas": cotas_usuarios.metricas(),
+        "escalonador": {"gemini": escalonador_gemini.metricas(), "cpu": escalonador_cpu.metricas()},
+        "livro_transacoes": livro_transacoes.metricas(),
+        "encerramento": gerenciador_encerramento.metricas(),
+        "compartilhado": {"workers": WORKERS, "ativo": COMPARTILHADO, **banco_compartilhado.metricas(),
+                          "limite_gemini": limite_gemini.metricas()},
+        "clientes": {"gemini": gemini_client.metricas(), **({"supabase": supabase.metricas()} if supabase else {})},
+        **({"artefatos": await asyncio.to_thread(armazem_artefatos.metricas)} if ARTEFATOS else {}),
+    })
+
+# 23.8 - Endpoint de situação das cotas de um usuário
+@app.get("/cotas/{user_id}")
+async def cotas_endpoint(user_id: int):
+    """
+    Retorna os limites e o saldo das cotas do usuário (páginas por minuto e
+    tokens por dia), o peso dele na fila justa e as chamadas em execução e
+    na fila do Gemini e do pool de CPU.
+    """
+    return JSONResponse(content={
+        **cotas_usuarios.status(user_id),
+        "escalonador": {"gemini": escalonador_gemini.status(user_id), "cpu": escalonador_cpu.status(user_id)},
+    })
+
 # 24 - Endpoint de base64
 @app.post("/processar-extrato-base64/")
-async def processar_extrato_base64_endpoint(payload: Base64Payload):
+async def processar_extrato_base64_endpoint(payload: Base64Payload, x_timeout_ms: int | None = Header(None)):
     """
     Recebe um PDF em base64, executa o pipeline otimizado e retorna o JSON.
-    Aceita um parâmetro opcional 'senha_do_pdf' para PDFs protegidos.
+    Aceita um parâmetro opcional 'senha_do_pdf' para PDFs protegidos e
+    'timeout_ms' (ou o cabeçalho X-Timeout-Ms) para o prazo.
     """
+    prazo = prazo_requisicao(payload.timeout_ms, x_timeout_ms)
     print(f"INFO: Recebido arquivo base64 para usuário {payload.user_id}")
     if payload.filename:
         print(f"INFO: Nome do arquivo: {payload.filename}")
     if payload.senha_do_pdf:
         print("INFO: Senha do PDF fornecida.")
     
+    try:
+        # Admitido pelo tamanho antes de decodificar e abrir (3 bytes a cada 4 caracteres de base64)
+        previa = await admitir_upload(len(payload.file_base64) * 3 // 4, "/processar-extrato-base64/")
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
     try:
         pdf_bytes = decodificar_base64_para_bytes(payload.file_base64)
-        return await _processar_bytes_sync(pdf_bytes, payload.user_id, payload.senha_do_pdf)
     except HTTPException as e:
+        liberar_documento(previa)
         return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail})
+    return await _processar_bytes_sync(pdf_bytes, payload.user_id, payload.senha_do_pdf, payload.modo_pipeline, prazo,
+                                       "/processar-extrato-base64/", previa)
+
+# 24.1 - Endpoint de base64 em streaming
+@app.post("/processar-extrato-base64-stream/")
+async def processar_extrato_base64_stream_endpoint(payload: Base64Payload, formato: str = "ndjson",
+                                                   x_timeout_ms: int | None = Header(None)):
+    """
+    Igual a /processar-extrato-base64/, com a resposta em streaming
+    (ver /processar-extrato-stream/).
+    """
+    prazo = prazo_requisicao(payload.timeout_ms, x_timeout_ms)
+    print(f"INFO: Recebido arquivo base64 (streaming {formato}) para usuário {payload.user_id}")
+    if payload.filename:
+        print(f"INFO: Nome do arquivo: {payload.filename}")
+    if payload.senha_do_pdf:
+        print("INFO: Senha do PDF fornecida.")
+    
+    try:
+        previa = await admitir_upload(len(payload.file_base64) * 3 // 4, "/processar-extrato-base64-stream/")
+    except HTTPException as e:
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail}, headers=e.headers)
+    try:
+        pdf_bytes = decodificar_base64_para_bytes(payload.file_base64)
+    except HTTPException as e:
+        liberar_documento(previa)
+        return JSONResponse(status_code=e.status_code, content={"success": False, "error_message": e.detail})
+    return await _processar_bytes_stream(pdf_bytes, payload.user_id, payload.senha_do_pdf, payload.modo_pipeline, formato, prazo,
+                                         "/processar-extrato-base64-stream/", previa)
 
 # 25 - Inicia servidor web
+METRICAS["inicializacao"]["segundos_importacao"] = round(time.perf_counter() - INICIO_IMPORTACAO, 3)
+
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", 8000))
+    import uvicorn
+    port = ler_inteiro("PORT", 8000)
     host = "0.0.0.0"
     
-    print(f"Iniciando servidor FastAPI em {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
+    # Em cada worker, o ciclo de vida encadeia a recusa de documentos novos aos tratadores de sinal do uvicorn
+    if WORKERS > 1:
+        # Cada worker é um processo que importa a API de novo (o estado comum fica no banco compartilhado).
+        # O SIGTERM chega aos workers pelo processo principal e cada um drena o próprio trabalho no ciclo de vida
+        print(f"Iniciando servidor FastAPI em {host}:{port} com {WORKERS} workers ({CPU_WORKERS} processos de CPU cada)")
+        uvicorn.run("api_rapida:app", host=host, port=port, workers=WORKERS,
+                    timeout_graceful_shutdown=int(ENCERRAMENTO_PRAZO_S))
+    else:
+        print(f"Iniciando servidor FastAPI em {host}:{port}")
+        uvicorn.run(app, host=host, port=port, timeout_graceful_shutdown=int(ENCERRAMENTO_PRAZO_S))
 
 
 
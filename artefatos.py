@@ -0,0 +1,259 @@
+# 1 - Importa módulos para o armazém de artefatos intermediários dos documentos
+import contextvars
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import zlib
+from compartilhado import conectar_sqlite
+from inicializacao import ler_decimal
+
+# 1.1 - Liga/desliga (desligado por padrão: guarda o texto dos extratos em disco), diretório
+# (índice SQLite + blobs compactados, legíveis só pelo dono do processo) e retenção
+ARTEFATOS = os.getenv("ARTEFATOS", "false").lower() in ("1", "true", "sim")
+ARTEFATOS_DIR = os.getenv("ARTEFATOS_DIR", os.path.join("dados", "artefatos"))
+ARTEFATOS_TTL_DIAS = ler_decimal("ARTEFATOS_TTL_DIAS", 30, minimo=0)  # 0 guarda para sempre
+INTERVALO_LIMPEZA_S = 3600
+
+# 1.2 - Tipos de artefato: por página (pagina >= 1) ou do documento inteiro (pagina 0)
+TEXTO_EXTRAIDO = "texto_extraido"            # texto nativo/OCR como saiu da extração
+TEXTO_LLM = "texto_llm"                      # texto enviado à LLM (tabelas remontadas, sem boilerplate)
+RENDERIZACAO = "renderizacao"                # DPI e dimensões das páginas renderizadas (OCR/multimodal)
+RESULTADOS_PARSER = "resultados_parser"      # páginas resolvidas pelo parser determinístico
+RESULTADOS_MULTIMODAL = "resultados_multimodal"
+SAIDAS_LLM = "saidas_llm"                    # respostas brutas da LLM, por versão do prompt
+
+# 1.3 - Respostas da LLM da requisição em andamento (None = não coletar)
+saidas_llm_atuais: contextvars.ContextVar[list | None] = contextvars.ContextVar("saidas_llm_atuais", default=None)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    hash TEXT PRIMARY KEY,
+    user_id INTEGER,
+    paginas INTEGER NOT NULL,
+    tamanho_bytes INTEGER NOT NULL,
+    modelo_layout TEXT,
+    estrategias TEXT NOT NULL,
+    criado_em REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS artefatos (
+    hash TEXT NOT NULL REFERENCES documentos(hash) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,
+    pagina INTEGER NOT NULL,
+    chave TEXT NOT NULL DEFAULT '',
+    arquivo TEXT NOT NULL,
+    metadados TEXT,
+    tamanho_bytes INTEGER NOT NULL,
+    criado_em REAL NOT NULL,
+    PRIMARY KEY (hash, tipo, pagina, chave)
+);
+"""
+
+
+# 2 - Armazém de artefatos
+class ArmazemArtefatos:
+    """
+    Guarda, por hash (sha256) do PDF, o que é caro de refazer: o texto de cada
+    página (extraído e o enviado à LLM), os metadados de renderização, os
+    resultados do parser/multimodal e as respostas brutas da LLM. O índice
+    fica em SQLite e o conteúdo em arquivos compactados com zlib em
+    blobs/<hash[:2]>/<hash>/, gravados de forma atômica.
+    Com isso, uma mudança de prompt ou de categorização pode ser reaplicada
+    sem baixar, abrir ou fazer OCR do PDF de novo.
+    Cada documento fica associado ao user_id do último processamento e as
+    leituras filtram por ele. Isso só separa os documentos dos usuários: o
+    user_id vem de quem chama, sem autenticação, então não é controle de
+    acesso. Os arquivos são gravados com permissão só para o dono do processo.
+    """
+
+    def __init__(self, diretorio: str = ARTEFATOS_DIR, ttl_dias: float = ARTEFATOS_TTL_DIAS):
+        self.diretorio = diretorio
+        self.ttl_dias = ttl_dias
+        self._conexao = None
+        self._trava = threading.Lock()
+        self._ultima_limpeza = 0.0
+        self.salvos = 0
+        self.carregados = 0
+        self.removidos = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            os.makedirs(os.path.join(self.diretorio, "blobs"), mode=0o700, exist_ok=True)
+            self._conexao = conectar_sqlite(os.path.join(self.diretorio, "artefatos.db"))
+            self._conexao.execute("PRAGMA foreign_keys = ON")
+            self._conexao.executescript(ESQUEMA)
+            colunas = {linha[1] for linha in self._conexao.execute("PRAGMA table_info(documentos)")}
+            if "user_id" not in colunas:
+                # Armazém anterior ao dono dos documentos: os antigos ficam sem dono (ninguém reprocessa)
+                self._conexao.execute("ALTER TABLE documentos ADD COLUMN user_id INTEGER")
+        return self._conexao
+
+    def _pasta(self, hash_documento: str) -> str:
+        return os.path.join(self.diretorio, "blobs", hash_documento[:2], hash_documento)
+
+    def _gravar_blob(self, hash_documento: str, nome: str, conteudo: str) -> tuple[str, int]:
+        pasta = self._pasta(hash_documento)
+        os.makedirs(pasta, mode=0o700, exist_ok=True)
+        dados = zlib.compress(conteudo.encode("utf-8"), 6)
+        caminho = os.path.join(pasta, nome)
+        with open(os.open(caminho + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            f.write(dados)
+        os.replace(caminho + ".tmp", caminho)
+        return os.path.relpath(caminho, self.diretorio), len(dados)
+
+    def _ler_blob(self, arquivo: str) -> str:
+        with open(os.path.join(self.diretorio, arquivo), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def _inserir(self, conexao: sqlite3.Connection, hash_documento: str, tipo: str, pagina: int, conteudo,
+                 metadados: dict | None = None, chave: str = ""):
+        texto = conteudo if isinstance(conteudo, str) else json.dumps(conteudo, ensure_ascii=False)
+        nome = f"{tipo}-{pagina}{'-' + chave if chave else ''}.z"
+        arquivo, tamanho = self._gravar_blob(hash_documento, nome, texto)
+        conexao.execute(
+            "INSERT OR REPLACE INTO artefatos VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (hash_documento, tipo, pagina, chave, arquivo, json.dumps(metadados) if metadados else None, tamanho, time.time()))
+
+    # 2.1 - Gravação
+    def salvar(self, hash_documento: str, artefatos: dict):
+        """
+        Grava (substituindo) os artefatos de um processamento completo:
+        {"user_id", "paginas", "tamanho_bytes", "modelo_layout", "estrategias": {pagina: estrategia},
+         "textos_extraidos"/"textos_llm": {pagina: texto}, "renderizacao": {pagina: {...}},
+         "resultados_parser"/"resultados_multimodal": [...], "versao_prompt", "saidas_llm": [...]}.
+        Páginas a partir de 1. As respostas da LLM de outras versões do prompt
+        são mantidas, salvo se o documento mudou de usuário; os arquivos dos
+        artefatos substituídos são apagados junto com as linhas.
+        """
+        try:
+            with self._trava:
+                conexao = self._conectar()
+                with conexao:
+                    agora = time.time()
+                    anterior = conexao.execute("SELECT user_id FROM documentos WHERE hash = ?", (hash_documento,)).fetchone()
+                    # Processado por outro usuário: nada do anterior fica para o novo (nem as respostas da LLM)
+                    if anterior is not None and anterior[0] != artefatos["user_id"]:
+                        filtro, parametros = "hash = ?", (hash_documento,)
+                    else:
+                        filtro, parametros = "hash = ? AND tipo != ?", (hash_documento, SAIDAS_LLM)
+                    substituidos = {a for (a,) in conexao.execute(f"SELECT arquivo FROM artefatos WHERE {filtro}", parametros)}
+                    conexao.execute(f"DELETE FROM artefatos WHERE {filtro}", parametros)
+                    conexao.execute(
+                        "INSERT INTO documentos (hash, user_id, paginas, tamanho_bytes, modelo_layout, estrategias, criado_em, "
+                        "atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(hash) DO UPDATE SET user_id = excluded.user_id, "
+                        "modelo_layout = excluded.modelo_layout, estrategias = excluded.estrategias, atualizado_em = excluded.atualizado_em",
+                        (hash_documento, artefatos["user_id"], artefatos["paginas"], artefatos["tamanho_bytes"],
+                         artefatos.get("modelo_layout"), json.dumps(artefatos["estrategias"]), agora, agora))
+                    for pagina, texto in artefatos.get("textos_extraidos", {}).items():
+                        self._inserir(conexao, hash_documento, TEXTO_EXTRAIDO, pagina, texto,
+                                      {"estrategia": artefatos["estrategias"].get(pagina)})
+                    for pagina, texto in artefatos.get("textos_llm", {}).items():
+                        self._inserir(conexao, hash_documento, TEXTO_LLM, pagina, texto)
+                    for pagina, metadados in artefatos.get("renderizacao", {}).items():
+                        self._inserir(conexao, hash_documento, RENDERIZACAO, pagina, metadados)
+                    for tipo in (RESULTADOS_PARSER, RESULTADOS_MULTIMODAL):
+                        if artefatos.get(tipo):
+                            self._inserir(conexao, hash_documento, tipo, 0, artefatos[tipo])
+                    self._inserir_saidas(conexao, hash_documento, artefatos.get("versao_prompt", ""), artefatos.get("saidas_llm"))
+                    mantidos = {a for (a,) in conexao.execute("SELECT arquivo FROM artefatos WHERE hash = ?", (hash_documento,))}
+                for arquivo in substituidos - mantidos:
+                    try:
+                        os.remove(os.path.join(self.diretorio, arquivo))
+                    except FileNotFoundError:
+                        pass
+                self.salvos += 1
+            self._limpar_expirados()
+        except Exception as e:
+            print(f"ERRO ao salvar artefatos do documento {hash_documento[:12]}: {e}")
+
+    def _inserir_saidas(self, conexao: sqlite3.Connection, hash_documento: str, versao_prompt: str, saidas: list | None):
+        if saidas:
+            self._inserir(conexao, hash_documento, SAIDAS_LLM, 0, saidas, {"chamadas": len(saidas)}, chave=versao_prompt)
+
+    def salvar_saidas_llm(self, hash_documento: str, versao_prompt: str, saidas: list):
+        """
+        Acrescenta as respostas brutas de um reprocessamento (substitui as da mesma versão do prompt).
+        """
+        try:
+            with self._trava:
+                conexao = self._conectar()
+                with conexao:
+                    self._inserir_saidas(conexao, hash_documento, versao_prompt, saidas)
+                    conexao.execute("UPDATE documentos SET atualizado_em = ? WHERE hash = ?", (time.time(), hash_documento))
+        except Exception as e:
+            print(f"ERRO ao salvar respostas da LLM do documento {hash_documento[:12]}: {e}")
+
+    # 2.2 - Leitura
+    def carregar(self, hash_documento: str, user_id: int) -> dict | None:
+        """
+        Lê os artefatos do documento no mesmo formato de salvar (saidas_llm
+        agrupadas por versão do prompt), ou None se o documento não existir
+        ou não for de user_id (sem distinguir os casos).
+        """
+        with self._trava:
+            conexao = self._conectar()
+            documento = conexao.execute(
+                "SELECT paginas, tamanho_bytes, modelo_layout, estrategias, criado_em, atualizado_em FROM documentos "
+                "WHERE hash = ? AND user_id = ?", (hash_documento, user_id)).fetchone()
+            if documento is None:
+                return None
+            linhas = conexao.execute("SELECT tipo, pagina, chave, arquivo FROM artefatos WHERE hash = ?", (hash_documento,)).fetchall()
+            artefatos = {
+                "hash": hash_documento, "user_id": user_id, "paginas": documento[0], "tamanho_bytes": documento[1], "modelo_layout": documento[2],
+                "estrategias": {int(p): e for p, e in json.loads(documento[3]).items()},
+                "criado_em": documento[4], "atualizado_em": documento[5],
+                "textos_extraidos": {}, "textos_llm": {}, "renderizacao": {}, "saidas_llm": {},
+            }
+            for tipo, pagina, chave, arquivo in linhas:
+                conteudo = self._ler_blob(arquivo)
+                if tipo == TEXTO_EXTRAIDO:
+                    artefatos["textos_extraidos"][pagina] = conteudo
+                elif tipo == TEXTO_LLM:
+                    artefatos["textos_llm"][pagina] = conteudo
+                elif tipo == RENDERIZACAO:
+                    artefatos["renderizacao"][pagina] = json.loads(conteudo)
+                elif tipo == SAIDAS_LLM:
+                    artefatos["saidas_llm"][chave] = json.loads(conteudo)
+                else:
+                    artefatos[tipo] = json.loads(conteudo)
+            self.carregados += 1
+        return artefatos
+
+    def listar(self, user_id: int) -> list[str]:
+        with self._trava:
+            return [h for (h,) in self._conectar().execute("SELECT hash FROM documentos WHERE user_id = ? ORDER BY atualizado_em",
+                                                           (user_id,))]
+
+    # 2.3 - Retenção
+    def remover(self, hash_documento: str):
+        with self._trava:
+            conexao = self._conectar()
+            with conexao:
+                conexao.execute("DELETE FROM documentos WHERE hash = ?", (hash_documento,))
+            shutil.rmtree(self._pasta(hash_documento), ignore_errors=True)
+            self.removidos += 1
+
+    def _limpar_expirados(self):
+        """
+        Remove, no máximo uma vez por hora, os documentos sem uso há mais de ARTEFATOS_TTL_DIAS.
+        """
+        if self.ttl_dias <= 0 or time.time() - self._ultima_limpeza < INTERVALO_LIMPEZA_S:
+            return
+        self._ultima_limpeza = time.time()
+        with self._trava:
+            limite = time.time() - self.ttl_dias * 86400
+            expirados = [h for (h,) in self._conectar().execute("SELECT hash FROM documentos WHERE atualizado_em < ?", (limite,))]
+        for hash_documento in expirados:
+            self.remover(hash_documento)
+        if expirados:
+            print(f"DEBUG: {len(expirados)} documentos expirados removidos do armazém de artefatos")
+
+    def metricas(self) -> dict:
+        with self._trava:
+            documentos, = self._conectar().execute("SELECT COUNT(*) FROM documentos").fetchone()
+            tamanho, = self._conectar().execute("SELECT COALESCE(SUM(tamanho_bytes), 0) FROM artefatos").fetchone()
+        return {"documentos": documentos, "mb_em_disco": round(tamanho / 2**20, 2), "salvos": self.salvos,
+                "carregados": self.carregados, "removidos": self.removidos}
@@ -0,0 +1,165 @@
+# 1 - Importa módulos para o cache global de estabelecimentos
+import gzip
+import json
+import os
+import threading
+import time
+from inicializacao import ler_inteiro, ler_decimal
+
+# 1.1 - Parâmetros do cache (compartilhado entre todos os usuários)
+CACHE_ESTABELECIMENTOS = os.getenv("CACHE_ESTABELECIMENTOS", "true").lower() in ("1", "true", "sim")
+CACHE_ARQUIVO = os.getenv("CACHE_ESTABELECIMENTOS_ARQUIVO", os.path.join("dados", "cache_estabelecimentos.json.gz"))
+CACHE_CONFIANCA_MINIMA = ler_decimal("CACHE_CONFIANCA_MINIMA", 2.0, minimo=0)
+CACHE_PREDOMINANCIA = ler_decimal("CACHE_PREDOMINANCIA", 0.8, minimo=0)
+CACHE_MEIA_VIDA_DIAS = ler_decimal("CACHE_MEIA_VIDA_DIAS", 90, minimo=1)
+CACHE_MAX_ENTRADAS = ler_inteiro("CACHE_MAX_ENTRADAS", 200000, minimo=1)
+CACHE_INTERVALO_SALVAR = ler_decimal("CACHE_INTERVALO_SALVAR", 60, minimo=0)
+VERSAO_FORMATO = 1
+SEGUNDOS_POR_DIA = 86400
+
+
+# 2 - Dicionário estabelecimento -> categoria com contagens e decaimento
+class CacheEstabelecimentos:
+    """
+    Guarda, para cada descrição normalizada (chave de limpar_descricao_para_match),
+    quantas vezes a LLM a classificou em cada (categoria, subcategoria). Os pesos
+    decaem pela meia-vida: categorizações antigas perdem força até serem
+    confirmadas de novo pela LLM.
+
+    Formato em disco (JSON compactado com gzip), pensado para carregar rápido:
+    {"versao": 1, "categorias": [[categoria, subcategoria], ...],
+     "entradas": {chave: [dia, indice_categoria, peso, indice_categoria, peso, ...]}}
+    As categorias são internadas em uma lista e referenciadas pelo índice.
+    """
+
+    def __init__(self, arquivo: str | None = CACHE_ARQUIVO):
+        self.arquivo = arquivo
+        self._categorias: list[tuple[str, str]] = []
+        self._indices: dict[tuple[str, str], int] = {}
+        self._entradas: dict[str, list] = {}
+        self._trava = threading.Lock()
+        self._alterado = False
+        self._ultimo_salvamento = time.time()
+        self.consultas = 0
+        self.acertos = 0
+
+    # 2.1 - Persistência
+    def carregar(self):
+        """
+        Lê o arquivo do cache, se existir. Arquivo ausente ou inválido começa vazio.
+        """
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return
+        try:
+            with gzip.open(self.arquivo, "rt", encoding="utf-8") as f:
+                dados = json.load(f)
+            if dados.get("versao") != VERSAO_FORMATO:
+                print(f"AVISO: Formato do cache de estabelecimentos desconhecido, ignorando {self.arquivo}")
+                return
+            with self._trava:
+                self._categorias = [tuple(c) for c in dados["categorias"]]
+                self._indices = {c: i for i, c in enumerate(self._categorias)}
+                self._entradas = dados["entradas"]
+            print(f"DEBUG: Cache de estabelecimentos carregado: {len(self._entradas)} entradas")
+        except Exception as e:
+            print(f"ERRO ao carregar cache de estabelecimentos: {e}")
+
+    def salvar(self):
+        """
+        Grava o cache (escrita atômica via arquivo temporário), descartando as
+        entradas mais fracas acima de CACHE_MAX_ENTRADAS.
+        """
+        if not self.arquivo:
+            return
+        with self._trava:
+            hoje = _dia_atual()
+            if len(self._entradas) > CACHE_MAX_ENTRADAS:
+                por_peso = sorted(self._entradas, key=lambda c: sum(self._pesos(self._entradas[c], hoje).values()))
+                for chave in por_peso[:len(self._entradas) - CACHE_MAX_ENTRADAS]:
+                    del self._entradas[chave]
+            dados = {
+                "versao": VERSAO_FORMATO,
+                "categorias": [list(c) for c in self._categorias],
+                "entradas": dict(self._entradas),
+            }
+            self._alterado = False
+            self._ultimo_salvamento = time.time()
+        try:
+            os.makedirs(os.path.dirname(self.arquivo) or ".", exist_ok=True)
+            temporario = f"{self.arquivo}.tmp"
+            with gzip.open(temporario, "wt", encoding="utf-8") as f:
+                json.dump(dados, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(temporario, self.arquivo)
+            print(f"DEBUG: Cache de estabelecimentos salvo: {len(dados['entradas'])} entradas")
+        except Exception as e:
+            print(f"ERRO ao salvar cache de estabelecimentos: {e}")
+
+    def precisa_salvar(self) -> bool:
+        """
+        Há alterações e já passou CACHE_INTERVALO_SALVAR desde o último salvamento.
+        """
+        return self._alterado and time.time() - self._ultimo_salvamento >= CACHE_INTERVALO_SALVAR
+
+    # 2.2 - Consulta e aprendizado
+    def _pesos(self, entrada: list, hoje: int) -> dict[int, float]:
+        fator = 0.5 ** ((hoje - entrada[0]) / CACHE_MEIA_VIDA_DIAS)
+        return {entrada[i]: entrada[i + 1] * fator for i in range(1, len(entrada), 2)}
+
+    def consultar(self, chave: str) -> dict | None:
+        """
+        Retorna {"categoria", "subcategoria"} se a chave tem confiança suficiente:
+        peso (já com decaimento) de pelo menos CACHE_CONFIANCA_MINIMA e
+        predominância de CACHE_PREDOMINANCIA sobre as outras categorias.
+        """
+        with self._trava:
+            self.consultas += 1
+            entrada = self._entradas.get(chave)
+            if not entrada:
+                return None
+            pesos = self._pesos(entrada, _dia_atual())
+            indice, peso = max(pesos.items(), key=lambda p: p[1])
+            if peso < CACHE_CONFIANCA_MINIMA or peso < CACHE_PREDOMINANCIA * sum(pesos.values()):
+                return None
+            self.acertos += 1
+            categoria, subcategoria = self._categorias[indice]
+        return {"categoria": categoria, "subcategoria": subcategoria}
+
+    def registrar(self, chave: str, categoria: str, subcategoria: str):
+        """
+        Soma uma observação (categoria dada pela LLM) à chave, aplicando antes o
+        decaimento dos pesos existentes.
+        """
+        if not chave or not categoria:
+            return
+        with self._trava:
+            par = (categoria, subcategoria or "")
+            if par not in self._indices:
+                self._indices[par] = len(self._categorias)
+                self._categorias.append(par)
+            indice = self._indices[par]
+
+            hoje = _dia_atual()
+            entrada = self._entradas.get(chave)
+            pesos = self._pesos(entrada, hoje) if entrada else {}
+            pesos[indice] = pesos.get(indice, 0.0) + 1.0
+            nova = [hoje]
+            for i, peso in pesos.items():
+                if peso >= 0.05:
+                    nova.extend((i, round(peso, 3)))
+            self._entradas[chave] = nova
+            self._alterado = True
+
+    def metricas(self) -> dict:
+        return {
+            "entradas": len(self._entradas),
+            "consultas": self.consultas,
+            "acertos": self.acertos,
+            "taxa_acerto": round(self.acertos / self.consultas, 4) if self.consultas else 0.0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+
+def _dia_atual() -> int:
+    return int(time.time() // SEGUNDOS_POR_DIA)
@@ -0,0 +1,70 @@
+# 1 - Importa módulos para a categorização local por palavras-chave
+import os
+import re
+import unicodedata
+from prompt_e_schema import TAXONOMIA
+
+# 1.1 - Liga/desliga o categorizador local (antes da LLM)
+CATEGORIZACAO_LOCAL = os.getenv("CATEGORIZACAO_LOCAL", "true").lower() in ("1", "true", "sim")
+
+
+# 2 - Normalização usada tanto nas palavras-chave quanto nas descrições
+def normalizar_texto(texto: str) -> str:
+    """
+    Minúsculas, sem acentos, sem apóstrofos e com espaços colapsados
+    ("McDonald's" -> "mcdonalds", "Pão de Açúcar" -> "pao de acucar").
+    """
+    texto = unicodedata.normalize("NFKD", texto)
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.casefold().replace("'", "").replace("’", "")
+    return " ".join(texto.split())
+
+
+# 3 - Casador de múltiplos padrões compilado a partir da taxonomia
+class CategorizadorLocal:
+    """
+    Compila todas as palavras-chave de categorias.json (exceto as marcadas em
+    "fora_do_matcher", genéricas demais) em uma única expressão regular.
+    As alternativas ficam em ordem decrescente de tamanho, então a palavra-chave
+    mais longa vence na mesma posição ("zona azul" antes de "azul", "uber eats"
+    antes de "uber").
+
+    Uma descrição é categorizada localmente só quando todas as palavras-chave
+    encontradas apontam para a mesma (categoria, subcategoria); sem palavra-chave
+    ou com destinos diferentes, fica para a LLM.
+    """
+
+    def __init__(self, taxonomia: list[dict]):
+        self._destinos: dict[str, set[tuple[str, str]]] = {}
+        for categoria in taxonomia:
+            for sub in categoria["subcategorias"]:
+                fora = set(sub.get("fora_do_matcher", []))
+                for exemplo in sub["exemplos"]:
+                    if exemplo in fora:
+                        continue
+                    chave = normalizar_texto(exemplo)
+                    self._destinos.setdefault(chave, set()).add((categoria["nome"], sub["nome"]))
+
+        alternativas = "|".join(re.escape(p) for p in sorted(self._destinos, key=len, reverse=True))
+        self._padrao = re.compile(rf"(?<![a-z0-9])(?:{alternativas})(?![a-z0-9])")
+
+    def palavras_encontradas(self, descricao: str) -> list[str]:
+        return [m.group(0) for m in self._padrao.finditer(normalizar_texto(descricao))]
+
+    def categorizar(self, descricao: str) -> dict | None:
+        """
+        Retorna {"categoria", "subcategoria"} ou None se a descrição for ambígua
+        ou não tiver palavra-chave conhecida.
+        """
+        destinos = set()
+        for palavra in self.palavras_encontradas(descricao):
+            destinos |= self._destinos[palavra]
+        if len(destinos) != 1:
+            return None
+        categoria, subcategoria = destinos.pop()
+        return {"categoria": categoria, "subcategoria": subcategoria}
+
+    def __len__(self) -> int:
+        return len(self._destinos)
+
+categorizador_local = CategorizadorLocal(TAXONOMIA)
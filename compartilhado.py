@@ -0,0 +1,339 @@
+# 1 - Importa módulos para o modo com vários workers (estado compartilhado entre processos)
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from inicializacao import ler_inteiro, ler_decimal
+
+# 1.1 - Workers do uvicorn (WEB_CONCURRENCY, a mesma variável do uvicorn e do Render) e estado
+# compartilhado entre eles em um banco SQLite; ligado por padrão quando há mais de um worker
+WORKERS = ler_inteiro("WEB_CONCURRENCY", 1, minimo=1)
+COMPARTILHADO = os.getenv("COMPARTILHADO", "true" if WORKERS > 1 else "false").lower() in ("1", "true", "sim")
+COMPARTILHADO_ARQUIVO = os.getenv("COMPARTILHADO_ARQUIVO", os.path.join("dados", "compartilhado.db"))
+SQLITE_ESPERA_S = 5  # espera pela trava de escrita de outro processo antes de "database is locked"
+INTERVALO_LIMPEZA_S = 600
+
+# 1.2 - Validade das entradas compartilhadas (0 desliga): respostas da LLM por prompt
+# e categorizações personalizadas de cada usuário (lidas do Supabase)
+CACHE_RESPOSTAS_TTL_S = ler_inteiro("CACHE_RESPOSTAS_TTL_S", 86400, minimo=0)
+CATEGORIZACOES_TTL_S = ler_inteiro("CATEGORIZACOES_TTL_S", 60, minimo=0)
+
+# 1.3 - Limites do projeto no Gemini, somados entre todos os workers (0 desliga), e pausa
+# de todos eles quando um 429 escapa mesmo assim. Com mais de um worker, sem GEMINI_RPM/GEMINI_TPM,
+# valem os limites documentados do nível pago 1 do modelo (requisições, tokens de entrada por minuto)
+LIMITES_GEMINI_NIVEL_1 = {
+    "gemini-2.5-pro": (150, 2_000_000),
+    "gemini-2.5-flash": (1000, 1_000_000),
+    "gemini-2.5-flash-lite": (4000, 4_000_000),
+    "gemini-2.0-flash": (2000, 4_000_000),
+    "gemini-2.0-flash-lite": (4000, 4_000_000),
+}
+GEMINI_PAUSA_429_S = ler_decimal("GEMINI_PAUSA_429_S", 30, minimo=0)
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    espaco TEXT NOT NULL,
+    chave TEXT NOT NULL,
+    valor TEXT NOT NULL,
+    expira_em REAL NOT NULL,
+    PRIMARY KEY (espaco, chave)
+);
+CREATE INDEX IF NOT EXISTS cache_expira_em ON cache (expira_em);
+CREATE TABLE IF NOT EXISTS baldes (
+    nome TEXT PRIMARY KEY,
+    saldo REAL NOT NULL,
+    atualizado_em REAL NOT NULL,
+    consumido REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def limites_gemini(modelo: str) -> tuple[int, int]:
+    """
+    (GEMINI_RPM, GEMINI_TPM) configurados; sem eles, os do nível 1 do modelo
+    quando há vários workers, ou 0 (sem limite) com um só ou modelo desconhecido.
+    """
+    rpm, tpm = LIMITES_GEMINI_NIVEL_1.get(modelo, (0, 0)) if WORKERS > 1 else (0, 0)
+    return ler_inteiro("GEMINI_RPM", rpm, minimo=0), ler_inteiro("GEMINI_TPM", tpm, minimo=0)
+
+
+# 2 - Conexão SQLite usada por vários processos
+def conectar_sqlite(arquivo: str, **opcoes) -> sqlite3.Connection:
+    """
+    Abre um banco SQLite que vários workers usam ao mesmo tempo: modo WAL
+    (leituras não bloqueiam a escrita de outro processo) e espera de até
+    SQLITE_ESPERA_S pela trava de escrita em vez de falhar na hora. O arquivo
+    fica legível só pelo dono (o SQLite cria o -wal e o -shm com as mesmas
+    permissões): guarda transações, PDFs pendentes e senhas de PDF. Só cria
+    o arquivo se ainda não existe: fechar outro descritor de um banco aberto
+    soltaria as travas das conexões deste processo.
+    """
+    os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+    if not os.path.exists(arquivo):
+        try:
+            os.close(os.open(arquivo, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600))
+        except FileExistsError:
+            pass  # outro worker criou ao mesmo tempo
+    for caminho in (arquivo, arquivo + "-wal", arquivo + "-shm"):
+        if os.path.exists(caminho):
+            os.chmod(caminho, 0o600)
+    conexao = sqlite3.connect(arquivo, check_same_thread=False, timeout=SQLITE_ESPERA_S, **opcoes)
+    conexao.execute("PRAGMA journal_mode = WAL")
+    conexao.execute("PRAGMA synchronous = NORMAL")
+    return conexao
+
+
+# 3 - Banco compartilhado: cache com validade e baldes de tokens
+class BancoCompartilhado:
+    """
+    Estado que precisa ser o mesmo em todos os workers: um cache
+    chave -> valor (JSON) com validade, separado por espaço, e os saldos dos
+    baldes de tokens (cotas dos usuários e limite do Gemini), atualizados em
+    transações exclusivas para que dois processos não gastem o mesmo saldo.
+    A conexão só é aberta no primeiro uso.
+    """
+
+    def __init__(self, arquivo: str = COMPARTILHADO_ARQUIVO):
+        self.arquivo = arquivo
+        self._conexao = None
+        self._trava = threading.Lock()
+        self._ultima_limpeza = 0.0
+        self.acertos = 0
+        self.falhas = 0
+        self.gravacoes = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            self._conexao = conectar_sqlite(self.arquivo, isolation_level=None)
+            self._conexao.executescript(ESQUEMA)
+        return self._conexao
+
+    # 3.1 - Cache
+    def obter(self, espaco: str, chave: str):
+        """
+        Valor guardado (já decodificado do JSON) ou None se ausente ou expirado.
+        """
+        with self._trava:
+            linha = self._conectar().execute("SELECT valor FROM cache WHERE espaco = ? AND chave = ? AND expira_em > ?",
+                                             (espaco, chave, time.time())).fetchone()
+            if linha is None:
+                self.falhas += 1
+                return None
+            self.acertos += 1
+        return json.loads(linha[0])
+
+    def guardar(self, espaco: str, chave: str, valor, ttl_s: float):
+        valor = json.dumps(valor, ensure_ascii=False, separators=(",", ":"))
+        with self._trava:
+            conexao = self._conectar()
+            conexao.execute("INSERT OR REPLACE INTO cache (espaco, chave, valor, expira_em) VALUES (?, ?, ?, ?)",
+                            (espaco, chave, valor, time.time() + ttl_s))
+            self.gravacoes += 1
+            if time.time() - self._ultima_limpeza >= INTERVALO_LIMPEZA_S:
+                self._ultima_limpeza = time.time()
+                conexao.execute("DELETE FROM cache WHERE expira_em <= ?", (time.time(),))
+
+    def remover(self, espaco: str, chave: str) -> bool:
+        with self._trava:
+            return self._conectar().execute("DELETE FROM cache WHERE espaco = ? AND chave = ?", (espaco, chave)).rowcount > 0
+
+    def aparar(self, espaco: str, maximo: int) -> int:
+        """
+        Mantém no espaço só as 'maximo' entradas de validade mais longa (as
+        mais recentes) e retorna quantas foram removidas.
+        """
+        with self._trava:
+            return self._conectar().execute(
+                "DELETE FROM cache WHERE espaco = ? AND chave NOT IN "
+                "(SELECT chave FROM cache WHERE espaco = ? ORDER BY expira_em DESC LIMIT ?)",
+                (espaco, espaco, maximo)).rowcount
+
+    def contar(self, espaco: str) -> int:
+        with self._trava:
+            return self._conectar().execute("SELECT COUNT(*) FROM cache WHERE espaco = ? AND expira_em > ?",
+                                            (espaco, time.time())).fetchone()[0]
+
+    # 3.2 - Baldes de tokens
+    def _saldo(self, conexao: sqlite3.Connection, nome: str, capacidade: float, periodo_s: float, agora: float) -> tuple[float, float]:
+        linha = conexao.execute("SELECT saldo, atualizado_em, consumido FROM baldes WHERE nome = ?", (nome,)).fetchone()
+        if linha is None:
+            return float(capacidade), 0.0
+        saldo, atualizado_em, consumido = linha
+        return min(capacidade, saldo + max(0.0, agora - atualizado_em) * capacidade / periodo_s), consumido
+
+    def saldo(self, nome: str, capacidade: float, periodo_s: float) -> tuple[float, float]:
+        """
+        (saldo atual, total consumido) do balde, que enche à taxa capacidade/periodo_s.
+        """
+        with self._trava:
+            return self._saldo(self._conectar(), nome, capacidade, periodo_s, time.time())
+
+    def reservar(self, pedidos: dict[str, tuple[float, float, float]], forcar: bool = False,
+                 conferir: frozenset = frozenset()) -> float:
+        """
+        Retira, numa única transação, a quantidade pedida de cada balde
+        {nome: (capacidade, periodo_s, quantidade)} se todos tiverem saldo e
+        retorna 0. Senão, não retira nada e retorna os segundos até haver
+        saldo em todos (a quantidade é limitada à capacidade, como em
+        cotas.BaldeTokens). Com 'forcar', retira mesmo sem saldo, deixando-o
+        negativo (consumo já feito, conhecido só depois da chamada). Os
+        baldes em 'conferir' só precisam ter o saldo: nada é retirado deles.
+        """
+        with self._trava:
+            conexao = self._conectar()
+            conexao.execute("BEGIN IMMEDIATE")
+            try:
+                agora = time.time()
+                saldos = {}
+                espera = 0.0
+                for nome, (capacidade, periodo_s, quantidade) in pedidos.items():
+                    saldos[nome], _ = self._saldo(conexao, nome, capacidade, periodo_s, agora)
+                    espera = max(espera, (min(quantidade, capacidade) - saldos[nome]) * periodo_s / capacidade)
+                retirar = forcar or espera <= 0
+                for nome, (_, _, quantidade) in pedidos.items():
+                    retirado = quantidade if retirar and nome not in conferir else 0
+                    conexao.execute(
+                        "INSERT INTO baldes (nome, saldo, atualizado_em, consumido) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT (nome) DO UPDATE SET saldo = excluded.saldo, atualizado_em = excluded.atualizado_em, "
+                        "consumido = consumido + excluded.consumido",
+                        (nome, saldos[nome] - retirado, agora, retirado))
+                conexao.execute("COMMIT")
+            except BaseException:
+                conexao.execute("ROLLBACK")
+                raise
+        return 0.0 if retirar else espera
+
+    def pausar(self, pedidos: dict[str, tuple[float, float, float]], segundos: float):
+        """
+        Zera os baldes e os deixa negativos o bastante para só voltarem a ter
+        saldo daqui a 'segundos' (em todos os processos).
+        """
+        with self._trava:
+            conexao = self._conectar()
+            agora = time.time()
+            for nome, (capacidade, periodo_s, _) in pedidos.items():
+                conexao.execute(
+                    "INSERT INTO baldes (nome, saldo, atualizado_em) VALUES (?, ?, ?) "
+                    "ON CONFLICT (nome) DO UPDATE SET saldo = excluded.saldo, atualizado_em = excluded.atualizado_em",
+                    (nome, -segundos * capacidade / periodo_s, agora))
+
+    def balde(self, nome: str, capacidade: float, periodo_s: float) -> "BaldeCompartilhado":
+        return BaldeCompartilhado(self, nome, capacidade, periodo_s)
+
+    def metricas(self) -> dict:
+        consultas = self.acertos + self.falhas
+        return {
+            "pid": os.getpid(),
+            "consultas": consultas,
+            "acertos": self.acertos,
+            "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0,
+            "gravacoes": self.gravacoes,
+        }
+
+
+# 4 - Balde de tokens no banco compartilhado
+class BaldeCompartilhado:
+    """
+    Mesma interface do cotas.BaldeTokens, com o saldo no banco: todos os
+    workers gastam do mesmo balde.
+    """
+
+    def __init__(self, banco: BancoCompartilhado, nome: str, capacidade: float, periodo_s: float):
+        self.banco = banco
+        self.nome = nome
+        self.capacidade = capacidade
+        self.periodo_s = periodo_s
+        self.taxa = capacidade / periodo_s
+
+    def disponivel(self) -> float:
+        return self.banco.saldo(self.nome, self.capacidade, self.periodo_s)[0]
+
+    def espera_para(self, quantidade: float) -> float:
+        falta = min(quantidade, self.capacidade) - self.disponivel()
+        return max(0.0, falta / self.taxa)
+
+    def consumir(self, quantidade: float):
+        self.banco.reservar({self.nome: (self.capacidade, self.periodo_s, quantidade)}, forcar=True)
+
+    @property
+    def consumido(self) -> float:
+        return self.banco.saldo(self.nome, self.capacidade, self.periodo_s)[1]
+
+
+# 5 - Limite do projeto no Gemini
+class LimiteGemini:
+    """
+    Requisições e tokens por minuto do projeto no Gemini, em baldes do banco
+    compartilhado: com mais workers, as chamadas se repartem dentro da mesma
+    cota em vez de multiplicar os 429. Se um 429 escapar mesmo assim (outro
+    cliente na mesma chave, cota menor que a configurada, limites não
+    configurados), todos os workers pausam por GEMINI_PAUSA_429_S: a pausa
+    fica no balde "gemini:pausa" (1 por segundo, negativo enquanto dura),
+    consultado em toda chamada mesmo sem RPM/TPM. Só é usado no modo
+    compartilhado (COMPARTILHADO): com um worker não há o que coordenar.
+    """
+
+    def __init__(self, banco: BancoCompartilhado, rpm: int = 0, tpm: int = 0,
+                 pausa_429_s: float = GEMINI_PAUSA_429_S):
+        self.banco = banco
+        self.rpm = rpm
+        self.tpm = tpm
+        self.pausa_429_s = pausa_429_s
+        self.chamadas_esperaram = 0
+        self.segundos_espera = 0.0
+        self.respostas_429 = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.rpm > 0 or self.tpm > 0
+
+    def _pedidos(self, tokens: int) -> dict[str, tuple[float, float, float]]:
+        pedidos = {"gemini:pausa": (1, 1, 0)}
+        if self.rpm > 0:
+            pedidos["gemini:requisicoes"] = (self.rpm, 60, 1)
+        if self.tpm > 0:
+            pedidos["gemini:tokens"] = (self.tpm, 60, tokens)
+        return pedidos
+
+    async def aguardar(self, tokens: int):
+        """
+        Espera até o projeto ter saldo para uma chamada com 'tokens' de entrada e o reserva.
+        """
+        inicio = time.monotonic()
+        esperou = False
+        while (espera := await asyncio.to_thread(self.banco.reservar, self._pedidos(tokens))) > 0:
+            if not esperou:
+                esperou = True
+                self.chamadas_esperaram += 1
+                print(f"DEBUG: Limite ou pausa do Gemini no projeto, aguardando {espera:.1f}s")
+            await asyncio.sleep(espera)
+        self.segundos_espera += time.monotonic() - inicio
+
+    async def registrar_429(self):
+        self.respostas_429 += 1
+        print(f"AVISO: Gemini respondeu 429; todos os workers pausam por {self.pausa_429_s:g}s")
+        await asyncio.to_thread(self.banco.pausar, self._pedidos(0), self.pausa_429_s)
+
+    def metricas(self) -> dict:
+        return {
+            "requisicoes_minuto": self.rpm,
+            "tokens_minuto": self.tpm,
+            "chamadas_esperaram": self.chamadas_esperaram,
+            "segundos_espera": round(self.segundos_espera, 3),
+            "respostas_429": self.respostas_429,
+        }
+
+
+# 6 - Resposta do Gemini lida do cache compartilhado
+class RespostaEmCache:
+    """
+    Só o texto de uma resposta já obtida por algum worker (sem candidatos
+    nem uso de tokens: não houve chamada).
+    """
+
+    def __init__(self, texto: str):
+        self.text = texto
+        self.candidates = []
+        self.usage_metadata = None
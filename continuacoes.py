@@ -0,0 +1,222 @@
+# 1 - Importa módulos para guardar os documentos com páginas pendentes
+import base64
+import gzip
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from inicializacao import ler_inteiro
+
+# 1.1 - Validade do token de continuação e máximo de documentos em memória
+CONTINUACAO_TTL_S = ler_inteiro("CONTINUACAO_TTL_S", 3600, minimo=1)
+CONTINUACAO_MAX_DOCUMENTOS = ler_inteiro("CONTINUACAO_MAX_DOCUMENTOS", 100, minimo=1)
+
+
+# 2 - Leitura do checkpoint gravado no encerramento
+def ler_checkpoint(arquivo: str) -> dict:
+    """
+    Lê e apaga o checkpoint {token: trabalho com PDF em base64}. Ausente
+    (ou já recuperado por outro worker) ou ilegível, retorna vazio.
+    """
+    try:
+        with gzip.open(arquivo, "rt", encoding="utf-8") as f:
+            trabalhos = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"AVISO: Checkpoint de continuações ilegível, ignorado: {e}")
+        trabalhos = {}
+    try:
+        os.remove(arquivo)
+    except FileNotFoundError:
+        return {}
+    return trabalhos
+
+
+# 3 - Armazém de continuações
+class ArmazemContinuacoes:
+    """
+    Guarda em memória, por token de continuação, o PDF de uma requisição que
+    terminou no prazo com páginas faltando, os parâmetros dela e o resultado
+    parcial já entregue. Os tokens expiram após CONTINUACAO_TTL_S; acima de
+    CONTINUACAO_MAX_DOCUMENTOS, os mais antigos são descartados.
+    """
+
+    def __init__(self, ttl_s: int = CONTINUACAO_TTL_S, max_documentos: int = CONTINUACAO_MAX_DOCUMENTOS):
+        self.ttl_s = ttl_s
+        self.max_documentos = max_documentos
+        self._trabalhos: OrderedDict[str, dict] = OrderedDict()
+        self._trava = threading.Lock()
+        self.criados = 0
+        self.concluidos = 0
+        self.expirados = 0
+
+    def _expirar(self):
+        agora = time.time()
+        for token in [t for t, trabalho in self._trabalhos.items() if trabalho["expira_em"] <= agora]:
+            del self._trabalhos[token]
+            self.expirados += 1
+        while len(self._trabalhos) > self.max_documentos:
+            self._trabalhos.popitem(last=False)
+            self.expirados += 1
+
+    def salvar(self, pdf_bytes: bytes, senha_do_pdf: str | None, user_id: int | None, modo_pipeline: str | None,
+               paginas: list[int], resultado: dict) -> str:
+        """
+        Guarda o trabalho e retorna o token de continuação.
+        'paginas' são as páginas faltantes (a partir de 1).
+        """
+        token = secrets.token_urlsafe(16)
+        with self._trava:
+            self._trabalhos[token] = {
+                "pdf_bytes": pdf_bytes,
+                "senha_do_pdf": senha_do_pdf,
+                "user_id": user_id,
+                "modo_pipeline": modo_pipeline,
+                "paginas": sorted(paginas),
+                "resultado": resultado,
+                "expira_em": time.time() + self.ttl_s,
+            }
+            self.criados += 1
+            self._expirar()
+        return token
+
+    def obter(self, token: str) -> dict | None:
+        with self._trava:
+            self._expirar()
+            return self._trabalhos.get(token)
+
+    def atualizar(self, token: str, paginas: list[int], resultado: dict):
+        """
+        Registra o progresso de uma continuação que ainda não terminou e renova a validade.
+        """
+        with self._trava:
+            trabalho = self._trabalhos.get(token)
+            if trabalho is not None:
+                trabalho.update(paginas=sorted(paginas), resultado=resultado, expira_em=time.time() + self.ttl_s)
+                self._trabalhos.move_to_end(token)
+
+    def concluir(self, token: str):
+        with self._trava:
+            if self._trabalhos.pop(token, None) is not None:
+                self.concluidos += 1
+
+    # 3.1 - Checkpoint no encerramento: os tokens entregues continuam valendo depois do reinício
+    def gravar(self, arquivo: str) -> int:
+        """
+        Grava os trabalhos pendentes (PDF em base64) em 'arquivo' (JSON
+        compactado, legível só pelo dono: pode conter senhas de PDF).
+        Retorna quantos foram gravados.
+        """
+        with self._trava:
+            self._expirar()
+            trabalhos = {token: {**trabalho, "pdf_bytes": base64.b64encode(trabalho["pdf_bytes"]).decode("ascii")}
+                         for token, trabalho in self._trabalhos.items()}
+        if not trabalhos:
+            return 0
+        os.makedirs(os.path.dirname(arquivo) or ".", exist_ok=True)
+        temporario = arquivo + ".tmp"
+        with open(os.open(temporario, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as bruto:
+            with gzip.open(bruto, "wt", encoding="utf-8") as f:
+                json.dump(trabalhos, f, ensure_ascii=False)
+        os.replace(temporario, arquivo)
+        return len(trabalhos)
+
+    def carregar(self, arquivo: str) -> int:
+        """
+        Recupera (e apaga) o checkpoint gravado no último encerramento,
+        descartando os tokens já expirados. Retorna quantos foram recuperados.
+        """
+        trabalhos = ler_checkpoint(arquivo)
+        with self._trava:
+            for token, trabalho in sorted(trabalhos.items(), key=lambda item: item[1]["expira_em"]):
+                self._trabalhos[token] = {**trabalho, "pdf_bytes": base64.b64decode(trabalho["pdf_bytes"])}
+            self._expirar()
+            return sum(1 for token in trabalhos if token in self._trabalhos)
+
+    def metricas(self) -> dict:
+        with self._trava:
+            self._expirar()
+            return {
+                "pendentes": len(self._trabalhos),
+                "criados": self.criados,
+                "concluidos": self.concluidos,
+                "expirados": self.expirados,
+            }
+
+    def __len__(self) -> int:
+        with self._trava:
+            return len(self._trabalhos)
+
+
+# 4 - Continuações no banco compartilhado (vários workers)
+class ContinuacoesCompartilhadas:
+    """
+    Mesma interface do ArmazemContinuacoes, com os trabalhos no banco
+    compartilhado: o pedido de continuação pode cair em qualquer worker.
+    O banco já sobrevive ao reinício, então não há checkpoint a gravar; a
+    validade fica a cargo do banco e, acima de CONTINUACAO_MAX_DOCUMENTOS
+    (somados entre os workers), os mais antigos são descartados.
+    """
+
+    def __init__(self, banco, ttl_s: int = CONTINUACAO_TTL_S, max_documentos: int = CONTINUACAO_MAX_DOCUMENTOS):
+        self.banco = banco
+        self.ttl_s = ttl_s
+        self.max_documentos = max_documentos
+        self.criados = 0
+        self.concluidos = 0
+        self.expirados = 0
+
+    def _guardar(self, token: str, trabalho: dict):
+        self.banco.guardar("continuacoes", token,
+                           {**trabalho, "pdf_bytes": base64.b64encode(trabalho["pdf_bytes"]).decode("ascii")}, self.ttl_s)
+
+    def salvar(self, pdf_bytes: bytes, senha_do_pdf: str | None, user_id: int | None, modo_pipeline: str | None,
+               paginas: list[int], resultado: dict) -> str:
+        token = secrets.token_urlsafe(16)
+        self._guardar(token, {"pdf_bytes": pdf_bytes, "senha_do_pdf": senha_do_pdf, "user_id": user_id,
+                              "modo_pipeline": modo_pipeline, "paginas": sorted(paginas), "resultado": resultado})
+        self.criados += 1
+        self.expirados += self.banco.aparar("continuacoes", self.max_documentos)
+        return token
+
+    def obter(self, token: str) -> dict | None:
+        trabalho = self.banco.obter("continuacoes", token)
+        if trabalho is not None:
+            trabalho["pdf_bytes"] = base64.b64decode(trabalho["pdf_bytes"])
+        return trabalho
+
+    def atualizar(self, token: str, paginas: list[int], resultado: dict):
+        trabalho = self.obter(token)
+        if trabalho is not None:
+            trabalho.update(paginas=sorted(paginas), resultado=resultado)
+            self._guardar(token, trabalho)
+
+    def concluir(self, token: str):
+        if self.banco.remover("continuacoes", token):
+            self.concluidos += 1
+
+    def gravar(self, arquivo: str) -> int:
+        return 0
+
+    def carregar(self, arquivo: str) -> int:
+        """
+        Leva para o banco o checkpoint de um encerramento com um só worker.
+        """
+        agora = time.time()
+        recuperados = 0
+        for token, trabalho in ler_checkpoint(arquivo).items():
+            if trabalho["expira_em"] > agora:
+                self.banco.guardar("continuacoes", token, {k: v for k, v in trabalho.items() if k != "expira_em"},
+                                   trabalho["expira_em"] - agora)
+                recuperados += 1
+        self.expirados += self.banco.aparar("continuacoes", self.max_documentos)
+        return recuperados
+
+    def metricas(self) -> dict:
+        return {"pendentes": len(self), "criados": self.criados, "concluidos": self.concluidos, "expirados": self.expirados}
+
+    def __len__(self) -> int:
+        return self.banco.contar("continuacoes")
@@ -0,0 +1,222 @@
+# 1 - Importa módulos para as cotas por usuário
+import asyncio
+import json
+import math
+import os
+import time
+from fastapi import HTTPException
+from inicializacao import ler_inteiro
+
+# 1.1 - Cotas padrão (0 desliga, o padrão): páginas por minuto e tokens do Gemini por dia
+COTA_PAGINAS_MINUTO = ler_inteiro("COTA_PAGINAS_MINUTO", 0, minimo=0)
+COTA_TOKENS_DIA = ler_inteiro("COTA_TOKENS_DIA", 0, minimo=0)
+
+# 1.2 - Usuários com baldes em memória a partir dos quais os ociosos (baldes cheios) são descartados
+COTAS_MAX_USUARIOS = ler_inteiro("COTAS_MAX_USUARIOS", 1024, minimo=1)
+
+# 1.3 - Ajustes por usuário, em JSON: {"42": {"peso": 2, "paginas_minuto": 300, "tokens_dia": 5000000}}
+try:
+    COTAS_USUARIOS = {str(k): v for k, v in json.loads(os.getenv("COTAS_USUARIOS", "") or "{}").items()}
+except ValueError:
+    print("AVISO: COTAS_USUARIOS não é um JSON válido; usando as cotas padrão")
+    COTAS_USUARIOS = {}
+
+
+# 2 - Balde de tokens
+class BaldeTokens:
+    """
+    Enche continuamente até a capacidade, à taxa capacidade/periodo_s.
+    O consumo pode deixar o saldo negativo (o custo real só é conhecido
+    depois da chamada); o usuário fica bloqueado até o saldo se recompor.
+    """
+
+    def __init__(self, capacidade: float, periodo_s: float):
+        self.capacidade = capacidade
+        self.taxa = capacidade / periodo_s
+        self.saldo = float(capacidade)
+        self.atualizado_em = time.monotonic()
+        self.consumido = 0.0
+
+    def _repor(self):
+        agora = time.monotonic()
+        self.saldo = min(self.capacidade, self.saldo + (agora - self.atualizado_em) * self.taxa)
+        self.atualizado_em = agora
+
+    def disponivel(self) -> float:
+        self._repor()
+        return self.saldo
+
+    def espera_para(self, quantidade: float) -> float:
+        """
+        Segundos até haver saldo para 'quantidade' (limitada à capacidade,
+        para que um pedido maior que o balde não fique bloqueado para sempre).
+        """
+        falta = min(quantidade, self.capacidade) - self.disponivel()
+        return max(0.0, falta / self.taxa)
+
+    def consumir(self, quantidade: float):
+        self._repor()
+        self.saldo -= quantidade
+        self.consumido += quantidade
+
+
+# 3 - Cotas por usuário
+class CotasUsuarios:
+    """
+    Um balde de páginas por minuto e um de tokens por dia para cada user_id,
+    com os limites de COTAS_USUARIOS ou os padrões. O peso do usuário na
+    fila justa (escalonador) vem da mesma configuração.
+    Com um banco compartilhado (vários workers), os saldos ficam nele e a
+    cota vale para o usuário, não para cada processo. Os baldes de usuários
+    ociosos (cheios de novo) saem da memória quando passam de max_usuarios:
+    um balde cheio é igual a um novo.
+    """
+
+    def __init__(self, paginas_minuto: int = COTA_PAGINAS_MINUTO, tokens_dia: int = COTA_TOKENS_DIA,
+                 por_usuario: dict | None = None, banco=None, max_usuarios: int = COTAS_MAX_USUARIOS):
+        self.paginas_minuto = paginas_minuto
+        self.tokens_dia = tokens_dia
+        self.por_usuario = COTAS_USUARIOS if por_usuario is None else por_usuario
+        self.banco = banco
+        self.max_usuarios = max_usuarios
+        self._baldes: dict = {}
+        self.recusadas = 0
+        self.descartados = 0
+
+    def config(self, user_id) -> dict:
+        ajuste = self.por_usuario.get(str(user_id), {})
+        return {
+            "peso": float(ajuste.get("peso", 1.0)),
+            "paginas_minuto": int(ajuste.get("paginas_minuto", self.paginas_minuto)),
+            "tokens_dia": int(ajuste.get("tokens_dia", self.tokens_dia)),
+        }
+
+    def peso(self, user_id) -> float:
+        return self.config(user_id)["peso"]
+
+    def _criar_balde(self, nome: str, capacidade: int, periodo_s: float):
+        if self.banco is not None:
+            return self.banco.balde(f"cota:{nome}", capacidade, periodo_s)
+        return BaldeTokens(capacidade, periodo_s)
+
+    def _baldes_usuario(self, user_id, guardar: bool = True) -> dict:
+        """
+        Baldes do usuário. Com guardar=False (consulta), um usuário sem
+        baldes recebe baldes novos (cheios) que não ficam guardados.
+        """
+        if user_id in self._baldes:
+            return self._baldes[user_id]
+        config = self.config(user_id)
+        baldes = {
+            "paginas": self._criar_balde(f"paginas:{user_id}", config["paginas_minuto"], 60) if config["paginas_minuto"] > 0 else None,
+            "tokens": self._criar_balde(f"tokens:{user_id}", config["tokens_dia"], 86400) if config["tokens_dia"] > 0 else None,
+        }
+        if guardar:
+            if len(self._baldes) >= self.max_usuarios:
+                self._descartar_ociosos()
+            self._baldes[user_id] = baldes
+        return baldes
+
+    def _descartar_ociosos(self):
+        # No banco compartilhado os baldes daqui são só referências: o saldo fica no banco
+        ociosos = [usuario for usuario, baldes in self._baldes.items() if self.banco is not None or all(
+            balde is None or balde.disponivel() >= balde.capacidade for balde in baldes.values())]
+        for usuario in ociosos:
+            del self._baldes[usuario]
+        self.descartados += len(ociosos)
+
+    # 3.1 - Verificação e consumo
+    def esperas(self, user_id, paginas: int, tokens: int) -> dict:
+        """
+        Segundos até o usuário ter saldo para o documento, por cota excedida.
+        """
+        baldes = self._baldes_usuario(user_id)
+        esperas = {}
+        if baldes["paginas"] is not None:
+            esperas["páginas por minuto"] = baldes["paginas"].espera_para(paginas)
+        if baldes["tokens"] is not None:
+            esperas["tokens por dia"] = baldes["tokens"].espera_para(tokens)
+        return {nome: espera for nome, espera in esperas.items() if espera > 0}
+
+    def reservar(self, user_id, paginas: int, tokens: int) -> dict:
+        """
+        Confere o saldo de páginas e de tokens e, se houver, consome as
+        páginas no mesmo passo (no banco compartilhado, numa transação só),
+        para que dois documentos simultâneos não passem ambos com o saldo de
+        um. Os tokens são só conferidos: o consumo real vem depois de cada
+        chamada (consumir_tokens). Retorna as esperas por cota excedida
+        (vazio quando reservou).
+        """
+        baldes = self._baldes_usuario(user_id)
+        if self.banco is not None:
+            pedidos = {balde.nome: (balde.capacidade, balde.periodo_s, quantidade)
+                       for balde, quantidade in ((baldes["paginas"], paginas), (baldes["tokens"], tokens)) if balde is not None}
+            conferir = frozenset([baldes["tokens"].nome]) if baldes["tokens"] is not None else frozenset()
+            espera = self.banco.reservar(pedidos, conferir=conferir) if pedidos else 0.0
+            return {} if espera <= 0 else self.esperas(user_id, paginas, tokens) or {"páginas por minuto": espera}
+        excedidas = self.esperas(user_id, paginas, tokens)
+        if not excedidas and baldes["paginas"] is not None:
+            baldes["paginas"].consumir(paginas)
+        return excedidas
+
+    def verificar(self, user_id, paginas: int, tokens: int):
+        """
+        Reserva as páginas do documento (reservar) ou recusa com 429 (e
+        Retry-After até o saldo se recompor) quando o usuário não tem saldo
+        de páginas ou de tokens para ele.
+        """
+        excedidas = self.reservar(user_id, paginas, tokens)
+        if excedidas:
+            self.recusadas += 1
+            segundos = math.ceil(max(excedidas.values()))
+            detalhe = f"Cota do usuário {user_id} excedida: {', '.join(excedidas)}"
+            print(f"AVISO: {detalhe}. Retry-After: {segundos}s")
+            raise HTTPException(status_code=429, detail=detalhe, headers={"Retry-After": str(segundos)})
+
+    async def aguardar(self, user_id, paginas: int, tokens: int):
+        """
+        Para jobs em background: espera o saldo se recompor em vez de recusar
+        e então reserva as páginas, como verificar.
+        """
+        while excedidas := self.reservar(user_id, paginas, tokens):
+            segundos = max(excedidas.values())
+            print(f"DEBUG: Cota do usuário {user_id} excedida ({', '.join(excedidas)}), aguardando {segundos:.0f}s")
+            await asyncio.sleep(segundos)
+
+    def consumir_paginas(self, user_id, paginas: int):
+        balde = self._baldes_usuario(user_id)["paginas"]
+        if balde is not None:
+            balde.consumir(paginas)
+
+    def devolver_paginas(self, user_id, paginas: int):
+        """
+        Devolve as páginas reservadas de um documento que não chegou a ser processado.
+        """
+        self.consumir_paginas(user_id, -paginas)
+
+    def consumir_tokens(self, user_id, tokens: int):
+        balde = self._baldes_usuario(user_id)["tokens"]
+        if balde is not None:
+            balde.consumir(tokens)
+
+    # 3.2 - Situação
+    def status(self, user_id) -> dict:
+        """
+        Situação das cotas do usuário, sem criar baldes para quem ainda não usou.
+        """
+        config = self.config(user_id)
+        baldes = self._baldes_usuario(user_id, guardar=False)
+        situacao = {"user_id": user_id, "peso": config["peso"]}
+        for nome, chave in (("paginas_minuto", "paginas"), ("tokens_dia", "tokens")):
+            balde = baldes[chave]
+            situacao[nome] = {"limite": config[nome], "disponivel": None, "consumido": None} if balde is None else {
+                "limite": config[nome],
+                "disponivel": max(0, math.floor(balde.disponivel())),
+                "consumido": round(balde.consumido),
+                "recompoe_em_s": math.ceil(balde.espera_para(balde.capacidade)),
+            }
+        return situacao
+
+    def metricas(self) -> dict:
+        return {"usuarios": len(self._baldes), "recusadas": self.recusadas, "descartados": self.descartados,
+                "paginas_minuto": self.paginas_minuto, "tokens_dia": self.tokens_dia}
@@ -0,0 +1,329 @@
+# 1 - Importa módulos para manipulação de PDF
+import io
+import os
+import threading
+import unicodedata
+import fitz
+import pdfplumber
+from fastapi import HTTPException
+from inicializacao import ler_decimal, ler_inteiro
+
+# 1.1 - Limiares do pré-classificador de páginas (texto nativo x OCR)
+MIN_CARACTERES_PAGINA = 50
+LIMIAR_LIXO = ler_decimal("LIMIAR_LIXO", 0.15, minimo=0)
+LIMIAR_COBERTURA_IMAGEM = ler_decimal("LIMIAR_COBERTURA_IMAGEM", 0.3, minimo=0)
+# Segmentos de desenho vetorial a partir dos quais uma página sem texto tem o texto em contornos
+# (glifos convertidos em curvas por alguns geradores); bordas de tabela ficam bem abaixo disso
+LIMIAR_DESENHOS = ler_inteiro("LIMIAR_DESENHOS", 300, minimo=1)
+PONTUACAO_COMUM = set(".,;:!?-+*/\\()[]{}<>%$#@&'\"=_|ºª°§€£–—“”‘’•·…")
+
+
+# 2 - Handle único do documento compartilhado entre as etapas do pipeline
+class DocumentHandle:
+    """
+    Abre o PDF uma única vez (autenticando com a senha, sem regravar o arquivo)
+    e expõe texto, palavras e pixmaps de cada página de forma preguiçosa,
+    guardando em cache o que já foi extraído.
+
+    Pode ser enviado para um ProcessPoolExecutor: na serialização viajam só os
+    bytes, a senha e o intervalo de páginas, e o documento é reaberto no worker.
+    """
+
+    def __init__(self, pdf_bytes: bytes, senha: str | None = None, paginas: range | None = None):
+        self.pdf_bytes = pdf_bytes
+        self.senha = senha
+        self._paginas = paginas
+        self._fitz_doc = None
+        self._plumber_pdf = None
+        self._textos: dict[int, str] = {}
+        self._palavras: dict[int, list[dict]] = {}
+        self._pixmaps: dict[tuple, "fitz.Pixmap"] = {}
+        self._perfis: dict[int, dict] = {}
+        # O PyMuPDF não é thread-safe: renderizações em threads diferentes passam por esta trava
+        self.trava_fitz = threading.RLock()
+
+    @classmethod
+    def abrir(cls, pdf_bytes: bytes, senha: str | None = None) -> "DocumentHandle":
+        """
+        Abre e valida o PDF. Se estiver protegido, autentica com a senha fornecida.
+        Levanta HTTPException 400 para PDF inválido ou senha ausente/incorreta.
+        """
+        doc = cls(pdf_bytes, senha)
+        try:
+            doc.fitz
+        except fitz.FileDataError:
+            print("ERRO: Arquivo PDF corrompido ou inválido.")
+            raise HTTPException(status_code=400, detail="Arquivo PDF corrompido ou inválido.")
+        except HTTPException:
+            raise
+        except Exception as e:
+            print(f"ERRO inesperado ao abrir PDF: {e}")
+            raise HTTPException(status_code=500, detail=f"Erro ao processar PDF protegido: {e}")
+        return doc
+
+    # 2.1 - Abertura preguiçosa dos parsers
+    @property
+    def fitz(self) -> "fitz.Document":
+        if self._fitz_doc is None:
+            doc = fitz.open(stream=self.pdf_bytes, filetype="pdf")
+            if doc.needs_pass:
+                if not self.senha:
+                    doc.close()
+                    print("ERRO: PDF protegido e nenhuma senha fornecida.")
+                    raise HTTPException(status_code=400, detail="PDF protegido por senha. Informe 'senha_do_pdf'.")
+                if not doc.authenticate(self.senha):
+                    doc.close()
+                    print("ERRO: Senha incorreta para o PDF.")
+                    raise HTTPException(status_code=400, detail="Senha incorreta para o PDF protegido.")
+                print("DEBUG: Senha correta! PDF desbloqueado com sucesso.")
+            self._fitz_doc = doc
+        return self._fitz_doc
+
+    @property
+    def plumber(self) -> "pdfplumber.PDF":
+        if self._plumber_pdf is None:
+            self._plumber_pdf = pdfplumber.open(io.BytesIO(self.pdf_bytes), password=self.senha or "")
+        return self._plumber_pdf
+
+    @property
+    def paginas(self) -> range:
+        """
+        Índices (base 0) das páginas cobertas por este handle.
+        """
+        if self._paginas is None:
+            self._paginas = range(self.fitz.page_count)
+        return self._paginas
+
+    def __len__(self) -> int:
+        return len(self.paginas)
+
+    # 2.2 - Acesso por página com cache
+    def texto(self, indice: int) -> str:
+        """
+        Texto nativo da página via pdfplumber (x_tolerance=2), com cache.
+        """
+        if indice not in self._textos:
+            pagina = self.plumber.pages[indice]
+            self._textos[indice] = pagina.extract_text(x_tolerance=2) or ""
+            if indice in self._palavras:
+                pagina.flush_cache()
+        return self._textos[indice]
+
+    def texto_fitz(self, indice: int) -> str:
+        """
+        Texto da página via PyMuPDF, usado como fallback quando o pdfplumber falha.
+        """
+        return self.fitz[indice].get_text()
+
+    def palavras(self, indice: int) -> list[dict]:
+        """
+        Palavras da página com coordenadas (x0, x1, top, bottom), com cache.
+        """
+        if indice not in self._palavras:
+            pagina = self.plumber.pages[indice]
+            self._palavras[indice] = pagina.extract_words(x_tolerance=2)
+            if indice in self._textos:
+                pagina.flush_cache()
+        return self._palavras[indice]
+
+    def pixmap(self, indice: int, zoom: float = 2.0, cinza: bool = False, clip: tuple | None = None) -> "fitz.Pixmap":
+        """
+        Renderiza a página na escala pedida (opcionalmente em tons de cinza e
+        recortada em 'clip'), com cache por (página, zoom, cinza, clip).
+        """
+        chave = (indice, zoom, cinza, clip)
+        if chave not in self._pixmaps:
+            self._pixmaps[chave] = self.fitz[indice].get_pixmap(
+                matrix=fitz.Matrix(zoom, zoom),
+                colorspace=fitz.csGRAY if cinza else fitz.csRGB,
+                clip=fitz.Rect(clip) if clip else None,
+            )
+        return self._pixmaps[chave]
+
+    def liberar_pixmaps(self, indice: int):
+        """
+        Descarta os pixmaps em cache de uma página (já codificados/enviados).
+        """
+        for chave in [c for c in self._pixmaps if c[0] == indice]:
+            del self._pixmaps[chave]
+
+    def perfil(self, indice: int) -> dict:
+        """
+        Metadados baratos da página via PyMuPDF (sem extrair layout):
+        quantidade de fontes e spans de texto, caracteres, cobertura de imagens
+        e proporção de caracteres ilegíveis. Calculado uma vez por página.
+        """
+        if indice not in self._perfis:
+            self._perfis[indice] = perfil_pagina(self.fitz[indice])
+        return self._perfis[indice]
+
+    def tem_texto(self, indice: int) -> bool:
+        """
+        Indica se o texto nativo da página já foi extraído (está no cache).
+        """
+        return indice in self._textos
+
+    def registrar_textos(self, textos: dict[int, str]):
+        """
+        Alimenta o cache com textos extraídos em outro processo.
+        """
+        self._textos.update(textos)
+
+    # 2.3 - Divisão por intervalo de páginas (para o pool de processos)
+    def fatia(self, inicio: int, fim: int) -> "DocumentHandle":
+        """
+        Retorna um handle leve cobrindo apenas as páginas [inicio, fim).
+        """
+        fatia = DocumentHandle(self.pdf_bytes, self.senha, range(inicio, fim))
+        fatia._textos = {i: t for i, t in self._textos.items() if inicio <= i < fim}
+        return fatia
+
+    def dividir(self, partes: int) -> list["DocumentHandle"]:
+        """
+        Divide as páginas do handle em até 'partes' intervalos contíguos.
+        """
+        paginas = self.paginas
+        partes = max(1, min(partes, len(paginas)))
+        tamanho, resto = divmod(len(paginas), partes)
+        fatias = []
+        inicio = paginas.start
+        for p in range(partes):
+            fim = inicio + tamanho + (1 if p < resto else 0)
+            fatias.append(self.fatia(inicio, fim))
+            inicio = fim
+        return fatias
+
+    def __getstate__(self) -> dict:
+        return {"pdf_bytes": self.pdf_bytes, "senha": self.senha, "paginas": self._paginas, "textos": self._textos}
+
+    def __setstate__(self, estado: dict):
+        self.__init__(estado["pdf_bytes"], estado["senha"], estado["paginas"])
+        self._textos = estado["textos"]
+
+    # 2.4 - Encerramento
+    def close(self):
+        if self._plumber_pdf is not None:
+            self._plumber_pdf.close()
+            self._plumber_pdf = None
+        if self._fitz_doc is not None:
+            self._fitz_doc.close()
+            self._fitz_doc = None
+        self._pixmaps.clear()
+
+    def __enter__(self) -> "DocumentHandle":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 3 - Worker do pool de processos: extrai o texto de um intervalo de páginas
+def extrair_textos_intervalo(doc: DocumentHandle, indices: list[int] | None = None) -> dict[int, str]:
+    """
+    Executado em outro processo. Recebe um handle fatiado e devolve
+    {indice_pagina: texto} para ser registrado no handle original.
+    Se 'indices' for informado, extrai apenas essas páginas do intervalo.
+    """
+    try:
+        return {i: doc.texto(i) for i in (doc.paginas if indices is None else indices)}
+    finally:
+        doc.close()
+
+
+# 4 - Pré-classificador rápido de páginas
+def perfil_pagina(page: "fitz.Page") -> dict:
+    """
+    Lê os spans de texto, as imagens e (só sem texto utilizável, onde
+    importam) os desenhos vetoriais da página e calcula os sinais usados
+    para decidir entre texto nativo e OCR.
+    """
+    fontes = set()
+    spans = 0
+    partes = []
+    tamanhos = []
+    for bloco in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        for linha in bloco.get("lines", []):
+            for span in linha["spans"]:
+                if span["text"].strip():
+                    spans += 1
+                    fontes.add(span["font"])
+                    partes.append(span["text"])
+                    tamanhos.append(span["size"])
+    texto = "".join(partes)
+    
+    area_pagina = abs(page.rect) or 1.0
+    area_imagens = 0.0
+    resolucao_imagem = 0.0
+    for imagem in page.get_image_info():
+        area = fitz.Rect(imagem["bbox"]) & page.rect
+        area_imagens += abs(area)
+        if area.width > 0:
+            # Resolução efetiva (DPI) da imagem embutida como foi posicionada na página
+            resolucao_imagem = max(resolucao_imagem, imagem["width"] / (area.width / 72))
+    
+    desenhos = 0
+    if len(texto.strip()) <= MIN_CARACTERES_PAGINA:
+        desenhos = sum(len(caminho["items"]) for caminho in page.get_cdrawings())
+    
+    return {
+        "fontes": len(fontes),
+        "nomes_fontes": sorted(fontes),
+        "spans": spans,
+        "caracteres": len(texto.strip()),
+        "cobertura_imagem": min(area_imagens / area_pagina, 1.0),
+        "razao_lixo": razao_caracteres_lixo(texto),
+        "fonte_mediana": sorted(tamanhos)[len(tamanhos) // 2] if tamanhos else None,
+        "resolucao_imagem": resolucao_imagem or None,
+        "desenhos": desenhos,
+    }
+
+def razao_caracteres_lixo(texto: str) -> float:
+    """
+    Proporção de caracteres não brancos que não são letras, dígitos ou
+    pontuação comum (glifos sem mapeamento, controle, área privada, U+FFFD).
+    """
+    uteis = [c for c in texto if not c.isspace()]
+    if not uteis:
+        return 0.0
+    lixo = 0
+    for c in uteis:
+        if c == "\ufffd" or unicodedata.category(c) in ("Cc", "Cf", "Co", "Cn", "Cs"):
+            lixo += 1
+        elif not (c.isalnum() or c in PONTUACAO_COMUM):
+            lixo += 1
+    return lixo / len(uteis)
+
+def estrategia_pagina(perfil: dict) -> str:
+    """
+    Decide como obter o texto da página a partir do perfil:
+    - "nativo": camada de texto utilizável
+    - "ocr": sem texto utilizável (ou texto ilegível) e com conteúdo em imagem
+      ou texto desenhado em contornos vetoriais
+    - "vazia": nem texto utilizável nem imagens ou desenhos relevantes
+    """
+    texto_utilizavel = (
+        perfil["caracteres"] > MIN_CARACTERES_PAGINA
+        and perfil["fontes"] > 0
+        and perfil["razao_lixo"] <= LIMIAR_LIXO
+    )
+    if texto_utilizavel:
+        return "nativo"
+    if (perfil["cobertura_imagem"] >= LIMIAR_COBERTURA_IMAGEM or perfil["caracteres"] > MIN_CARACTERES_PAGINA
+            or perfil.get("desenhos", 0) >= LIMIAR_DESENHOS):
+        return "ocr"
+    return "vazia"
+
+def indice_digitalizacao(perfis: list[dict]) -> float:
+    """
+    Estimativa (0 a 1) de quão "digitalizado" o documento parece: proporção de
+    páginas não vazias com imagem cobrindo a maior parte da página, texto
+    parcialmente ilegível ou sem camada de texto utilizável.
+    """
+    relevantes = [p for p in perfis if estrategia_pagina(p) != "vazia"]
+    if not relevantes:
+        return 0.0
+    suspeitas = sum(
+        1 for p in relevantes
+        if p["cobertura_imagem"] >= 0.5 or p["razao_lixo"] > LIMIAR_LIXO / 2 or estrategia_pagina(p) == "ocr"
+    )
+    return suspeitas / len(relevantes)
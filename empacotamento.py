@@ -0,0 +1,88 @@
+# 1 - Importa módulos para estimativa de tokens e empacotamento de páginas
+import math
+import os
+import re
+from typing import Callable
+from inicializacao import ler_inteiro
+
+# 1.1 - Orçamentos de tokens por chamada
+EMPACOTAMENTO = os.getenv("EMPACOTAMENTO", "true").lower() in ("1", "true", "sim")
+EMPACOTAMENTO_TOKENS = ler_inteiro("EMPACOTAMENTO_TOKENS", 6000, minimo=1)
+EMPACOTAMENTO_OCR_TOKENS = ler_inteiro("EMPACOTAMENTO_OCR_TOKENS", 2064, minimo=1)
+LIMITE_TOKENS_SAIDA = ler_inteiro("LIMITE_TOKENS_SAIDA", 8192, minimo=1)
+TOKENS_SAIDA_POR_TRANSACAO = 60
+TOKENS_SAIDA_POR_TRANSACAO_TABULAR = 20  # saída v2: uma linha delimitada por transação
+CARACTERES_POR_TOKEN = 4
+TOKENS_POR_BLOCO_IMAGEM = 258
+LADO_BLOCO_IMAGEM = 768
+
+# Valor monetário brasileiro (1.234,56, R$ -10,90): o mesmo padrão do pré-filtro e da reconstrução de tabelas
+REGEX_VALOR_BR = re.compile(r'(?:R\$\s*)?[-−]?\s?\d{1,3}(?:\.?\d{3})*,\d{2}(?!\d)')
+
+
+# 2 - Estimativa local de tokens (sem chamar a API)
+def estimar_tokens(texto: str) -> int:
+    """
+    Estimativa local de tokens de um texto: cerca de 4 caracteres por token no Gemini.
+    """
+    return math.ceil(len(texto) / CARACTERES_POR_TOKEN)
+
+def estimar_tokens_imagem(largura: int, altura: int) -> int:
+    """
+    Estimativa de tokens de uma imagem no Gemini: 258 tokens para imagens
+    pequenas (até 384px) ou 258 por bloco de 768x768 nas maiores.
+    """
+    if largura <= 384 and altura <= 384:
+        return TOKENS_POR_BLOCO_IMAGEM
+    return math.ceil(largura / LADO_BLOCO_IMAGEM) * math.ceil(altura / LADO_BLOCO_IMAGEM) * TOKENS_POR_BLOCO_IMAGEM
+
+def estimar_tokens_saida(texto: str, por_transacao: int = TOKENS_SAIDA_POR_TRANSACAO) -> int:
+    """
+    Estimativa dos tokens de saída da categorização: cada linha com valor
+    monetário pode virar uma transação na resposta (por_transacao tokens cada).
+    """
+    return len(REGEX_VALOR_BR.findall(texto)) * por_transacao
+
+
+# 3 - Agrupa itens consecutivos em pacotes dentro dos orçamentos
+def empacotar_paginas(itens: list, *orcamentos: tuple[int, Callable]) -> list[list]:
+    """
+    Agrupa itens consecutivos (páginas) em pacotes respeitando todos os
+    orçamentos informados como (limite, funcao_custo) — ex: tokens de entrada,
+    tokens de saída estimados, memória. Um item que sozinho estoura algum
+    orçamento vira um pacote próprio.
+    """
+    pacotes = []
+    atual = []
+    somas = [0] * len(orcamentos)
+    for item in itens:
+        custos = [custo(item) for _, custo in orcamentos]
+        estoura = any(soma + c > limite for soma, c, (limite, _) in zip(somas, custos, orcamentos))
+        if atual and estoura:
+            pacotes.append(atual)
+            atual = []
+            somas = [0] * len(orcamentos)
+        atual.append(item)
+        somas = [soma + c for soma, c in zip(somas, custos)]
+    if atual:
+        pacotes.append(atual)
+    return pacotes
+
+def dividir_pacote(pacote: list) -> tuple[list, list]:
+    """
+    Divide um pacote ao meio (usado quando a resposta excede o limite de saída).
+    """
+    meio = len(pacote) // 2
+    return pacote[:meio], pacote[meio:]
+
+
+# 4 - Separa a resposta de um pacote por página
+def separar_texto_por_pagina(texto: str) -> dict[int, str]:
+    """
+    Separa uma resposta com marcadores '=== PÁGINA N ===' em {N: texto}.
+    """
+    partes = re.split(r'^\s*=== PÁGINA (\d+) ===\s*$', texto, flags=re.MULTILINE)
+    paginas = {}
+    for i in range(1, len(partes) - 1, 2):
+        paginas[int(partes[i])] = partes[i + 1].strip()
+    return paginas
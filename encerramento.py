@@ -0,0 +1,257 @@
+# 1 - Importa módulos para o encerramento gracioso (deploys e reinícios)
+import asyncio
+import json
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from fastapi import HTTPException
+from inicializacao import ler_decimal
+
+try:
+    import fcntl  # trava entre workers no arquivo de trabalhos (só POSIX; no Windows roda com um worker)
+except ImportError:
+    fcntl = None
+
+# 1.1 - Prazo para drenar o trabalho em andamento (o Render mata o processo 30 s após o SIGTERM)
+# e diretório dos trabalhos que não terminaram a tempo (use um disco persistente, se houver)
+ENCERRAMENTO_PRAZO_S = ler_decimal("ENCERRAMENTO_PRAZO_S", 25, minimo=0)
+ENCERRAMENTO_DIR = os.getenv("ENCERRAMENTO_DIR", "dados")
+ARQUIVO_TRABALHOS = "trabalhos_pendentes.json"
+PRAZO_MINIMO_GRAVACOES_S = 3  # gravações pendentes sempre têm pelo menos este tempo, mesmo com o prazo estourado
+
+
+# 2 - Gerenciador do encerramento
+class GerenciadorEncerramento:
+    """
+    Acompanha o trabalho que não pertence a nenhuma requisição e que se
+    perderia num SIGTERM:
+    - gravações em segundo plano (categorizações no Supabase, cache,
+      artefatos, livro de transações), que são concluídas no encerramento;
+    - trabalhos de background (webhooks), que têm até o prazo para terminar
+      e, se não terminarem, são cancelados e gravados em disco com os
+      parâmetros para recomeçar na próxima subida (o trabalho pode gravar
+      o próprio progresso nesses parâmetros com registrar_progresso).
+    Durante o encerramento, novos documentos são recusados com 503.
+    """
+
+    def __init__(self, diretorio: str = ENCERRAMENTO_DIR, prazo_s: float = ENCERRAMENTO_PRAZO_S):
+        self.diretorio = diretorio
+        self.prazo_s = prazo_s
+        self.encerrando = False
+        self._inicio_encerramento = None
+        self._gravacoes: set[asyncio.Task] = set()
+        self._trabalhos: dict[asyncio.Task, dict] = {}
+        self.gravacoes_concluidas = 0
+        self.trabalhos_concluidos = 0
+        self.trabalhos_salvos = 0
+        self.trabalhos_retomados = 0
+
+    # 2.1 - Registro do trabalho
+    def gravar_depois(self, corrotina) -> asyncio.Task:
+        """
+        Agenda uma gravação em segundo plano (substitui o asyncio.create_task
+        solto, que também pode ser coletado antes de terminar).
+        """
+        task = asyncio.create_task(corrotina)
+        self._gravacoes.add(task)
+        task.add_done_callback(self._gravacao_terminou)
+        return task
+
+    def _gravacao_terminou(self, task: asyncio.Task):
+        self._gravacoes.discard(task)
+        if not task.cancelled():
+            self.gravacoes_concluidas += 1
+
+    def iniciar_trabalho(self, funcao, **parametros) -> asyncio.Task:
+        """
+        Inicia um trabalho de background 'funcao(**parametros)'. Os
+        parâmetros precisam ser serializáveis em JSON: são eles que vão para
+        o disco se o trabalho não terminar antes do encerramento.
+        """
+        task = asyncio.create_task(funcao(**parametros))
+        self._trabalhos[task] = {"funcao": funcao.__name__, "parametros": parametros}
+        task.add_done_callback(self._trabalho_terminou)
+        return task
+
+    def registrar_progresso(self, **parametros):
+        """
+        Chamada de dentro de um trabalho de background: acrescenta
+        'parametros' aos que vão para o disco se ele for interrompido (ex: o
+        resultado já processado, para a retomada só reenviar).
+        """
+        trabalho = self._trabalhos.get(asyncio.current_task())
+        if trabalho is not None:
+            trabalho["parametros"].update(parametros)
+
+    def _trabalho_terminou(self, task: asyncio.Task):
+        if self._trabalhos.pop(task, None) is not None and not task.cancelled():
+            self.trabalhos_concluidos += 1
+
+    def verificar_admissao(self):
+        """
+        Recusa novo trabalho enquanto o processo está encerrando.
+        """
+        if self.encerrando:
+            raise HTTPException(status_code=503, detail="Servidor reiniciando. Tente novamente em instantes.",
+                                headers={"Retry-After": "10"})
+
+    # 2.2 - Encerramento
+    def iniciar_encerramento(self):
+        """
+        Marca o início do encerramento (no sinal): a partir daqui, novo
+        trabalho é recusado e o prazo de drenagem começa a contar.
+        """
+        self.encerrando = True
+        if self._inicio_encerramento is None:
+            self._inicio_encerramento = time.monotonic()
+
+    @contextmanager
+    def capturar_sinais(self, sinais: tuple = (signal.SIGINT, signal.SIGTERM)):
+        """
+        Encadeia iniciar_encerramento aos tratadores de sinal já instalados
+        (os do uvicorn, em cada worker, também com WEB_CONCURRENCY > 1):
+        documentos novos são recusados já no sinal, enquanto as requisições
+        em andamento terminam. Ao sair, devolve os tratadores anteriores.
+        Fora da thread principal (onde não há sinais), não faz nada.
+        """
+        if threading.current_thread() is not threading.main_thread():
+            yield
+            return
+        anteriores = {sinal: signal.getsignal(sinal) for sinal in sinais}
+
+        def tratar(numero, quadro):
+            self.iniciar_encerramento()
+            anterior = anteriores[numero]
+            if callable(anterior):
+                anterior(numero, quadro)
+            elif anterior != signal.SIG_IGN:
+                # Tratador padrão: devolve e repete o sinal
+                signal.signal(numero, anterior)
+                signal.raise_signal(numero)
+
+        for sinal in sinais:
+            signal.signal(sinal, tratar)
+        try:
+            yield
+        finally:
+            for sinal, anterior in anteriores.items():
+                if signal.getsignal(sinal) is tratar:
+                    signal.signal(sinal, anterior)
+
+    def _restante(self) -> float:
+        return max(0.0, self.prazo_s - (time.monotonic() - self._inicio_encerramento))
+
+    async def drenar(self) -> dict:
+        """
+        Para de admitir trabalho, espera os trabalhos de background até o
+        fim do prazo (contado desde o sinal), grava em disco os que não
+        terminaram (e os cancela) e conclui as gravações pendentes.
+        Retorna o resumo do encerramento.
+        """
+        self.iniciar_encerramento()
+        pendentes = list(self._trabalhos)
+        if pendentes:
+            print(f"INFO: Encerrando: aguardando {len(pendentes)} trabalhos em background por até {self._restante():.1f}s...")
+            await asyncio.wait(pendentes, timeout=self._restante())
+
+        interrompidos = [(task, self._trabalhos[task]) for task in list(self._trabalhos) if not task.done()]
+        for task, _ in interrompidos:
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in interrompidos), return_exceptions=True)
+        if interrompidos:
+            self.salvar_trabalhos([trabalho for _, trabalho in interrompidos])
+
+        gravacoes = list(self._gravacoes)
+        if gravacoes:
+            restante = max(PRAZO_MINIMO_GRAVACOES_S, self._restante())
+            print(f"INFO: Encerrando: concluindo {len(gravacoes)} gravações pendentes...")
+            _, nao_gravadas = await asyncio.wait(gravacoes, timeout=restante)
+            if nao_gravadas:
+                print(f"AVISO: {len(nao_gravadas)} gravações não terminaram no prazo do encerramento.")
+        return {"trabalhos_concluidos": len(pendentes) - len(interrompidos), "trabalhos_salvos": len(interrompidos),
+                "gravacoes": len(gravacoes), "segundos": round(time.monotonic() - self._inicio_encerramento, 2)}
+
+    async def aguardar_gravacoes(self):
+        """
+        Espera as gravações em segundo plano agendadas até agora (ex: fim do processamento offline).
+        """
+        while self._gravacoes:
+            await asyncio.gather(*list(self._gravacoes), return_exceptions=True)
+
+    # 2.3 - Trabalhos interrompidos
+    def _arquivo(self) -> str:
+        return os.path.join(self.diretorio, ARQUIVO_TRABALHOS)
+
+    @contextmanager
+    def _travar_arquivo(self):
+        """
+        Com vários workers, todos gravam e retomam o mesmo arquivo: a trava
+        evita perder trabalhos gravados ao mesmo tempo e retomar duas vezes.
+        """
+        os.makedirs(self.diretorio, exist_ok=True)
+        with open(self._arquivo() + ".trava", "a") as trava:
+            if fcntl is not None:
+                fcntl.flock(trava, fcntl.LOCK_EX)
+            yield
+
+    def salvar_trabalhos(self, trabalhos: list[dict]):
+        """
+        Acrescenta os trabalhos interrompidos ao arquivo lido na próxima subida.
+        O arquivo pode conter senhas de PDF: fica legível só pelo dono.
+        """
+        try:
+            with self._travar_arquivo():
+                existentes = self._ler_trabalhos()
+                temporario = f"{self._arquivo()}.{os.getpid()}.tmp"
+                with open(os.open(temporario, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+                    json.dump(existentes + trabalhos, f, ensure_ascii=False)
+                os.replace(temporario, self._arquivo())
+            self.trabalhos_salvos += len(trabalhos)
+            print(f"INFO: {len(trabalhos)} trabalhos interrompidos salvos para retomar na próxima subida.")
+        except Exception as e:
+            print(f"ERRO ao salvar trabalhos interrompidos: {e}")
+
+    def _ler_trabalhos(self) -> list[dict]:
+        try:
+            with open(self._arquivo(), encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except ValueError as e:
+            print(f"AVISO: Arquivo de trabalhos interrompidos ilegível, ignorado: {e}")
+            return []
+
+    def retomar_trabalhos(self, funcoes: dict) -> int:
+        """
+        Reinicia os trabalhos salvos no último encerramento. 'funcoes' mapeia
+        o nome gravado para a função (só as conhecidas são retomadas).
+        """
+        with self._travar_arquivo():
+            trabalhos = self._ler_trabalhos()
+            if not trabalhos:
+                return 0
+            os.remove(self._arquivo())
+        retomados = 0
+        for trabalho in trabalhos:
+            funcao = funcoes.get(trabalho.get("funcao"))
+            if funcao is None:
+                print(f"AVISO: Trabalho interrompido desconhecido descartado: {trabalho.get('funcao')}")
+                continue
+            self.iniciar_trabalho(funcao, **trabalho["parametros"])
+            retomados += 1
+        self.trabalhos_retomados += retomados
+        print(f"INFO: {retomados} trabalhos interrompidos no último encerramento retomados.")
+        return retomados
+
+    def metricas(self) -> dict:
+        return {
+            "encerrando": self.encerrando,
+            "gravacoes_pendentes": len(self._gravacoes),
+            "gravacoes_concluidas": self.gravacoes_concluidas,
+            "trabalhos_em_andamento": len(self._trabalhos),
+            "trabalhos_concluidos": self.trabalhos_concluidos,
+            "trabalhos_salvos": self.trabalhos_salvos,
+            "trabalhos_retomados": self.trabalhos_retomados,
+        }
@@ -0,0 +1,149 @@
+# 1 - Importa módulos para o escalonamento justo das chamadas entre usuários
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+from contextlib import asynccontextmanager
+from inicializacao import ler_inteiro
+
+# 1.1 - Chamadas simultâneas ao Gemini (o pool de CPU usa CPU_WORKERS)
+ESCALONADOR_GEMINI_CONCORRENCIA = ler_inteiro("ESCALONADOR_GEMINI_CONCORRENCIA", 32, minimo=1)
+
+# 1.2 - Usuários com contadores em memória a partir dos quais os ociosos (sem nada em execução nem na fila) são descartados
+ESCALONADOR_MAX_USUARIOS = ler_inteiro("ESCALONADOR_MAX_USUARIOS", 1024, minimo=1)
+
+# 1.3 - Usuário da requisição em andamento (herdado pelas tasks criadas durante o processamento)
+usuario_atual: contextvars.ContextVar[int | None] = contextvars.ContextVar("usuario_atual", default=None)
+
+
+# 2 - Vaga ocupada por um pedido
+class Vaga:
+    """
+    Vaga ocupada no escalonador durante o bloco de EscalonadorJusto.vez. Se
+    'ate' receber um futuro que ainda não terminou quando o bloco acaba (a
+    thread de uma chamada, que não pode ser interrompida no timeout nem no
+    cancelamento), a vaga só é devolvida quando ele terminar.
+    """
+
+    def __init__(self):
+        self.ate: asyncio.Future | None = None
+
+
+# 3 - Fila justa ponderada (start-time fair queuing)
+class EscalonadorJusto:
+    """
+    Limita as execuções simultâneas e, quando há fila, escolhe a próxima
+    pela marca de início virtual de cada pedido (start-time fair queuing):
+    inicio = max(tempo_virtual, fim do pedido anterior do mesmo usuário) e
+    fim = inicio + custo / peso. Um usuário com 200 extratos na fila recebe
+    a mesma fatia (proporcional ao peso) que outro com um só, em vez de
+    ocupar todas as vagas na ordem de chegada.
+    Os contadores de usuários ociosos saem da memória quando passam de
+    max_usuarios.
+    """
+
+    def __init__(self, concorrencia: int, peso=lambda usuario: 1.0, max_usuarios: int = ESCALONADOR_MAX_USUARIOS):
+        self.concorrencia = concorrencia
+        self.max_usuarios = max_usuarios
+        self.livres = concorrencia
+        self.peso = peso
+        self.tempo_virtual = 0.0
+        self._fim_usuario: dict = {}
+        self._fila = []
+        self._sequencia = itertools.count()
+        self._por_usuario: dict = {}
+        self.descartados = 0
+
+    def _contadores(self, usuario) -> dict:
+        if usuario not in self._por_usuario:
+            if len(self._por_usuario) >= self.max_usuarios:
+                self._descartar_ociosos()
+            self._por_usuario[usuario] = {"em_execucao": 0, "na_fila": 0, "atendidas": 0, "custo_atendido": 0.0}
+        return self._por_usuario[usuario]
+
+    def _descartar_ociosos(self):
+        ociosos = [usuario for usuario, contadores in self._por_usuario.items()
+                   if contadores["em_execucao"] == 0 and contadores["na_fila"] == 0]
+        for usuario in ociosos:
+            del self._por_usuario[usuario]
+        self.descartados += len(ociosos)
+
+    def _marcar(self, usuario, custo: float) -> float:
+        inicio = max(self.tempo_virtual, self._fim_usuario.get(usuario, 0.0))
+        self._fim_usuario[usuario] = inicio + custo / max(self.peso(usuario), 1e-6)
+        return inicio
+
+    def _iniciar(self, usuario, custo: float, inicio: float):
+        self.livres -= 1
+        self.tempo_virtual = max(self.tempo_virtual, inicio)
+        contadores = self._contadores(usuario)
+        contadores["em_execucao"] += 1
+        contadores["atendidas"] += 1
+        contadores["custo_atendido"] += custo
+
+    def _despachar(self):
+        while self.livres > 0 and self._fila:
+            inicio, _, usuario, custo, futuro = heapq.heappop(self._fila)
+            self._contadores(usuario)["na_fila"] -= 1
+            if futuro.done():
+                continue
+            self._iniciar(usuario, custo, inicio)
+            futuro.set_result(True)
+        if not self._fila:
+            # Sem fila, as marcas antigas não importam mais
+            self._fim_usuario = {u: f for u, f in self._fim_usuario.items() if f > self.tempo_virtual}
+
+    @asynccontextmanager
+    async def vez(self, usuario=None, custo: float = 1.0):
+        """
+        Espera a vez do usuário e ocupa uma vaga (Vaga) enquanto o bloco
+        executa, ou até o fim do trabalho registrado em vaga.ate.
+        """
+        inicio = self._marcar(usuario, custo)
+        if self.livres > 0 and not self._fila:
+            self._iniciar(usuario, custo, inicio)
+        else:
+            futuro = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._fila, (inicio, next(self._sequencia), usuario, custo, futuro))
+            self._contadores(usuario)["na_fila"] += 1
+            try:
+                await futuro
+            except asyncio.CancelledError:
+                if futuro.done() and not futuro.cancelled():
+                    self._terminar(usuario)
+                else:
+                    futuro.cancel()
+                raise
+        vaga = Vaga()
+        try:
+            yield vaga
+        finally:
+            if vaga.ate is not None and not vaga.ate.done():
+                vaga.ate.add_done_callback(lambda ate: self._terminar_depois(usuario, ate))
+            else:
+                self._terminar(usuario)
+
+    def _terminar_depois(self, usuario, ate: asyncio.Future):
+        # Quem esperava já desistiu: o resultado (ou a exceção) da chamada é descartado
+        if not ate.cancelled():
+            ate.exception()
+        self._terminar(usuario)
+
+    def _terminar(self, usuario):
+        self.livres += 1
+        self._contadores(usuario)["em_execucao"] -= 1
+        self._despachar()
+
+    def status(self, usuario) -> dict:
+        return dict(self._contadores(usuario)) if usuario in self._por_usuario else {
+            "em_execucao": 0, "na_fila": 0, "atendidas": 0, "custo_atendido": 0.0}
+
+    def metricas(self) -> dict:
+        return {
+            "concorrencia": self.concorrencia,
+            "em_execucao": self.concorrencia - self.livres,
+            "na_fila": len(self._fila),
+            "usuarios": len(self._por_usuario),
+            "descartados": self.descartados,
+        }
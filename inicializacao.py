@@ -0,0 +1,84 @@
+# 1 - Importa módulos para a subida rápida da API (cold start)
+import math
+import os
+import threading
+import time
+
+# 1.1 - Aquecimento em segundo plano na subida (clientes e pool de CPU prontos antes da primeira requisição)
+AQUECIMENTO = os.getenv("AQUECIMENTO", "true").lower() in ("1", "true", "sim")
+
+
+# 2 - Configuração validada
+def ler_inteiro(nome: str, padrao: int, minimo: int | None = None) -> int:
+    """
+    Lê um inteiro do ambiente. Ausente, vazio, inválido ou abaixo do mínimo
+    usa o padrão (com AVISO) em vez de derrubar a importação da API.
+    """
+    valor = os.getenv(nome)
+    if valor is None or not valor.strip():
+        return padrao
+    try:
+        numero = int(valor)
+    except ValueError:
+        print(f"AVISO: {nome}={valor!r} não é um número inteiro, usando {padrao}.")
+        return padrao
+    if minimo is not None and numero < minimo:
+        print(f"AVISO: {nome}={numero} abaixo do mínimo {minimo}, usando {padrao}.")
+        return padrao
+    return numero
+
+def ler_decimal(nome: str, padrao: float, minimo: float | None = None) -> float:
+    """
+    Como ler_inteiro, para os ajustes decimais (limiares, frações, segundos).
+    Aceita vírgula como separador decimal e recusa NaN e infinito.
+    """
+    valor = os.getenv(nome)
+    if valor is None or not valor.strip():
+        return float(padrao)
+    try:
+        numero = float(valor.replace(",", "."))
+    except ValueError:
+        numero = math.nan
+    if not math.isfinite(numero):
+        print(f"AVISO: {nome}={valor!r} não é um número, usando {padrao}.")
+        return float(padrao)
+    if minimo is not None and numero < minimo:
+        print(f"AVISO: {nome}={numero:g} abaixo do mínimo {minimo}, usando {padrao}.")
+        return float(padrao)
+    return numero
+
+
+# 3 - Clientes criados no primeiro uso
+class Preguicoso:
+    """
+    Adia a importação do SDK e a criação de um cliente caro (Gemini,
+    Supabase) para o primeiro acesso a um atributo, ou para o aquecimento
+    em segundo plano, em vez de pagar o custo na importação da API.
+    Depois de criado, se comporta como o próprio cliente.
+    """
+
+    def __init__(self, nome: str, fabrica):
+        self._nome = nome
+        self._fabrica = fabrica
+        self._objeto = None
+        self._trava = threading.Lock()
+        self._segundos = None
+
+    def obter(self):
+        if self._objeto is None:
+            with self._trava:
+                if self._objeto is None:
+                    inicio = time.perf_counter()
+                    self._objeto = self._fabrica()
+                    self._segundos = time.perf_counter() - inicio
+                    print(f"DEBUG: Cliente {self._nome} criado em {self._segundos:.2f}s")
+        return self._objeto
+
+    def __getattr__(self, atributo: str):
+        if atributo.startswith("_"):
+            raise AttributeError(atributo)
+        return getattr(self.obter(), atributo)
+
+    def metricas(self) -> dict:
+        return {"criado": self._objeto is not None,
+                "segundos_criacao": round(self._segundos, 3) if self._segundos is not None else None}
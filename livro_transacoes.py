@@ -0,0 +1,228 @@
+# 1 - Importa módulos para o livro de transações já vistas de cada usuário
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from reconstrucao_tabelas import (
+    estruturar_linha, converter_data_periodo, converter_valor, tipo_lancamento, tipo_documento, periodo_documento,
+    REGEX_RESUMO, CABECALHO_COMPACTO
+)
+from preprocessamento import REGEX_VALOR_BR, MARCADOR_OMISSAO
+from compartilhado import conectar_sqlite
+
+# 1.1 - Liga/desliga e arquivo do livro
+LIVRO_TRANSACOES = os.getenv("LIVRO_TRANSACOES", "true").lower() in ("1", "true", "sim")
+LIVRO_TRANSACOES_ARQUIVO = os.getenv("LIVRO_TRANSACOES_ARQUIVO", os.path.join("dados", "livro_transacoes.db"))
+
+# 1.2 - Campos de saída que não fazem parte da transação guardada
+CAMPOS_DO_DOCUMENTO = ("pagina", "nova", "filename")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS transacoes (
+    user_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    descricao TEXT NOT NULL,
+    valor_centavos INTEGER NOT NULL,
+    ocorrencias INTEGER NOT NULL,
+    transacao TEXT NOT NULL,
+    bank_name TEXT,
+    document_type TEXT,
+    primeira_vez REAL NOT NULL,
+    ultima_vez REAL NOT NULL,
+    PRIMARY KEY (user_id, data, descricao, valor_centavos)
+);
+"""
+# 1.3 - Versão do esquema: a 1 guarda o valor com sinal (receita positiva, despesa negativa)
+VERSAO_ESQUEMA = 1
+
+
+# 2 - Linhas candidatas a transação no texto que iria para a LLM
+def linhas_candidatas(texto: str, document_type: str | None = None,
+                      periodo: tuple[int, int] | None = None) -> list[tuple[str, str, float, str]] | None:
+    """
+    Lê os lançamentos (data, descrição, valor, tipo) da página com as mesmas
+    regras do parser determinístico, no texto corrido ou no formato compacto
+    'data|descricao|valor'. O ano das datas sem ano vem do 'periodo'
+    (ano, mês) do documento e o tipo, do sinal do valor conforme o tipo do
+    documento (o informado ou o identificado na página).
+    Retorna None quando a página tem alguma linha com valor que não é um
+    lançamento inequívoco (sem data, vários valores) ou quando não dá para
+    separar receitas de despesas, porque aí só a LLM sabe o que é transação.
+    """
+    documento = document_type or tipo_documento(texto)
+    if documento is None:
+        return None
+    lancamentos = []
+    for linha in texto.splitlines():
+        linha = linha.strip()
+        if not linha or linha in (MARCADOR_OMISSAO, CABECALHO_COMPACTO) or not REGEX_VALOR_BR.search(linha):
+            continue
+        if REGEX_RESUMO.search(linha):
+            continue
+        estruturada = estruturar_linha([{"text": t, "top": 0} for t in linha.replace("|", " ").split()])
+        if not estruturada["data"] or len(estruturada["valores"]) != 1 or not estruturada["descricao"]:
+            return None
+        data = converter_data_periodo(estruturada["data"], periodo)
+        if data is None:
+            return None
+        valor, sinal = converter_valor(estruturada["valores"][0])
+        lancamentos.append((data, estruturada["descricao"], valor, sinal))
+    if lancamentos and documento == "bank-statement" and all(sinal is None for *_, sinal in lancamentos):
+        return None  # extrato sem sinal algum: não dá para separar entradas de saídas
+    return [(data, descricao, valor, tipo_lancamento(documento, sinal)) for data, descricao, valor, sinal in lancamentos]
+
+
+# 3 - Livro de transações por usuário
+class LivroTransacoes:
+    """
+    Guarda, por usuário, as transações já extraídas, com a chave
+    (data, descrição normalizada, valor com o sinal do tipo: uma compra e
+    o estorno dela são chaves diferentes) e quantas vezes a mesma chave
+    aparece num documento (duas compras iguais no mesmo dia).
+    Extratos consecutivos costumam repetir dias: as páginas cujos
+    lançamentos já estão todos no livro não vão para a LLM, as transações
+    conhecidas reaproveitam a categorização anterior e a resposta marca
+    cada transação como nova ou já vista.
+    'normalizar' é a normalização de descrição da API (limpar_descricao_para_match).
+    """
+
+    def __init__(self, normalizar, arquivo: str = LIVRO_TRANSACOES_ARQUIVO):
+        self.normalizar = normalizar
+        self.arquivo = arquivo
+        self._conexao = None
+        self._trava = threading.Lock()
+        self.paginas_puladas = 0
+        self.transacoes_novas = 0
+        self.transacoes_vistas = 0
+
+    def _conectar(self) -> sqlite3.Connection:
+        if self._conexao is None:
+            conexao = conectar_sqlite(self.arquivo)
+            conexao.executescript(ESQUEMA)
+            if conexao.execute("PRAGMA user_version").fetchone()[0] < VERSAO_ESQUEMA:
+                # Livros antigos guardavam o valor sem sinal: as despesas passam a negativas
+                with conexao:
+                    conexao.execute("UPDATE OR IGNORE transacoes SET valor_centavos = -valor_centavos "
+                                    "WHERE valor_centavos > 0 AND json_extract(transacao, '$.tipo') IS NOT 'receita'")
+                    conexao.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+            self._conexao = conexao
+        return self._conexao
+
+    def chave(self, data: str, descricao: str, valor: float, tipo: str | None) -> tuple[str, str, int]:
+        centavos = round(abs(valor) * 100)
+        return data, self.normalizar(descricao) or descricao.strip().lower(), centavos if tipo == "receita" else -centavos
+
+    def chave_transacao(self, transacao: dict) -> tuple[str, str, int] | None:
+        try:
+            return self.chave(str(transacao["data"]), str(transacao["descricao"]), float(transacao["valor"]),
+                              transacao.get("tipo"))
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def consultar(self, user_id: int, chaves: set[tuple]) -> dict[tuple, tuple[int, dict, str | None, str | None]]:
+        """
+        {chave: (ocorrencias, transacao, bank_name, document_type)} das chaves já vistas pelo usuário.
+        """
+        conhecidas = {}
+        with self._trava:
+            conexao = self._conectar()
+            for data, descricao, valor in chaves:
+                linha = conexao.execute(
+                    "SELECT ocorrencias, transacao, bank_name, document_type FROM transacoes "
+                    "WHERE user_id = ? AND data = ? AND descricao = ? AND valor_centavos = ?",
+                    (user_id, data, descricao, valor)).fetchone()
+                if linha:
+                    conhecidas[(data, descricao, valor)] = (linha[0], json.loads(linha[1]), linha[2], linha[3])
+        return conhecidas
+
+    # 3.1 - Páginas que não precisam da LLM
+    def paginas_conhecidas(self, user_id: int, textos: dict[int, str], contexto: str = "",
+                           document_type: str | None = None, periodo: tuple[int, int] | None = None) -> dict[int, dict]:
+        """
+        Para cada página (índice a partir de 0) cujos lançamentos já estão
+        todos no livro, monta o resultado no formato da LLM a partir das
+        transações guardadas (uma por linha da página, já categorizadas).
+        Páginas sem lançamentos legíveis ou com algum desconhecido ficam de fora.
+        'contexto' é o texto do documento antes da limpeza (cabeçalhos com o
+        tipo do documento e, sem 'periodo', as datas com ano do período).
+        """
+        document_type = document_type or tipo_documento(contexto)
+        periodo = periodo or periodo_documento(contexto)
+        chaves_paginas = {}
+        for i, texto in textos.items():
+            candidatas = linhas_candidatas(texto, document_type, periodo)
+            if candidatas:
+                chaves_paginas[i] = [self.chave(*c) for c in candidatas]
+        if not chaves_paginas:
+            return {}
+        conhecidas = self.consultar(user_id, {c for chaves in chaves_paginas.values() for c in chaves})
+
+        resultados = {}
+        for i, chaves in chaves_paginas.items():
+            if any(c not in conhecidas or n > conhecidas[c][0] for c, n in Counter(chaves).items()):
+                continue
+            transacoes = [{**conhecidas[c][1], "pagina": i + 1} for c in chaves]
+            bancos = Counter(conhecidas[c][2] for c in chaves).most_common(1)[0][0]
+            tipos = Counter(conhecidas[c][3] for c in chaves).most_common(1)[0][0]
+            resultados[i] = {"success": True, "bank_name": bancos or "TBD", "document_type": tipos or "unknown",
+                             "transactions": transacoes, "error_message": None}
+        self.paginas_puladas += len(resultados)
+        return resultados
+
+    # 3.2 - Marcação de novas x já vistas
+    def conciliar(self, user_id: int, transacoes: list[dict]):
+        """
+        Marca cada transação com "nova" (True se o usuário ainda não tinha
+        essa transação, contando as repetições dentro do documento) e aplica
+        às já vistas a categoria e subcategoria guardadas.
+        """
+        chaves = [self.chave_transacao(t) for t in transacoes]
+        conhecidas = self.consultar(user_id, {c for c in chaves if c})
+        vistas = Counter()
+        for transacao, chave in zip(transacoes, chaves):
+            vistas[chave] += 1
+            conhecida = conhecidas.get(chave)
+            transacao["nova"] = conhecida is None or vistas[chave] > conhecida[0]
+            if not transacao["nova"]:
+                for campo in ("categoria", "subcategoria"):
+                    if conhecida[1].get(campo):
+                        transacao[campo] = conhecida[1][campo]
+        novas = sum(1 for t in transacoes if t["nova"])
+        self.transacoes_novas += novas
+        self.transacoes_vistas += len(transacoes) - novas
+
+    def registrar(self, user_id: int, transacoes: list[dict], bank_name: str | None = None, document_type: str | None = None):
+        """
+        Grava as transações do documento no livro do usuário (a última
+        versão de cada uma, com o maior número de repetições já visto).
+        """
+        contagem = Counter()
+        ultimas = {}
+        for transacao in transacoes:
+            chave = self.chave_transacao(transacao)
+            if chave:
+                contagem[chave] += 1
+                ultimas[chave] = {k: v for k, v in transacao.items() if k not in CAMPOS_DO_DOCUMENTO}
+        if not ultimas:
+            return
+        try:
+            with self._trava:
+                conexao = self._conectar()
+                with conexao:
+                    agora = time.time()
+                    conexao.executemany(
+                        "INSERT INTO transacoes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(user_id, data, descricao, valor_centavos) DO UPDATE SET "
+                        "ocorrencias = MAX(ocorrencias, excluded.ocorrencias), transacao = excluded.transacao, "
+                        "bank_name = COALESCE(excluded.bank_name, bank_name), "
+                        "document_type = COALESCE(excluded.document_type, document_type), ultima_vez = excluded.ultima_vez",
+                        [(user_id, *chave, contagem[chave], json.dumps(transacao, ensure_ascii=False), bank_name,
+                          document_type, agora, agora) for chave, transacao in ultimas.items()])
+        except Exception as e:
+            print(f"ERRO ao registrar transações do usuário {user_id} no livro: {e}")
+
+    def metricas(self) -> dict:
+        return {"paginas_puladas": self.paginas_puladas, "transacoes_novas": self.transacoes_novas,
+                "transacoes_vistas": self.transacoes_vistas}
@@ -0,0 +1,208 @@
+# 1 - Importa módulos para identificar o layout do emissor antes da extração
+import json
+import os
+import random
+import re
+import threading
+from collections import Counter
+from reconstrucao_tabelas import REGEX_DATA_INTEIRA, REGEX_VALOR_INTEIRO, tipo_documento
+from categorizacao_local import normalizar_texto
+from inicializacao import ler_decimal
+
+# 1.1 - Liga/desliga a identificação de layout e arquivo do registro de modelos
+MODELOS_LAYOUT = os.getenv("MODELOS_LAYOUT", "true").lower() in ("1", "true", "sim")
+ARQUIVO_MODELOS = os.getenv(
+    "MODELOS_LAYOUT_ARQUIVO",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "modelos_layout.json")
+)
+TIPOS_MODELO = ("parser", "prompt")
+TOLERANCIA_COLUNA = 0.03  # fração da largura da página
+
+# 1.2 - Fração dos documentos de modelos "parser" cujas páginas do parser também vão para a LLM, para medir o acerto
+MODELOS_LAYOUT_AUDITORIA = min(1.0, ler_decimal("MODELOS_LAYOUT_AUDITORIA", 0.05, minimo=0))
+TOLERANCIA_AUDITORIA = 0.01  # reais de diferença na soma dos valores da página
+
+
+# 2 - Impressão digital da primeira página
+def impressao_digital(texto: str, palavras: list[dict] | None = None, largura: float | None = None,
+                      fontes: list[str] | tuple = ()) -> dict:
+    """
+    Resume o layout do documento a partir da primeira página:
+    texto normalizado, tipo de documento, nomes das fontes (sem o prefixo de
+    subconjunto "ABCDEF+") e posição relativa das colunas de data (x0 mais
+    comum) e de valor (x1 mais comum), quando há caixas de palavras.
+    """
+    colunas = {}
+    if palavras and largura:
+        datas = Counter(round(p["x0"] / largura, 2) for p in palavras if REGEX_DATA_INTEIRA.match(p["text"]))
+        valores = Counter(round(p["x1"] / largura, 2) for p in palavras if REGEX_VALOR_INTEIRO.match(p["text"]))
+        if datas:
+            colunas["data"] = datas.most_common(1)[0][0]
+        if valores:
+            colunas["valor"] = valores.most_common(1)[0][0]
+    return {
+        "texto": " ".join(texto.split()).casefold(),
+        "document_type": tipo_documento(texto),
+        "fontes": sorted({f.split("+", 1)[-1].casefold() for f in fontes}),
+        "colunas": colunas,
+    }
+
+
+# 3 - Registro de modelos com contadores de uso e acerto
+class RegistroModelos:
+    """
+    Carrega os modelos de layout de modelos_layout.json. Cada modelo tem:
+    - nome, banco, document_type;
+    - tipo: "parser" (layout totalmente suportado, as páginas vão para o parser
+      determinístico de colunas) ou "prompt" (a LLM recebe as instruções curtas
+      do modelo junto com o prompt de extração);
+    - marcadores: expressões procuradas no texto da primeira página
+      (mínimo de "minimo_marcadores", padrão 1);
+    - opcionais: "fontes" (trechos de nomes de fonte) e "colunas"
+      ({"data": x0, "valor": x1} relativos à largura da página);
+      obrigatório "colunas" nos modelos "parser".
+
+    Só casam modelos do mesmo tipo de documento identificado no texto; entre
+    eles, vence o de maior pontuação (marcadores, fontes e colunas). Um modelo
+    "parser" só casa quando todas as suas fontes e colunas conferem: com o
+    layout mudado, o documento fica com o modelo "prompt" do mesmo emissor.
+    Os contadores por modelo medem quantos documentos foram identificados,
+    se o banco e o tipo de documento devolvidos pela LLM confirmaram a
+    identificação e, nos modelos "parser", se as páginas auditadas
+    (MODELOS_LAYOUT_AUDITORIA) deram as mesmas transações no parser e na LLM.
+    """
+
+    def __init__(self, modelos: list[dict]):
+        self.modelos = []
+        for modelo in modelos:
+            if modelo.get("tipo") not in TIPOS_MODELO:
+                raise ValueError(f"Modelo de layout '{modelo.get('nome')}' com tipo inválido: {modelo.get('tipo')}")
+            if modelo["tipo"] == "parser" and not modelo.get("colunas"):
+                raise ValueError(f"Modelo de layout '{modelo['nome']}' do tipo parser sem as colunas do layout")
+            self.modelos.append({**modelo, "_marcadores": [re.compile(m, re.IGNORECASE) for m in modelo["marcadores"]]})
+        self._trava = threading.Lock()
+        self._contadores = {m["nome"]: self._contadores_vazios() for m in self.modelos}
+        self.documentos = 0
+        self.sem_modelo = 0
+
+    @classmethod
+    def carregar(cls, arquivo: str = ARQUIVO_MODELOS) -> "RegistroModelos":
+        with open(arquivo, encoding="utf-8") as f:
+            return cls(json.load(f)["modelos"])
+
+    @staticmethod
+    def _contadores_vazios() -> dict:
+        return {"documentos": 0, "paginas_parser": 0, "paginas_llm": 0, "confirmacoes": 0, "divergencias": 0,
+                "paginas_auditadas": 0, "auditorias_divergentes": 0}
+
+    # 3.1 - Identificação
+    def pontuar(self, modelo: dict, impressao: dict) -> int:
+        """
+        Pontuação do modelo para a impressão digital; 0 quando não casa.
+        """
+        marcadores = sum(1 for m in modelo["_marcadores"] if m.search(impressao["texto"]))
+        if marcadores < modelo.get("minimo_marcadores", 1):
+            return 0
+        if impressao["document_type"] != modelo["document_type"]:
+            return 0  # tipo não identificado ou diferente: as instruções do modelo poderiam enganar a LLM
+
+        fontes = sum(1 for f in modelo.get("fontes", []) if any(f.casefold() in nome for nome in impressao["fontes"]))
+        colunas = sum(1 for coluna, posicao in modelo.get("colunas", {}).items()
+                      if coluna in impressao["colunas"] and abs(impressao["colunas"][coluna] - posicao) <= TOLERANCIA_COLUNA)
+        if modelo["tipo"] == "parser" and (fontes < len(modelo.get("fontes", [])) or colunas < len(modelo["colunas"])):
+            return 0  # o parser só é confiável no layout exato
+        return marcadores + fontes + colunas
+
+    def identificar(self, impressao: dict) -> dict | None:
+        """
+        Retorna o modelo de maior pontuação (o primeiro registrado, em caso de
+        empate) ou None se nenhum casar.
+        """
+        melhor, melhor_pontos = None, 0
+        for modelo in self.modelos:
+            pontos = self.pontuar(modelo, impressao)
+            if pontos > melhor_pontos:
+                melhor, melhor_pontos = modelo, pontos
+        with self._trava:
+            self.documentos += 1
+            if melhor is None:
+                self.sem_modelo += 1
+            else:
+                self._contadores[melhor["nome"]]["documentos"] += 1
+        return melhor
+
+    # 3.2 - Contadores de acerto
+    def registrar_paginas(self, modelo: dict, parser: int = 0, llm: int = 0):
+        with self._trava:
+            self._contadores[modelo["nome"]]["paginas_parser"] += parser
+            self._contadores[modelo["nome"]]["paginas_llm"] += llm
+
+    def registrar_resultado(self, modelo: dict, resultado: dict):
+        """
+        Compara o banco e o tipo de documento devolvidos pela LLM com os do
+        modelo: diverge se algum dos dois for diferente. Campo que a LLM não
+        identificou não é comparado; sem nenhum dos dois, não conta nem
+        acerto nem divergência.
+        """
+        bank_name, document_type = resultado.get("bank_name"), resultado.get("document_type")
+        divergentes = []
+        if bank_name and bank_name != "TBD":
+            banco, informado = normalizar_texto(modelo["banco"]), normalizar_texto(bank_name)
+            if not (banco in informado or informado in banco):
+                divergentes.append(f"banco '{bank_name}'")
+        elif document_type in (None, "", "unknown"):
+            return
+        if document_type not in (None, "", "unknown") and document_type != modelo["document_type"]:
+            divergentes.append(f"tipo '{document_type}'")
+        if divergentes:
+            print(f"AVISO: Modelo de layout '{modelo['nome']}' identificado, mas a LLM indicou {' e '.join(divergentes)}")
+        with self._trava:
+            self._contadores[modelo["nome"]]["divergencias" if divergentes else "confirmacoes"] += 1
+
+    def auditar(self, modelo: dict) -> bool:
+        """
+        Sorteia se as páginas do parser deste documento também vão para a LLM.
+        """
+        return modelo["tipo"] == "parser" and random.random() < MODELOS_LAYOUT_AUDITORIA
+
+    def registrar_auditoria(self, modelo: dict, resultados_parser: list[dict], transacoes_llm: list[dict]) -> int:
+        """
+        Compara, página a página, as transações do parser com as que a LLM
+        extraiu das mesmas páginas: confere se quantidade e soma dos valores
+        batem. Retorna quantas páginas divergiram.
+        """
+        da_llm = {}
+        for transacao in transacoes_llm:
+            da_llm.setdefault(transacao.get("pagina"), []).append(transacao)
+        divergentes = []
+        for resultado in resultados_parser:
+            pagina = resultado["transactions"][0]["pagina"]
+            llm = da_llm.get(pagina, [])
+            soma_parser = sum(abs(t["valor"]) for t in resultado["transactions"])
+            soma_llm = sum(abs(float(t.get("valor") or 0)) for t in llm)
+            if len(llm) != len(resultado["transactions"]) or abs(soma_parser - soma_llm) > TOLERANCIA_AUDITORIA:
+                divergentes.append(pagina)
+        if divergentes:
+            print(f"AVISO: Modelo de layout '{modelo['nome']}': parser e LLM divergiram nas páginas {divergentes}")
+        with self._trava:
+            self._contadores[modelo["nome"]]["paginas_auditadas"] += len(resultados_parser)
+            self._contadores[modelo["nome"]]["auditorias_divergentes"] += len(divergentes)
+        return len(divergentes)
+
+    def metricas(self) -> dict:
+        with self._trava:
+            modelos = {}
+            for nome, contadores in self._contadores.items():
+                avaliados = contadores["confirmacoes"] + contadores["divergencias"]
+                auditadas = contadores["paginas_auditadas"]
+                modelos[nome] = {
+                    **contadores,
+                    "taxa_acerto": round(contadores["confirmacoes"] / avaliados, 4) if avaliados else None,
+                    "taxa_acerto_parser": round(1 - contadores["auditorias_divergentes"] / auditadas, 4) if auditadas else None,
+                }
+            return {"documentos": self.documentos, "sem_modelo": self.sem_modelo, "modelos": modelos}
+
+    def __len__(self) -> int:
+        return len(self.modelos)
+
+registro_modelos = RegistroModelos.carregar()
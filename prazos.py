@@ -0,0 +1,97 @@
+# 1 - Importa módulos para o prazo de ponta a ponta das requisições
+import asyncio
+import contextvars
+import os
+import time
+from inicializacao import ler_inteiro, ler_decimal
+
+# 1.1 - Prazo padrão (0 = sem prazo), limite de cada chamada ao Gemini e divisão do prazo entre as etapas
+TIMEOUT_PADRAO_MS = ler_inteiro("TIMEOUT_PADRAO_MS", 0, minimo=0)
+TIMEOUT_GEMINI_MS = ler_inteiro("TIMEOUT_GEMINI_MS", 120000, minimo=1)
+PRAZO_FRACAO_EXTRACAO = ler_decimal("PRAZO_FRACAO_EXTRACAO", 0.2, minimo=0)
+PRAZO_FRACAO_OCR = ler_decimal("PRAZO_FRACAO_OCR", 0.5, minimo=0)
+PRAZO_MARGEM_MS = ler_inteiro("PRAZO_MARGEM_MS", 500, minimo=0)  # reservado para consolidar e responder
+ETAPAS_PRAZO = ("extracao", "ocr", "llm")
+
+# 1.2 - Prazo da requisição em andamento (herdado pelas tasks criadas durante o processamento)
+prazo_atual: contextvars.ContextVar["Prazo | None"] = contextvars.ContextVar("prazo_atual", default=None)
+
+
+# 2 - Prazo com orçamentos por etapa
+class Prazo:
+    """
+    Prazo total da requisição dividido em marcos acumulados por etapa:
+    a extração nativa precisa terminar até PRAZO_FRACAO_EXTRACAO do total,
+    o OCR até PRAZO_FRACAO_OCR e as chamadas à LLM até o fim do prazo menos
+    PRAZO_MARGEM_MS. Como os marcos são acumulados, o tempo que uma etapa não
+    usou fica para as seguintes.
+    As páginas canceladas por falta de tempo são anotadas em paginas_pendentes
+    (numeração a partir de 1).
+    """
+
+    def __init__(self, timeout_ms: int):
+        if timeout_ms <= 0:
+            raise ValueError(f"timeout_ms deve ser positivo: {timeout_ms}")
+        self.timeout_ms = timeout_ms
+        self.inicio = time.monotonic()
+        self.fim = self.inicio + timeout_ms / 1000
+        margem = min(PRAZO_MARGEM_MS / 1000, timeout_ms / 1000 * 0.1)
+        total = timeout_ms / 1000 - margem
+        self.marcos = {
+            "extracao": self.inicio + total * PRAZO_FRACAO_EXTRACAO,
+            "ocr": self.inicio + total * PRAZO_FRACAO_OCR,
+            "llm": self.inicio + total,
+        }
+        self.paginas_pendentes: set[int] = set()
+
+    def restante(self, etapa: str | None = None) -> float:
+        """
+        Segundos até o marco da etapa (ou até o fim do prazo), nunca negativo.
+        """
+        limite = self.fim if etapa is None else self.marcos[etapa]
+        return max(0.0, limite - time.monotonic())
+
+    def esgotado(self, etapa: str | None = None) -> bool:
+        return self.restante(etapa) <= 0
+
+    def registrar_pendentes(self, paginas):
+        self.paginas_pendentes.update(paginas)
+
+    def decorrido_ms(self) -> int:
+        return int((time.monotonic() - self.inicio) * 1000)
+
+
+def criar_prazo(timeout_ms: int | None) -> Prazo | None:
+    """
+    Prazo da requisição a partir do parâmetro/cabeçalho timeout_ms
+    (ou de TIMEOUT_PADRAO_MS); None quando não há prazo.
+    """
+    timeout_ms = timeout_ms if timeout_ms is not None else TIMEOUT_PADRAO_MS
+    return Prazo(timeout_ms) if timeout_ms and timeout_ms > 0 else None
+
+
+# 3 - Espera um grupo de tarefas até o marco da etapa
+async def aguardar_no_prazo(tarefas: list[asyncio.Task], etapa: str) -> tuple[list[asyncio.Task], list[asyncio.Task]]:
+    """
+    Espera as tarefas até o marco da etapa no prazo atual (sem prazo, espera
+    todas). As que não terminaram são canceladas. Retorna (concluidas,
+    pendentes), cada lista na ordem original.
+    """
+    if not tarefas:
+        return [], []
+    prazo = prazo_atual.get()
+    _, pendentes = await asyncio.wait(tarefas, timeout=prazo.restante(etapa) if prazo else None)
+    for tarefa in pendentes:
+        tarefa.cancel()
+    if pendentes:
+        await asyncio.gather(*pendentes, return_exceptions=True)
+    return [t for t in tarefas if t not in pendentes], [t for t in tarefas if t in pendentes]
+
+
+def timeout_chamada() -> float:
+    """
+    Timeout de uma chamada ao Gemini: TIMEOUT_GEMINI_MS, limitado ao fim do prazo atual.
+    """
+    timeout = TIMEOUT_GEMINI_MS / 1000
+    prazo = prazo_atual.get()
+    return min(timeout, prazo.restante()) if prazo else timeout
@@ -0,0 +1,197 @@
+# 1 - Importa módulos para o pré-processamento do texto antes da LLM
+import math
+import os
+import re
+from collections import Counter
+from typing import Callable
+from documento_pdf import DocumentHandle
+from empacotamento import estimar_tokens, REGEX_VALOR_BR
+from inicializacao import ler_inteiro, ler_decimal
+
+# 1.1 - Parâmetros da remoção de cabeçalhos, rodapés e textos repetidos
+REMOVER_BOILERPLATE = os.getenv("REMOVER_BOILERPLATE", "true").lower() in ("1", "true", "sim")
+BOILERPLATE_LIMIAR = ler_decimal("BOILERPLATE_LIMIAR", 0.5, minimo=0)
+BOILERPLATE_BANDA = ler_decimal("BOILERPLATE_BANDA", 0.15, minimo=0)
+MIN_CARACTERES_TEXTO_FIXO = 60  # frases repetidas deste tamanho no corpo são texto legal/propaganda
+TOLERANCIA_LINHA = 3  # pontos de diferença no 'top' para considerar palavras na mesma linha
+
+# 1.2 - Parâmetros do pré-filtro de linhas de transação
+PREFILTRO_TRANSACOES = os.getenv("PREFILTRO_TRANSACOES", "true").lower() in ("1", "true", "sim")
+PREFILTRO_JANELA = ler_inteiro("PREFILTRO_JANELA", 1, minimo=0)
+PREFILTRO_RAZAO_MINIMA = ler_decimal("PREFILTRO_RAZAO_MINIMA", 0.6, minimo=0)
+PREFILTRO_LINHAS_CABECALHO = 3  # primeiras linhas da página (banco, tipo de documento, período)
+MARCADOR_OMISSAO = "[...]"
+
+
+# 2 - Normalização de linhas para comparação entre páginas
+def normalizar_linha(linha: str) -> str:
+    """
+    Chave de comparação da linha: minúsculas e espaços colapsados. Em linhas sem
+    valor monetário os dígitos viram '#', para que "Página 1 de 5" e "Página 2 de 5"
+    (ou datas de emissão) sejam reconhecidas como a mesma linha.
+    """
+    chave = " ".join(linha.split()).casefold()
+    if not REGEX_VALOR_BR.search(chave):
+        chave = re.sub(r'\d', '#', chave)
+    return chave
+
+# 3 - Posição vertical das linhas a partir das caixas de palavras do pdfplumber
+def posicoes_linhas(doc: DocumentHandle, indice: int) -> dict[str, float]:
+    """
+    Agrupa as palavras da página em linhas pelo 'top' e devolve
+    {chave_normalizada: posição vertical relativa (0 = topo, 1 = base)}.
+    """
+    altura = doc.plumber.pages[indice].height or 1.0
+    linhas = []
+    for palavra in sorted(doc.palavras(indice), key=lambda p: (p["top"], p["x0"])):
+        if linhas and abs(palavra["top"] - linhas[-1]["top"]) <= TOLERANCIA_LINHA:
+            linhas[-1]["palavras"].append(palavra)
+        else:
+            linhas.append({"top": palavra["top"], "palavras": [palavra]})
+
+    posicoes = {}
+    for linha in linhas:
+        texto = " ".join(p["text"] for p in sorted(linha["palavras"], key=lambda p: p["x0"]))
+        posicoes.setdefault(normalizar_linha(texto), linha["top"] / altura)
+    return posicoes
+
+def na_banda(posicao: float) -> bool:
+    """
+    Indica se a posição relativa cai na faixa de cabeçalho ou de rodapé.
+    """
+    return posicao <= BOILERPLATE_BANDA or posicao >= 1 - BOILERPLATE_BANDA
+
+
+# 4 - Remove linhas repetidas entre páginas
+def remover_boilerplate(textos: dict[int, str],
+                        posicao_linha: Callable[[int, str], float | None] | None = None) -> tuple[dict[int, str], dict]:
+    """
+    Detecta linhas que se repetem em várias páginas (cabeçalho, títulos das colunas,
+    rodapé legal, propaganda) e as remove de todas as páginas exceto a primeira em
+    que aparecem, para que a LLM ainda veja o nome do banco e o tipo do documento.
+
+    - Linhas sem valor monetário: removidas quando aparecem (com dígitos mascarados)
+      em pelo menos BOILERPLATE_LIMIAR das páginas e estão na faixa de cabeçalho/rodapé,
+      ou são frases longas (texto legal, propaganda). Linhas curtas no corpo da página
+      ficam, pois podem ser a descrição de uma transação quebrada em duas linhas.
+    - Linhas com valor monetário: só quando se repetem idênticas e estão na faixa de
+      cabeçalho/rodapé da página — nunca no corpo, onde podem ser transações.
+
+    'posicao_linha(indice, chave)' devolve a posição vertical relativa da linha
+    (caixas de palavras do PDF); sem ela, ou quando a linha não é encontrada,
+    usa a ordem da linha no texto da página.
+    Retorna (textos_limpos, relatorio).
+    """
+    relatorio = {
+        "paginas": len(textos),
+        "linhas_removidas": 0,
+        "tokens_antes": sum(estimar_tokens(t) for t in textos.values()),
+    }
+    if len(textos) < 2:
+        relatorio["tokens_depois"] = relatorio["tokens_antes"]
+        relatorio["tokens_economizados"] = 0
+        return textos, relatorio
+
+    linhas_por_pagina = {i: textos[i].splitlines() for i in sorted(textos)}
+    chaves_por_pagina = {
+        i: [normalizar_linha(linha) for linha in linhas]
+        for i, linhas in linhas_por_pagina.items()
+    }
+    frequencia = Counter(chave for chaves in chaves_por_pagina.values() for chave in set(chaves) if chave)
+    minimo_paginas = max(2, math.ceil(BOILERPLATE_LIMIAR * len(textos)))
+
+    primeira_pagina = {}
+    for i, chaves in chaves_por_pagina.items():
+        for chave in chaves:
+            primeira_pagina.setdefault(chave, i)
+
+    limpos = {}
+    for i, linhas in linhas_por_pagina.items():
+        chaves = chaves_por_pagina[i]
+        mantidas = []
+        for n, (linha, chave) in enumerate(zip(linhas, chaves)):
+            if not chave or frequencia[chave] < 2 or primeira_pagina[chave] == i:
+                mantidas.append(linha)
+                continue
+
+            posicao = posicao_linha(i, chave) if posicao_linha else None
+            if posicao is None:
+                posicao = n / max(1, len(linhas) - 1)
+
+            if REGEX_VALOR_BR.search(chave):
+                remover = na_banda(posicao)
+            else:
+                remover = frequencia[chave] >= minimo_paginas and (na_banda(posicao) or len(chave) >= MIN_CARACTERES_TEXTO_FIXO)
+
+            if remover:
+                relatorio["linhas_removidas"] += 1
+            else:
+                mantidas.append(linha)
+        limpos[i] = "\n".join(mantidas)
+
+    relatorio["tokens_depois"] = sum(estimar_tokens(t) for t in limpos.values())
+    relatorio["tokens_economizados"] = relatorio["tokens_antes"] - relatorio["tokens_depois"]
+    return limpos, relatorio
+
+
+# 5 - Pré-filtro de linhas candidatas a transação (data + valor)
+MESES_BR = "jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez"
+REGEX_DATA_BR = re.compile(
+    r'\b(?:0?[1-9]|[12]\d|3[01])[/.-](?:0?[1-9]|1[0-2])(?:[/.-](?:\d{4}|\d{2}))?\b'
+    rf'|\b(?:0?[1-9]|[12]\d|3[01])\s*(?:de\s+|/\s*)?(?:{MESES_BR})[a-zç]*\.?(?![a-z])',
+    re.IGNORECASE
+)
+
+def prefiltrar_pagina(texto: str) -> tuple[str, bool]:
+    """
+    Mantém só as linhas com data e valor (as únicas que podem ser transações pelas
+    regras do PROMPT_SISTEMA), mais PREFILTRO_JANELA linhas de contexto em volta
+    e as primeiras linhas da página. Trechos omitidos viram '[...]'.
+
+    Salvaguarda de recall: devolve a página inteira quando a proporção parece errada —
+    nenhuma linha candidata, ou muitas linhas com valor sem data na mesma linha
+    (layouts com a data em linha separada, agrupamento por dia, colunas quebradas).
+    Retorna (texto, filtrado).
+    """
+    linhas = texto.splitlines()
+    com_valor = [i for i, linha in enumerate(linhas) if REGEX_VALOR_BR.search(linha)]
+    candidatas = [i for i in com_valor if REGEX_DATA_BR.search(linhas[i])]
+
+    if not candidatas or len(candidatas) < PREFILTRO_RAZAO_MINIMA * len(com_valor):
+        return texto, False
+
+    manter = set(range(min(PREFILTRO_LINHAS_CABECALHO, len(linhas))))
+    for i in candidatas:
+        manter.update(range(max(0, i - PREFILTRO_JANELA), min(len(linhas), i + PREFILTRO_JANELA + 1)))
+
+    saida = []
+    anterior = -1
+    for i in sorted(manter):
+        if i > anterior + 1:
+            saida.append(MARCADOR_OMISSAO)
+        saida.append(linhas[i])
+        anterior = i
+    if anterior < len(linhas) - 1:
+        saida.append(MARCADOR_OMISSAO)
+    return "\n".join(saida), True
+
+def prefiltrar_transacoes(textos: dict[int, str]) -> tuple[dict[int, str], dict]:
+    """
+    Aplica o pré-filtro em todas as páginas e mede a redução de tokens.
+    Retorna (textos_filtrados, relatorio).
+    """
+    relatorio = {
+        "paginas": len(textos),
+        "paginas_filtradas": 0,
+        "paginas_inteiras": 0,
+        "tokens_antes": 0,
+        "tokens_depois": 0,
+    }
+    filtrados = {}
+    for i, texto in textos.items():
+        filtrados[i], filtrado = prefiltrar_pagina(texto)
+        relatorio["paginas_filtradas" if filtrado else "paginas_inteiras"] += 1
+        relatorio["tokens_antes"] += estimar_tokens(texto)
+        relatorio["tokens_depois"] += estimar_tokens(filtrados[i])
+    relatorio["tokens_economizados"] = relatorio["tokens_antes"] - relatorio["tokens_depois"]
+    return filtrados, relatorio
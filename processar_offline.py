@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Processamento offline de extratos em lote, sem o servidor: roda o mesmo
+pipeline da API (processar_documento) sobre arquivos, diretórios ou globs.
+
+Uso:
+    python processar_offline.py extratos/ "arquivo/2024/**/*.pdf" --saida resultados.jsonl
+    python processar_offline.py extratos/ --user-id 42 --modo auto --documentos 4 --concorrencia-llm 16 --workers-cpu 8
+    python processar_offline.py --reprocessar todos --user-id 42 --saida reprocessados.jsonl
+
+Cada documento vira uma linha JSON em --saida, gravada assim que ele termina.
+Rodar de novo com a mesma saída continua de onde parou: os documentos já
+processados com sucesso (mesmo caminho e mesmo conteúdo) são pulados e os
+que falharam são tentados de novo. No fim, imprime o resumo de vazão.
+
+Com --reprocessar (e --user-id, obrigatório: só os documentos do usuário),
+as entradas são hashes de documentos (ou PDFs, dos quais só o hash é
+calculado, ou "todos") e só as etapas finais (LLM e categorização) são
+refeitas a partir do armazém de artefatos, sem abrir os PDFs.
+"""
+import argparse
+import asyncio
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+
+
+# 1 - Entrada e progresso
+def listar_pdfs(entradas: list[str]) -> list[str]:
+    """
+    Expande arquivos, diretórios (PDFs em qualquer subpasta) e globs, sem repetições.
+    """
+    caminhos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            caminhos.extend(glob.glob(os.path.join(entrada, "**", "*.pdf"), recursive=True))
+            caminhos.extend(glob.glob(os.path.join(entrada, "**", "*.PDF"), recursive=True))
+        elif os.path.isfile(entrada):
+            caminhos.append(entrada)
+        else:
+            caminhos.extend(c for c in glob.glob(entrada, recursive=True) if os.path.isfile(c))
+    return sorted(set(os.path.normpath(c) for c in caminhos))
+
+def listar_hashes(entradas: list[str], user_id: int) -> list[tuple[str, str]]:
+    """
+    (arquivo ou hash, hash) dos documentos a reprocessar: hashes sha256 como
+    estão, PDFs/diretórios/globs pelo hash do conteúdo e "todos" para todos
+    os documentos do usuário no armazém de artefatos.
+    """
+    import api_rapida
+
+    documentos = []
+    for entrada in entradas:
+        if entrada == "todos":
+            documentos.extend((h, h) for h in api_rapida.armazem_artefatos.listar(user_id))
+        elif re.fullmatch(r"[0-9a-f]{64}", entrada):
+            documentos.append((entrada, entrada))
+        else:
+            for caminho in listar_pdfs([entrada]):
+                with open(caminho, "rb") as f:
+                    documentos.append((caminho, hashlib.sha256(f.read()).hexdigest()))
+    return list(dict.fromkeys(documentos))
+
+def carregar_progresso(saida: str) -> set[tuple[str, str]]:
+    """
+    (arquivo, sha256) dos documentos já concluídos com sucesso na saída.
+    Ignora linhas incompletas (processo interrompido no meio da gravação).
+    """
+    concluidos = set()
+    if not os.path.exists(saida):
+        return concluidos
+    with open(saida, encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue
+            if registro.get("status_code") == 200:
+                concluidos.add((registro["arquivo"], registro["sha256"]))
+    return concluidos
+
+def terminou_em_linha(saida: str) -> bool:
+    """
+    Indica se a saída termina em quebra de linha (senão a última gravação foi cortada).
+    """
+    with open(saida, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+# 2 - Processamento
+async def processar_arquivo(caminho: str, pdf_bytes: bytes, user_id: int | None, senha_do_pdf: str | None,
+                            modo_pipeline: str | None) -> dict:
+    """
+    Executa o pipeline da API sobre um PDF e monta a linha de saída.
+    """
+    import api_rapida
+
+    inicio = time.perf_counter()
+    registro = {"arquivo": caminho, "sha256": hashlib.sha256(pdf_bytes).hexdigest(), "paginas": 0}
+    try:
+        doc = api_rapida.abrir_documento(pdf_bytes, senha_do_pdf)
+        try:
+            registro["paginas"] = len(doc)
+            resultado = await api_rapida.processar_documento(doc, user_id, modo_pipeline)
+        finally:
+            doc.close()
+        resultado["transactions_count"] = len(resultado.get("transactions", []))
+        registro.update(status_code=200, resultado=resultado)
+    except api_rapida.HTTPException as e:
+        registro.update(status_code=e.status_code, erro=e.detail)
+    except Exception as e:
+        print(f"ERRO Inesperado em {caminho}: {e}")
+        registro.update(status_code=500, erro=str(e))
+    registro["segundos"] = round(time.perf_counter() - inicio, 2)
+    return registro
+
+async def reprocessar_arquivo(arquivo: str, hash_documento: str, user_id: int) -> dict:
+    """
+    Reprocessa um documento a partir dos artefatos e monta a linha de saída
+    (sem prazo na fila de admissão, como os trabalhos de background).
+    """
+    import api_rapida
+
+    inicio = time.perf_counter()
+    # Nenhuma página do PDF é reaberta: "paginas" fica em 0 e a vazão é medida em documentos
+    registro = {"arquivo": arquivo, "sha256": hash_documento, "paginas": 0, "reprocessado": True}
+    try:
+        resultado = await api_rapida.reprocessar_documento(hash_documento, user_id, espera_max_s=None)
+        resultado["transactions_count"] = len(resultado.get("transactions", []))
+        registro.update(status_code=200, resultado=resultado)
+    except api_rapida.HTTPException as e:
+        registro.update(status_code=e.status_code, erro=e.detail)
+    except Exception as e:
+        print(f"ERRO Inesperado ao reprocessar {arquivo}: {e}")
+        registro.update(status_code=500, erro=str(e))
+    registro["segundos"] = round(time.perf_counter() - inicio, 2)
+    return registro
+
+async def executar(entradas: list[str], saida: str, user_id: int | None = None, senha_do_pdf: str | None = None,
+                   modo_pipeline: str | None = None, documentos_simultaneos: int = 4, reprocessar: bool = False) -> dict:
+    """
+    Processa os PDFs que ainda não estão concluídos na saída, até
+    'documentos_simultaneos' por vez, e retorna o resumo da execução.
+    Com 'reprocessar', refaz só as etapas finais a partir dos artefatos dos
+    documentos de user_id (ver listar_hashes).
+    """
+    import api_rapida
+
+    api_rapida.validar_modo_pipeline(modo_pipeline)
+    if reprocessar and user_id is None:
+        raise api_rapida.HTTPException(status_code=400, detail="O reprocessamento exige --user-id (dono dos documentos).")
+    if reprocessar:
+        documentos = listar_hashes(entradas, user_id)
+        caminhos = [arquivo for arquivo, _ in documentos]
+        hashes = dict(documentos)
+    else:
+        caminhos = listar_pdfs(entradas)
+    concluidos = set() if reprocessar else carregar_progresso(saida)
+    resumo = {"documentos": len(caminhos), "processados": 0, "com_erro": 0, "pulados": 0, "paginas": 0, "transacoes": 0}
+    chamadas_antes = api_rapida.escalonador_gemini.status(user_id)["atendidas"]
+    semaforo = asyncio.Semaphore(documentos_simultaneos)
+    inicio = time.perf_counter()
+    if reprocessar:
+        print(f"INFO: {len(caminhos)} documentos para reprocessar a partir dos artefatos")
+    else:
+        print(f"INFO: {len(caminhos)} PDFs encontrados, {len(concluidos)} já concluídos em {saida}")
+
+    with open(saida, "a", encoding="utf-8") as arquivo_saida:
+        if arquivo_saida.tell() > 0 and not terminou_em_linha(saida):
+            arquivo_saida.write("\n")
+
+        async def carregar_e_processar(caminho: str) -> dict | None:
+            with open(caminho, "rb") as f:
+                pdf_bytes = f.read()
+            if (caminho, hashlib.sha256(pdf_bytes).hexdigest()) in concluidos:
+                return None
+            return await processar_arquivo(caminho, pdf_bytes, user_id, senha_do_pdf, modo_pipeline)
+
+        async def processar(caminho: str):
+            async with semaforo:
+                if reprocessar:
+                    registro = await reprocessar_arquivo(caminho, hashes[caminho], user_id)
+                else:
+                    registro = await carregar_e_processar(caminho)
+                if registro is None:
+                    resumo["pulados"] += 1
+                    return
+            arquivo_saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            arquivo_saida.flush()
+            if registro["status_code"] == 200:
+                resumo["processados"] += 1
+                resumo["paginas"] += registro["paginas"]
+                resumo["transacoes"] += registro["resultado"]["transactions_count"]
+                print(f"SUCESSO: {caminho}: {registro['resultado']['transactions_count']} transações em {registro['segundos']}s")
+            else:
+                resumo["com_erro"] += 1
+                print(f"ERRO: {caminho}: {registro['erro']}")
+
+        await asyncio.gather(*(processar(caminho) for caminho in caminhos))
+
+    # Gravações agendadas pelo pipeline (categorizações no Supabase, artefatos, livro) terminam antes de sair
+    await api_rapida.gerenciador_encerramento.aguardar_gravacoes()
+
+    segundos = time.perf_counter() - inicio
+    resumo.update(
+        segundos=round(segundos, 2),
+        documentos_por_minuto=round(resumo["processados"] / segundos * 60, 2) if segundos else 0.0,
+        paginas_por_segundo=round(resumo["paginas"] / segundos, 2) if segundos else 0.0,
+        chamadas_gemini=api_rapida.escalonador_gemini.status(user_id)["atendidas"] - chamadas_antes,
+    )
+    return resumo
+
+
+# 3 - Linha de comando
+def main():
+    parser = argparse.ArgumentParser(description="Processa extratos em PDF offline, com o pipeline da API.")
+    parser.add_argument("entradas", nargs="+", help="arquivos PDF, diretórios ou globs (use aspas)")
+    parser.add_argument("--saida", default="resultados.jsonl", help="arquivo JSONL de saída e progresso")
+    parser.add_argument("--user-id", type=int, default=None, help="aplica as categorizações personalizadas do usuário")
+    parser.add_argument("--senha", default=None, help="senha dos PDFs protegidos")
+    parser.add_argument("--modo", default=None, help="modo_pipeline: duas_etapas, multimodal ou auto")
+    parser.add_argument("--documentos", type=int, default=4, help="documentos processados ao mesmo tempo")
+    parser.add_argument("--concorrencia-llm", type=int, default=None, help="chamadas simultâneas ao Gemini")
+    parser.add_argument("--reprocessar", action="store_true",
+                        help="refaz só LLM e categorização a partir dos artefatos (entradas: hashes, PDFs ou 'todos'; exige --user-id)")
+    parser.add_argument("--workers-cpu", type=int, default=None, help="processos do pool de extração/renderização")
+    args = parser.parse_args()
+    if args.reprocessar and args.user_id is None:
+        parser.error("--reprocessar exige --user-id (só o dono reprocessa os próprios documentos)")
+
+    # Os limites são lidos quando a API é importada
+    if args.concorrencia_llm:
+        os.environ["ESCALONADOR_GEMINI_CONCORRENCIA"] = str(args.concorrencia_llm)
+    if args.workers_cpu:
+        os.environ["CPU_WORKERS"] = str(args.workers_cpu)
+    import api_rapida
+
+    print("🚀 PROCESSAMENTO OFFLINE DE EXTRATOS")
+    try:
+        resumo = asyncio.run(executar(args.entradas, args.saida, args.user_id, args.senha, args.modo, args.documentos,
+                                     args.reprocessar))
+    except api_rapida.HTTPException as e:
+        print(f"ERRO: {e.detail}")
+        raise SystemExit(2)
+    finally:
+        api_rapida.salvar_cache_estabelecimentos()
+        if api_rapida.executor_cpu is not None:
+            api_rapida.executor_cpu.shutdown()
+
+    print("\n📊 RESUMO")
+    print(f"   • Documentos: {resumo['processados']} processados, {resumo['com_erro']} com erro, "
+          f"{resumo['pulados']} já concluídos (de {resumo['documentos']})")
+    print(f"   • Páginas: {resumo['paginas']} | Transações: {resumo['transacoes']} | Chamadas ao Gemini: {resumo['chamadas_gemini']}")
+    print(f"   • Tempo: {resumo['segundos']}s | {resumo['documentos_por_minuto']} documentos/min | "
+          f"{resumo['paginas_por_segundo']} páginas/s")
+    if resumo["com_erro"]:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
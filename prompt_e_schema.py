@@ -1,3 +1,8 @@
+import json
+import os
+
+ARQUIVO_CATEGORIAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "categorias.json")
+
 PROMPT_SISTEMA = """
 Você é uma API de processamento de extratos financeiros de alta precisão.
 Sua única tarefa é receber texto bruto (de um OCR ou extração nativa) e convertê-lo
@@ -18,7 +23,7 @@ REGRAS DE ANÁLISE:
     - Qualquer linha que NÃO tenha uma DATA específica associada
 
 3.  **Critérios OBRIGATÓRIOS para ser considerado transação:**
-    - DEVE ter uma DATA específica (DD/MM/YYYY, DD/MM/YY, DD/MM - Caso não explicite o ano da operação, considere como 2025)
+    - DEVE ter uma DATA específica (DD/MM/YYYY, DD/MM/YY, DD/MM - Caso não explicite o ano da operação, use o PERÍODO DO DOCUMENTO quando informado; sem ele, considere como 2025)
     - DEVE representar uma operação individual específica
     - DEVE ter um estabelecimento/serviço/descrição clara
     - NÃO pode ser um totalizador ou resumo
@@ -87,106 +92,46 @@ REGRAS DE ANÁLISE:
 }
 """
 
-CATEGORIAS_COMPLETAS = """
-**CATEGORIAS PRINCIPAIS:**
-        - MORADIA
-        - COMUNICACAO  
-        - ALIMENTACAO
-        - TRANSPORTE
-        - SAUDE
-        - CUIDADO_PESSOAL
-        - EDUCACAO
-        - LAZER
-        - SERVICOS_FINANCEIROS
-        - DIVERSOS
-        
-        **SUBCATEGORIAS por categoria (com exemplos de palavras-chave):**
-        
-        MORADIA: 
-        • Condomínio (ex: condomínio, taxa condominial)
-        • Aluguel (ex: aluguel, locação)
-        • Energia Elétrica (ex: Enel, Light, Cemig, energia, elétrica)
-        • Gás (ex: Ultragaz, Liquigás, gás)
-        • Água (ex: Sabesp, Cedae, água, saneamento)
-        • Serviços de limpeza / Faxina (ex: faxina, limpeza, diarista)
-        • Reforma / Manutenção / Jardineiro (ex: reforma, pintura, jardineiro, manutenção)
-        • Outras
-        
-        COMUNICACAO: 
-        • Telefone Celular (ex: Vivo, Tim, Claro, Oi, celular, telefone)
-        • Combo (TV + Internet + Tel) (ex: Sky, Net, Vivo Fibra, internet, TV)
-        • Apps (Netflix, Spotify, Prime, etc) (ex: Netflix, Spotify, Amazon Prime, Disney+, YouTube Premium, Apple Music, Deezer, HBO Max, Paramount+, apps, streaming)
-        • Outros
-        
-        ALIMENTACAO: 
-        • Supermercado (ex: Pão de Açúcar, Carrefour, Extra, supermercado, mercado)
-        • Refeições em restaurante (ex: restaurante, lanchonete, fast food, McDonald's, Burger King, iFood, Uber Eats, delivery)
-        • Feira (ex: feira, hortifruiti, sacolão)
-        • Padaria (ex: padaria, pão, confeitaria)
-        • Outros
-        
-        TRANSPORTE: 
-        • Combustível (ex: Petrobras, Shell, Ipiranga, posto, gasolina, etanol, combustível)
-        • Seguro (ex: seguro auto, Porto Seguro, Bradesco Seguros)
-        • IPVA (ex: IPVA, imposto veículo)
-        • Licenciamento (ex: licenciamento, DETRAN)
-        • Manutenção (ex: oficina, mecânico, troca óleo, revisão, pneu)
-        • Estacionamento (ex: estacionamento, zona azul, parking)
-        • Pedágio (ex: pedágio, CCR, Ecovias)
-        • Multas (ex: multa, infração, DETRAN)
-        • Uber (ex: Uber, 99, taxi, transporte app, Cabify)
-        • Lavagem / Higienização (ex: lava jato, lavagem, enceramento)
-        • Outros
-        
-        SAUDE: 
-        • Plano de Saúde (ex: Unimed, Bradesco Saúde, SulAmérica, plano saúde)
-        • Dentista (ex: dentista, ortodontia, odontologia)
-        • Medicamentos / Farmácia (ex: Drogaria, Farmácia, medicamento, remédio, Drogasil, Pacheco)
-        • Terapia / Tratamentos Contínuos (ex: fisioterapia, psicologia, terapia)
-        • Exames fora do plano (ex: laboratório, exame, Fleury, Dasa)
-        • Outras Consultas Fora do Plano (ex: consulta particular, médico particular)
-        • Outros
-        
-        CUIDADO_PESSOAL: 
-        • Vestuário / Calçados / Acessórios (ex: roupa, sapato, tênis, Zara, C&A, Renner, Shopping)
-        • Higiene pessoal (ex: shampoo, sabonete, perfume, O Boticário, Natura)
-        • Lavanderia (ex: lavanderia, tinturaria, lavagem roupa)
-        • Salão / Barbeiro / Manicure (ex: salão, cabeleireiro, barbeiro, manicure, estética)
-        • Academia / Esportes (ex: academia, Smart Fit, ginástica, pilates, crossfit)
-        • Suplemento Alimentar (ex: whey, suplemento, Growth, Integral Médica)
-        • Outros
-        
-        EDUCACAO: 
-        • Graduação (ex: faculdade, universidade, graduação, mensalidade)
-        • Pós-Graduação (ex: pós, MBA, mestrado, doutorado, especialização)
-        • Cursos e Congressos (ex: curso, congresso, seminário, workshop)
-        • Cursos de Extensão (ex: extensão, certificação, capacitação)
-        • Mentorias (ex: mentoria, coaching, consultoria educacional)
-        • Idiomas (ex: inglês, espanhol, Wizard, CNA, CCAA, idioma)
-        • Outros
-        
-        LAZER: 
-        • Cinema / Teatro / Shows/ Jantares (ex: cinema, teatro, show, concerto, jantar, bar, balada, festa, entretenimento)
-        • Livros (ex: livro, livraria, Saraiva, Amazon livros, literatura)
-        • Viagens (ex: viagem, hotel, pousada, passagem, avião, ônibus, rodoviária, aeroporto, Booking, Airbnb, Latam, Gol, Azul, Delta, American Airlines, United, TAP, companhia aérea)
-        • Outros
-        
-        SERVICOS_FINANCEIROS: 
-        • Tarifas Bancárias (ex: tarifa, banco, taxa bancária, manutenção conta)
-        • Anuidade Cartão Crédito (ex: anuidade, cartão crédito, Visa, Mastercard)
-        • Transferências (ex: transferência, PIX, TED, DOC)
-        • Depósitos (ex: depósito, aplicação)
-        • Outros
-        
-        DIVERSOS: 
-        • Animais de estimação (ex: pet shop, veterinário, ração, animal)
-        • Presentes (ex: presente, gift, loja presente)
-        • Doações (ex: doação, caridade, ONG)
-        • Impostos (ex: imposto de renda, IRPF, tributo, receita federal)
-        • Advogado (ex: advogado, advocacia, jurídico, cartório)
-        • Outros
-        
-        **INSTRUÇÕES CRÍTICAS DE CATEGORIZAÇÃO:**
+def carregar_taxonomia(caminho: str = ARQUIVO_CATEGORIAS) -> list[dict]:
+    """
+    Lê a taxonomia de categorias (categorias.json): fonte única para o texto
+    do prompt e para o categorizador local por palavras-chave.
+    """
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)["categorias"]
+
+def gerar_texto_categorias(taxonomia: list[dict], codigos: bool = False) -> str:
+    """
+    Monta a lista de categorias e subcategorias (com exemplos de palavras-chave) do prompt.
+    Com codigos=True, cada subcategoria vem precedida do seu código "[C.S]"
+    (ver codigos_subcategorias), usado na saída tabular.
+    """
+    linhas = ["", "**CATEGORIAS PRINCIPAIS:**"]
+    linhas += [f"        - {categoria['nome']}" for categoria in taxonomia]
+    linhas += ["        ", "        **SUBCATEGORIAS por categoria (com exemplos de palavras-chave):**", "        "]
+    for c, categoria in enumerate(taxonomia, 1):
+        linhas.append(f"        {categoria['nome']}: ")
+        for s, sub in enumerate(categoria["subcategorias"], 1):
+            exemplos = f" (ex: {', '.join(sub['exemplos'])})" if sub["exemplos"] else ""
+            codigo = f"[{c}.{s}] " if codigos else ""
+            linhas.append(f"        • {codigo}{sub['nome']}{exemplos}")
+        linhas.append("        ")
+    return "\n".join(linhas) + "\n"
+
+def codigos_subcategorias(taxonomia: list[dict]) -> dict[str, tuple[str, str]]:
+    """
+    Códigos curtos "C.S" (posição da categoria e da subcategoria, a partir de 1)
+    -> (categoria, subcategoria).
+    """
+    return {
+        f"{c}.{s}": (categoria["nome"], sub["nome"])
+        for c, categoria in enumerate(taxonomia, 1)
+        for s, sub in enumerate(categoria["subcategorias"], 1)
+    }
+
+TAXONOMIA = carregar_taxonomia()
+
+INSTRUCOES_CATEGORIZACAO = """        **INSTRUÇÕES CRÍTICAS DE CATEGORIZAÇÃO:**
         - EVITE usar DIVERSOS como primeira opção - use apenas quando realmente não houver outra categoria aplicável
         - Analise MUITO cuidadosamente o nome da transação antes de categorizar
         - Procure por palavras-chave específicas mencionadas nos exemplos
@@ -217,3 +162,155 @@ CATEGORIAS_COMPLETAS = """
         - Se contém "EXTRATO", "CONTA CORRENTE", "POUPANÇA", use "extrato"  
         - Se não conseguir determinar, use "other"
 """
+
+CATEGORIAS_COMPLETAS = gerar_texto_categorias(TAXONOMIA) + INSTRUCOES_CATEGORIZACAO
+CATEGORIAS_CODIFICADAS = gerar_texto_categorias(TAXONOMIA, codigos=True) + INSTRUCOES_CATEGORIZACAO
+
+PROMPT_EXTRACAO = """
+Você é uma API de processamento de extratos financeiros de alta precisão.
+Sua única tarefa é receber texto bruto (de um OCR ou extração nativa) e extrair
+as transações em um objeto JSON estruturado. NÃO categorize as transações.
+
+REGRAS DE ANÁLISE:
+1.  **Varredura Completa:** Analise CADA linha do texto bruto minuciosamente. Procure por transações INDIVIDUAIS.
+
+2.  **Filtragem Rigorosa:** IGNORE totalizadores, resumos, cabeçalhos, informações de fatura,
+    rodapés, textos publicitários, saldos, limites e qualquer linha que NÃO tenha uma DATA específica associada.
+
+3.  **Critérios OBRIGATÓRIOS para ser considerado transação:**
+    - DEVE ter uma DATA específica (DD/MM/YYYY, DD/MM/YY, DD/MM - Caso não explicite o ano da operação, use o PERÍODO DO DOCUMENTO quando informado; sem ele, considere como 2025)
+    - DEVE representar uma operação individual específica, com estabelecimento/serviço/descrição
+    - NÃO pode ser um totalizador ou resumo
+
+4.  **Extração Completa:** NUNCA pule uma transação que tenha data e valor monetário identificáveis.
+    Para linhas com mais de um valor monetário (ex: em Dólar e em Real), escolha o valor em Real (R$).
+
+5.  **Tipo:** Determine 'tipo' ("receita" ou "despesa") com base no contexto (créditos, débitos, sinais de +/-).
+
+6.  **Parcelamento:** Detecte parcelas (ex: "3/9", "PARC 01/12", "PARCELA 1 DE 12"). Se 'parcelado' for false,
+    NÃO inclua os campos 'numero_parcelas' e 'total_parcelas'.
+
+7.  **Descrição:** Copie a descrição como aparece no documento, sem datas e sem o número da parcela.
+
+8.  **Tipo de documento:** "credit-card-statement" para faturas de cartão, "bank-statement" para extratos de conta.
+
+9.  **Output:** Retorne APENAS o objeto JSON, nada mais.
+
+**ESTRUTURA JSON DE SAÍDA OBRIGATÓRIA:**
+{
+  "success": true,
+  "bank_name": "Nome do Banco (ex: Bradesco, BTG Pactual, Inter)",
+  "document_type": "[DETERMINE: 'credit-card-statement' ou 'bank-statement']",
+  "transactions": [
+    {"data": "YYYY-MM-DD", "descricao": "Descrição da transação", "valor": 99.99, "tipo": "despesa", "parcelado": true, "numero_parcelas": 3, "total_parcelas": 9},
+    {"data": "YYYY-MM-DD", "descricao": "Outra transação", "valor": 50.00, "tipo": "despesa", "parcelado": false}
+  ],
+  "error_message": null
+}
+
+**SE NENHUMA TRANSAÇÃO FOR ENCONTRADA, retorne este JSON:**
+{
+  "success": false,
+  "bank_name": "Nome do Banco (se identificável)",
+  "document_type": "unknown",
+  "transactions": [],
+  "error_message": "Nenhuma transação encontrada no documento"
+}
+"""
+
+PROMPT_CATEGORIZACAO = """
+Você é uma API de categorização de transações financeiras de alta precisão.
+Você recebe uma lista numerada de descrições de transações (estabelecimentos, serviços,
+transferências) e deve atribuir a cada uma a categoria e a subcategoria mais adequadas.
+
+REGRAS:
+1.  Categorize TODAS as descrições da lista, uma entrada por número.
+2.  Use apenas as categorias e subcategorias listadas abaixo, escritas exatamente como aparecem.
+3.  Evite "DIVERSOS" a menos que seja a única opção.
+4.  Retorne APENAS o objeto JSON, nada mais.
+
+**ESTRUTURA JSON DE SAÍDA OBRIGATÓRIA:**
+{"categorias": [{"id": 1, "categoria": "ALIMENTACAO", "subcategoria": "Refeições em restaurante"}, {"id": 2, "categoria": "TRANSPORTE", "subcategoria": "Uber"}]}
+"""
+
+# Contrato de saída tabular (VERSAO_PROMPT = "v2"): uma linha por transação em vez de um objeto JSON
+FORMATO_SAIDA_TABULAR = """
+**FORMATO DE SAÍDA OBRIGATÓRIO (linhas separadas por "|", NÃO use JSON):**
+Linha 1: BANCO|<nome do banco, ou TBD>|<C para fatura de cartão, E para extrato de conta, U se não souber>
+Linha 2: o cabeçalho, exatamente: {cabecalho}
+Demais linhas: uma transação por linha, na ordem do documento.
+- pag: número da página de onde a transação foi extraída
+- data: YYYY-MM-DD
+- descricao: como aparece no documento, sem data e sem o número da parcela, inclusive qualquer "|" que houver nela
+- valor: número positivo com ponto decimal, sem separador de milhar (ex: 1234.56)
+- tipo: D para despesa, R para receita
+- parcela: N/T (ex: 3/9) se parcelado; vazio se não for parcelado{campo_categoria}
+Se nenhuma transação for encontrada, escreva apenas a linha BANCO e uma linha NENHUMA.
+
+Exemplo:
+BANCO|Nubank|C
+{cabecalho}
+{exemplo}
+"""
+
+REGRAS_TABULAR = """
+REGRAS DE ANÁLISE:
+1.  **Varredura Completa:** Analise CADA linha do texto bruto minuciosamente. Procure por transações INDIVIDUAIS.
+
+2.  **Filtragem Rigorosa:** IGNORE totalizadores, resumos, cabeçalhos, informações de fatura,
+    rodapés, textos publicitários, saldos, limites e qualquer linha que NÃO tenha uma DATA específica associada.
+
+3.  **Critérios OBRIGATÓRIOS para ser considerado transação:**
+    - DEVE ter uma DATA específica (DD/MM/YYYY, DD/MM/YY, DD/MM - Caso não explicite o ano da operação, use o PERÍODO DO DOCUMENTO quando informado; sem ele, considere como 2025)
+    - DEVE representar uma operação individual específica, com estabelecimento/serviço/descrição
+    - NÃO pode ser um totalizador ou resumo
+
+4.  **Extração Completa:** NUNCA pule uma transação que tenha data e valor monetário identificáveis.
+    Para linhas com mais de um valor monetário (ex: em Dólar e em Real), escolha o valor em Real (R$).
+
+5.  **Tipo:** Determine o tipo (receita ou despesa) com base no contexto (créditos, débitos, sinais de +/-).
+
+6.  **Parcelamento:** Detecte parcelas (ex: "3/9", "PARC 01/12", "PARCELA 1 DE 12").
+
+7.  **Output:** Retorne APENAS as linhas no formato abaixo, nada mais.
+"""
+
+CABECALHO_TABULAR_EXTRACAO = "pag|data|descricao|valor|tipo|parcela"
+CABECALHO_TABULAR_COMPLETO = CABECALHO_TABULAR_EXTRACAO + "|cat"
+
+PROMPT_EXTRACAO_TABULAR = """
+Você é uma API de processamento de extratos financeiros de alta precisão.
+Sua única tarefa é receber texto bruto (de um OCR ou extração nativa) e extrair
+as transações em linhas delimitadas. NÃO categorize as transações.
+""" + REGRAS_TABULAR + FORMATO_SAIDA_TABULAR.format(
+    cabecalho=CABECALHO_TABULAR_EXTRACAO,
+    campo_categoria="",
+    exemplo="1|2025-01-05|IFOOD *RESTAURANTE|58.90|D|\n1|2025-01-07|LOJAS RENNER|99.90|D|2/10",
+)
+
+PROMPT_SISTEMA_TABULAR = """
+Você é uma API de processamento de extratos financeiros de alta precisão.
+Sua única tarefa é receber texto bruto (de um OCR ou extração nativa) e extrair
+as transações em linhas delimitadas, cada uma com o código da sua subcategoria.
+""" + REGRAS_TABULAR + FORMATO_SAIDA_TABULAR.format(
+    cabecalho=CABECALHO_TABULAR_COMPLETO,
+    campo_categoria="\n- cat: código da subcategoria entre colchetes na lista de categorias (ex: 3.2, sem os colchetes). Evite DIVERSOS a menos que seja a única opção",
+    exemplo="1|2025-01-05|IFOOD *RESTAURANTE|58.90|D||3.2\n1|2025-01-07|LOJAS RENNER|99.90|D|2/10|6.1",
+)
+
+PROMPT_CATEGORIZACAO_TABULAR = """
+Você é uma API de categorização de transações financeiras de alta precisão.
+Você recebe uma lista numerada de descrições de transações (estabelecimentos, serviços,
+transferências) e deve atribuir a cada uma a subcategoria mais adequada.
+
+REGRAS:
+1.  Categorize TODAS as descrições da lista, uma linha por número.
+2.  Use apenas os códigos entre colchetes da lista de categorias (ex: 3.2, sem os colchetes).
+3.  Evite DIVERSOS a menos que seja a única opção.
+4.  Retorne APENAS as linhas no formato abaixo, nada mais (NÃO use JSON).
+
+**FORMATO DE SAÍDA OBRIGATÓRIO:**
+id|cat
+1|3.2
+2|4.9
+"""
@@ -0,0 +1,236 @@
+# 1 - Importa módulos para renderização de páginas
+import asyncio
+import io
+import os
+import fitz
+from PIL import Image
+from documento_pdf import DocumentHandle
+from inicializacao import ler_inteiro
+
+# 1.1 - Parâmetros da renderização adaptativa
+DPI_BASE = ler_inteiro("RASTER_DPI_BASE", 144, minimo=1)
+DPI_MIN = ler_inteiro("RASTER_DPI_MIN", 100, minimo=1)
+DPI_MAX = ler_inteiro("RASTER_DPI_MAX", 220, minimo=1)
+DPI_RETENTATIVA = ler_inteiro("RASTER_DPI_RETENTATIVA", 288, minimo=1)
+LADO_MAX_PX = ler_inteiro("RASTER_LADO_MAX_PX", 2400, minimo=1)
+RASTER_CINZA = os.getenv("RASTER_CINZA", "true").lower() in ("1", "true", "sim")
+RASTER_WEBP = os.getenv("RASTER_WEBP", "false").lower() in ("1", "true", "sim")
+QUALIDADE_JPEG = ler_inteiro("RASTER_QUALIDADE_JPEG", 80, minimo=1)
+RASTER_ORCAMENTO_MB = ler_inteiro("RASTER_ORCAMENTO_MB", 64, minimo=1)
+MARGEM_RECORTE = 8  # pontos de folga ao redor do conteúdo
+LIMIAR_BRANCO = 235  # pixels mais claros que isso são considerados fundo
+LIMIAR_ESCURO = 40  # pixels mais escuros que isso são traço (texto, linhas)
+LIMIAR_MEIOS_TONS = 0.15  # fração de pixels entre os dois a partir da qual a página é digitalização/foto
+
+
+# 2 - Orçamento global de memória para imagens em trânsito
+class OrcamentoMemoria:
+    """
+    Semáforo por bytes: limita quanta memória as imagens renderizadas (e ainda
+    não enviadas ao OCR) ocupam somando todas as requisições do processo.
+    Um pedido maior que o orçamento inteiro é aceito quando nada mais está em uso,
+    para não travar páginas muito grandes.
+    """
+
+    def __init__(self, limite_bytes: int):
+        self.limite_bytes = limite_bytes
+        self.em_uso = 0
+        self._condicao = asyncio.Condition()
+
+    async def adquirir(self, n: int):
+        async with self._condicao:
+            await self._condicao.wait_for(lambda: self.em_uso == 0 or self.em_uso + n <= self.limite_bytes)
+            self.em_uso += n
+
+    async def liberar(self, n: int):
+        async with self._condicao:
+            self.em_uso = max(0, self.em_uso - n)
+            self._condicao.notify_all()
+
+orcamento_memoria = OrcamentoMemoria(RASTER_ORCAMENTO_MB * 1024 * 1024)
+
+
+# 3 - Escolhe o DPI de cada página
+def escolher_dpi(rect: "fitz.Rect", perfil: dict) -> int:
+    """
+    Define o DPI a partir do tamanho da página e da densidade do texto:
+    fontes pequenas e páginas densas pedem mais resolução; imagens digitalizadas
+    não são renderizadas acima da própria resolução; páginas grandes são
+    limitadas a LADO_MAX_PX no maior lado.
+    """
+    dpi = DPI_BASE
+
+    fonte = perfil.get("fonte_mediana")
+    if fonte and fonte < 9:
+        dpi = DPI_BASE * 9 / fonte
+
+    polegadas_quadradas = (rect.width / 72) * (rect.height / 72) or 1.0
+    if perfil.get("caracteres", 0) / polegadas_quadradas > 25:
+        dpi *= 1.25
+
+    if perfil.get("resolucao_imagem"):
+        dpi = min(dpi, max(DPI_MIN, perfil["resolucao_imagem"]))
+
+    dpi = max(DPI_MIN, min(DPI_MAX, dpi))
+    maior_lado = max(rect.width, rect.height) / 72
+    if maior_lado * dpi > LADO_MAX_PX:
+        dpi = LADO_MAX_PX / maior_lado
+    return int(dpi)
+
+# 4 - Recorta margens em branco
+def area_util(page: "fitz.Page") -> "fitz.Rect | None":
+    """
+    Encontra a área com conteúdo a partir de uma miniatura em tons de cinza.
+    Retorna None para página em branco e o retângulo da página inteira
+    quando o recorte não compensa.
+    """
+    escala = 0.25
+    miniatura = page.get_pixmap(matrix=fitz.Matrix(escala, escala), colorspace=fitz.csGRAY, alpha=False)
+    imagem = Image.frombytes("L", (miniatura.width, miniatura.height), miniatura.samples)
+    caixa = imagem.point(lambda v: 255 if v < LIMIAR_BRANCO else 0).getbbox()
+    if not caixa:
+        return None
+
+    x0, y0, x1, y1 = caixa
+    rect = fitz.Rect(
+        page.rect.x0 + x0 / escala - MARGEM_RECORTE,
+        page.rect.y0 + y0 / escala - MARGEM_RECORTE,
+        page.rect.x0 + x1 / escala + MARGEM_RECORTE,
+        page.rect.y0 + y1 / escala + MARGEM_RECORTE,
+    ) & page.rect
+    if abs(rect) > 0.95 * abs(page.rect):
+        return page.rect
+    return rect
+
+# 5 - Renderiza e codifica uma página
+def fracao_meios_tons(imagem: Image.Image) -> float:
+    """
+    Fração dos pixels que não são nem fundo nem traço. Página de texto
+    renderizada fica perto de 0 (só as bordas suavizadas das letras);
+    digitalização e foto passam de LIMIAR_MEIOS_TONS.
+    """
+    histograma = imagem.convert("L").histogram() if imagem.mode != "L" else imagem.histogram()
+    return sum(histograma[LIMIAR_ESCURO:LIMIAR_BRANCO]) / max(1, sum(histograma))
+
+def codificar_pixmap(pix: "fitz.Pixmap") -> tuple[str, bytes]:
+    """
+    Codifica a imagem em um formato só, escolhido pelo conteúdo (um
+    histograma custa bem menos que codificar duas vezes): PNG para texto
+    (fundo liso e traço nítido, que o PNG comprime bem e o JPEG borra) e
+    JPEG, ou WebP com RASTER_WEBP, para digitalizações e fotos.
+    """
+    imagem = Image.frombytes("L" if pix.n == 1 else "RGB", (pix.width, pix.height), pix.samples)
+    if fracao_meios_tons(imagem) < LIMIAR_MEIOS_TONS:
+        return "image/png", pix.tobytes("png")
+    if RASTER_WEBP:
+        buffer = io.BytesIO()
+        imagem.save(buffer, format="WEBP", quality=QUALIDADE_JPEG)
+        return "image/webp", buffer.getvalue()
+    return "image/jpeg", pix.tobytes("jpeg", jpg_quality=QUALIDADE_JPEG)
+
+def renderizar_pagina(doc: DocumentHandle, indice: int, dpi: int | None = None) -> dict | None:
+    """
+    Renderiza uma página com DPI adaptativo (ou o DPI pedido), em tons de cinza
+    e sem as margens em branco. Retorna None se a página estiver em branco.
+    """
+    with doc.trava_fitz:
+        page = doc.fitz[indice]
+        clip = area_util(page)
+        if clip is None:
+            return None
+        dpi = dpi or escolher_dpi(page.rect, doc.perfil(indice))
+        clip_chave = None if clip == page.rect else tuple(clip)
+        pix = doc.pixmap(indice, dpi / 72, RASTER_CINZA, clip_chave)
+        mime_type, dados = codificar_pixmap(pix)
+        largura, altura = pix.width, pix.height
+        doc.liberar_pixmaps(indice)
+    return {
+        "indice": indice,
+        "pagina": indice + 1,
+        "dpi": dpi,
+        "mime_type": mime_type,
+        "dados": dados,
+        "largura": largura,
+        "altura": altura,
+    }
+
+def estimar_bytes_renderizacao(doc: DocumentHandle, indice: int, dpi: int | None = None) -> int:
+    """
+    Estimativa do pico de memória para renderizar a página (pixmap bruto).
+    """
+    with doc.trava_fitz:
+        rect = doc.fitz[indice].rect
+        dpi = dpi or escolher_dpi(rect, doc.perfil(indice))
+    canais = 1 if RASTER_CINZA else 3
+    return int(rect.width / 72 * dpi * rect.height / 72 * dpi * canais)
+
+def estimar_dimensoes(doc: DocumentHandle, indice: int) -> tuple[int, int]:
+    """
+    Largura e altura (px) aproximadas da página renderizada, sem renderizar
+    (desconsidera o recorte de margens, então superestima).
+    """
+    with doc.trava_fitz:
+        rect = doc.fitz[indice].rect
+        dpi = escolher_dpi(rect, doc.perfil(indice))
+    return int(rect.width / 72 * dpi), int(rect.height / 72 * dpi)
+
+def reserva_imagem(pagina: dict) -> int:
+    """
+    Memória mantida enquanto a imagem aguarda o OCR (bytes + cópia em base64).
+    """
+    return int(len(pagina["dados"]) * (1 + 4 / 3))
+
+# 6 - Gerador preguiçoso com orçamento de memória
+async def renderizar_com_orcamento(doc: DocumentHandle, indice: int, dpi: int | None = None,
+                                   orcamento: OrcamentoMemoria = orcamento_memoria) -> dict | None:
+    """
+    Renderiza uma página reservando memória no orçamento global.
+    A página retornada mantém "reserva" bytes reservados: quem consome deve
+    chamar orcamento.liberar(pagina["reserva"]) depois de usar a imagem.
+    """
+    estimativa = await asyncio.to_thread(estimar_bytes_renderizacao, doc, indice, dpi)
+    await orcamento.adquirir(estimativa)
+    try:
+        pagina = await asyncio.to_thread(renderizar_pagina, doc, indice, dpi)
+    except BaseException:
+        await orcamento.liberar(estimativa)
+        raise
+    if pagina is None:
+        await orcamento.liberar(estimativa)
+        return None
+    pagina["reserva"] = reserva_imagem(pagina)
+    await orcamento.liberar(max(0, estimativa - pagina["reserva"]))
+    if pagina["reserva"] > estimativa:
+        await orcamento.adquirir(pagina["reserva"] - estimativa)
+    return pagina
+
+async def rasterizar_paginas(doc: DocumentHandle, indices: list[int],
+                             orcamento: OrcamentoMemoria = orcamento_memoria):
+    """
+    Gera as páginas renderizadas uma a uma, só avançando quando há memória
+    disponível no orçamento. Páginas em branco são puladas.
+    """
+    for indice in indices:
+        pagina = await renderizar_com_orcamento(doc, indice, orcamento=orcamento)
+        if pagina is None:
+            print(f"DEBUG: Página {indice + 1} em branco, ignorada na renderização")
+            continue
+        print(f"DEBUG: Página {indice + 1} renderizada: {pagina['dpi']} DPI, {pagina['largura']}x{pagina['altura']}, "
+              f"{pagina['mime_type']}, {len(pagina['dados']) // 1024} KB")
+        yield pagina
+
+# 7 - Worker do pool de processos: renderiza um intervalo de páginas
+def renderizar_paginas_intervalo(doc: DocumentHandle, indices: list[int]) -> dict[int, dict]:
+    """
+    Executado em outro processo. Renderiza as páginas pedidas com o mesmo
+    critério adaptativo e devolve {indice_pagina: pagina_renderizada}.
+    """
+    try:
+        paginas = {}
+        for i in indices:
+            pagina = renderizar_pagina(doc, i)
+            if pagina is not None:
+                paginas[i] = pagina
+        return paginas
+    finally:
+        doc.close()
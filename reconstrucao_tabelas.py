@@ -0,0 +1,267 @@
+# 1 - Importa módulos para reconstruir linhas e colunas a partir das coordenadas das palavras
+import os
+import re
+import contextvars
+from preprocessamento import REGEX_DATA_BR, REGEX_VALOR_BR, MESES_BR
+from inicializacao import ler_inteiro
+
+# 1.1 - Parâmetros da reconstrução
+EXTRACAO_COLUNAS = os.getenv("EXTRACAO_COLUNAS", "true").lower() in ("1", "true", "sim")
+PARSER_DETERMINISTICO = os.getenv("PARSER_DETERMINISTICO", "false").lower() in ("1", "true", "sim")
+ANO_PADRAO = ler_inteiro("ANO_PADRAO", 2025)  # mesmo padrão do PROMPT_SISTEMA para datas sem ano
+
+# 1.2 - Período (ano, mês) do documento em processamento, para os prompts da LLM datarem as
+# linhas sem ano como o parser e o livro de transações
+periodo_atual: contextvars.ContextVar[tuple[int, int] | None] = contextvars.ContextVar("periodo_atual", default=None)
+MIN_TRANSACOES_DETERMINISTICO = 3
+TOLERANCIA_LINHA = 3  # pontos de diferença no 'top' para considerar palavras na mesma linha
+MIN_LARGURA_CALHA = 15  # pontos livres entre duas colunas de lançamentos
+CABECALHO_COMPACTO = "data|descricao|valor"
+
+REGEX_DATA_INTEIRA = re.compile(rf'^(?:{REGEX_DATA_BR.pattern})$', re.IGNORECASE)
+REGEX_VALOR_INTEIRO = re.compile(r'^[-−+]?(?:R\$)?[-−]?\d{1,3}(?:\.?\d{3})*,\d{2}[-−]?(?:\s?[CD])?$')
+REGEX_RESUMO = re.compile(
+    r'\b(total|subtotal|saldo|limite|valor a pagar|pagamento m[ií]nimo|resumo)\b',
+    re.IGNORECASE
+)
+REGEX_DATA_COM_ANO = re.compile(r'\b(?:0?[1-9]|[12]\d|3[01])[/.-](0?[1-9]|1[0-2])[/.-]((?:19|20)\d{2})\b')
+REGEX_PARCELA = re.compile(r'(?:\bPARC(?:ELA)?\.?\s*)?\b(\d{1,2})\s*(?:/|DE)\s*(\d{1,2})\s*$', re.IGNORECASE)
+MESES_NUMERO = {mes: i + 1 for i, mes in enumerate(MESES_BR.split("|"))}
+
+
+# 2 - Agrupa palavras em linhas e separa colunas de lançamentos lado a lado
+def agrupar_em_linhas(palavras: list[dict]) -> list[list[dict]]:
+    """
+    Agrupa palavras ({x0, x1, top, bottom, text}) em linhas pelo 'top',
+    cada linha ordenada da esquerda para a direita.
+    """
+    linhas = []
+    for palavra in sorted(palavras, key=lambda p: (p["top"], p["x0"])):
+        if linhas and abs(palavra["top"] - linhas[-1][0]["top"]) <= TOLERANCIA_LINHA:
+            linhas[-1].append(palavra)
+        else:
+            linhas.append([palavra])
+    return [sorted(linha, key=lambda p: p["x0"]) for linha in linhas]
+
+def _parece_lancamentos(palavras: list[dict]) -> bool:
+    textos = [p["text"] for p in palavras]
+    return any(REGEX_DATA_INTEIRA.match(t) for t in textos) and any(REGEX_VALOR_INTEIRO.match(t) for t in textos)
+
+def dividir_colunas(palavras: list[dict], largura: float) -> list[list[dict]]:
+    """
+    Procura uma calha vertical vazia (sem nenhuma palavra) no miolo da página.
+    Só divide quando os dois lados têm datas e valores, ou seja, são colunas
+    de lançamentos lado a lado, e não as colunas data/descrição/valor da
+    mesma tabela. Aplica recursivamente em cada lado.
+    """
+    if not palavras:
+        return []
+    ocupado = [False] * (int(largura) + 2)
+    for p in palavras:
+        for x in range(max(0, int(p["x0"])), min(len(ocupado), int(p["x1"]) + 1)):
+            ocupado[x] = True
+
+    melhor = None
+    inicio = None
+    for x in range(int(largura * 0.2), int(largura * 0.8) + 1):
+        if x < len(ocupado) and not ocupado[x]:
+            inicio = x if inicio is None else inicio
+        else:
+            if inicio is not None and x - inicio >= MIN_LARGURA_CALHA and (melhor is None or x - inicio > melhor[1] - melhor[0]):
+                melhor = (inicio, x)
+            inicio = None
+    if melhor is None:
+        return [palavras]
+
+    corte = (melhor[0] + melhor[1]) / 2
+    esquerda = [p for p in palavras if p["x1"] <= corte]
+    direita = [p for p in palavras if p["x0"] >= corte]
+    if not (_parece_lancamentos(esquerda) and _parece_lancamentos(direita)):
+        return [palavras]
+    return dividir_colunas(esquerda, corte) + dividir_colunas(direita, largura)
+
+
+# 3 - Classifica cada linha como lançamento (data|descrição|valor) ou texto
+def estruturar_linha(palavras: list[dict]) -> dict:
+    """
+    Identifica a data no início da linha e os valores no fim.
+    Retorna {"texto", "top", "data", "descricao", "valores"}; data/valores
+    vazios quando a linha não é um lançamento.
+    """
+    tokens = [p["text"] for p in palavras]
+    texto = " ".join(tokens)
+
+    data = None
+    if tokens and REGEX_DATA_INTEIRA.match(tokens[0]):
+        data, tokens = tokens[0], tokens[1:]
+    elif len(tokens) >= 2 and REGEX_DATA_INTEIRA.match(f"{tokens[0]} {tokens[1]}"):
+        data, tokens = f"{tokens[0]} {tokens[1]}", tokens[2:]
+
+    valores = []
+    while tokens:
+        token = tokens[-1]
+        if REGEX_VALOR_INTEIRO.match(token):
+            valores.insert(0, token)
+            tokens = tokens[:-1]
+        elif token.replace("R$", "") in ("", "-", "−", "+") and valores:
+            valores[0] = f"{token.replace('R$', '')}{valores[0]}"
+            tokens = tokens[:-1]
+        elif token in ("C", "D") and len(tokens) >= 2 and REGEX_VALOR_INTEIRO.match(tokens[-2]):
+            valores.insert(0, f"{tokens[-2]} {token}")
+            tokens = tokens[:-2]
+        else:
+            break
+
+    return {"texto": texto, "top": palavras[0]["top"], "data": data, "descricao": " ".join(tokens), "valores": valores}
+
+def reconstruir_pagina(palavras: list[dict], largura: float) -> tuple[str, list[dict]]:
+    """
+    Reconstrói a página a partir das coordenadas das palavras: separa colunas de
+    lançamentos lado a lado, remonta as linhas e escreve os lançamentos no formato
+    compacto 'data|descricao|valor' (demais linhas como texto corrido).
+    Retorna (texto_compacto, linhas_estruturadas); cada linha guarda em
+    "compacto" o texto com que foi escrita.
+    """
+    linhas = []
+    for bloco in dividir_colunas(palavras, largura):
+        linhas.extend(estruturar_linha(linha) for linha in agrupar_em_linhas(bloco))
+
+    saida = []
+    if any(l["data"] and l["valores"] for l in linhas):
+        saida.append(CABECALHO_COMPACTO)
+    for linha in linhas:
+        if linha["data"] and linha["valores"]:
+            linha["compacto"] = "|".join([linha["data"], linha["descricao"], *[v.replace("R$", "") for v in linha["valores"]]])
+        else:
+            linha["compacto"] = linha["texto"]
+        saida.append(linha["compacto"])
+    return "\n".join(saida), linhas
+
+
+# 4 - Parser determinístico (sem LLM) para páginas sem ambiguidade
+def tipo_documento(texto: str) -> str | None:
+    """
+    Mesmas regras do prompt: "FATURA"/"CARTÃO" -> cartão, "EXTRATO"/"CONTA CORRENTE" -> conta.
+    """
+    texto = texto.upper()
+    cartao = bool(re.search(r'FATURA|CART[ÃA]O|CARD', texto))
+    conta = bool(re.search(r'EXTRATO|CONTA CORRENTE|POUPAN[ÇC]A', texto))
+    if cartao == conta:
+        return None
+    return "credit-card-statement" if cartao else "bank-statement"
+
+def converter_valor(valor: str) -> tuple[float, str | None]:
+    """
+    '1.234,56-' -> (1234.56, '-'); '-R$ 10,00' -> (10.0, '-'); '50,00 C' -> (50.0, 'C').
+    """
+    sinal = None
+    if valor.endswith((" C", " D")):
+        sinal, valor = valor[-1], valor[:-2]
+    limpo = valor.replace("R$", "").replace("−", "-").strip()
+    if limpo.startswith("-") or limpo.endswith("-"):
+        sinal = sinal or "-"
+    limpo = limpo.strip("-+ ")
+    return float(limpo.replace(".", "").replace(",", ".")), sinal
+
+def converter_data(data: str, ano: int) -> str | None:
+    partes = re.split(r'[/.\-\s]+', data.lower().replace("de ", ""))
+    try:
+        dia = int(partes[0])
+        mes = int(partes[1]) if partes[1].isdigit() else MESES_NUMERO[partes[1][:3]]
+        if len(partes) > 2 and partes[2].isdigit():
+            ano = int(partes[2]) + (2000 if len(partes[2]) == 2 else 0)
+        if not (1 <= dia <= 31 and 1 <= mes <= 12):
+            return None
+        return f"{ano:04d}-{mes:02d}-{dia:02d}"
+    except (IndexError, KeyError, ValueError):
+        return None
+
+def periodo_documento(texto: str) -> tuple[int, int] | None:
+    """
+    (ano, mês) da data completa mais recente do documento (vencimento,
+    fechamento ou fim do período), referência para as datas sem ano.
+    """
+    datas = [(int(ano), int(mes)) for mes, ano in REGEX_DATA_COM_ANO.findall(texto) if 1 <= int(mes) <= 12]
+    return max(datas) if datas else None
+
+def converter_data_periodo(data: str, periodo: tuple[int, int] | None) -> str | None:
+    """
+    Como converter_data, com o ano da data sem ano tirado do período do
+    documento: meses depois do mês de referência são do ano anterior
+    (compras de dezembro na fatura de janeiro). Sem período, ANO_PADRAO.
+    """
+    if periodo is None:
+        return converter_data(data, ANO_PADRAO)
+    ano, mes = periodo
+    convertida = converter_data(data, ano)
+    if convertida and int(convertida[5:7]) > mes:
+        return converter_data(data, ano - 1)  # com ano explícito o resultado não muda
+    return convertida
+
+def tipo_lancamento(documento: str, sinal: str | None) -> str:
+    """
+    Receita x despesa pelo sinal do valor: na fatura o crédito ('-'/'C') é
+    receita; no extrato o débito ('-'/'D') é despesa.
+    """
+    if documento == "credit-card-statement":
+        return "receita" if sinal in ("-", "C") else "despesa"
+    return "despesa" if sinal in ("-", "D") else "receita"
+
+def resultado_deterministico(linhas: list[dict], contexto: str, pagina_num: int,
+                             document_type: str | None = None, bank_name: str = "TBD",
+                             periodo: tuple[int, int] | None = None) -> dict | None:
+    """
+    Converte os lançamentos da página em transações sem chamar a LLM, quando a
+    estrutura não deixa dúvida:
+    - o tipo do documento é identificável no contexto (primeira página + página atual);
+    - há pelo menos MIN_TRANSACOES_DETERMINISTICO lançamentos;
+    - toda linha com valor é um lançamento com data e um único valor (linhas de
+      total/saldo/limite são ignoradas);
+    - o sinal dos valores permite decidir receita x despesa.
+    Retorna o JSON no formato do PROMPT_EXTRACAO (transações ainda sem categoria)
+    ou None para deixar a página com a LLM. Com um modelo de layout identificado,
+    o tipo de documento e o banco vêm do modelo. As datas sem ano seguem o
+    'periodo' do documento (ver converter_data_periodo).
+    """
+    documento = document_type or tipo_documento(contexto)
+    if documento is None:
+        return None
+
+    lancamentos = []
+    for linha in linhas:
+        if not linha["valores"] and not REGEX_VALOR_BR.search(linha["texto"]):
+            continue
+        if REGEX_RESUMO.search(linha["texto"]):
+            continue
+        if not linha["data"] or len(linha["valores"]) != 1 or not linha["descricao"]:
+            return None
+
+        data = converter_data_periodo(linha["data"], periodo)
+        if data is None:
+            return None
+        valor, sinal = converter_valor(linha["valores"][0])
+        lancamentos.append((data, linha["descricao"], valor, sinal))
+
+    if len(lancamentos) < MIN_TRANSACOES_DETERMINISTICO:
+        return None
+    if documento == "bank-statement" and all(sinal is None for *_, sinal in lancamentos):
+        return None  # extrato sem sinal algum: não dá para separar entradas de saídas
+
+    transacoes = []
+    for data, descricao, valor, sinal in lancamentos:
+        tipo = tipo_lancamento(documento, sinal)
+        transacao = {"data": data, "descricao": descricao, "valor": valor, "tipo": tipo, "parcelado": False}
+        parcela = REGEX_PARCELA.search(descricao)
+        if parcela and 1 <= int(parcela.group(1)) <= int(parcela.group(2)) and int(parcela.group(2)) > 1:
+            transacao["descricao"] = descricao[:parcela.start()].strip() or descricao
+            transacao.update(parcelado=True, numero_parcelas=int(parcela.group(1)), total_parcelas=int(parcela.group(2)))
+        transacao["pagina"] = pagina_num
+        transacoes.append(transacao)
+
+    return {
+        "success": True,
+        "bank_name": bank_name,
+        "document_type": documento,
+        "transactions": transacoes,
+        "error_message": None,
+    }
@@ -0,0 +1,116 @@
+# 1 - Importa módulos para interpretar a saída tabular da LLM
+import os
+import re
+from prompt_e_schema import TAXONOMIA, codigos_subcategorias, CABECALHO_TABULAR_EXTRACAO, CABECALHO_TABULAR_COMPLETO
+
+# 1.1 - Versão do contrato de saída: "v1" = JSON por transação, "v2" = linhas delimitadas com códigos
+VERSOES_PROMPT = ("v1", "v2")
+VERSAO_PROMPT = os.getenv("VERSAO_PROMPT", "v1").lower()
+if VERSAO_PROMPT not in VERSOES_PROMPT:
+    print(f"AVISO: VERSAO_PROMPT inválida ({VERSAO_PROMPT}), usando v1")
+    VERSAO_PROMPT = "v1"
+
+CODIGOS_SUBCATEGORIAS = codigos_subcategorias(TAXONOMIA)
+CATEGORIA_PADRAO = ("DIVERSOS", "Outros")
+TIPOS_DOCUMENTO = {"C": "credit-card-statement", "E": "bank-statement", "U": "unknown"}
+TIPOS_TRANSACAO = {"D": "despesa", "R": "receita"}
+SEM_TRANSACOES = "NENHUMA"
+
+REGEX_DATA_ISO = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+REGEX_VALOR_DECIMAL = re.compile(r'^\d+(?:\.\d{1,2})?$')
+REGEX_PARCELA = re.compile(r'^(\d{1,3})/(\d{1,3})$')
+REGEX_CERCAS = re.compile(r'^```[a-z]*\s*|\s*```$')
+
+
+# 2 - Parser estrito das transações
+def _linhas(texto: str) -> list[str]:
+    return [linha.strip() for linha in REGEX_CERCAS.sub("", texto.strip()).splitlines() if linha.strip()]
+
+def _cabecalho(linha: str) -> str:
+    return "|".join(campo.strip().casefold() for campo in linha.split("|"))
+
+def interpretar_saida_tabular(texto: str, com_categoria: bool) -> dict:
+    """
+    Converte a saída tabular (ver FORMATO_SAIDA_TABULAR) para o mesmo JSON da
+    saída v1: {"success", "bank_name", "document_type", "transactions", "error_message"}.
+    Estrito na estrutura: linha BANCO, cabeçalho e número de campos, datas,
+    valores, tipos e parcelas inválidos levantam ValueError (como um JSON
+    inválido, o chamador divide o pacote e tenta de novo). A única exceção
+    tolerada é "|" dentro da descrição: os campos excedentes voltam para ela.
+    Códigos de subcategoria desconhecidos viram DIVERSOS > Outros.
+    """
+    linhas = _linhas(texto)
+    if not linhas or not linhas[0].upper().startswith("BANCO|"):
+        raise ValueError("saída tabular sem a linha BANCO")
+    banco = linhas[0].split("|")
+    if len(banco) != 3 or banco[2].strip().upper() not in TIPOS_DOCUMENTO:
+        raise ValueError(f"linha BANCO inválida: {linhas[0]!r}")
+    bank_name = banco[1].strip() or "TBD"
+    document_type = TIPOS_DOCUMENTO[banco[2].strip().upper()]
+
+    corpo = linhas[1:]
+    if corpo and corpo[0].upper() == SEM_TRANSACOES:
+        corpo = []
+    elif corpo:
+        esperado = CABECALHO_TABULAR_COMPLETO if com_categoria else CABECALHO_TABULAR_EXTRACAO
+        if _cabecalho(corpo[0]) != esperado:
+            raise ValueError(f"cabeçalho inesperado: {corpo[0]!r}")
+        corpo = corpo[1:]
+
+    colunas = len((CABECALHO_TABULAR_COMPLETO if com_categoria else CABECALHO_TABULAR_EXTRACAO).split("|"))
+    transacoes = [_transacao(linha, colunas, com_categoria) for linha in corpo]
+    return {
+        "success": bool(transacoes),
+        "bank_name": bank_name,
+        "document_type": document_type,
+        "transactions": transacoes,
+        "error_message": None if transacoes else "Nenhuma transação encontrada no documento",
+    }
+
+def _transacao(linha: str, colunas: int, com_categoria: bool) -> dict:
+    brutos = linha.split("|")
+    if len(brutos) < colunas:
+        raise ValueError(f"linha com {len(brutos)} campos (esperado {colunas}): {linha!r}")
+    # Os "|" a mais são da descrição: ela volta exatamente como veio
+    excedentes = len(brutos) - colunas
+    campos = [campo.strip() for campo in brutos[:2] + ["|".join(brutos[2:3 + excedentes])] + brutos[3 + excedentes:]]
+    pagina, data, descricao, valor, tipo, parcela = campos[:6]
+
+    if not pagina.isdigit() or not REGEX_DATA_ISO.match(data) or not descricao:
+        raise ValueError(f"página, data ou descrição inválida: {linha!r}")
+    if not REGEX_VALOR_DECIMAL.match(valor) or tipo.upper() not in TIPOS_TRANSACAO:
+        raise ValueError(f"valor ou tipo inválido: {linha!r}")
+
+    transacao = {"data": data, "descricao": descricao, "valor": float(valor), "tipo": TIPOS_TRANSACAO[tipo.upper()], "parcelado": False}
+    if parcela:
+        partes = REGEX_PARCELA.match(parcela)
+        if not partes:
+            raise ValueError(f"parcela inválida: {linha!r}")
+        transacao.update(parcelado=True, numero_parcelas=int(partes.group(1)), total_parcelas=int(partes.group(2)))
+    if com_categoria:
+        categoria, subcategoria = CODIGOS_SUBCATEGORIAS.get(campos[6].strip("[] "), CATEGORIA_PADRAO)
+        transacao = {"uuid": "1", **transacao, "categoria": categoria, "subcategoria": subcategoria}
+    transacao["pagina"] = int(pagina)
+    return transacao
+
+
+# 3 - Parser das categorias em lote ("id|cat")
+def interpretar_categorias_tabular(texto: str) -> dict[int, dict]:
+    """
+    Converte as linhas "id|cat" em {id: {"categoria", "subcategoria"}}.
+    Linhas fora do formato levantam ValueError; códigos desconhecidos ficam de
+    fora (a descrição cai em DIVERSOS > Outros no chamador).
+    """
+    categorias = {}
+    linhas = _linhas(texto)
+    if linhas and _cabecalho(linhas[0]) == "id|cat":
+        linhas = linhas[1:]
+    for linha in linhas:
+        campos = [campo.strip() for campo in linha.split("|")]
+        if len(campos) != 2 or not campos[0].isdigit():
+            raise ValueError(f"linha de categoria inválida: {linha!r}")
+        codigo = campos[1].strip("[] ")
+        if codigo in CODIGOS_SUBCATEGORIAS:
+            categoria, subcategoria = CODIGOS_SUBCATEGORIAS[codigo]
+            categorias[int(campos[0])] = {"categoria": categoria, "subcategoria": subcategoria}
+    return categorias
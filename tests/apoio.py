@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Apoio comum dos testes que substituem o Gemini: resposta falsa, respostas
+de extração e categorização no formato da LLM, PDFs de teste e
+processamento de um documento esperando as gravações em segundo plano.
+Importado antes da API, leva os arquivos de dados para uma pasta temporária.
+"""
+import os
+import re
+import sys
+import json
+import atexit
+import shutil
+import asyncio
+import tempfile
+
+import fitz
+
+# Arquivos de dados dos testes numa pasta temporária, nunca em dados/ (os módulos leem as variáveis ao serem importados)
+PASTA_DADOS = tempfile.mkdtemp(prefix="testes_dados_")
+atexit.register(shutil.rmtree, PASTA_DADOS, True)
+os.environ["ENCERRAMENTO_DIR"] = PASTA_DADOS
+os.environ["COMPARTILHADO_ARQUIVO"] = os.path.join(PASTA_DADOS, "compartilhado.db")
+os.environ["LIVRO_TRANSACOES_ARQUIVO"] = os.path.join(PASTA_DADOS, "livro_transacoes.db")
+os.environ["ARTEFATOS_DIR"] = os.path.join(PASTA_DADOS, "artefatos")
+os.environ["CACHE_ESTABELECIMENTOS_ARQUIVO"] = os.path.join(PASTA_DADOS, "cache_estabelecimentos.json.gz")
+
+CHAMADAS = []
+
+class RespostaFalsa:
+    def __init__(self, texto: str):
+        self.text = texto
+        self.candidates = []
+
+def resposta_categorias(contents: str) -> RespostaFalsa | None:
+    """
+    Mesma categoria para todo o lote quando o prompt é de categorização; None nos demais.
+    """
+    if "DESCRIÇÕES PARA CATEGORIZAR" not in contents:
+        return None
+    ids = re.findall(r"^(\d+)\. ", contents, re.M)
+    return RespostaFalsa(json.dumps({"categorias": [
+        {"id": int(i), "categoria": "ALIMENTACAO", "subcategoria": "Refeições em restaurante"} for i in ids]}))
+
+def resposta_extracao(transacoes: list[dict]) -> RespostaFalsa:
+    return RespostaFalsa(json.dumps({"success": True, "bank_name": "Exemplo", "document_type": "credit-card-statement",
+                                     "transactions": transacoes}))
+
+def gemini_falso(model=None, contents=None, **kwargs):
+    """
+    Uma transação por linha "DD/MM LOJA R$ V" (ou já em colunas "DD/MM|LOJA|V") do texto; categorização fixa.
+    """
+    CHAMADAS.append(contents)
+    categorias = resposta_categorias(contents)
+    if categorias is not None:
+        return categorias
+    return resposta_extracao([{"data": f"2025-{mes}-{dia}", "descricao": loja, "valor": float(valor.replace(",", ".")),
+                               "tipo": "despesa", "parcelado": False, "pagina": 1}
+                              for dia, mes, loja, valor in re.findall(r"(\d{2})/(\d{2})[ |](LOJA \w+)(?: R\$ |\|)([\d,]+)", contents)])
+
+async def buscar_categorizacoes_falsa(user_id: int) -> dict:
+    return {}
+
+def criar_pdf_teste(paginas: list[list[str]]) -> bytes:
+    """
+    PDF com uma página por lista de linhas (texto nativo, uma linha a cada 14 pontos).
+    """
+    doc = fitz.open()
+    for linhas in paginas:
+        pagina = doc.new_page()
+        for i, linha in enumerate(linhas):
+            pagina.insert_text((50, 60 + i * 14), linha, fontsize=9)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+async def processar_e_aguardar(pdf_bytes: bytes, user_id: int) -> dict:
+    """
+    Processa o PDF e espera as gravações feitas em segundo plano (artefatos, livro).
+    """
+    import api_rapida
+    doc = api_rapida.abrir_documento(pdf_bytes, None)
+    try:
+        resultado = await api_rapida.processar_documento(doc, user_id)
+    finally:
+        doc.close()
+    pendentes = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+    await asyncio.gather(*pendentes, return_exceptions=True)
+    return resultado
+
+
+def capturar_estado() -> list[tuple[dict, dict]]:
+    """
+    Cópia rasa do estado global da aplicação: variáveis dos módulos da raiz, atributos
+    dos objetos desses módulos (cotas, escalonador, livro...) e o cliente Gemini falsificado.
+    Os testes trocam flags e funções sem desfazer; restaurar_estado volta tudo entre um e outro.
+    """
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    modulos = {nome: modulo for nome, modulo in list(sys.modules.items())
+               if os.path.dirname(os.path.abspath(getattr(modulo, "__file__", None) or "")) == raiz}
+    estado = []
+    for modulo in modulos.values():
+        estado.append((vars(modulo), dict(vars(modulo))))
+        for valor in list(vars(modulo).values()):
+            if type(valor).__module__ in modulos and hasattr(valor, "__dict__"):
+                estado.append((vars(valor), dict(vars(valor))))
+    if "api_rapida" in modulos:
+        modelos = modulos["api_rapida"].gemini_client.models
+        estado.append((vars(modelos), dict(vars(modelos))))
+    return estado
+
+def restaurar_estado(estado: list[tuple[dict, dict]]):
+    for atual, copia in estado:
+        for nome in [nome for nome in atual if nome not in copia]:
+            del atual[nome]
+        for nome, valor in copia.items():
+            if atual.get(nome) is not valor:
+                atual[nome] = valor
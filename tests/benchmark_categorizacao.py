@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: categorização dentro da saída de cada página x extração seguida da
+categorização em lote das descrições únicas do documento.
+
+Uso:
+    python tests/benchmark_categorizacao.py extrato.pdf [outro.pdf ...]
+    python tests/benchmark_categorizacao.py extrato.pdf --ao-vivo   # chama o Gemini de verdade
+
+Sem --ao-vivo, estima localmente os tokens de saída a partir das linhas com data
+e valor (candidatas a transação) e das descrições distintas. Com --ao-vivo, mede
+tempo total, chamadas e tokens reais (usage_metadata) nos dois modos.
+"""
+import sys
+import os
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_rapida
+from preprocessamento import REGEX_DATA_BR, REGEX_VALOR_BR
+
+TOKENS_TRANSACAO_COMPLETA = 60   # data, descrição, valor, tipo, parcelas, categoria e subcategoria
+TOKENS_TRANSACAO_EXTRACAO = 40   # mesma transação sem categoria e subcategoria
+TOKENS_CATEGORIA_LOTE = 20       # {"id", "categoria", "subcategoria"} por descrição única
+
+def medir_offline(paginas: list[tuple[int, str]]) -> dict:
+    """
+    Estima os tokens de saída das duas estratégias a partir das linhas candidatas.
+    """
+    descricoes = []
+    for _, texto in paginas:
+        for linha in texto.splitlines():
+            if REGEX_DATA_BR.search(linha) and REGEX_VALOR_BR.search(linha):
+                descricao = REGEX_VALOR_BR.sub("", REGEX_DATA_BR.sub("", linha))
+                descricoes.append(api_rapida.limpar_descricao_para_match(descricao))
+    unicas = len(set(descricoes))
+    return {
+        "transacoes_candidatas": len(descricoes),
+        "descricoes_unicas": unicas,
+        "saida_por_pagina": len(descricoes) * TOKENS_TRANSACAO_COMPLETA,
+        "saida_separada": len(descricoes) * TOKENS_TRANSACAO_EXTRACAO + unicas * TOKENS_CATEGORIA_LOTE,
+    }
+
+async def medir_ao_vivo(paginas: list[tuple[int, str]], separada: bool) -> dict:
+    """
+    Executa a categorização real e soma os tokens informados pela API.
+    """
+    api_rapida.CATEGORIZACAO_SEPARADA = separada
+    uso = {"chamadas": 0, "tokens_entrada": 0, "tokens_saida": 0}
+    original = api_rapida.gemini_client.models.generate_content
+
+    def generate_content_medido(*args, **kwargs):
+        response = original(*args, **kwargs)
+        uso["chamadas"] += 1
+        if response.usage_metadata:
+            uso["tokens_entrada"] += response.usage_metadata.prompt_token_count or 0
+            uso["tokens_saida"] += response.usage_metadata.candidates_token_count or 0
+        return response
+
+    api_rapida.gemini_client.models.generate_content = generate_content_medido
+    try:
+        inicio = time.time()
+        resultado = await api_rapida.categorizar_com_llm(paginas)
+        uso["segundos"] = round(time.time() - inicio, 2)
+        uso["segundos_por_pagina"] = round(uso["segundos"] / max(1, len(paginas)), 2)
+        uso["transacoes"] = len(resultado.get("transactions", []))
+    finally:
+        api_rapida.gemini_client.models.generate_content = original
+    return uso
+
+async def rodar(caminho: str, ao_vivo: bool):
+    print(f"\n📄 {caminho}")
+    with open(caminho, "rb") as f:
+        doc = api_rapida.abrir_documento(f.read(), None)
+    try:
+        textos = await api_rapida.extrair_paginas_documento(doc)
+    finally:
+        doc.close()
+    if not textos:
+        print("❌ Não foi possível extrair texto")
+        return
+
+    paginas = [(i + 1, textos[i]) for i in sorted(textos)]
+    print(f"   • Páginas: {len(paginas)}")
+    print(f"   • Estimativa: {medir_offline(paginas)}")
+
+    if ao_vivo:
+        for nome, separada in (("categorização por página", False), ("descrições únicas em lote", True)):
+            print(f"   • {nome} (ao vivo): {await medir_ao_vivo(paginas, separada)}")
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not argumentos:
+        print(__doc__)
+        sys.exit(1)
+    print("🏁 BENCHMARK DE CATEGORIZAÇÃO POR DESCRIÇÃO ÚNICA")
+    for caminho in argumentos:
+        asyncio.run(rodar(caminho, "--ao-vivo" in sys.argv))
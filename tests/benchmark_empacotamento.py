@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark: empacotamento de várias páginas por chamada x uma página por chamada.
+
+Uso:
+    python tests/benchmark_empacotamento.py extrato.pdf [outro.pdf ...]
+    python tests/benchmark_empacotamento.py extrato.pdf --ao-vivo   # chama o Gemini de verdade
+
+Sem --ao-vivo, compara apenas o número de chamadas e os tokens de entrada estimados
+localmente. Com --ao-vivo, mede também tempo total e tokens reais (usage_metadata).
+"""
+import sys
+import os
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_rapida
+from empacotamento import estimar_tokens
+from prompt_e_schema import PROMPT_SISTEMA, CATEGORIAS_COMPLETAS
+
+TOKENS_PROMPT = estimar_tokens(PROMPT_SISTEMA + CATEGORIAS_COMPLETAS)
+
+def medir_offline(paginas: list[tuple[int, str]], empacotar: bool) -> dict:
+    """
+    Conta chamadas e tokens de entrada estimados para as duas estratégias.
+    """
+    api_rapida.EMPACOTAMENTO = empacotar
+    pacotes = api_rapida.empacotar_paginas_texto(paginas)
+    tokens = sum(TOKENS_PROMPT + sum(estimar_tokens(t) for _, t in pacote) for pacote in pacotes)
+    return {"chamadas": len(pacotes), "tokens_entrada_estimados": tokens}
+
+async def medir_ao_vivo(texto_bruto: str, empacotar: bool) -> dict:
+    """
+    Executa a categorização real e soma os tokens informados pela API.
+    """
+    api_rapida.EMPACOTAMENTO = empacotar
+    uso = {"chamadas": 0, "tokens_entrada": 0, "tokens_saida": 0}
+    original = api_rapida.gemini_client.models.generate_content
+
+    def generate_content_medido(*args, **kwargs):
+        response = original(*args, **kwargs)
+        uso["chamadas"] += 1
+        if response.usage_metadata:
+            uso["tokens_entrada"] += response.usage_metadata.prompt_token_count or 0
+            uso["tokens_saida"] += response.usage_metadata.candidates_token_count or 0
+        return response
+
+    api_rapida.gemini_client.models.generate_content = generate_content_medido
+    try:
+        inicio = time.time()
+        resultado = await api_rapida.categorizar_com_llm(texto_bruto)
+        uso["segundos"] = round(time.time() - inicio, 2)
+        uso["transacoes"] = resultado.get("transactions_count", len(resultado.get("transactions", [])))
+    finally:
+        api_rapida.gemini_client.models.generate_content = original
+    return uso
+
+async def rodar(caminho: str, ao_vivo: bool):
+    print(f"\n📄 {caminho}")
+    with open(caminho, "rb") as f:
+        doc = api_rapida.abrir_documento(f.read(), None)
+    try:
+        texto_bruto = await api_rapida.extrair_texto_documento(doc)
+    finally:
+        doc.close()
+    if not texto_bruto:
+        print("❌ Não foi possível extrair texto")
+        return
+
+    paginas = [(i + 1, p.strip()) for i, p in enumerate(texto_bruto.split("\n\n--- NOVA PÁGINA ---\n\n")) if p.strip()]
+    print(f"   • Páginas: {len(paginas)}")
+
+    for nome, empacotar in (("uma página por chamada", False), ("empacotado", True)):
+        print(f"   • {nome}: {medir_offline(paginas, empacotar)}")
+
+    if ao_vivo:
+        for nome, empacotar in (("uma página por chamada", False), ("empacotado", True)):
+            print(f"   • {nome} (ao vivo): {await medir_ao_vivo(texto_bruto, empacotar)}")
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not argumentos:
+        print(__doc__)
+        sys.exit(1)
+    print("🏁 BENCHMARK DE EMPACOTAMENTO DE PÁGINAS")
+    for caminho in argumentos:
+        asyncio.run(rodar(caminho, "--ao-vivo" in sys.argv))
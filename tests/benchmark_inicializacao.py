@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: custo da subida a frio (instância que acorda no plano gratuito).
+
+Uso:
+    python tests/benchmark_inicializacao.py
+    python tests/benchmark_inicializacao.py extrato.pdf --ao-vivo   # mede também a primeira extração de verdade
+
+Sem --ao-vivo, mede em processos novos (sem TOKENFILE_LIMIT no ambiente):
+- o tempo de "import api_rapida" (mediana de REPETICOES), comparado com o
+  custo dos SDKs que agora só são importados no primeiro uso ou no aquecimento;
+- o tempo até o primeiro byte: do início de "python api_rapida.py" até a
+  primeira resposta de /metricas/, com o tempo de aquecimento reportado.
+Com --ao-vivo, depois de subir o servidor envia o PDF a /processar-extrato/
+e mede o tempo até a primeira extração completa.
+"""
+import sys
+import os
+import time
+import json
+import socket
+import statistics
+import subprocess
+import urllib.request
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPETICOES = 5
+ESPERA_MAXIMA_S = 60
+
+def ambiente() -> dict:
+    variaveis = {k: v for k, v in os.environ.items() if k != "TOKENFILE_LIMIT"}
+    variaveis.setdefault("GOOGLE_API_KEY", "teste")
+    return variaveis
+
+def medir_importacao(codigo: str) -> float:
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, env=ambiente(), check=True, capture_output=True)
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos)
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def buscar(url: str, dados: bytes | None = None, cabecalhos: dict | None = None, timeout: float = 2) -> dict:
+    requisicao = urllib.request.Request(url, data=dados, headers=cabecalhos or {})
+    with urllib.request.urlopen(requisicao, timeout=timeout) as resposta:
+        return json.loads(resposta.read())
+
+def multipart(caminho: str) -> tuple[bytes, str]:
+    fronteira = "----benchmarkinicializacao"
+    with open(caminho, "rb") as f:
+        conteudo = f.read()
+    corpo = (f"--{fronteira}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{os.path.basename(caminho)}\"\r\n"
+             f"Content-Type: application/pdf\r\n\r\n").encode() + conteudo + f"\r\n--{fronteira}--\r\n".encode()
+    return corpo, f"multipart/form-data; boundary={fronteira}"
+
+def medir_servidor(caminho_pdf: str | None = None):
+    porta = porta_livre()
+    inicio = time.perf_counter()
+    servidor = subprocess.Popen([sys.executable, "api_rapida.py"], cwd=RAIZ, env={**ambiente(), "PORT": str(porta)},
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        metricas = None
+        while time.perf_counter() - inicio < ESPERA_MAXIMA_S:
+            try:
+                metricas = buscar(f"http://127.0.0.1:{porta}/metricas/")
+                break
+            except OSError:
+                time.sleep(0.02)
+        if metricas is None:
+            print(f"   • Servidor não respondeu em {ESPERA_MAXIMA_S}s")
+            return
+        primeiro_byte = time.perf_counter() - inicio
+        print(f"   • Primeiro byte em {primeiro_byte:.2f}s (importação {metricas['inicializacao']['segundos_importacao']}s)")
+        time.sleep(3)
+        metricas = buscar(f"http://127.0.0.1:{porta}/metricas/")
+        print(f"   • Aquecimento em segundo plano: {metricas['inicializacao']['segundos_aquecimento']}s | "
+              f"clientes {metricas['clientes']}")
+
+        if caminho_pdf:
+            corpo, tipo = multipart(caminho_pdf)
+            inicio_extracao = time.perf_counter()
+            resultado = buscar(f"http://127.0.0.1:{porta}/processar-extrato/", corpo, {"Content-Type": tipo}, timeout=600)
+            print(f"   • Primeira extração: {resultado.get('transactions_count')} transações em "
+                  f"{time.perf_counter() - inicio_extracao:.2f}s ({time.perf_counter() - inicio:.2f}s desde a subida)")
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+if __name__ == "__main__":
+    print("🏁 BENCHMARK DE SUBIDA A FRIO")
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if "--ao-vivo" in sys.argv and not argumentos:
+        print(__doc__)
+        sys.exit(1)
+
+    print(f"\n📊 Importação (mediana de {REPETICOES} processos novos)")
+    api = medir_importacao("import api_rapida")
+    sdks = medir_importacao("from google import genai; import supabase")
+    vazio = medir_importacao("pass")
+    print(f"   • import api_rapida: {api:.2f}s | SDKs adiados (google.genai + supabase): {sdks - vazio:.2f}s "
+          f"| interpretador vazio: {vazio:.2f}s")
+
+    print("\n📊 Servidor")
+    medir_servidor(argumentos[0] if "--ao-vivo" in sys.argv else None)
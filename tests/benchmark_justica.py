@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark: justiça entre usuários na fila das chamadas ao Gemini
+(ordem de chegada x fila justa ponderada), medida pelo índice de Jain.
+
+Uso:
+    python tests/benchmark_justica.py
+    python tests/benchmark_justica.py extrato.pdf --ao-vivo   # processa o PDF de verdade, vários usuários
+
+Sem --ao-vivo, simula um usuário que envia 200 páginas de uma vez e quatro
+usuários com 20 páginas cada, chegando logo depois, sobre 4 vagas. Mede,
+enquanto todos têm trabalho na fila, a vazão de cada usuário dividida pelo
+peso dele; o índice de Jain (soma² / (n · soma dos quadrados)) vale 1 quando
+a divisão é perfeitamente proporcional e 1/n quando um só usuário é atendido.
+Com --ao-vivo, o usuário 1 envia 5 cópias do PDF e os usuários 2 a 4 uma cópia
+cada, ao mesmo tempo; mede o índice de Jain das chamadas ao Gemini concluídas
+na janela de disputa. Diminua ESCALONADOR_GEMINI_CONCORRENCIA para que as
+vagas fiquem disputadas com PDFs pequenos.
+"""
+import sys
+import os
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+
+from escalonador import EscalonadorJusto
+
+CONCORRENCIA = 4
+DURACAO_CHAMADA_S = 0.01
+
+def indice_jain(valores: list[float]) -> float:
+    if not any(valores):
+        return 0.0
+    return sum(valores) ** 2 / (len(valores) * sum(v * v for v in valores))
+
+async def simular(justo: bool, usuarios: dict, pesos: dict) -> dict:
+    """
+    usuarios: {nome: (chamadas, chegada_s)}. Retorna as conclusões (nome, instante) de cada chamada.
+    """
+    escalonador = EscalonadorJusto(CONCORRENCIA, lambda u: pesos.get(u, 1.0))
+    semaforo = asyncio.Semaphore(CONCORRENCIA)
+    conclusoes = []
+    inicio = time.perf_counter()
+
+    async def chamada(nome: str):
+        vaga = escalonador.vez(nome, 1.0) if justo else semaforo
+        async with vaga:
+            await asyncio.sleep(DURACAO_CHAMADA_S)
+        conclusoes.append((nome, time.perf_counter() - inicio))
+
+    async def usuario(nome: str, chamadas: int, chegada_s: float):
+        await asyncio.sleep(chegada_s)
+        await asyncio.gather(*(chamada(nome) for _ in range(chamadas)))
+
+    await asyncio.gather(*(usuario(nome, n, chegada) for nome, (n, chegada) in usuarios.items()))
+    return medir(conclusoes, usuarios, pesos)
+
+def medir(conclusoes: list[tuple[str, float]], usuarios: dict, pesos: dict) -> dict:
+    """
+    Vazão por usuário na janela de disputa: da última chegada até o primeiro
+    usuário esvaziar a fila dele.
+    """
+    inicio_janela = max(chegada for _, chegada in usuarios.values())
+    fim_janela = min(max(t for n, t in conclusoes if n == nome) for nome in usuarios)
+    vazao = {nome: sum(1 for n, t in conclusoes if n == nome and inicio_janela <= t <= fim_janela) / pesos.get(nome, 1.0)
+             for nome in usuarios}
+    termino = {nome: round(max(t for n, t in conclusoes if n == nome), 2) for nome in usuarios}
+    return {"jain": round(indice_jain(list(vazao.values())), 3), "atendidas_por_peso": vazao, "termino_s": termino}
+
+def rodar_offline():
+    cenarios = {
+        "pesos iguais": ({"pesado": (200, 0), **{f"leve{i}": (20, 0.05) for i in range(1, 5)}}, {}),
+        "leve1 com peso 2": ({"pesado": (200, 0), **{f"leve{i}": (20, 0.05) for i in range(1, 5)}}, {"leve1": 2.0}),
+    }
+    for nome, (usuarios, pesos) in cenarios.items():
+        print(f"\n📊 {nome}")
+        for estrategia, justo in (("ordem de chegada", False), ("fila justa", True)):
+            resultado = asyncio.run(simular(justo, usuarios, pesos))
+            leves = [t for n, t in resultado["termino_s"].items() if n != "pesado"]
+            print(f"   • {estrategia}: Jain {resultado['jain']} | atendidas/peso {resultado['atendidas_por_peso']} "
+                  f"| leves terminam em {min(leves)}-{max(leves)}s, pesado em {resultado['termino_s']['pesado']}s")
+
+async def rodar_ao_vivo(caminho: str):
+    import api_rapida
+
+    with open(caminho, "rb") as f:
+        pdf_bytes = f.read()
+    envios = {1: 5, 2: 1, 3: 1, 4: 1}
+    api_rapida.cotas_usuarios.paginas_minuto = 0
+    api_rapida.cotas_usuarios.tokens_dia = 0
+    conclusoes = []
+    original = api_rapida.gemini_client.models.generate_content
+    inicio = time.perf_counter()
+
+    def generate_content_medido(*args, **kwargs):
+        # A thread herda o contexto da task, então usuario_atual identifica quem chamou
+        response = original(*args, **kwargs)
+        conclusoes.append((api_rapida.usuario_atual.get(), time.perf_counter() - inicio))
+        return response
+
+    async def processar(user_id: int):
+        doc = api_rapida.abrir_documento(pdf_bytes, None)
+        try:
+            await api_rapida.processar_documento(doc, user_id)
+        finally:
+            doc.close()
+
+    api_rapida.gemini_client.models.generate_content = generate_content_medido
+    try:
+        await asyncio.gather(*(processar(u) for u, copias in envios.items() for _ in range(copias)))
+    finally:
+        api_rapida.gemini_client.models.generate_content = original
+    resultado = medir(conclusoes, {u: (n, 0) for u, n in envios.items()}, {u: api_rapida.cotas_usuarios.peso(u) for u in envios})
+    print(f"   • {len(conclusoes)} chamadas em {time.perf_counter() - inicio:.2f}s, "
+          f"{api_rapida.escalonador_gemini.concorrencia} vagas (ESCALONADOR_GEMINI_CONCORRENCIA)")
+    print(f"   • Jain {resultado['jain']} | chamadas/peso {resultado['atendidas_por_peso']} | término {resultado['termino_s']}")
+
+if __name__ == "__main__":
+    print("🏁 BENCHMARK DE JUSTIÇA ENTRE USUÁRIOS")
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if "--ao-vivo" in sys.argv:
+        if not argumentos:
+            print(__doc__)
+            sys.exit(1)
+        for caminho in argumentos:
+            print(f"\n📄 {caminho} (ao vivo)")
+            asyncio.run(rodar_ao_vivo(caminho))
+    else:
+        rodar_offline()
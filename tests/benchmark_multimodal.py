@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark: pipeline em duas etapas (OCR -> texto -> categorização) x multimodal
+(imagem direto para o JSON categorizado) nas páginas digitalizadas.
+
+Uso:
+    python tests/benchmark_multimodal.py extrato.pdf [outro.pdf ...]
+    python tests/benchmark_multimodal.py extrato.pdf --ao-vivo   # chama o Gemini de verdade
+
+Sem --ao-vivo, compara o roteamento das páginas, o número de chamadas e os tokens
+de entrada estimados localmente (sem o texto do OCR, que só existe ao vivo).
+Com --ao-vivo, mede também latência, tokens reais (usage_metadata) e transações
+encontradas em cada modo.
+"""
+import sys
+import os
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_rapida
+from empacotamento import estimar_tokens, estimar_tokens_imagem
+from rasterizacao import estimar_dimensoes
+from prompt_e_schema import PROMPT_SISTEMA, CATEGORIAS_COMPLETAS
+
+TOKENS_PROMPT = estimar_tokens(PROMPT_SISTEMA + CATEGORIAS_COMPLETAS)
+MODOS = ("duas_etapas", "multimodal", "auto")
+
+def medir_offline(doc, modo: str) -> dict:
+    """
+    Conta as páginas roteadas e as chamadas/tokens de entrada estimados das páginas
+    de imagem (a categorização do texto do OCR, no modo em duas etapas, não entra
+    na estimativa de tokens porque o texto ainda não existe).
+    """
+    estrategias = api_rapida.classificar_paginas(doc)
+    estrategias = api_rapida.rotear_paginas_multimodal(doc, estrategias, modo)
+    ocr = [i for i, e in estrategias.items() if e == "ocr"]
+    multimodal = [i for i, e in estrategias.items() if e == "multimodal"]
+
+    tokens_imagem = {i: estimar_tokens_imagem(*estimar_dimensoes(doc, i)) for i in ocr + multimodal}
+    pacotes_ocr = api_rapida.empacotar_paginas_ocr(doc, ocr) if ocr else []
+    pacotes_multimodal = api_rapida.empacotar_paginas_ocr(doc, multimodal) if multimodal else []
+    return {
+        "paginas_ocr": len(ocr),
+        "paginas_multimodal": len(multimodal),
+        "chamadas_imagem": len(pacotes_ocr) + len(pacotes_multimodal),
+        "chamadas_categorizacao_texto": "≥1" if ocr else 0,
+        "tokens_imagem_estimados": sum(tokens_imagem.values()),
+        "tokens_prompt_multimodal": TOKENS_PROMPT * len(pacotes_multimodal),
+    }
+
+async def medir_ao_vivo(pdf_bytes: bytes, modo: str) -> dict:
+    """
+    Executa o pipeline completo no modo pedido e soma os tokens informados pela API.
+    """
+    uso = {"chamadas": 0, "tokens_entrada": 0, "tokens_saida": 0}
+    original = api_rapida.gemini_client.models.generate_content
+
+    def generate_content_medido(*args, **kwargs):
+        response = original(*args, **kwargs)
+        uso["chamadas"] += 1
+        if response.usage_metadata:
+            uso["tokens_entrada"] += response.usage_metadata.prompt_token_count or 0
+            uso["tokens_saida"] += response.usage_metadata.candidates_token_count or 0
+        return response
+
+    api_rapida.gemini_client.models.generate_content = generate_content_medido
+    doc = api_rapida.abrir_documento(pdf_bytes, None)
+    try:
+        inicio = time.time()
+        resultado = await api_rapida.processar_documento(doc, None, modo)
+        uso["segundos"] = round(time.time() - inicio, 2)
+        uso["transacoes"] = len(resultado.get("transactions", []))
+    finally:
+        doc.close()
+        api_rapida.gemini_client.models.generate_content = original
+    return uso
+
+async def rodar(caminho: str, ao_vivo: bool):
+    print(f"\n📄 {caminho}")
+    with open(caminho, "rb") as f:
+        pdf_bytes = f.read()
+
+    doc = api_rapida.abrir_documento(pdf_bytes, None)
+    try:
+        print(f"   • Páginas: {len(doc)}")
+        for modo in MODOS:
+            print(f"   • {modo}: {medir_offline(doc, modo)}")
+    finally:
+        doc.close()
+
+    if ao_vivo:
+        for modo in MODOS:
+            print(f"   • {modo} (ao vivo): {await medir_ao_vivo(pdf_bytes, modo)}")
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not argumentos:
+        print(__doc__)
+        sys.exit(1)
+    print("🏁 BENCHMARK DUAS ETAPAS x MULTIMODAL")
+    for caminho in argumentos:
+        asyncio.run(rodar(caminho, "--ao-vivo" in sys.argv))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark: contrato de saída v1 (JSON por transação) x v2 (linhas delimitadas
+com códigos de subcategoria).
+
+Uso:
+    python tests/benchmark_saida_tabular.py extrato.pdf [outro.pdf ...]
+    python tests/benchmark_saida_tabular.py extrato.pdf --ao-vivo   # chama o Gemini de verdade
+
+Sem --ao-vivo, monta as duas respostas para as linhas candidatas a transação
+(data e valor) e compara os tokens de saída estimados e o tempo de geração a
+TOKENS_POR_SEGUNDO. Com --ao-vivo, mede tempo total e tokens reais
+(usage_metadata) com VERSAO_PROMPT v1 e v2.
+"""
+import sys
+import os
+import re
+import json
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api_rapida
+from empacotamento import estimar_tokens
+from preprocessamento import REGEX_DATA_BR, REGEX_VALOR_BR
+from saida_tabular import interpretar_saida_tabular, CODIGOS_SUBCATEGORIAS
+from prompt_e_schema import CABECALHO_TABULAR_COMPLETO
+
+TOKENS_POR_SEGUNDO = float(os.getenv("TOKENS_POR_SEGUNDO", 150))  # ritmo de geração aproximado do modelo
+
+def transacoes_candidatas(paginas: list[tuple[int, str]]) -> list[dict]:
+    """
+    Transações no formato v1 (com categoria) a partir das linhas com data e valor.
+    """
+    codigos = list(CODIGOS_SUBCATEGORIAS.values())
+    transacoes = []
+    for numero, texto in paginas:
+        for linha in texto.splitlines():
+            data, valor = REGEX_DATA_BR.search(linha), REGEX_VALOR_BR.search(linha)
+            if not (data and valor):
+                continue
+            descricao = " ".join(REGEX_VALOR_BR.sub("", REGEX_DATA_BR.sub("", linha)).split()) or "TRANSACAO"
+            categoria, subcategoria = codigos[len(transacoes) % len(codigos)]
+            parcela = re.search(r'\b(\d{1,2})/(\d{1,2})\s*$', descricao)
+            transacao = {
+                "uuid": "1", "data": "2025-01-05", "descricao": descricao.replace("|", "/"),
+                "valor": float(re.sub(r'[^\d,]', '', valor.group(0)).replace(",", ".")),
+                "categoria": categoria, "tipo": "despesa", "subcategoria": subcategoria,
+                "parcelado": bool(parcela), "pagina": numero,
+            }
+            if parcela:
+                transacao.update(numero_parcelas=int(parcela.group(1)), total_parcelas=int(parcela.group(2)))
+            transacoes.append(transacao)
+    return transacoes
+
+def saida_v1(transacoes: list[dict]) -> str:
+    return json.dumps({"success": True, "bank_name": "Banco", "document_type": "credit-card-statement",
+                       "transactions_count": 0, "transactions": transacoes, "error_message": None},
+                      ensure_ascii=False)
+
+def saida_v2(transacoes: list[dict]) -> str:
+    codigos = {v: k for k, v in CODIGOS_SUBCATEGORIAS.items()}
+    linhas = ["BANCO|Banco|C", CABECALHO_TABULAR_COMPLETO]
+    for t in transacoes:
+        parcela = f"{t['numero_parcelas']}/{t['total_parcelas']}" if t["parcelado"] else ""
+        codigo = codigos[(t["categoria"], t["subcategoria"])]
+        linhas.append(f"{t['pagina']}|{t['data']}|{t['descricao']}|{t['valor']:.2f}|D|{parcela}|{codigo}")
+    return "\n".join(linhas)
+
+def medir_offline(paginas: list[tuple[int, str]]) -> dict:
+    """
+    Compara os tokens de saída das duas versões e o custo do parser v2.
+    """
+    transacoes = transacoes_candidatas(paginas)
+    v1, v2 = saida_v1(transacoes), saida_v2(transacoes)
+    inicio = time.perf_counter()
+    expandido = interpretar_saida_tabular(v2, com_categoria=True)
+    parser_ms = (time.perf_counter() - inicio) * 1000
+    assert len(expandido["transactions"]) == len(transacoes)
+    tokens_v1, tokens_v2 = estimar_tokens(v1), estimar_tokens(v2)
+    return {
+        "transacoes": len(transacoes),
+        "tokens_saida_v1": tokens_v1,
+        "tokens_saida_v2": tokens_v2,
+        "reducao": f"{1 - tokens_v2 / tokens_v1:.0%}" if tokens_v1 else "-",
+        "geracao_v1_s": round(tokens_v1 / TOKENS_POR_SEGUNDO, 1),
+        "geracao_v2_s": round(tokens_v2 / TOKENS_POR_SEGUNDO, 1),
+        "parser_v2_ms": round(parser_ms, 2),
+    }
+
+async def medir_ao_vivo(paginas: list[tuple[int, str]], versao: str) -> dict:
+    """
+    Executa a extração real com a versão de prompt pedida e soma os tokens informados pela API.
+    """
+    api_rapida.VERSAO_PROMPT = versao
+    uso = {"chamadas": 0, "tokens_entrada": 0, "tokens_saida": 0}
+    original = api_rapida.gemini_client.models.generate_content
+
+    def generate_content_medido(*args, **kwargs):
+        response = original(*args, **kwargs)
+        uso["chamadas"] += 1
+        if response.usage_metadata:
+            uso["tokens_entrada"] += response.usage_metadata.prompt_token_count or 0
+            uso["tokens_saida"] += response.usage_metadata.candidates_token_count or 0
+        return response
+
+    api_rapida.gemini_client.models.generate_content = generate_content_medido
+    try:
+        inicio = time.time()
+        resultado = await api_rapida.categorizar_com_llm(paginas)
+        uso["segundos"] = round(time.time() - inicio, 2)
+        uso["transacoes"] = len(resultado.get("transactions", []))
+    finally:
+        api_rapida.gemini_client.models.generate_content = original
+    return uso
+
+async def rodar(caminho: str, ao_vivo: bool):
+    print(f"\n📄 {caminho}")
+    with open(caminho, "rb") as f:
+        doc = api_rapida.abrir_documento(f.read(), None)
+    try:
+        textos = await api_rapida.extrair_paginas_documento(doc)
+    finally:
+        doc.close()
+    if not textos:
+        print("❌ Não foi possível extrair texto")
+        return
+
+    paginas = [(i + 1, textos[i]) for i in sorted(textos)]
+    print(f"   • Páginas: {len(paginas)}")
+    print(f"   • Estimativa: {medir_offline(paginas)}")
+
+    if ao_vivo:
+        for versao in ("v1", "v2"):
+            print(f"   • VERSAO_PROMPT={versao} (ao vivo): {await medir_ao_vivo(paginas, versao)}")
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not argumentos:
+        print(__doc__)
+        sys.exit(1)
+    print("🏁 BENCHMARK DO CONTRATO DE SAÍDA TABULAR")
+    for caminho in argumentos:
+        asyncio.run(rodar(caminho, "--ao-vivo" in sys.argv))
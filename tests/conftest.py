@@ -0,0 +1,13 @@
+"""
+Execução dos scripts de teste juntos no pytest: cada script roda com o estado
+da aplicação de antes dele, como se fosse um processo novo.
+"""
+import pytest
+
+import apoio
+
+@pytest.fixture(autouse=True)
+def estado_isolado():
+    estado = apoio.capturar_estado()
+    yield
+    apoio.restaurar_estado(estado)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Teste do controle de admissão: limites de carga, fila por prioridade,
+recusas 429/503 com Retry-After, liberação e admissão do upload pelo
+tamanho antes de ler o arquivo.
+"""
+import sys
+import os
+import io
+import json
+import asyncio
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from fastapi import HTTPException, UploadFile
+from apoio import gemini_falso, buscar_categorizacoes_falsa, criar_pdf_teste
+from admissao import (
+    ControleAdmissao, custo_documento, custo_upload, PRIORIDADE_INTERATIVA, PRIORIDADE_LOTE, PRIORIDADES_ENDPOINT
+)
+
+LIMITES = {"paginas": 10, "tokens": 10**9, "memoria_mb": 10**6}
+
+def custo(paginas: int) -> dict:
+    return {"paginas": paginas, "tokens": 0, "memoria_mb": 0}
+
+async def cenario_prioridade() -> list[str]:
+    """
+    Ocupa o controle, enfileira um job de lote e depois um interativo: o
+    interativo deve entrar primeiro quando a carga for liberada.
+    """
+    controle = ControleAdmissao(LIMITES, {PRIORIDADE_INTERATIVA: 5, PRIORIDADE_LOTE: 5}, espera_max_s=5)
+    ordem = []
+    ocupado = await controle.admitir(custo(8))
+
+    async def requisicao(nome: str, paginas: int, prioridade: int):
+        admitida_em = await controle.admitir(custo(paginas), prioridade)
+        ordem.append(nome)
+        await asyncio.sleep(0.01)
+        controle.liberar(custo(paginas), admitida_em)
+
+    lote = asyncio.create_task(requisicao("lote", 5, PRIORIDADE_LOTE))
+    await asyncio.sleep(0.01)
+    interativa = asyncio.create_task(requisicao("interativa", 5, PRIORIDADE_INTERATIVA))
+    await asyncio.sleep(0.01)
+    assert ordem == [] and controle.metricas()["na_fila"] == 2
+    controle.liberar(custo(8), ocupado)
+    await asyncio.gather(lote, interativa)
+    assert controle.em_uso["paginas"] == 0 and controle.ativas == 0
+    return ordem
+
+async def cenario_recusas() -> tuple[HTTPException, HTTPException]:
+    controle = ControleAdmissao(LIMITES, {PRIORIDADE_INTERATIVA: 1, PRIORIDADE_LOTE: 1}, espera_max_s=0.05)
+    await controle.admitir(custo(10))
+    espera = asyncio.create_task(controle.admitir(custo(1)))
+    await asyncio.sleep(0.01)
+    try:
+        await controle.admitir(custo(1))
+    except HTTPException as e:
+        cheia = e
+    try:
+        await espera
+    except HTTPException as e:
+        demorada = e
+    return cheia, demorada
+
+async def cenario_limites():
+    controle = ControleAdmissao(LIMITES, espera_max_s=1)
+    # Maior que o limite: entra sozinha quando não há nada em andamento
+    admitida_em = await controle.admitir(custo(50))
+    assert controle.ativas == 1
+    # Cancelada na fila: não ocupa nada e não bloqueia as próximas
+    esperando = asyncio.create_task(controle.admitir(custo(1)))
+    await asyncio.sleep(0.01)
+    esperando.cancel()
+    await asyncio.gather(esperando, return_exceptions=True)
+    controle.liberar(custo(50), admitida_em)
+    await controle.admitir(custo(3))
+    assert controle.em_uso["paginas"] == 3 and controle.metricas()["na_fila"] == 0
+
+async def cenario_upload(pdf_bytes: bytes) -> tuple[int, int, int, int]:
+    """
+    Upload com o controle ocupado (recusado sem ler o arquivo) e depois livre
+    (admitido uma vez só, com as páginas reais). Retorna (status recusado,
+    leituras na recusa, status aceito, admissões).
+    """
+    import api_rapida
+    controle = ControleAdmissao(LIMITES, {PRIORIDADE_INTERATIVA: 0, PRIORIDADE_LOTE: 0}, espera_max_s=0.05)
+    api_rapida.controle_admissao = controle
+    leituras = []
+
+    def upload() -> UploadFile:
+        arquivo = UploadFile(io.BytesIO(pdf_bytes), size=len(pdf_bytes), filename="extrato.pdf")
+        ler = arquivo.read
+        async def ler_contando(*args):
+            leituras.append(1)
+            return await ler(*args)
+        arquivo.read = ler_contando
+        return arquivo
+
+    ocupado = await controle.admitir(custo(10))
+    recusada = await api_rapida.processar_extrato_endpoint(upload(), 1, None, None, None, None)
+    leituras_na_recusa = len(leituras)
+    controle.liberar(custo(10), ocupado)
+    admitidas = controle.contadores["admitidas"]
+    aceita = await api_rapida.processar_extrato_endpoint(upload(), 1, None, None, None, None)
+    assert controle.ativas == 0 and controle.em_uso["paginas"] == 0
+    return recusada.status_code, leituras_na_recusa, aceita.status_code, controle.contadores["admitidas"] - admitidas
+
+def testar_casos():
+    """
+    Testa a estimativa de custo, a prioridade por endpoint, as recusas e os casos de borda.
+    """
+    print("🧪 TESTANDO CONTROLE DE ADMISSÃO\n")
+
+    # Teste 1: Custo estimado do documento
+    print("Teste 1: Custo do documento")
+    estimado = custo_documento(2 * 2**20, 10)
+    print(f"Resultado: {estimado}")
+    assert estimado["paginas"] == 10 and estimado["tokens"] > 0 and estimado["memoria_mb"] > 2
+    assert PRIORIDADES_ENDPOINT["/processar-extrato/"] < PRIORIDADES_ENDPOINT["/processar-extrato-url/"]
+    print("✅ Passou\n")
+
+    # Teste 2: Upload interativo passa na frente do job de URL
+    print("Teste 2: Prioridade")
+    ordem = asyncio.run(cenario_prioridade())
+    print(f"Resultado: {ordem}")
+    assert ordem == ["interativa", "lote"]
+    print("✅ Passou\n")
+
+    # Teste 3: Fila cheia -> 429, espera demais -> 503, ambos com Retry-After
+    print("Teste 3: Recusas")
+    cheia, demorada = asyncio.run(cenario_recusas())
+    print(f"Resultado: {cheia.status_code} {cheia.headers}, {demorada.status_code} {demorada.headers}")
+    assert cheia.status_code == 429 and int(cheia.headers["Retry-After"]) >= 1
+    assert demorada.status_code == 503 and int(demorada.headers["Retry-After"]) >= 1
+    print("✅ Passou\n")
+
+    # Teste 4: Documento maior que o limite e cancelamento na fila
+    print("Teste 4: Casos de borda")
+    asyncio.run(cenario_limites())
+    controle = ControleAdmissao(LIMITES, espera_max_s=1)
+    estimado = custo_upload(250000)
+    admitida_em = asyncio.run(controle.admitir(estimado))
+    controle.ajustar(estimado, custo_documento(250000, 1))
+    print(f"Resultado: upload de 250 KB estimado em {estimado['paginas']} páginas, ajustado para {controle.em_uso['paginas']}")
+    assert estimado["paginas"] == 3 and controle.em_uso["paginas"] == 1
+    controle.liberar(custo_documento(250000, 1), admitida_em)
+    assert controle.ativas == 0 and controle.em_uso["paginas"] == 0
+    print("✅ Passou\n")
+
+    # Teste 5: Upload recusado pela admissão antes de ser lido; aceito, é admitido uma só vez
+    print("Teste 5: Admissão do upload pelo tamanho")
+    import api_rapida
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.buscar_categorizacoes_usuario = buscar_categorizacoes_falsa
+    api_rapida.cotas_usuarios.paginas_minuto = 0
+    api_rapida.cotas_usuarios.tokens_dia = 0
+    api_rapida.LIVRO_TRANSACOES = False
+    recusada, leituras, aceita, admissoes = asyncio.run(cenario_upload(criar_pdf_teste(
+        [[f"{d:02d}/01 LOJA X R$ {d},90" for d in range(1, 7)]])))
+    print(f"Resultado: recusada {recusada} com {leituras} leituras; aceita {aceita} com {admissoes} admissão")
+    assert recusada == 429 and leituras == 0 and aceita == 200 and admissoes == 1
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Teste do armazém de artefatos: gravação e leitura por hash, artefatos
+gravados pelo pipeline e reprocessamento (API e linha de comando) sem
+abrir o PDF de novo, só com o user_id do processamento; arquivos privados
+e apagados junto com as linhas substituídas.
+"""
+import sys
+import os
+import json
+import asyncio
+import tempfile
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import CHAMADAS, gemini_falso, buscar_categorizacoes_falsa, criar_pdf_teste, processar_e_aguardar
+import api_rapida
+import processar_offline
+from artefatos import ArmazemArtefatos
+
+def testar_casos():
+    """
+    Testa a ida e volta do armazém, o reprocessamento, o documento desconhecido e a linha de comando.
+    """
+    print("🧪 TESTANDO ARMAZÉM DE ARTEFATOS E REPROCESSAMENTO\n")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.cotas_usuarios.paginas_minuto = 0
+    api_rapida.cotas_usuarios.tokens_dia = 0
+    api_rapida.buscar_categorizacoes_usuario = buscar_categorizacoes_falsa
+    api_rapida.LIVRO_TRANSACOES = False
+    api_rapida.ARTEFATOS = True
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # Teste 1: Ida e volta pelo armazém (SQLite + blobs compactados)
+        print("Teste 1: Gravação e leitura")
+        armazem = ArmazemArtefatos(os.path.join(pasta, "unitario"), ttl_dias=0)
+        armazem.salvar("ab" * 32, {
+            "user_id": 7, "paginas": 2, "tamanho_bytes": 100, "modelo_layout": None, "estrategias": {1: "nativo", 2: "ocr"},
+            "textos_extraidos": {1: "texto 1", 2: "texto 2 " * 500}, "textos_llm": {1: "texto 1"},
+            "renderizacao": {2: {"estrategia": "ocr", "dpi": 200}}, "resultados_parser": [{"success": True, "transactions": []}],
+            "versao_prompt": "v1", "saidas_llm": [{"resposta": "{}"}],
+        })
+        armazem.salvar_saidas_llm("ab" * 32, "v2", [{"resposta": "a|b"}])
+        lido = armazem.carregar("ab" * 32, 7)
+        print(f"Resultado: {armazem.metricas()}")
+        assert lido["estrategias"] == {1: "nativo", 2: "ocr"} and lido["textos_extraidos"][2] == "texto 2 " * 500
+        assert lido["renderizacao"][2]["dpi"] == 200 and set(lido["saidas_llm"]) == {"v1", "v2"}
+        assert armazem.carregar("cd" * 32, 7) is None and armazem.carregar("ab" * 32, 8) is None
+        assert armazem.listar(7) == ["ab" * 32] and armazem.listar(8) == []
+        assert {os.stat(os.path.join(armazem._pasta("ab" * 32), nome)).st_mode & 0o777
+                for nome in os.listdir(armazem._pasta("ab" * 32))} == {0o600}, "blobs legíveis só pelo dono do processo"
+        armazem.remover("ab" * 32)
+        assert armazem.listar(7) == [] and not os.path.exists(armazem._pasta("ab" * 32))
+        print("✅ Passou\n")
+
+        # Teste 1.1: Regravação apaga os arquivos substituídos; outro usuário não herda as respostas da LLM
+        print("Teste 1.1: Regravação e troca de usuário")
+        base = {"paginas": 1, "tamanho_bytes": 100, "modelo_layout": None, "estrategias": {1: "nativo"}}
+        armazem.salvar("ef" * 32, {**base, "user_id": 7, "textos_extraidos": {1: "a", 2: "b"}, "versao_prompt": "v1",
+                                   "saidas_llm": [{"resposta": "do usuário 7"}]})
+        armazem.salvar("ef" * 32, {**base, "user_id": 7, "textos_extraidos": {1: "a"}})
+        arquivos_mesmo_usuario = sorted(os.listdir(armazem._pasta("ef" * 32)))
+        armazem.salvar("ef" * 32, {**base, "user_id": 9, "textos_extraidos": {1: "a"}})
+        lido = armazem.carregar("ef" * 32, 9)
+        print(f"Resultado: {arquivos_mesmo_usuario} -> {sorted(os.listdir(armazem._pasta('ef' * 32)))}")
+        assert arquivos_mesmo_usuario == ["saidas_llm-0-v1.z", "texto_extraido-1.z"]
+        assert lido["saidas_llm"] == {} and armazem.carregar("ef" * 32, 7) is None
+        assert os.listdir(armazem._pasta("ef" * 32)) == ["texto_extraido-1.z"]
+        print("✅ Passou\n")
+
+        # Teste 2: O pipeline grava os artefatos e o reprocessamento não abre o PDF
+        print("Teste 2: Reprocessamento")
+        api_rapida.armazem_artefatos = ArmazemArtefatos(os.path.join(pasta, "api"))
+        original = asyncio.run(processar_e_aguardar(criar_pdf_teste(
+            [[f"{d:02d}/{mes:02d} LOJA MES{mes} R$ {d},90" for d in range(1, 7)] for mes in (1, 2)]), 7))
+        artefatos = api_rapida.armazem_artefatos.carregar(original["document_hash"], 7)
+        assert len(artefatos["textos_extraidos"]) == 2 and artefatos["estrategias"] == {1: "nativo", 2: "nativo"}
+        assert artefatos["saidas_llm"][api_rapida.VERSAO_PROMPT], "respostas brutas da LLM guardadas"
+        abrir_documento = api_rapida.abrir_documento
+        api_rapida.abrir_documento = None  # qualquer tentativa de abrir o PDF falha
+        CHAMADAS.clear()
+        admitidas = api_rapida.controle_admissao.contadores["admitidas"]
+        try:
+            resposta = asyncio.run(api_rapida.reprocessar_endpoint(original["document_hash"], 7))
+        finally:
+            api_rapida.abrir_documento = abrir_documento
+        reprocessado = json.loads(resposta.body)
+        print(f"Resultado: {resposta.status_code}, {reprocessado['transactions_count']} transações, {len(CHAMADAS)} chamadas")
+        assert resposta.status_code == 200 and reprocessado["reprocessed"] is True
+        assert reprocessado["transactions_count"] == len(original["transactions"]) == 12
+        assert any("LOJA MES" in c for c in CHAMADAS), "a LLM roda de novo sobre o texto guardado"
+        assert api_rapida.controle_admissao.contadores["admitidas"] == admitidas + 1, "passa pelo controle de admissão"
+        assert api_rapida.controle_admissao.metricas()["ativas"] == 0
+        print("✅ Passou\n")
+
+        # Teste 3: Documento fora do armazém ou de outro usuário: 404, sem revelar qual dos dois
+        print("Teste 3: Documento desconhecido ou de outro usuário")
+        resposta = asyncio.run(api_rapida.reprocessar_endpoint("0" * 64, 7))
+        alheio = asyncio.run(api_rapida.reprocessar_endpoint(original["document_hash"], 8))
+        print(f"Resultado: {resposta.status_code} {json.loads(resposta.body)['error_message']}")
+        assert resposta.status_code == alheio.status_code == 404 and resposta.body == alheio.body
+        print("✅ Passou\n")
+
+        # Teste 4: Linha de comando reprocessa "todos" os documentos do usuário
+        print("Teste 4: Reprocessamento offline")
+        saida = os.path.join(pasta, "reprocessados.jsonl")
+        assert asyncio.run(processar_offline.executar(["todos"], saida, user_id=8, reprocessar=True))["documentos"] == 0
+        resumo = asyncio.run(processar_offline.executar(["todos", "1" * 64], saida, user_id=7, reprocessar=True))
+        with open(saida, encoding="utf-8") as f:
+            linhas = [json.loads(linha) for linha in f]
+        print(f"Resultado: {resumo}")
+        assert resumo["processados"] == 1 and resumo["com_erro"] == 1 and resumo["transacoes"] == 12
+        assert sorted(l["status_code"] for l in linhas) == [200, 404] and all(l["reprocessado"] for l in linhas)
+        print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
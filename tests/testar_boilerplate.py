@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para a remoção de cabeçalhos, rodapés e textos repetidos entre páginas.
+"""
+import sys
+import os
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from documento_pdf import DocumentHandle
+from preprocessamento import remover_boilerplate, posicoes_linhas, normalizar_linha
+
+RODAPE_LEGAL = "Central de atendimento 24h: 4004 0000. Ouvidoria: 0800 000 0000, dias úteis das 9h às 18h."
+
+def criar_pdf_teste(paginas: int = 4) -> bytes:
+    """
+    Cria um extrato com cabeçalho, títulos das colunas, limite no topo e rodapé
+    legal repetidos em todas as páginas, além das transações de cada página.
+    """
+    doc = fitz.open()
+    for p in range(paginas):
+        pagina = doc.new_page()
+        linhas_topo = ["BANCO EXEMPLO S.A. - Extrato de conta", "Limite total R$ 5.000,00", "Data Descrição Valor"]
+        for i, linha in enumerate(linhas_topo):
+            pagina.insert_text((50, 50 + i * 14), linha, fontsize=9)
+        corpo = [f"{p * 10 + i + 1:02d}/01 MERCADO {p}-{i} R$ {i + 10},90" for i in range(20)]
+        corpo += ["UBER *TRIP", f"{p + 20:02d}/01 PAGAMENTO R$ 99,00", "05/01 NETFLIX R$ 39,90"]
+        for i, linha in enumerate(corpo):
+            pagina.insert_text((50, 120 + i * 14), linha, fontsize=9)
+        pagina.insert_text((50, 790), RODAPE_LEGAL, fontsize=7)
+        pagina.insert_text((50, 810), f"Página {p + 1} de {paginas}", fontsize=7)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def testar_casos():
+    """
+    Testa a detecção por repetição e por posição, e o relatório de tokens.
+    """
+    print("🧪 TESTANDO REMOÇÃO DE BOILERPLATE\n")
+
+    doc = DocumentHandle.abrir(criar_pdf_teste())
+    textos = {i: doc.texto(i) for i in doc.paginas}
+
+    def posicao_linha(indice, chave):
+        return posicoes_linhas(doc, indice).get(chave)
+
+    limpos, relatorio = remover_boilerplate(textos, posicao_linha)
+    print(f"Relatório: {relatorio}\n")
+
+    # Teste 1: A primeira página mantém o cabeçalho (nome do banco para a LLM)
+    print("Teste 1: Primeira página preserva o cabeçalho")
+    assert "BANCO EXEMPLO" in limpos[0] and "Limite total" in limpos[0]
+    print("✅ Passou\n")
+
+    # Teste 2: Cabeçalho, rodapé e paginação saem das demais páginas
+    print("Teste 2: Cabeçalho, rodapé legal e paginação removidos das páginas seguintes")
+    for i in (1, 2, 3):
+        assert "BANCO EXEMPLO" not in limpos[i], f"Cabeçalho ficou na página {i + 1}"
+        assert "Limite total" not in limpos[i], f"Limite do topo ficou na página {i + 1}"
+        assert "Ouvidoria" not in limpos[i], f"Rodapé legal ficou na página {i + 1}"
+        assert "Página" not in limpos[i], f"Paginação ficou na página {i + 1}"
+    print("✅ Passou\n")
+
+    # Teste 3: Linhas do corpo não são removidas, mesmo repetidas
+    print("Teste 3: Transações e descrições curtas no corpo são mantidas")
+    for i in range(4):
+        assert "UBER *TRIP" in limpos[i], "Descrição curta no corpo não deveria ser removida"
+        assert "05/01 NETFLIX R$ 39,90" in limpos[i], "Transação repetida no corpo não deveria ser removida"
+        assert f"MERCADO {i}-0" in limpos[i], "Transação da página foi removida"
+    print("✅ Passou\n")
+
+    # Teste 4: Relatório de tokens
+    print("Teste 4: Relatório de tokens economizados")
+    assert relatorio["tokens_economizados"] > 0
+    assert relatorio["tokens_depois"] == relatorio["tokens_antes"] - relatorio["tokens_economizados"]
+    print("✅ Passou\n")
+
+    # Teste 5: Página única não é alterada
+    print("Teste 5: Documento de uma página")
+    limpos, relatorio = remover_boilerplate({0: textos[0]})
+    assert limpos[0] == textos[0] and relatorio["tokens_economizados"] == 0
+    print("✅ Passou\n")
+
+    # Teste 6: Normalização mascara dígitos apenas em linhas sem valor
+    print("Teste 6: Normalização de linhas")
+    assert normalizar_linha("Página 1 de 4") == normalizar_linha("Página  2 de 4")
+    assert normalizar_linha("01/01 PADARIA R$ 10,90") != normalizar_linha("02/01 PADARIA R$ 10,90")
+    print("✅ Passou\n")
+
+    doc.close()
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
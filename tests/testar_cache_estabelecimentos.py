@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para o cache global estabelecimento -> categoria.
+"""
+import sys
+import os
+import tempfile
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cache_estabelecimentos
+from cache_estabelecimentos import CacheEstabelecimentos
+
+def testar_casos():
+    """
+    Testa confiança mínima, predominância, decaimento e persistência.
+    """
+    print("🧪 TESTANDO CACHE DE ESTABELECIMENTOS\n")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, "cache.json.gz")
+        cache = CacheEstabelecimentos(arquivo)
+
+        # Teste 1: Uma observação não basta (confiança mínima padrão = 2)
+        print("Teste 1: Confiança mínima")
+        cache.registrar("ifood restaurante", "ALIMENTACAO", "Refeições em restaurante")
+        assert cache.consultar("ifood restaurante") is None
+        cache.registrar("ifood restaurante", "ALIMENTACAO", "Refeições em restaurante")
+        resultado = cache.consultar("ifood restaurante")
+        print(f"Resultado: {resultado}")
+        assert resultado == {"categoria": "ALIMENTACAO", "subcategoria": "Refeições em restaurante"}
+        print("✅ Passou\n")
+
+        # Teste 2: Categorias em conflito não passam na predominância
+        print("Teste 2: Predominância")
+        for categoria in ("LAZER", "DIVERSOS", "LAZER", "DIVERSOS"):
+            cache.registrar("loja x", categoria, "Outros")
+        assert cache.consultar("loja x") is None
+        print("✅ Passou\n")
+
+        # Teste 3: Pesos antigos decaem até perder a confiança
+        print("Teste 3: Decaimento")
+        cache._entradas["ifood restaurante"][0] -= int(cache_estabelecimentos.CACHE_MEIA_VIDA_DIAS)
+        assert cache.consultar("ifood restaurante") is None, "Peso de 2 com uma meia-vida deveria cair para 1"
+        cache.registrar("ifood restaurante", "ALIMENTACAO", "Refeições em restaurante")
+        assert cache.consultar("ifood restaurante") is not None, "Nova observação deveria reconfirmar"
+        print("✅ Passou\n")
+
+        # Teste 4: Salva e carrega do disco
+        print("Teste 4: Persistência")
+        cache.salvar()
+        novo = CacheEstabelecimentos(arquivo)
+        novo.carregar()
+        assert len(novo) == len(cache) == 2
+        assert novo.consultar("ifood restaurante") == cache.consultar("ifood restaurante")
+        print(f"Arquivo: {os.path.getsize(arquivo)} bytes")
+        print("✅ Passou\n")
+
+        # Teste 5: Métricas de acerto
+        print("Teste 5: Métricas")
+        print(f"Resultado: {novo.metricas()}")
+        assert novo.metricas()["consultas"] == 1 and novo.metricas()["acertos"] == 1
+        print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para o categorizador local compilado a partir de categorias.json.
+"""
+import sys
+import os
+import time
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categorizacao_local import CategorizadorLocal, categorizador_local
+from prompt_e_schema import TAXONOMIA, CATEGORIAS_COMPLETAS
+
+def testar_casos():
+    """
+    Testa categorização por palavra-chave, ambiguidade e o texto gerado para o prompt.
+    """
+    print("🧪 TESTANDO CATEGORIZADOR LOCAL\n")
+
+    casos = [
+        ("SPOTIFY P1A2B3", ("COMUNICACAO", "Apps (Netflix, Spotify, Prime, etc)")),
+        ("POSTO IPIRANGA 123", ("TRANSPORTE", "Combustível")),
+        ("DROGASIL 0456", ("SAUDE", "Medicamentos / Farmácia")),
+        ("MCDONALDS PAULISTA", ("ALIMENTACAO", "Refeições em restaurante")),
+        ("UBER EATS", ("ALIMENTACAO", "Refeições em restaurante")),
+        ("UBER *TRIP", ("TRANSPORTE", "Uber")),
+        ("ZONA AZUL SP", ("TRANSPORTE", "Estacionamento")),
+        ("PAO DE ACUCAR-1234", ("ALIMENTACAO", "Supermercado")),
+        ("LATAM AIRLINES", ("LAZER", "Viagens")),
+    ]
+
+    # Teste 1: Palavras-chave conhecidas
+    print("Teste 1: Descrições com palavra-chave")
+    for descricao, esperado in casos:
+        resultado = categorizador_local.categorizar(descricao)
+        print(f"   {descricao} -> {resultado}")
+        assert resultado == {"categoria": esperado[0], "subcategoria": esperado[1]}, descricao
+    print("✅ Passou\n")
+
+    # Teste 2: Ambíguas ou desconhecidas ficam para a LLM
+    print("Teste 2: Descrições ambíguas ou desconhecidas")
+    for descricao in ("PIX QRS IFOOD", "DETRAN SP", "LOJA XPTO 123", "MERCADO LIVRE", "NETSHOES", "BARBEARIA"):
+        resultado = categorizador_local.categorizar(descricao)
+        print(f"   {descricao} -> {resultado}")
+        assert resultado is None, descricao
+    print("✅ Passou\n")
+
+    # Teste 3: O prompt é gerado da mesma taxonomia
+    print("Teste 3: Prompt gerado de categorias.json")
+    for categoria in TAXONOMIA:
+        assert f"- {categoria['nome']}" in CATEGORIAS_COMPLETAS
+        for sub in categoria["subcategorias"]:
+            assert f"• {sub['nome']}" in CATEGORIAS_COMPLETAS
+    assert "Spotify" in CATEGORIAS_COMPLETAS and "INSTRUÇÕES CRÍTICAS" in CATEGORIAS_COMPLETAS
+    print("✅ Passou\n")
+
+    # Teste 4: Custo por descrição
+    print("Teste 4: Desempenho")
+    inicio = time.perf_counter()
+    CategorizadorLocal(TAXONOMIA)
+    compilacao = (time.perf_counter() - inicio) * 1000
+    descricoes = [d for d, _ in casos] * 1000
+    inicio = time.perf_counter()
+    for descricao in descricoes:
+        categorizador_local.categorizar(descricao)
+    por_descricao = (time.perf_counter() - inicio) / len(descricoes) * 1e6
+    print(f"Resultado: {len(categorizador_local)} palavras-chave, compilação {compilacao:.1f} ms, {por_descricao:.1f} µs por descrição")
+    assert por_descricao < 1000
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para o pré-classificador de páginas (texto nativo x OCR).
+"""
+import sys
+import os
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from documento_pdf import DocumentHandle, estrategia_pagina, razao_caracteres_lixo
+
+def criar_pdf_teste() -> bytes:
+    """
+    Cria um PDF com 5 páginas: texto nativo, página digitalizada (só imagem), página vazia,
+    texto em contornos vetoriais (glifos desenhados como curvas) e página só com bordas de tabela.
+    """
+    doc = fitz.open()
+
+    pagina = doc.new_page()
+    for i in range(20):
+        pagina.insert_text((50, 60 + i * 14), f"{i + 1:02d}/01 IFOOD *RESTAURANTE R$ {i + 10},90", fontsize=9)
+
+    imagem = doc[0].get_pixmap(matrix=fitz.Matrix(1, 1))
+    pagina = doc.new_page()
+    pagina.insert_image(pagina.rect, stream=imagem.tobytes("png"))
+
+    doc.new_page()
+
+    pagina = doc.new_page()
+    forma = pagina.new_shape()
+    for i in range(20):
+        for j in range(30):
+            forma.draw_circle((50 + j * 6, 60 + i * 14), 2.5)
+    forma.finish(fill=(0, 0, 0))
+    forma.commit()
+
+    pagina = doc.new_page()
+    forma = pagina.new_shape()
+    for i in range(21):
+        forma.draw_line((50, 60 + i * 14), (550, 60 + i * 14))
+    for x in (50, 150, 450, 550):
+        forma.draw_line((x, 60), (x, 340))
+    forma.finish(color=(0, 0, 0))
+    forma.commit()
+
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def testar_casos():
+    """
+    Testa a classificação de páginas e a detecção de texto ilegível.
+    """
+    print("🧪 TESTANDO PRÉ-CLASSIFICADOR DE PÁGINAS\n")
+
+    doc = DocumentHandle.abrir(criar_pdf_teste())
+
+    # Teste 1: Página com texto nativo
+    print("Teste 1: Página com texto nativo")
+    resultado = estrategia_pagina(doc.perfil(0))
+    print(f"Resultado: {resultado} {doc.perfil(0)}")
+    assert resultado == "nativo", "Página com texto deveria usar extração nativa"
+    print("✅ Passou\n")
+
+    # Teste 2: Página digitalizada
+    print("Teste 2: Página digitalizada (apenas imagem)")
+    resultado = estrategia_pagina(doc.perfil(1))
+    print(f"Resultado: {resultado} {doc.perfil(1)}")
+    assert resultado == "ocr", "Página só com imagem deveria ir para OCR"
+    print("✅ Passou\n")
+
+    # Teste 3: Página vazia
+    print("Teste 3: Página vazia")
+    resultado = estrategia_pagina(doc.perfil(2))
+    print(f"Resultado: {resultado}")
+    assert resultado == "vazia", "Página sem texto e sem imagem deveria ser ignorada"
+    print("✅ Passou\n")
+
+    # Teste 3.1: Texto em contornos vetoriais (sem spans nem imagem) vai para OCR
+    print("Teste 3.1: Texto em contornos vetoriais")
+    resultado = estrategia_pagina(doc.perfil(3))
+    print(f"Resultado: {resultado} (desenhos={doc.perfil(3)['desenhos']})")
+    assert resultado == "ocr", "Página com texto desenhado em curvas não deveria ser descartada"
+    print("✅ Passou\n")
+
+    # Teste 3.2: Só bordas de tabela continua vazia
+    print("Teste 3.2: Página só com bordas de tabela")
+    resultado = estrategia_pagina(doc.perfil(4))
+    print(f"Resultado: {resultado} (desenhos={doc.perfil(4)['desenhos']})")
+    assert resultado == "vazia", "Algumas linhas vetoriais não justificam OCR"
+    print("✅ Passou\n")
+
+    # Teste 4: Camada de texto corrompida (passa nos 50 caracteres, mas é ilegível)
+    print("Teste 4: Camada de texto corrompida")
+    perfil_corrompido = {
+        "fontes": 1,
+        "spans": 30,
+        "caracteres": 400,
+        "cobertura_imagem": 0.0,
+        "razao_lixo": razao_caracteres_lixo(" �� 12/01 " * 20),
+    }
+    resultado = estrategia_pagina(perfil_corrompido)
+    print(f"Resultado: {resultado} (lixo={perfil_corrompido['razao_lixo']:.0%})")
+    assert resultado == "ocr", "Texto ilegível deveria ir para OCR"
+    print("✅ Passou\n")
+
+    # Teste 5: Texto normal com acentos e símbolos monetários
+    print("Teste 5: Texto normal com acentos")
+    razao = razao_caracteres_lixo("Padaria São João — Pão de Açúcar R$ 1.234,56 (3/9) º")
+    print(f"Resultado: {razao:.2%}")
+    assert razao < 0.05, "Texto em português não deveria ser considerado ilegível"
+    print("✅ Passou\n")
+
+    doc.close()
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Teste do estado compartilhado entre workers: bancos SQLite em modo WAL,
+cache com validade visto por outros processos, baldes de tokens sem gasto
+duplicado, cotas e continuações comuns, limites e pausa do Gemini após
+um 429 (mesmo sem RPM/TPM, só com COMPARTILHADO) e cache de respostas da LLM em chamar_gemini.
+"""
+import sys
+import os
+import time
+import asyncio
+import tempfile
+import subprocess
+
+# Adiciona o diretório pai ao path para importar a API
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from fastapi import HTTPException
+from apoio import RespostaFalsa
+import api_rapida
+from compartilhado import BancoCompartilhado, LimiteGemini, limites_gemini
+from artefatos import ArmazemArtefatos
+from livro_transacoes import LivroTransacoes
+from cotas import CotasUsuarios
+from continuacoes import ArmazemContinuacoes, ContinuacoesCompartilhadas
+
+CHAMADAS = []
+
+class ErroCota(Exception):
+    code = 429
+
+def gemini_falso(model=None, contents=None, **kwargs):
+    CHAMADAS.append(contents)
+    if "ESGOTADO" in str(contents):
+        raise ErroCota("429 RESOURCE_EXHAUSTED")
+    return RespostaFalsa(f"resposta {len(CHAMADAS)}")
+
+def em_outro_processo(codigo: str) -> str:
+    """
+    Executa 'codigo' em um processo novo (como outro worker) e retorna a saída.
+    """
+    resultado = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    return resultado.stdout.strip()
+
+async def chamar_duas_vezes(prompt) -> tuple:
+    primeira = await api_rapida.chamar_gemini(prompt)
+    await api_rapida.gerenciador_encerramento.aguardar_gravacoes()
+    segunda = await api_rapida.chamar_gemini(prompt)
+    return primeira, segunda
+
+async def pausa_apos_429(limite: LimiteGemini) -> float:
+    await limite.registrar_429()
+    inicio = time.monotonic()
+    await limite.aguardar(100)
+    return time.monotonic() - inicio
+
+def testar_casos():
+    """
+    Testa o WAL, o cache entre processos, os baldes, as cotas, as continuações, o limite do Gemini e o cache de respostas.
+    """
+    print("🧪 TESTANDO ESTADO COMPARTILHADO ENTRE WORKERS\n")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.cotas_usuarios.tokens_dia = 0
+
+    with tempfile.TemporaryDirectory() as pasta:
+        arquivo = os.path.join(pasta, "compartilhado.db")
+        banco = BancoCompartilhado(arquivo)
+
+        # Teste 1: Todos os bancos SQLite abrem em modo WAL
+        print("Teste 1: Modo WAL")
+        modos = {
+            "compartilhado": banco._conectar().execute("PRAGMA journal_mode").fetchone()[0],
+            "artefatos": ArmazemArtefatos(os.path.join(pasta, "artefatos"))._conectar().execute("PRAGMA journal_mode").fetchone()[0],
+            "livro": LivroTransacoes(str.lower, os.path.join(pasta, "livro.db"))._conectar().execute("PRAGMA journal_mode").fetchone()[0],
+        }
+        print(f"Resultado: {modos}")
+        assert set(modos.values()) == {"wal"}
+        print("✅ Passou\n")
+
+        # Teste 2: Outro processo lê o que este gravou (e grava de volta); entradas vencidas somem
+        print("Teste 2: Cache entre processos")
+        banco.guardar("categorizacoes", "7", {"padaria": {"categoria": "ALIMENTACAO", "subcategoria": "Padaria"}}, 60)
+        banco.guardar("categorizacoes", "8", {}, 0)
+        saida = em_outro_processo(
+            "from compartilhado import BancoCompartilhado\n"
+            f"banco = BancoCompartilhado({arquivo!r})\n"
+            "print(banco.obter('categorizacoes', '7')['padaria']['categoria'], banco.obter('categorizacoes', '8'))\n"
+            "banco.guardar('respostas_llm', 'abc', 'texto do outro worker', 60)\n")
+        print(f"Resultado: {saida!r} | {banco.obter('respostas_llm', 'abc')!r}")
+        assert saida == "ALIMENTACAO None" and banco.obter("respostas_llm", "abc") == "texto do outro worker"
+        assert banco.remover("respostas_llm", "abc") and banco.obter("respostas_llm", "abc") is None
+        print("✅ Passou\n")
+
+        # Teste 3: Vários processos disputando o mesmo balde não gastam mais que o saldo
+        print("Teste 3: Balde de tokens entre processos")
+        codigo = ("from compartilhado import BancoCompartilhado\n"
+                  f"banco = BancoCompartilhado({arquivo!r})\n"
+                  "print(sum(banco.reservar({'teste': (20, 3600, 1)}) == 0 for _ in range(10)))\n")
+        processos = [subprocess.Popen([sys.executable, "-c", codigo], cwd=RAIZ, stdout=subprocess.PIPE, text=True)
+                     for _ in range(4)]
+        conseguiram = [int(p.communicate()[0]) for p in processos]
+        espera = banco.reservar({"teste": (20, 3600, 1)})
+        print(f"Resultado: {conseguiram} reservas (total {sum(conseguiram)}), próxima em {espera:.0f}s")
+        assert sum(conseguiram) == 20 and 170 < espera <= 180
+        print("✅ Passou\n")
+
+        # Teste 4: Cotas e continuações valem para todos os workers
+        print("Teste 4: Cotas e continuações compartilhadas")
+        worker_a = CotasUsuarios(paginas_minuto=10, tokens_dia=0, por_usuario={}, banco=banco)
+        worker_b = CotasUsuarios(paginas_minuto=10, tokens_dia=0, por_usuario={}, banco=BancoCompartilhado(arquivo))
+        worker_a.consumir_paginas(5, 8)
+        try:
+            worker_b.verificar(5, 3, 0)
+            assert False, "a cota gasta no worker A vale no worker B"
+        except HTTPException as e:
+            assert e.status_code == 429
+        assert worker_b.status(5)["paginas_minuto"]["consumido"] == 8
+        worker_a.verificar(6, 6, 0)
+        try:
+            worker_b.verificar(6, 6, 0)
+            assert False, "a reserva do worker A já consumiu as páginas: o B não passa com o mesmo saldo"
+        except HTTPException as e:
+            assert e.status_code == 429
+        assert worker_b.status(6)["paginas_minuto"]["consumido"] == 6
+
+        continuacoes_a = ContinuacoesCompartilhadas(banco)
+        continuacoes_b = ContinuacoesCompartilhadas(BancoCompartilhado(arquivo))
+        token = continuacoes_a.salvar(b"%PDF-1.4 teste", None, 5, None, [3, 2], {"transactions": []})
+        continuacoes_b.atualizar(token, [3], {"transactions": [{"valor": 1.0}]})
+        trabalho = continuacoes_a.obter(token)
+        assert trabalho["pdf_bytes"] == b"%PDF-1.4 teste" and trabalho["paginas"] == [3] and len(continuacoes_b) == 1
+        continuacoes_b.concluir(token)
+        assert continuacoes_a.obter(token) is None
+        assert os.stat(arquivo).st_mode & 0o777 == 0o600, "o banco guarda PDFs e senhas: só o dono lê"
+
+        # Acima do máximo de documentos (somados entre os workers), os mais antigos saem
+        limitadas = ContinuacoesCompartilhadas(banco, max_documentos=2)
+        tokens = [limitadas.salvar(b"%PDF", "senha", 5, None, [2], {"transactions": []}) for _ in range(3)]
+        assert limitadas.obter(tokens[0]) is None and limitadas.obter(tokens[2]) is not None
+        assert len(continuacoes_b) == 2 and limitadas.metricas()["expirados"] == 1
+        for t in tokens[1:]:
+            limitadas.concluir(t)
+
+        checkpoint = os.path.join(pasta, "continuacoes.json.gz")
+        antigo = ArmazemContinuacoes()
+        token_antigo = antigo.salvar(b"%PDF", None, 6, None, [4], {"transactions": []})
+        antigo.gravar(checkpoint)
+        assert continuacoes_a.carregar(checkpoint) == 1 and continuacoes_b.obter(token_antigo)["user_id"] == 6
+        print(f"Resultado: cota gasta em A recusada em B; continuação {token[:8]}... salva em A, concluída em B")
+        print("✅ Passou\n")
+
+        # Teste 5: Um 429 pausa todos os workers
+        print("Teste 5: Pausa do Gemini após 429")
+        limite = LimiteGemini(banco, rpm=600, tpm=100000, pausa_429_s=0.3)
+        assert em_outro_processo(
+            "from compartilhado import BancoCompartilhado\n"
+            f"banco = BancoCompartilhado({arquivo!r})\n"
+            "print(banco.reservar({'gemini:requisicoes': (600, 60, 1)}) == 0)\n") == "True"
+        esperou = asyncio.run(pausa_apos_429(limite))
+        print(f"Resultado: esperou {esperou:.2f}s | {limite.metricas()}")
+        assert 0.25 <= esperou < 1 and limite.respostas_429 == 1 and limite.chamadas_esperaram == 1
+
+        # Sem RPM/TPM a pausa também vale (balde gemini:pausa), inclusive para outro worker
+        sem_limites = LimiteGemini(banco, rpm=0, tpm=0, pausa_429_s=0.3)
+        esperou_sem_limites = asyncio.run(pausa_apos_429(sem_limites))
+        asyncio.run(sem_limites.registrar_429())
+        saldo_pausa = float(em_outro_processo(
+            "from compartilhado import BancoCompartilhado\n"
+            f"print(BancoCompartilhado({arquivo!r}).saldo('gemini:pausa', 1, 1)[0])\n"))
+        print(f"Resultado sem RPM/TPM: esperou {esperou_sem_limites:.2f}s; saldo da pausa no outro worker {saldo_pausa:.2f}")
+        assert not sem_limites.ativo and 0.25 <= esperou_sem_limites < 1 and saldo_pausa < 0
+        time.sleep(0.3)
+
+        # Com vários workers e sem GEMINI_RPM/GEMINI_TPM, valem os limites do nível 1 do modelo
+        padroes = em_outro_processo(
+            "import os\nos.environ['WEB_CONCURRENCY'] = '2'\n"
+            "from compartilhado import limites_gemini\n"
+            "print(limites_gemini('gemini-2.5-flash-lite'), limites_gemini('modelo-desconhecido'))\n")
+        print(f"Resultado padrões com 2 workers: {padroes} | com 1: {limites_gemini('gemini-2.5-flash-lite')}")
+        assert padroes == "(4000, 4000000) (0, 0)" and limites_gemini("gemini-2.5-flash-lite") == (0, 0)
+        print("✅ Passou\n")
+
+        # Teste 6: chamar_gemini: prompt repetido sai do cache (só texto); 429 pausa mesmo sem RPM/TPM
+        print("Teste 6: Cache de respostas e 429 em chamar_gemini")
+        api_rapida.COMPARTILHADO = True
+        api_rapida.CACHE_RESPOSTAS = True
+        api_rapida.banco_compartilhado = banco
+        api_rapida.limite_gemini = LimiteGemini(banco, rpm=0, tpm=0, pausa_429_s=0.1)
+        primeira, segunda = asyncio.run(chamar_duas_vezes("Extraia as transações da página 1"))
+        assert primeira.text == segunda.text == "resposta 1" and len(CHAMADAS) == 1
+        assert not api_rapida.resposta_truncada(segunda)
+        asyncio.run(chamar_duas_vezes([{"text": "página 1"}]))
+        assert len(CHAMADAS) == 3, "partes multimodais não usam o cache"
+        try:
+            asyncio.run(api_rapida.chamar_gemini("ESGOTADO"))
+            assert False, "o 429 chega a quem chamou"
+        except ErroCota:
+            pass
+        print(f"Resultado: {len(CHAMADAS)} chamadas; limite {api_rapida.limite_gemini.metricas()}")
+        assert api_rapida.limite_gemini.respostas_429 == 1
+        inicio = time.monotonic()
+        asyncio.run(api_rapida.chamar_gemini("Extraia as transações da página 2"))
+        assert time.monotonic() - inicio >= 0.05 and api_rapida.limite_gemini.chamadas_esperaram == 1, "a chamada seguinte espera a pausa"
+        print("✅ Passou\n")
+
+        # Teste 7: Com um worker (sem COMPARTILHADO) o limite não é consultado e um 429 não pausa nada
+        print("Teste 7: Um worker sem limite compartilhado")
+        api_rapida.COMPARTILHADO = False
+        api_rapida.CACHE_RESPOSTAS = False
+        api_rapida.limite_gemini = LimiteGemini(BancoCompartilhado(os.path.join(pasta, "nao_usado.db")), pausa_429_s=5)
+        try:
+            asyncio.run(api_rapida.chamar_gemini("ESGOTADO"))
+            assert False, "o 429 chega a quem chamou"
+        except ErroCota:
+            pass
+        inicio = time.monotonic()
+        asyncio.run(api_rapida.chamar_gemini("Extraia as transações da página 3"))
+        esperou = time.monotonic() - inicio
+        print(f"Resultado: esperou {esperou:.2f}s; limite {api_rapida.limite_gemini.metricas()}")
+        assert esperou < 1 and api_rapida.limite_gemini.respostas_429 == 0
+        assert not os.path.exists(os.path.join(pasta, "nao_usado.db")), "sem COMPARTILHADO o banco nem é criado"
+        print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Teste da leitura da configuração: valores vazios, inválidos ou abaixo do
+mínimo usam o padrão (com AVISO) em vez de derrubar a importação da API.
+"""
+import sys
+import os
+import subprocess
+
+# Adiciona o diretório pai ao path para importar a API
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(RAIZ)
+
+from inicializacao import ler_inteiro, ler_decimal
+
+def testar_casos():
+    """
+    Testa ler_inteiro/ler_decimal e a importação da API com variáveis inválidas.
+    """
+    print("🧪 TESTANDO LEITURA DA CONFIGURAÇÃO\n")
+
+    # Teste 1: Inteiros e decimais válidos, vazios, inválidos e abaixo do mínimo
+    print("Teste 1: ler_inteiro e ler_decimal")
+    casos = {"T_VAZIO": "", "T_TEXTO": "abc", "T_NEGATIVO": "-3", "T_INTEIRO": "7", "T_VIRGULA": "1,5", "T_NAN": "nan"}
+    os.environ.update(casos)
+    try:
+        lidos = [ler_inteiro("T_VAZIO", 10), ler_inteiro("T_TEXTO", 10), ler_inteiro("T_NEGATIVO", 10, minimo=1),
+                 ler_inteiro("T_INTEIRO", 10), ler_decimal("T_VIRGULA", 2), ler_decimal("T_NAN", 2),
+                 ler_decimal("T_NEGATIVO", 2, minimo=0), ler_decimal("T_AUSENTE", 2)]
+    finally:
+        for nome in casos:
+            del os.environ[nome]
+    print(f"Resultado: {lidos}")
+    assert lidos == [10, 10, 10, 7, 1.5, 2.0, 2.0, 2.0]
+    print("✅ Passou\n")
+
+    # Teste 2: A API importa com configuração inválida (antes: ValueError na importação)
+    print("Teste 2: Importação com variáveis inválidas")
+    ambiente = {**os.environ, "GOOGLE_API_KEY": "teste", "ADMISSAO_MAX_PAGINAS": "", "ESCALONADOR_GEMINI_CONCORRENCIA": "abc",
+                "PRAZO_FRACAO_OCR": "meio", "TOKENFILE_LIMIT": "x"}
+    resultado = subprocess.run(
+        [sys.executable, "-c", "import api_rapida as a, admissao; print(admissao.ADMISSAO_MAX_PAGINAS, a.ESCALONADOR_GEMINI_CONCORRENCIA, "
+                               "a.TOKENFILE_LIMIT, __import__('prazos').PRAZO_FRACAO_OCR)"],
+        cwd=RAIZ, env=ambiente, capture_output=True, text=True)
+    avisos = [linha for linha in resultado.stdout.splitlines() if linha.startswith("AVISO:") and "usando" in linha]
+    print(f"Resultado: {resultado.stdout.splitlines()[-1] if resultado.stdout else resultado.stderr[-300:]}")
+    assert resultado.returncode == 0 and resultado.stdout.splitlines()[-1] == "150 32 100000 0.5"
+    assert len(avisos) == 3, avisos
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Teste do encerramento gracioso: gravações pendentes concluídas, novos
+documentos recusados, trabalhos de background salvos e retomados,
+continuações preservadas, o ciclo de vida completo da aplicação, a recusa
+já no sinal e o webhook retomado sem processar nem enviar às cegas de novo.
+"""
+import sys
+import os
+import json
+import signal
+import asyncio
+import tempfile
+
+import httpx
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import criar_pdf_teste
+import api_rapida
+from encerramento import GerenciadorEncerramento
+from continuacoes import ArmazemContinuacoes
+
+GRAVADOS = []
+EXECUCOES = []
+
+async def gravacao_lenta(nome: str):
+    await asyncio.sleep(0.2)
+    GRAVADOS.append(nome)
+
+async def trabalho_longo(file_url: str, user_id: int, duracao_s: float):
+    EXECUCOES.append(file_url)
+    await asyncio.sleep(duracao_s)
+
+async def drenar_com_trabalhos(gerenciador: GerenciadorEncerramento) -> dict:
+    gerenciador.gravar_depois(gravacao_lenta("categorizacoes"))
+    gerenciador.iniciar_trabalho(trabalho_longo, file_url="http://curto", user_id=1, duracao_s=0.05)
+    gerenciador.iniciar_trabalho(trabalho_longo, file_url="http://longo", user_id=2, duracao_s=60)
+    await asyncio.sleep(0)
+    return await gerenciador.drenar()
+
+async def retomar(gerenciador: GerenciadorEncerramento) -> int:
+    retomados = gerenciador.retomar_trabalhos({"trabalho_longo": trabalho_longo})
+    await asyncio.sleep(0)
+    return retomados
+
+async def ciclo_completo(app) -> tuple[int, int]:
+    async with api_rapida.ciclo_de_vida(app):
+        token = api_rapida.armazem_continuacoes.salvar(b"%PDF", None, 3, None, [2], {"transactions": []})
+        api_rapida.gerenciador_encerramento.gravar_depois(gravacao_lenta("livro"))
+    return len(api_rapida.armazem_continuacoes), token
+
+class ClienteFalso:
+    """
+    Cliente HTTP sem rede: o download falha na hora e o POST do webhook demora 'espera_s'.
+    """
+    def __init__(self, espera_s: float):
+        self.espera_s = espera_s
+        self.downloads = []
+        self.envios = []
+
+    async def get(self, url, **kwargs):
+        self.downloads.append(url)
+        raise httpx.ConnectError("sem rede")
+
+    async def post(self, url, json=None, headers=None, **kwargs):
+        self.envios.append((headers["Idempotency-Key"], json["success"]))
+        await asyncio.sleep(self.espera_s)
+
+async def webhook_interrompido() -> dict:
+    api_rapida.gerenciador_encerramento.iniciar_trabalho(
+        api_rapida.processar_e_enviar_webhook, file_url="http://pdf", webhook_url="http://destino", user_id=4,
+        chave_idempotencia="chave-1")
+    await asyncio.sleep(0.05)
+    return await api_rapida.gerenciador_encerramento.drenar()
+
+async def webhook_retomado() -> int:
+    retomados = api_rapida.gerenciador_encerramento.retomar_trabalhos(
+        {"processar_e_enviar_webhook": api_rapida.processar_e_enviar_webhook})
+    await asyncio.gather(*api_rapida.gerenciador_encerramento._trabalhos)
+    return retomados
+
+def testar_casos():
+    """
+    Testa a drenagem, a recusa durante o encerramento, a retomada, o checkpoint e o ciclo de vida.
+    """
+    print("🧪 TESTANDO ENCERRAMENTO GRACIOSO\n")
+
+    with tempfile.TemporaryDirectory() as pasta:
+        # Teste 1: Gravações concluídas, trabalho curto termina, trabalho longo é salvo
+        print("Teste 1: Drenagem")
+        gerenciador = GerenciadorEncerramento(pasta, prazo_s=0.5)
+        resumo = asyncio.run(drenar_com_trabalhos(gerenciador))
+        print(f"Resultado: {resumo}")
+        assert GRAVADOS == ["categorizacoes"]
+        assert resumo["trabalhos_concluidos"] == 1 and resumo["trabalhos_salvos"] == 1 and resumo["segundos"] < 2
+        with open(os.path.join(pasta, "trabalhos_pendentes.json"), encoding="utf-8") as f:
+            salvos = json.load(f)
+        assert salvos == [{"funcao": "trabalho_longo", "parametros": {"file_url": "http://longo", "user_id": 2, "duracao_s": 60}}]
+        print("✅ Passou\n")
+
+        # Teste 2: Durante o encerramento, novos documentos recebem 503 com Retry-After
+        print("Teste 2: Recusa durante o encerramento")
+        api_rapida.gerenciador_encerramento.iniciar_encerramento()
+        resposta = asyncio.run(api_rapida._processar_bytes_sync(criar_pdf_teste([["05/01 LOJA X R$ 10,90"]]), 1))
+        print(f"Resultado: {resposta.status_code} {json.loads(resposta.body)['error_message']}")
+        assert resposta.status_code == 503 and resposta.headers["retry-after"] == "10"
+        api_rapida.gerenciador_encerramento = GerenciadorEncerramento(pasta)
+        print("✅ Passou\n")
+
+        # Teste 3: Na subida seguinte, o trabalho salvo recomeça com os mesmos parâmetros
+        print("Teste 3: Retomada")
+        EXECUCOES.clear()
+        novo = GerenciadorEncerramento(pasta)
+        retomados = asyncio.run(retomar(novo))
+        print(f"Resultado: {retomados} retomado(s): {EXECUCOES}")
+        assert retomados == 1 and EXECUCOES == ["http://longo"]
+        assert not os.path.exists(os.path.join(pasta, "trabalhos_pendentes.json"))
+        print("✅ Passou\n")
+
+        # Teste 4: Continuações sobrevivem ao reinício (e as expiradas não voltam)
+        print("Teste 4: Checkpoint das continuações")
+        armazem = ArmazemContinuacoes()
+        token = armazem.salvar(b"%PDF-1.4 teste", "senha", 7, "auto", [3, 2], {"transactions": [{"valor": 1.0}]})
+        expirado = ArmazemContinuacoes(ttl_s=0)
+        arquivo = os.path.join(pasta, "continuacoes.json.gz")
+        assert armazem.gravar(arquivo) == 1 and expirado.gravar(arquivo + ".vazio") == 0
+        assert oct(os.stat(arquivo).st_mode & 0o777) == "0o600"
+        reiniciado = ArmazemContinuacoes()
+        assert reiniciado.carregar(arquivo) == 1 and not os.path.exists(arquivo)
+        trabalho = reiniciado.obter(token)
+        print(f"Resultado: {token[:8]}... páginas {trabalho['paginas']}")
+        assert trabalho["pdf_bytes"] == b"%PDF-1.4 teste" and trabalho["paginas"] == [2, 3] and trabalho["user_id"] == 7
+        print("✅ Passou\n")
+
+        # Teste 5: Ciclo de vida da aplicação: grava a continuação na parada e recupera na subida
+        print("Teste 5: Ciclo de vida")
+        GRAVADOS.clear()
+        api_rapida.AQUECIMENTO = False
+        api_rapida.ARQUIVO_CONTINUACOES = os.path.join(pasta, "continuacoes_api.json.gz")
+        pendentes, token = asyncio.run(ciclo_completo(api_rapida.app))
+        assert GRAVADOS == ["livro"] and api_rapida.http_client.is_closed
+        assert os.path.exists(api_rapida.ARQUIVO_CONTINUACOES)
+        api_rapida.armazem_continuacoes = ArmazemContinuacoes()
+        assert api_rapida.armazem_continuacoes.carregar(api_rapida.ARQUIVO_CONTINUACOES) == 1
+        print(f"Resultado: {pendentes} continuação(ões) gravada(s) e recuperada(s); cliente HTTP fechado")
+        assert api_rapida.armazem_continuacoes.obter(token)["user_id"] == 3
+        print("✅ Passou\n")
+
+        # Teste 6: O sinal marca o encerramento e segue para o tratador anterior (o do uvicorn em cada worker)
+        print("Teste 6: Recusa já no sinal")
+        recebidos = []
+        anterior = signal.signal(signal.SIGINT, lambda numero, quadro: recebidos.append(numero))
+        try:
+            gerenciador = GerenciadorEncerramento(pasta)
+            with gerenciador.capturar_sinais():
+                signal.raise_signal(signal.SIGINT)
+            restaurado = signal.getsignal(signal.SIGINT)
+        finally:
+            signal.signal(signal.SIGINT, anterior)
+        print(f"Resultado: encerrando={gerenciador.encerrando}, sinais repassados {recebidos}")
+        assert gerenciador.encerrando and recebidos == [signal.SIGINT]
+        assert restaurado is not None and restaurado.__name__ == "<lambda>", "o tratador anterior volta ao sair"
+        print("✅ Passou\n")
+
+        # Teste 7: Webhook interrompido no envio: a retomada só reenvia o resultado, com a mesma chave
+        print("Teste 7: Webhook retomado")
+        http_client = api_rapida.http_client
+        api_rapida.http_client = ClienteFalso(espera_s=60)
+        api_rapida.gerenciador_encerramento = GerenciadorEncerramento(pasta, prazo_s=0.3)
+        try:
+            resumo = asyncio.run(webhook_interrompido())
+            with open(os.path.join(pasta, "trabalhos_pendentes.json"), encoding="utf-8") as f:
+                salvo = json.load(f)[0]["parametros"]
+            api_rapida.http_client.espera_s = 0
+            api_rapida.gerenciador_encerramento = GerenciadorEncerramento(pasta)
+            retomados = asyncio.run(webhook_retomado())
+            cliente = api_rapida.http_client
+        finally:
+            api_rapida.http_client = http_client
+        print(f"Resultado: {resumo['trabalhos_salvos']} salvo, {retomados} retomado; downloads {cliente.downloads}, envios {cliente.envios}")
+        assert salvo["chave_idempotencia"] == "chave-1" and salvo["resultado"]["success"] is False
+        assert cliente.downloads == ["http://pdf"], "o PDF não é baixado nem processado de novo"
+        assert cliente.envios == [("chave-1", False), ("chave-1", False)]
+        print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Teste da fila justa entre usuários (ordem de atendimento, pesos,
+cancelamento) e das cotas por usuário (páginas/minuto, tokens/dia):
+desligadas por padrão, conferidas e consumidas num passo só, usuários
+ociosos descartados e consulta sem criar baldes.
+"""
+import sys
+import os
+import json
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+import fitz
+import apoio  # arquivos de dados numa pasta temporária
+import api_rapida
+from fastapi import HTTPException
+from escalonador import EscalonadorJusto
+import cotas as modulo_cotas
+from cotas import CotasUsuarios, BaldeTokens
+
+async def ordem_atendimento(pedidos: list[tuple[str, int]], pesos: dict | None = None) -> list[str]:
+    """
+    Com uma vaga só, ocupa o escalonador, enfileira os pedidos (usuario, quantidade)
+    na ordem dada e retorna a ordem em que foram atendidos.
+    """
+    escalonador = EscalonadorJusto(1, lambda u: (pesos or {}).get(u, 1.0))
+    ordem = []
+    liberar = asyncio.Event()
+
+    async def ocupar():
+        async with escalonador.vez("ocupante"):
+            await liberar.wait()
+
+    async def chamada(usuario: str):
+        async with escalonador.vez(usuario):
+            ordem.append(usuario)
+            await asyncio.sleep(0)
+
+    ocupante = asyncio.create_task(ocupar())
+    await asyncio.sleep(0)
+    tarefas = []
+    for usuario, quantidade in pedidos:
+        for _ in range(quantidade):
+            tarefas.append(asyncio.create_task(chamada(usuario)))
+            await asyncio.sleep(0)
+    liberar.set()
+    await asyncio.gather(ocupante, *tarefas)
+    assert escalonador.livres == 1 and escalonador.metricas()["na_fila"] == 0
+    return ordem
+
+async def cancelar_na_fila() -> int:
+    escalonador = EscalonadorJusto(1)
+    async with escalonador.vez("a"):
+        esperando = asyncio.create_task(escalonador.vez("b").__aenter__())
+        await asyncio.sleep(0)
+        esperando.cancel()
+        await asyncio.gather(esperando, return_exceptions=True)
+    async with escalonador.vez("c"):
+        pass
+    return escalonador.livres
+
+def criar_pdf_teste(paginas: int) -> bytes:
+    doc = fitz.open()
+    for p in range(paginas):
+        doc.new_page().insert_text((50, 60), f"05/01 LOJA {p} R$ 10,90", fontsize=9)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def testar_casos():
+    """
+    Testa a fila justa, os pesos, o cancelamento, os baldes de cota e a recusa por cota na API.
+    """
+    print("🧪 TESTANDO ESCALONADOR JUSTO E COTAS\n")
+
+    # Teste 1: Quem chega depois com pouco trabalho não espera todo o trabalho de quem chegou antes
+    print("Teste 1: Fila justa")
+    ordem = asyncio.run(ordem_atendimento([("pesado", 6), ("leve", 2)]))
+    print(f"Resultado: {ordem}")
+    assert ordem[:4].count("leve") == 2, "as duas chamadas do leve devem intercalar com as do pesado"
+    print("✅ Passou\n")
+
+    # Teste 2: Peso 2 recebe o dobro da vez
+    print("Teste 2: Pesos")
+    ordem = asyncio.run(ordem_atendimento([("a", 6), ("b", 6)], {"b": 2.0}))
+    print(f"Resultado: {ordem}")
+    assert ordem[:6].count("b") == 4 and ordem[:6].count("a") == 2
+    print("✅ Passou\n")
+
+    # Teste 3: Cancelado na fila não ocupa vaga
+    print("Teste 3: Cancelamento na fila")
+    livres = asyncio.run(cancelar_na_fila())
+    print(f"Resultado: {livres} vaga livre")
+    assert livres == 1
+    print("✅ Passou\n")
+
+    # Teste 4: Baldes de cota por usuário
+    print("Teste 4: Cotas")
+    balde = BaldeTokens(60, 60)
+    balde.consumir(90)
+    assert balde.disponivel() < -29 and 29 < balde.espera_para(1) < 32
+    assert balde.espera_para(1000) <= 121, "pedido maior que o balde espera só até encher"
+    cotas = CotasUsuarios(paginas_minuto=10, tokens_dia=0, por_usuario={"7": {"peso": 3, "paginas_minuto": 100}})
+    cotas.verificar(1, 10, 10**9)
+    try:
+        cotas.verificar(1, 1, 0)
+        assert False, "Cota de páginas esgotada deveria recusar"
+    except HTTPException as e:
+        assert e.status_code == 429 and int(e.headers["Retry-After"]) >= 1
+    cotas.verificar(7, 50, 0)
+    status = cotas.status(1)
+    print(f"Resultado: {status}")
+    assert status["paginas_minuto"]["consumido"] == 10 and status["tokens_dia"]["limite"] == 0
+    assert cotas.peso(7) == 3.0 and cotas.peso(1) == 1.0
+    print("✅ Passou\n")
+
+    # Teste 4.1: Desligadas por padrão; a consulta não cria baldes; ociosos saem da memória
+    print("Teste 4.1: Padrão, consulta e descarte de ociosos")
+    assert "COTA_PAGINAS_MINUTO" in os.environ or modulo_cotas.COTA_PAGINAS_MINUTO == 0
+    assert "COTA_TOKENS_DIA" in os.environ or modulo_cotas.COTA_TOKENS_DIA == 0
+    cotas = CotasUsuarios(paginas_minuto=10, tokens_dia=0, por_usuario={}, max_usuarios=3)
+    situacao = cotas.status(50)
+    assert situacao["paginas_minuto"]["disponivel"] == 10 and cotas.metricas()["usuarios"] == 0
+    cotas.verificar(1, 10, 0)
+    for usuario in range(2, 6):
+        cotas.verificar(usuario, 1, 0)
+        cotas.devolver_paginas(usuario, 1)  # documento recusado na fila: o balde volta a ficar cheio
+    print(f"Resultado: {cotas.metricas()}")
+    assert 1 in cotas._baldes and len(cotas._baldes) <= 3 and cotas.descartados >= 2
+    escalonador = EscalonadorJusto(2, max_usuarios=3)
+    async def um_por_usuario():
+        for usuario in range(10):
+            async with escalonador.vez(usuario):
+                pass
+    asyncio.run(um_por_usuario())
+    assert len(escalonador._por_usuario) <= 3 and escalonador.metricas()["descartados"] >= 7
+    print("✅ Passou\n")
+
+    # Teste 5: API recusa com 429 quem passou da cota e reporta em /cotas/{user_id}
+    print("Teste 5: Cota na API")
+    api_rapida.cotas_usuarios.por_usuario["77"] = {"paginas_minuto": 3}
+    situacao = json.loads(asyncio.run(api_rapida.cotas_endpoint(77)).body)
+    assert 77 not in api_rapida.cotas_usuarios._baldes, "GET /cotas só consulta"
+    api_rapida.cotas_usuarios.consumir_paginas(77, 3)
+    resposta = asyncio.run(api_rapida._processar_bytes_sync(criar_pdf_teste(4), 77, None, None))
+    corpo = json.loads(resposta.body)
+    print(f"Resultado: {resposta.status_code} {corpo['error_message']} (Retry-After {resposta.headers.get('retry-after')})")
+    assert resposta.status_code == 429 and int(resposta.headers["retry-after"]) >= 1
+    situacao = json.loads(asyncio.run(api_rapida.cotas_endpoint(77)).body)
+    assert situacao["paginas_minuto"]["limite"] == 3 and situacao["escalonador"]["gemini"]["na_fila"] == 0
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Teste da corrida entre a extração nativa e o OCR especulativo: a página
+nativa pronta cancela na hora o OCR dela, e o OCR que vence todas as
+páginas cancela a extração nativa que falta.
+"""
+import sys
+import os
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import criar_pdf_teste
+import api_rapida
+
+CANCELADAS = []
+
+def pdf_tres_paginas() -> bytes:
+    return criar_pdf_teste([[f"{d:02d}/0{p} IFOOD *RESTAURANTE PAGINA {p} R$ {d},90" for d in range(1, 8)] for p in (1, 2, 3)])
+
+def ocr_com_espera(espera_s: float):
+    """
+    OCR falso que demora 'espera_s' e anota as páginas cujas chamadas foram canceladas.
+    """
+    async def ocr(doc, paginas: list[dict]) -> list[dict]:
+        try:
+            await asyncio.sleep(espera_s)
+        except asyncio.CancelledError:
+            CANCELADAS.extend(p["pagina"] for p in paginas)
+            raise
+        return [{"pagina": p["pagina"], "sucesso": True, "texto": f"TEXTO DO OCR DA PAGINA {p['pagina']}"} for p in paginas]
+    return ocr
+
+async def nativo_lento(doc, indices=None, ao_extrair=None):
+    try:
+        await asyncio.sleep(30)
+    except asyncio.CancelledError:
+        CANCELADAS.append("nativa")
+        raise
+
+async def extrair(pdf_bytes: bytes) -> tuple[dict, float, list]:
+    doc = api_rapida.abrir_documento(pdf_bytes, None)
+    avisadas = []
+    async def pagina_extraida(i: int):
+        avisadas.append(i)
+    inicio = time.perf_counter()
+    try:
+        textos = await api_rapida.extrair_paginas_documento(doc, {0: "nativo", 1: "nativo", 2: "nativo"}, pagina_extraida)
+    finally:
+        doc.close()
+    return textos, time.perf_counter() - inicio, avisadas
+
+def testar_casos():
+    """
+    Testa a vitória do nativo (OCR cancelado por página) e a do OCR (extração nativa cancelada).
+    """
+    print("🧪 TESTANDO OCR ESPECULATIVO\n")
+    api_rapida.ESPECULACAO_OCR = True
+    api_rapida.ESPECULACAO_LIMIAR = 0
+    api_rapida.ESPECULACAO_CHAMADAS_OCR = True
+    metricas = api_rapida.METRICAS["especulacao"]
+    ocr_original = api_rapida.ocr_pacote_renderizado
+    nativo_original = api_rapida.extrair_texto_nativo_por_paginas
+
+    try:
+        # Teste 1: Texto nativo vence: as chamadas de OCR das páginas são canceladas, sem esperar
+        print("Teste 1: Nativo vence")
+        CANCELADAS.clear()
+        antes = dict(metricas)
+        api_rapida.ocr_pacote_renderizado = ocr_com_espera(30)
+        textos, segundos, avisadas = asyncio.run(extrair(pdf_tres_paginas()))
+        print(f"Resultado: {sorted(textos)} em {segundos:.2f}s, OCR cancelado nas páginas {sorted(CANCELADAS)}")
+        assert sorted(textos) == [0, 1, 2] and all("IFOOD" in texto for texto in textos.values())
+        assert sorted(CANCELADAS) == [1, 2, 3] and segundos < 10 and sorted(avisadas) == [0, 1, 2]
+        assert metricas["vitorias_nativo"] - antes["vitorias_nativo"] == 3
+        assert metricas["chamadas_ocr_desperdicadas"] - antes["chamadas_ocr_desperdicadas"] == 3
+        print("✅ Passou\n")
+
+        # Teste 2: OCR vence todas as páginas: a extração nativa é cancelada
+        print("Teste 2: OCR vence")
+        CANCELADAS.clear()
+        antes = dict(metricas)
+        api_rapida.ocr_pacote_renderizado = ocr_com_espera(0)
+        api_rapida.extrair_texto_nativo_por_paginas = nativo_lento
+        textos, segundos, avisadas = asyncio.run(extrair(pdf_tres_paginas()))
+        print(f"Resultado: {sorted(textos)} em {segundos:.2f}s, canceladas {CANCELADAS}")
+        assert sorted(textos) == [0, 1, 2] and all("OCR" in texto for texto in textos.values())
+        assert CANCELADAS == ["nativa"] and segundos < 10 and sorted(avisadas) == [0, 1, 2]
+        assert metricas["vitorias_ocr"] - antes["vitorias_ocr"] == 3
+        assert metricas["nativas_canceladas"] - antes["nativas_canceladas"] == 1
+        print("✅ Passou\n")
+    finally:
+        api_rapida.ocr_pacote_renderizado = ocr_original
+        api_rapida.extrair_texto_nativo_por_paginas = nativo_original
+        api_rapida.ESPECULACAO_OCR = False
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Teste do livro de transações por usuário: leitura dos lançamentos da
+página (ano pelo período do documento, tipo pelo sinal), páginas já
+conhecidas sem LLM, categorização reaproveitada, compra x estorno e
+marcação de transações novas x já vistas em extratos sobrepostos.
+"""
+import sys
+import os
+import json
+import asyncio
+import sqlite3
+import tempfile
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import CHAMADAS, gemini_falso, buscar_categorizacoes_falsa, criar_pdf_teste, processar_e_aguardar
+import api_rapida
+from livro_transacoes import LivroTransacoes, linhas_candidatas, ESQUEMA
+from reconstrucao_tabelas import periodo_documento
+
+def testar_casos():
+    """
+    Testa a leitura dos lançamentos, o primeiro extrato, o extrato sobreposto e a separação por usuário.
+    """
+    print("🧪 TESTANDO LIVRO DE TRANSAÇÕES POR USUÁRIO\n")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.buscar_categorizacoes_usuario = buscar_categorizacoes_falsa
+    api_rapida.cotas_usuarios.paginas_minuto = 0
+    api_rapida.cotas_usuarios.tokens_dia = 0
+
+    # Segunda quinzena de janeiro com duas compras iguais no mesmo dia (faturas com vencimento em 2025)
+    janeiro = (["FATURA DO CARTÃO - VENCIMENTO 10/02/2025"] + [f"{d:02d}/01 LOJA JAN R$ {d},90" for d in range(16, 22)]
+               + ["21/01 LOJA JAN R$ 21,90"])
+    fevereiro = [f"{d:02d}/02 LOJA FEV R$ {d},50" for d in range(1, 7)]
+
+    with tempfile.TemporaryDirectory() as pasta:
+        api_rapida.livro_transacoes = LivroTransacoes(api_rapida.limpar_descricao_para_match, os.path.join(pasta, "livro.db"))
+
+        # Teste 1: Lançamentos da página (texto corrido e compacto); página ambígua fica com a LLM
+        print("Teste 1: Linhas candidatas")
+        candidatas = linhas_candidatas("FATURA\n05/01 LOJA X R$ 10,90\n06/01|LOJA Y|1.234,00-\nTotal R$ 1.244,90")
+        print(f"Resultado: {candidatas}")
+        assert candidatas == [("2025-01-05", "LOJA X", 10.9, "despesa"), ("2025-01-06", "LOJA Y", 1234.0, "receita")]
+        assert linhas_candidatas("FATURA\n05/01 LOJA X R$ 10,90\nLOJA SEM DATA R$ 3,00") is None
+        assert linhas_candidatas("05/01 LOJA X R$ 10,90") is None, "sem tipo de documento não há como saber o sinal"
+        assert linhas_candidatas("EXTRATO\n05/01 LOJA X R$ 10,90") is None, "extrato sem sinal algum fica com a LLM"
+        print("✅ Passou\n")
+
+        # Teste 1.1: Datas sem ano seguem o período do documento (dezembro na fatura de janeiro é do ano anterior)
+        print("Teste 1.1: Ano pelo período do documento")
+        periodo = periodo_documento("FATURA\nFechamento 03/01/2024 Vencimento 10/01/2024\nCompra em 3x 01/11/23")
+        candidatas = linhas_candidatas("20/12 LOJA DEZ R$ 5,00\n02/01 LOJA JAN R$ 6,00\n15/06/2023 LOJA JUN R$ 7,00",
+                                       "credit-card-statement", periodo)
+        print(f"Resultado: período {periodo} -> {[c[0] for c in candidatas]}")
+        assert periodo == (2024, 1)
+        assert [c[0] for c in candidatas] == ["2023-12-20", "2024-01-02", "2023-06-15"]
+        print("✅ Passou\n")
+
+        # Teste 1.2: Compra e estorno do mesmo valor são chaves diferentes
+        print("Teste 1.2: Compra x estorno")
+        livro = api_rapida.livro_transacoes
+        compra = {"data": "2025-03-05", "descricao": "LOJA X", "valor": 10.9, "tipo": "despesa"}
+        livro.registrar(9, [compra])
+        estorno = [{**compra, "tipo": "receita"}, dict(compra)]
+        livro.conciliar(9, estorno)
+        print(f"Resultado: chaves {livro.chave_transacao(estorno[0])} x {livro.chave_transacao(compra)}; novas {[t['nova'] for t in estorno]}")
+        assert [t["nova"] for t in estorno] == [True, False]
+        print("✅ Passou\n")
+
+        # Teste 1.3: Livro antigo (valor sem sinal) é migrado: despesas passam a negativas
+        print("Teste 1.3: Migração do livro antigo")
+        arquivo_antigo = os.path.join(pasta, "antigo.db")
+        conexao = sqlite3.connect(arquivo_antigo)
+        conexao.executescript(ESQUEMA)
+        for tipo, valor in (("despesa", 1090), ("receita", 500)):
+            conexao.execute("INSERT INTO transacoes VALUES (1, '2025-01-05', ?, ?, 1, ?, NULL, NULL, 0, 0)",
+                            (f"loja {tipo}", valor, json.dumps({"tipo": tipo})))
+        conexao.commit()
+        conexao.close()
+        migrado = LivroTransacoes(api_rapida.limpar_descricao_para_match, arquivo_antigo)
+        valores = migrado._conectar().execute("SELECT descricao, valor_centavos FROM transacoes ORDER BY descricao").fetchall()
+        print(f"Resultado: {valores}")
+        assert valores == [("loja despesa", -1090), ("loja receita", 500)]
+        assert migrado._conectar().execute("PRAGMA user_version").fetchone()[0] == 1
+        print("✅ Passou\n")
+
+        # Teste 2: Primeiro extrato: tudo novo e tudo na LLM
+        print("Teste 2: Primeiro extrato")
+        primeiro = asyncio.run(processar_e_aguardar(criar_pdf_teste([janeiro]), 9))
+        print(f"Resultado: {len(primeiro['transactions'])} transações, {sum(t['nova'] for t in primeiro['transactions'])} novas")
+        assert len(primeiro["transactions"]) == 7 and all(t["nova"] for t in primeiro["transactions"])
+        print("✅ Passou\n")
+
+        # Teste 3: Extrato sobreposto: a página de janeiro não vai para a LLM e sai marcada como já vista
+        print("Teste 3: Extrato sobreposto")
+        CHAMADAS.clear()
+        segundo = asyncio.run(processar_e_aguardar(criar_pdf_teste([janeiro, fevereiro]), 9))
+        vistas = [t for t in segundo["transactions"] if not t["nova"]]
+        novas = [t for t in segundo["transactions"] if t["nova"]]
+        print(f"Resultado: {len(vistas)} já vistas, {len(novas)} novas, {len(CHAMADAS)} chamadas")
+        # Com mais de uma página, a consolidação do documento já junta as repetições idênticas
+        assert len(vistas) == 6 and {t["descricao"] for t in vistas} == {"LOJA JAN"}
+        assert len(novas) == 6 and {t["descricao"] for t in novas} == {"LOJA FEV"}
+        assert not any("LOJA JAN" in c for c in CHAMADAS), "página conhecida não vai para a LLM"
+        assert all(t["categoria"] == "ALIMENTACAO" and t["pagina"] == 1 for t in vistas)
+        assert api_rapida.livro_transacoes.metricas()["paginas_puladas"] == 1
+        print("✅ Passou\n")
+
+        # Teste 4: Uma compra a mais no mesmo dia é nova; outro usuário não vê o livro do primeiro
+        print("Teste 4: Repetições e usuários")
+        CHAMADAS.clear()
+        terceiro = asyncio.run(processar_e_aguardar(criar_pdf_teste([janeiro + ["21/01 LOJA JAN R$ 21,90"]]), 9))
+        print(f"Resultado: {sum(t['nova'] for t in terceiro['transactions'])} nova(s), {len(CHAMADAS)} chamadas")
+        assert sum(t["nova"] for t in terceiro["transactions"]) == 1 and CHAMADAS
+        outro = asyncio.run(processar_e_aguardar(criar_pdf_teste([janeiro]), 10))
+        assert all(t["nova"] for t in outro["transactions"])
+        print("✅ Passou\n")
+
+        # Teste 5: Fatura de janeiro de 2024 com compras de dezembro: parser, livro e prompt datam igual
+        print("Teste 5: Fatura de janeiro de 2024 com compras de dezembro")
+        dezembro = (["FATURA DO CARTÃO - VENCIMENTO 10/01/2024"] + [f"{d:02d}/12 LOJA DEZ R$ {d},90" for d in range(5, 10)]
+                    + ["03/01 LOJA JAN R$ 3,90"])
+        api_rapida.PARSER_DETERMINISTICO = True
+        try:
+            parser = asyncio.run(processar_e_aguardar(criar_pdf_teste([dezembro]), 11))
+        finally:
+            api_rapida.PARSER_DETERMINISTICO = False
+        datas = sorted(t["data"] for t in parser["transactions"])
+        puladas = api_rapida.livro_transacoes.metricas()["paginas_puladas"]
+        CHAMADAS.clear()
+        repetida = asyncio.run(processar_e_aguardar(criar_pdf_teste([dezembro]), 11))
+        CHAMADAS.clear()
+        asyncio.run(processar_e_aguardar(criar_pdf_teste([dezembro]), 12))
+        prompt = next(c for c in CHAMADAS if "LOJA DEZ" in c and "DESCRIÇÕES PARA CATEGORIZAR" not in c)
+        print(f"Resultado: datas {datas[0]}..{datas[-1]}; repetida pulou "
+              f"{api_rapida.livro_transacoes.metricas()['paginas_puladas'] - puladas} página(s)")
+        assert datas[0] == "2023-12-05" and datas[-1] == "2024-01-03"
+        assert api_rapida.livro_transacoes.metricas()["paginas_puladas"] == puladas + 1
+        assert not any(t["nova"] for t in repetida["transactions"])
+        assert "PERÍODO DO DOCUMENTO" in prompt and "depois de 01 são de 2023" in prompt
+        print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Teste do processamento em lote: vários PDFs e zip no mesmo upload,
+categorizações do usuário buscadas uma vez, erros por documento e
+deduplicação das transações entre documentos.
+"""
+import sys
+import os
+import io
+import json
+import asyncio
+import zipfile
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import gemini_falso, criar_pdf_teste
+import api_rapida
+from fastapi import UploadFile
+
+BUSCAS = []
+
+async def buscar_categorizacoes_falsa(user_id: int) -> dict:
+    BUSCAS.append(user_id)
+    await asyncio.sleep(0.01)
+    return {"loja janeiro": {"categoria": "MERCADO", "subcategoria": "Supermercado"}}
+
+def criar_zip(arquivos: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as arquivo:
+        for nome, dados in arquivos.items():
+            arquivo.writestr(nome, dados)
+    return buffer.getvalue()
+
+def testar_casos():
+    """
+    Testa o lote por upload (PDF + zip + arquivo inválido), o resultado consolidado e os limites.
+    """
+    print("🧪 TESTANDO PROCESSAMENTO EM LOTE\n")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.buscar_categorizacoes_usuario = buscar_categorizacoes_falsa
+    api_rapida.cotas_usuarios.paginas_minuto = 0
+    api_rapida.cotas_usuarios.tokens_dia = 0
+
+    janeiro = criar_pdf_teste([[f"{d:02d}/01 LOJA JANEIRO R$ {d},90" for d in range(5, 15)]])
+    # Fevereiro repete o fim de janeiro (extratos com período sobreposto)
+    fevereiro = criar_pdf_teste([[f"{d:02d}/01 LOJA JANEIRO R$ {d},90" for d in range(12, 15)] +
+                                 [f"{d:02d}/02 LOJA FEVEREIRO R$ {d},50" for d in range(3, 10)]])
+    marco = criar_pdf_teste([[f"{d:02d}/03 LOJA MARCO R$ {d},10" for d in range(1, 8)]])
+    arquivos = [
+        UploadFile(file=io.BytesIO(janeiro), filename="janeiro.pdf"),
+        UploadFile(file=io.BytesIO(criar_zip({"fevereiro.pdf": fevereiro, "marco.pdf": marco, "leia-me.txt": b"x"})),
+                   filename="extratos.zip"),
+        UploadFile(file=io.BytesIO(b"nao sou um pdf"), filename="quebrado.pdf"),
+    ]
+
+    # Teste 1: Upload com PDF, zip e um arquivo inválido
+    print("Teste 1: Lote por upload")
+    resposta = asyncio.run(api_rapida.processar_lote_endpoint(arquivos, user_id=5))
+    lote = json.loads(resposta.body)
+    documentos = {d["filename"]: d for d in lote["documents"]}
+    print(f"Resultado: {[(nome, d['status_code'], d['transactions_count']) for nome, d in documentos.items()]}")
+    assert resposta.status_code == 200 and lote["documents_count"] == 4 and lote["documents_failed"] == 1
+    assert documentos["quebrado.pdf"]["status_code"] == 400
+    assert documentos["extratos.zip/fevereiro.pdf"]["transactions_count"] == 10
+    print("✅ Passou\n")
+
+    # Teste 2: Categorizações do usuário buscadas uma vez e aplicadas em todos os documentos
+    print("Teste 2: Categorizações compartilhadas")
+    print(f"Resultado: {len(BUSCAS)} busca(s)")
+    assert BUSCAS == [5]
+    assert all(t["categoria"] == "MERCADO" for t in lote["transactions"] if t["descricao"] == "LOJA JANEIRO")
+    print("✅ Passou\n")
+
+    # Teste 3: Transações deduplicadas entre documentos e período total
+    print("Teste 3: Consolidação")
+    print(f"Resultado: {lote['transactions_count']} transações, {lote['duplicates_removed']} repetidas, "
+          f"{lote['start_month']}..{lote['end_month']}")
+    assert lote["transactions_count"] == 10 + 7 + 7 and lote["duplicates_removed"] == 3
+    assert lote["start_month"] == "2025-01" and lote["end_month"] == "2025-03"
+    assert {t["filename"] for t in lote["transactions"]} == {"janeiro.pdf", "extratos.zip/fevereiro.pdf", "extratos.zip/marco.pdf"}
+    print("✅ Passou\n")
+
+    # Teste 4: Limites do lote
+    print("Teste 4: Limites")
+    for documentos_lote, erro in (([], "Nenhum PDF"), ([("a.pdf", janeiro)] * (api_rapida.LOTE_MAX_DOCUMENTOS + 1), "máximo")):
+        try:
+            asyncio.run(api_rapida.processar_lote(documentos_lote, 5))
+            assert False, "Lote inválido deveria ser recusado"
+        except api_rapida.HTTPException as e:
+            assert e.status_code == 400 and erro in e.detail
+    try:
+        api_rapida.expandir_zip("ruim.zip", b"PK\x03\x04lixo")
+        assert False, "Zip inválido deveria ser recusado"
+    except api_rapida.HTTPException as e:
+        print(f"Resultado: {e.detail}")
+        assert e.status_code == 400
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
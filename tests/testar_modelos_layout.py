@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para a identificação de layout e o registro de modelos,
+com o modelo "parser" registrado aplicado a um PDF no layout dele
+(sem a LLM, e com a LLM só na auditoria do acerto).
+"""
+import sys
+import os
+import re
+import json
+import asyncio
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+import fitz
+from apoio import CHAMADAS, RespostaFalsa, resposta_categorias, buscar_categorizacoes_falsa, processar_e_aguardar
+import api_rapida
+import modelos_layout
+from modelos_layout import RegistroModelos, impressao_digital, registro_modelos
+from reconstrucao_tabelas import resultado_deterministico, estruturar_linha
+
+def palavras_linha(top: float, *colunas: tuple[float, str]) -> list[dict]:
+    return [{"x0": x, "x1": x + 6 * len(texto), "top": top, "bottom": top + 8, "text": texto} for x, texto in colunas]
+
+LANCAMENTOS_ITAU = [("05/01", "LOJA ALFA", "58,90"), ("06/01", "LOJA BETA", "12,00"), ("07/01", "LOJA GAMA", "230,45"),
+                    ("09/01", "LOJA DELTA", "7,50")]
+
+def pdf_layout_itau(colunas: dict) -> bytes:
+    """
+    Fatura no layout do modelo itau_fatura_colunas: data começando em colunas["data"] e
+    valor alinhado à direita em colunas["valor"] (frações da largura da página).
+    """
+    doc = fitz.open()
+    pagina = doc.new_page()
+    largura = pagina.rect.width
+    pagina.insert_text((50, 50), "Itau Unibanco S.A. - Fatura do cartao Itaucard", fontsize=11)
+    for i, (data, descricao, valor) in enumerate(LANCAMENTOS_ITAU):
+        topo = 90 + i * 16
+        pagina.insert_text((colunas["data"] * largura, topo), data, fontsize=9)
+        pagina.insert_text((colunas["data"] * largura + 60, topo), descricao, fontsize=9)
+        pagina.insert_text((colunas["valor"] * largura - fitz.get_text_length(valor, fontsize=9), topo), valor, fontsize=9)
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def gemini_itau(sem_ultima: bool = False):
+    """
+    LLM falsa que lê os lançamentos do texto bruto; com 'sem_ultima', esquece o último (auditoria divergente).
+    """
+    def gerar(model=None, contents=None, **kwargs):
+        CHAMADAS.append(contents)
+        categorias = resposta_categorias(contents)
+        if categorias is not None:
+            return categorias
+        lancamentos = re.findall(r"(\d{2})/(\d{2})\s+(LOJA \w+)\s+([\d,]+)", contents)
+        return RespostaFalsa(json.dumps({"success": True, "bank_name": "Itaú Unibanco", "document_type": "credit-card-statement",
+                                         "transactions": [{"data": f"2025-{mes}-{dia}", "descricao": loja, "valor": float(valor.replace(",", ".")),
+                                                           "tipo": "despesa", "parcelado": False, "pagina": 1}
+                                                          for dia, mes, loja, valor in lancamentos[:-1 if sem_ultima else None]]}))
+    return gerar
+
+def testar_casos():
+    """
+    Testa a identificação dos emissores registrados, a pontuação por fontes e
+    colunas, o modelo do tipo parser e os contadores.
+    """
+    print("🧪 TESTANDO MODELOS DE LAYOUT\n")
+
+    # Teste 1: Emissores registrados em modelos_layout.json
+    print("Teste 1: Identificação pelo texto da primeira página")
+    casos = [
+        ("Nu Pagamentos S.A. - Fatura do cartão", "nubank_fatura"),
+        ("NU PAGAMENTOS S.A. Extrato de conta corrente", "nubank_extrato"),
+        ("Itaú Unibanco - Fatura", "itau_fatura"),
+        ("Banco Bradesco S.A. Extrato mensal", "bradesco_extrato"),
+        ("BANCO INTER S.A. FATURA", "inter_fatura"),
+        ("Banco BTG Pactual - Fatura do cartão", "btg_fatura"),
+        ("Fatura do cartão - Banco Exemplo", None),
+        ("Nu Pagamentos S.A.", None),  # sem tipo de documento identificável
+    ]
+    for texto, esperado in casos:
+        modelo = registro_modelos.identificar(impressao_digital(texto))
+        nome = modelo["nome"] if modelo else None
+        print(f"   {texto} -> {nome}")
+        assert nome == esperado, texto
+    print("✅ Passou\n")
+
+    # Teste 2: Fontes e posição das colunas desempatam layouts do mesmo banco
+    print("Teste 2: Fontes e colunas")
+    registro = RegistroModelos([
+        {"nome": "exemplo_antigo", "banco": "Exemplo", "document_type": "credit-card-statement", "tipo": "prompt",
+         "marcadores": ["banco exemplo"], "colunas": {"data": 0.08, "valor": 0.9}},
+        {"nome": "exemplo_novo", "banco": "Exemplo", "document_type": "credit-card-statement", "tipo": "parser",
+         "marcadores": ["banco exemplo"], "fontes": ["Roboto"], "colunas": {"data": 0.1, "valor": 0.68}},
+    ])
+    palavras = palavras_linha(100, (60, "05/01"), (120, "IFOOD"), (380, "58,90"))
+    impressao = impressao_digital("FATURA - BANCO EXEMPLO", palavras, 600, ["ABCDEF+Roboto-Regular"])
+    print(f"Resultado: {impressao['colunas']}, {impressao['fontes']}")
+    assert impressao["colunas"] == {"data": 0.1, "valor": 0.68}
+    assert registro.identificar(impressao)["nome"] == "exemplo_novo"
+    assert registro.identificar(impressao_digital("FATURA - BANCO EXEMPLO"))["nome"] == "exemplo_antigo"
+    print("✅ Passou\n")
+
+    # Teste 3: Modelo do tipo parser define banco e tipo no resultado determinístico
+    print("Teste 3: Parser do modelo")
+    linhas = [estruturar_linha(palavras_linha(100 + i * 12, (60, data), (120, descricao), (380, valor)))
+              for i, (data, descricao, valor) in enumerate([("05/01", "IFOOD", "58,90"), ("06/01", "UBER", "12,00"),
+                                                             ("07/01", "PAGAMENTO", "-100,00")])]
+    resultado = resultado_deterministico(linhas, "", 1, document_type="credit-card-statement", bank_name="Exemplo")
+    assert resultado["bank_name"] == "Exemplo" and resultado["document_type"] == "credit-card-statement"
+    assert [t["tipo"] for t in resultado["transactions"]] == ["despesa", "despesa", "receita"]
+    assert resultado_deterministico(linhas, "", 1) is None, "Sem modelo, o tipo precisa estar no texto"
+    print("✅ Passou\n")
+
+    # Teste 4: Contadores de uso e acerto
+    print("Teste 4: Contadores")
+    modelo = registro.modelos[1]
+    registro.registrar_paginas(modelo, parser=3, llm=1)
+    registro.registrar_resultado(modelo, {"bank_name": "Banco Exemplo S.A.", "document_type": "credit-card-statement"})
+    registro.registrar_resultado(modelo, {"bank_name": "Outro Banco", "document_type": "credit-card-statement"})
+    registro.registrar_resultado(modelo, {"bank_name": "Exemplo", "document_type": "bank-statement"})
+    registro.registrar_resultado(modelo, {"bank_name": "TBD", "document_type": "unknown"})
+    transacoes = [{"valor": 10.0, "pagina": 1}, {"valor": 5.5, "pagina": 1}, {"valor": 1.0, "pagina": 2}]
+    parser = [{"transactions": transacoes[:2]}, {"transactions": transacoes[2:]}]
+    assert registro.registrar_auditoria(modelo, parser, [{**t, "valor": -t["valor"]} for t in transacoes]) == 0
+    assert registro.registrar_auditoria(modelo, parser, transacoes[:1] + transacoes[2:]) == 1
+    metricas = registro.metricas()
+    print(f"Resultado: {metricas}")
+    contadores = metricas["modelos"]["exemplo_novo"]
+    assert metricas["documentos"] == 2 and contadores["documentos"] == 1
+    assert contadores["paginas_parser"] == 3 and contadores["paginas_llm"] == 1
+    assert contadores["confirmacoes"] == 1 and contadores["divergencias"] == 2, "banco ou tipo diferente diverge"
+    assert contadores["paginas_auditadas"] == 4 and contadores["taxa_acerto_parser"] == 0.75
+    print("✅ Passou\n")
+
+    # Teste 5: Tipo de modelo inválido
+    print("Teste 5: Validação do registro")
+    try:
+        RegistroModelos([{"nome": "x", "banco": "X", "document_type": "bank-statement", "tipo": "regex", "marcadores": []}])
+        assert False, "Deveria rejeitar o tipo"
+    except ValueError as e:
+        print(f"Resultado: {e}")
+    try:
+        RegistroModelos([{"nome": "x", "banco": "X", "document_type": "bank-statement", "tipo": "parser", "marcadores": ["x"]}])
+        assert False, "Deveria exigir as colunas no modelo parser"
+    except ValueError as e:
+        print(f"Resultado: {e}")
+    print("✅ Passou\n")
+
+    # Teste 6: Modelo parser registrado: o PDF no layout dele sai do parser, sem a LLM; layout mudado vai para o modelo prompt
+    print("Teste 6: Modelo parser registrado")
+    api_rapida.gemini_client.models.generate_content = gemini_itau()
+    api_rapida.buscar_categorizacoes_usuario = buscar_categorizacoes_falsa
+    api_rapida.LIVRO_TRANSACOES = False
+    colunas = next(m for m in registro_modelos.modelos if m["nome"] == "itau_fatura_colunas")["colunas"]
+    modelos_layout.MODELOS_LAYOUT_AUDITORIA = 0
+    CHAMADAS.clear()
+    resultado = asyncio.run(processar_e_aguardar(pdf_layout_itau(colunas), 1))
+    contadores = registro_modelos.metricas()["modelos"]["itau_fatura_colunas"]
+    print(f"Resultado: {resultado['bank_name']}, {len(resultado['transactions'])} transações, {contadores}")
+    assert resultado["bank_name"] == "Itaú" and resultado["document_type"] == "credit-card-statement"
+    assert [t["valor"] for t in resultado["transactions"]] == [58.9, 12.0, 230.45, 7.5]
+    assert not [c for c in CHAMADAS if "DESCRIÇÕES PARA CATEGORIZAR" not in c], "a extração não passa pela LLM"
+    assert contadores["documentos"] == 1 and contadores["paginas_parser"] == 1 and contadores["paginas_llm"] == 0
+    impressao = impressao_digital("Itau Unibanco - Fatura", palavras_linha(100, (200, "05/01"), (300, "LOJA"), (500, "58,90")), 600)
+    assert registro_modelos.identificar(impressao)["nome"] == "itau_fatura"
+    print("✅ Passou\n")
+
+    # Teste 7: Auditoria do parser pela LLM, fora do resultado
+    print("Teste 7: Auditoria do acerto do parser")
+    modelos_layout.MODELOS_LAYOUT_AUDITORIA = 1
+    try:
+        resultado = asyncio.run(processar_e_aguardar(pdf_layout_itau(colunas), 1))
+        api_rapida.gemini_client.models.generate_content = gemini_itau(sem_ultima=True)
+        asyncio.run(processar_e_aguardar(pdf_layout_itau(colunas), 1))
+    finally:
+        modelos_layout.MODELOS_LAYOUT_AUDITORIA = 0
+    contadores = registro_modelos.metricas()["modelos"]["itau_fatura_colunas"]
+    print(f"Resultado: {contadores}")
+    assert len(resultado["transactions"]) == 4, "as transações da auditoria não entram no resultado"
+    assert contadores["paginas_auditadas"] == 2 and contadores["auditorias_divergentes"] == 1
+    assert contadores["confirmacoes"] == 2 and contadores["taxa_acerto_parser"] == 0.5
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
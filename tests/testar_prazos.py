@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Teste do prazo por requisição: marcos por etapa, cancelamento das páginas
+atrasadas, resposta parcial e continuação pelo token (só do mesmo usuário),
+vaga do Gemini ocupada até a thread terminar e páginas nativas já extraídas
+aproveitadas quando o prazo acaba.
+"""
+import sys
+import os
+import re
+import json
+import time
+import asyncio
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import resposta_categorias, resposta_extracao, criar_pdf_teste
+import api_rapida
+from prazos import Prazo, criar_prazo, prazo_atual, aguardar_no_prazo
+from continuacoes import ArmazemContinuacoes
+
+PAGINAS_LENTAS = set()
+
+def gemini_falso(model=None, contents=None, **kwargs):
+    """
+    Uma transação por página; as páginas de PAGINAS_LENTAS demoram 3 segundos.
+    """
+    categorias = resposta_categorias(contents)
+    if categorias is not None:
+        return categorias
+    paginas = [int(n) for n in re.findall(r"=== PÁGINA (\d+) ===", contents)]
+    if not paginas:
+        paginas = [int(re.search(r"LOJA PAGINA (\d+)", contents).group(1))]
+    if PAGINAS_LENTAS & set(paginas):
+        time.sleep(3)
+    transacoes = [{"data": f"2025-0{p}-05", "descricao": f"LOJA PAGINA {p}", "valor": 10.0 * p, "tipo": "despesa",
+                   "parcelado": False, "pagina": p} for p in paginas]
+    return resposta_extracao(transacoes)
+
+CONFIGS = []
+
+def gemini_demorado(model=None, contents=None, config=None, **kwargs):
+    CONFIGS.append(config)
+    time.sleep(0.5)
+    return resposta_extracao([])
+
+async def vaga_apos_timeout() -> tuple[int, int]:
+    """
+    Chama o Gemini com prazo menor que a chamada; retorna as vagas ocupadas logo depois do timeout e depois da thread.
+    """
+    prazo_atual.set(Prazo(200))
+    try:
+        await api_rapida.chamar_gemini("página demorada")
+        assert False, "o prazo deveria ter acabado"
+    except TimeoutError:
+        pass
+    logo_apos = api_rapida.escalonador_gemini.metricas()["em_execucao"]
+    await asyncio.sleep(0.6)
+    return logo_apos, api_rapida.escalonador_gemini.metricas()["em_execucao"]
+
+async def nativo_pela_metade(doc, indices=None, ao_extrair=None):
+    doc.texto(indices[0])
+    await asyncio.sleep(5)
+
+async def extrair_no_prazo(pdf_bytes: bytes) -> tuple[dict, set]:
+    prazo = Prazo(300)
+    prazo_atual.set(prazo)
+    doc = api_rapida.abrir_documento(pdf_bytes, None)
+    try:
+        textos = await api_rapida.extrair_paginas_documento(doc, {0: "nativo", 1: "nativo"})
+    finally:
+        doc.close()
+    return textos, prazo.paginas_pendentes
+
+def pdf_paginas(paginas: int) -> bytes:
+    return criar_pdf_teste([[f"{i + 1:02d}/0{p} LOJA PAGINA {p} R$ {i + 10},90" for i in range(12)]
+                            for p in range(1, paginas + 1)])
+
+def testar_casos():
+    """
+    Testa os marcos do prazo, a espera com cancelamento, o armazém de
+    continuações e o fluxo completo resposta parcial -> continuação.
+    """
+    print("🧪 TESTANDO PRAZOS E CONTINUAÇÕES\n")
+
+    # Teste 1: Marcos acumulados por etapa
+    print("Teste 1: Marcos do prazo")
+    prazo = Prazo(10000)
+    restantes = [round(prazo.restante(etapa), 1) for etapa in ("extracao", "ocr", "llm")] + [round(prazo.restante(), 1)]
+    print(f"Resultado: {restantes}")
+    assert restantes[0] < restantes[1] < restantes[2] < restantes[3] <= 10.0
+    assert criar_prazo(None) is None and criar_prazo(0) is None and criar_prazo(500).timeout_ms == 500
+    print("✅ Passou\n")
+
+    # Teste 2: Tarefas que passam do marco são canceladas
+    print("Teste 2: Espera no prazo")
+    async def esperar():
+        prazo_atual.set(Prazo(300))
+        tarefas = [asyncio.create_task(asyncio.sleep(t, result=t)) for t in (0.01, 5, 0.02)]
+        return await aguardar_no_prazo(tarefas, "llm")
+    inicio = time.time()
+    concluidas, pendentes = asyncio.run(esperar())
+    print(f"Resultado: {[t.result() for t in concluidas]} concluídas, {len(pendentes)} cancelada em {time.time() - inicio:.2f}s")
+    assert [t.result() for t in concluidas] == [0.01, 0.02] and len(pendentes) == 1 and pendentes[0].cancelled()
+    assert time.time() - inicio < 1
+    print("✅ Passou\n")
+
+    # Teste 3: Armazém de continuações (validade e limite)
+    print("Teste 3: Armazém de continuações")
+    armazem = ArmazemContinuacoes(ttl_s=60, max_documentos=2)
+    tokens = [armazem.salvar(b"%PDF", None, 1, None, [3, 2], {"transactions": []}) for _ in range(3)]
+    assert armazem.obter(tokens[0]) is None, "o mais antigo sai quando passa do limite"
+    assert armazem.obter(tokens[2])["paginas"] == [2, 3]
+    armazem.concluir(tokens[2])
+    expirado = ArmazemContinuacoes(ttl_s=0)
+    assert expirado.obter(expirado.salvar(b"%PDF", None, 1, None, [1], {})) is None
+    print(f"Resultado: {armazem.metricas()}")
+    assert armazem.metricas() == {"pendentes": 1, "criados": 3, "concluidos": 1, "expirados": 1}
+    print("✅ Passou\n")
+
+    # Teste 4: Resposta parcial com páginas faltantes e token
+    print("Teste 4: Resposta parcial")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.EMPACOTAMENTO = False
+    api_rapida.CATEGORIZACAO_SEPARADA = True
+    PAGINAS_LENTAS.update({3, 4})
+    pdf_bytes = pdf_paginas(4)
+    inicio = time.time()
+    resposta = asyncio.run(api_rapida._processar_bytes_sync(pdf_bytes, None, None, "duas_etapas", Prazo(1500)))
+    decorrido = time.time() - inicio
+    parcial = json.loads(resposta.body)
+    print(f"Resultado: {parcial['transactions_count']} transações, faltam {parcial.get('missing_pages')} ({decorrido:.2f}s)")
+    assert resposta.status_code == 200 and parcial["partial"] and parcial["missing_pages"] == [3, 4]
+    assert sorted(t["pagina"] for t in parcial["transactions"]) == [1, 2] and parcial["continuation_token"]
+    print("✅ Passou\n")
+
+    # Teste 5: Continuação processa só as páginas faltantes e consolida
+    print("Teste 5: Continuação")
+    PAGINAS_LENTAS.clear()
+    try:
+        asyncio.run(api_rapida.continuar_processamento(parcial["continuation_token"], 99))
+        assert False, "Token de outro usuário deveria ser rejeitado"
+    except api_rapida.HTTPException as e:
+        assert e.status_code == 404
+    completo = asyncio.run(api_rapida.continuar_processamento(parcial["continuation_token"], None))
+    print(f"Resultado: {completo['transactions_count']} transações, {completo['start_month']}..{completo['end_month']}")
+    assert sorted(t["pagina"] for t in completo["transactions"]) == [1, 2, 3, 4]
+    assert "missing_pages" not in completo and completo["start_month"] == "2025-01" and completo["end_month"] == "2025-04"
+    try:
+        asyncio.run(api_rapida.continuar_processamento(parcial["continuation_token"], None))
+        assert False, "Token já concluído deveria ser rejeitado"
+    except api_rapida.HTTPException as e:
+        assert e.status_code == 404
+    print("✅ Passou\n")
+
+    # Teste 6: A vaga do Gemini só volta quando a thread termina; o prazo vai como timeout HTTP
+    print("Teste 6: Vaga do Gemini após o timeout")
+    api_rapida.gemini_client.models.generate_content = gemini_demorado
+    logo_apos, depois = asyncio.run(vaga_apos_timeout())
+    print(f"Resultado: vagas ocupadas {logo_apos} -> {depois}; config {CONFIGS[-1]}")
+    assert logo_apos == 1 and depois == 0
+    assert 0 < CONFIGS[-1]["http_options"]["timeout"] <= 200
+    print("✅ Passou\n")
+
+    # Teste 7: Prazo da extração nativa: as páginas já extraídas seguem, só as demais ficam pendentes
+    print("Teste 7: Extração nativa interrompida pelo prazo")
+    extrair_nativo = api_rapida.extrair_texto_nativo_por_paginas
+    api_rapida.extrair_texto_nativo_por_paginas = nativo_pela_metade
+    try:
+        textos, pendentes = asyncio.run(extrair_no_prazo(pdf_paginas(2)))
+    finally:
+        api_rapida.extrair_texto_nativo_por_paginas = extrair_nativo
+    print(f"Resultado: páginas extraídas {sorted(textos)}, pendentes {pendentes}")
+    assert sorted(textos) == [0] and "LOJA PAGINA 1" in textos[0] and pendentes == {2}
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para o pré-filtro de linhas candidatas a transação.
+"""
+import sys
+import os
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preprocessamento import prefiltrar_pagina, prefiltrar_transacoes, REGEX_DATA_BR, REGEX_VALOR_BR
+
+PAGINA_FATURA = """BANCO EXEMPLO S.A.
+Fatura do cartão de crédito
+Período: 01/01/2025 a 31/01/2025
+Aproveite: seguro celular com 20% de desconto no primeiro ano.
+Consulte condições em nosso site.
+Programa de pontos: acumule 1 ponto a cada real gasto.
+05/01 UBER *TRIP R$ 12,90
+06 JAN IFOOD *RESTAURANTE 33,10
+Parcela 02/10
+07/01/2025 LOJA X -1.234,56
+Encargos e informações legais sobre o rotativo.
+Central de atendimento 24h."""
+
+PAGINA_AGRUPADA = """BANCO EXEMPLO S.A.
+05 JAN
+UBER *TRIP 12,90
+IFOOD *RESTAURANTE 33,10
+06 JAN
+PADARIA 8,50"""
+
+def testar_casos():
+    """
+    Testa os padrões de data/valor, a janela de contexto e a salvaguarda de recall.
+    """
+    print("🧪 TESTANDO PRÉ-FILTRO DE TRANSAÇÕES\n")
+
+    # Teste 1: Formatos de data e valor brasileiros
+    print("Teste 1: Datas e valores")
+    for data in ("05/01", "5/1/25", "07/01/2025", "06 JAN", "6 de janeiro", "15-03"):
+        assert REGEX_DATA_BR.search(data), f"Data não reconhecida: {data}"
+    for valor in ("R$ 12,90", "33,10", "-1.234,56", "R$1234,00"):
+        assert REGEX_VALOR_BR.search(valor), f"Valor não reconhecido: {valor}"
+    assert not REGEX_DATA_BR.search("Janela 45/99"), "Data inválida reconhecida"
+    print("✅ Passou\n")
+
+    # Teste 2: Mantém transações, contexto e cabeçalho; omite o resto
+    print("Teste 2: Página de fatura")
+    texto, filtrado = prefiltrar_pagina(PAGINA_FATURA)
+    print(texto + "\n")
+    assert filtrado
+    for trecho in ("BANCO EXEMPLO", "UBER *TRIP", "IFOOD", "Parcela 02/10", "LOJA X"):
+        assert trecho in texto, f"'{trecho}' deveria ser mantido"
+    assert "Aproveite" not in texto and "Central de atendimento" not in texto
+    assert "[...]" in texto
+    print("✅ Passou\n")
+
+    # Teste 3: Salvaguarda — valores sem data na mesma linha mantêm a página inteira
+    print("Teste 3: Layout agrupado por dia volta para a página inteira")
+    texto, filtrado = prefiltrar_pagina(PAGINA_AGRUPADA)
+    assert not filtrado and texto == PAGINA_AGRUPADA
+    print("✅ Passou\n")
+
+    # Teste 4: Sem candidatas, a página segue inteira
+    print("Teste 4: Página sem transações")
+    texto, filtrado = prefiltrar_pagina("Informações gerais\nsem valores")
+    assert not filtrado
+    print("✅ Passou\n")
+
+    # Teste 5: Relatório de redução de tokens
+    print("Teste 5: Relatório")
+    _, relatorio = prefiltrar_transacoes({0: PAGINA_FATURA, 1: PAGINA_AGRUPADA})
+    print(f"Resultado: {relatorio}")
+    assert relatorio["paginas_filtradas"] == 1 and relatorio["paginas_inteiras"] == 1
+    assert relatorio["tokens_depois"] < relatorio["tokens_antes"]
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
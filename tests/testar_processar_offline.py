@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Teste do processamento offline: expansão das entradas, saída JSONL,
+retomada sem reprocessar o que já foi concluído e resumo de vazão.
+"""
+import sys
+import os
+import json
+import asyncio
+import tempfile
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import gemini_falso, criar_pdf_teste
+import api_rapida
+import processar_offline
+
+def salvar_pdf(caminho: str, mes: int):
+    with open(caminho, "wb") as arquivo:
+        arquivo.write(criar_pdf_teste([[f"{d:02d}/{mes:02d} LOJA MES{mes} R$ {d},90" for d in range(1, 9)]]))
+
+def ler_saida(caminho: str) -> list[dict]:
+    with open(caminho, encoding="utf-8") as f:
+        return [json.loads(linha) for linha in f]
+
+def testar_casos():
+    """
+    Testa a listagem dos PDFs, a primeira execução, a retomada e o resumo.
+    """
+    print("🧪 TESTANDO PROCESSAMENTO OFFLINE\n")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+
+    with tempfile.TemporaryDirectory() as pasta:
+        os.makedirs(os.path.join(pasta, "2025", "fev"))
+        salvar_pdf(os.path.join(pasta, "2025", "janeiro.pdf"), 1)
+        salvar_pdf(os.path.join(pasta, "2025", "fev", "fevereiro.pdf"), 2)
+        with open(os.path.join(pasta, "2025", "quebrado.pdf"), "wb") as f:
+            f.write(b"nao sou um pdf")
+        saida = os.path.join(pasta, "resultados.jsonl")
+
+        # Teste 1: Diretório, glob e arquivo repetido viram uma lista sem repetições
+        print("Teste 1: Entradas")
+        caminhos = processar_offline.listar_pdfs([os.path.join(pasta, "2025"), os.path.join(pasta, "**", "janeiro.pdf")])
+        print(f"Resultado: {[os.path.relpath(c, pasta) for c in caminhos]}")
+        assert len(caminhos) == 3
+        print("✅ Passou\n")
+
+        # Teste 2: Primeira execução grava uma linha por documento
+        print("Teste 2: Primeira execução")
+        resumo = asyncio.run(processar_offline.executar([pasta], saida, documentos_simultaneos=2))
+        linhas = ler_saida(saida)
+        print(f"Resultado: {resumo}")
+        assert resumo["processados"] == 2 and resumo["com_erro"] == 1 and resumo["pulados"] == 0
+        assert resumo["transacoes"] == 16 and resumo["paginas"] == 2 and resumo["chamadas_gemini"] >= 2
+        assert resumo["paginas_por_segundo"] > 0
+        assert sorted(l["status_code"] for l in linhas) == [200, 200, 400]
+        print("✅ Passou\n")
+
+        # Teste 3: Retomada pula os concluídos, tenta de novo os que falharam e reprocessa os alterados
+        print("Teste 3: Retomada")
+        with open(saida, "a", encoding="utf-8") as f:
+            f.write('{"arquivo": "interrompido')  # linha cortada por uma interrupção
+        salvar_pdf(os.path.join(pasta, "2025", "janeiro.pdf"), 3)
+        resumo = asyncio.run(processar_offline.executar([pasta], saida))
+        print(f"Resultado: {resumo}")
+        assert resumo["pulados"] == 1 and resumo["processados"] == 1 and resumo["com_erro"] == 1
+        with open(saida, encoding="utf-8") as f:
+            novas = f.read().splitlines()[4:]
+        assert sorted(json.loads(linha)["status_code"] for linha in novas) == [200, 400], "a linha cortada não se junta à próxima"
+        print("✅ Passou\n")
+
+        # Teste 4: Modo inválido é recusado antes de processar
+        print("Teste 4: Modo inválido")
+        try:
+            asyncio.run(processar_offline.executar([pasta], saida, modo_pipeline="xyz"))
+            assert False, "Modo inválido deveria ser recusado"
+        except api_rapida.HTTPException as e:
+            print(f"Resultado: {e.detail}")
+            assert e.status_code == 400
+        print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Teste unitário da codificação das páginas renderizadas: um formato só por
+página, escolhido pelo conteúdo (PNG para texto, JPEG para digitalização).
+"""
+import sys
+import os
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz
+from PIL import Image, ImageFilter
+import rasterizacao
+from rasterizacao import codificar_pixmap, fracao_meios_tons
+
+def pixmap_texto() -> "fitz.Pixmap":
+    doc = fitz.open()
+    pagina = doc.new_page()
+    for i in range(40):
+        pagina.insert_text((50, 60 + i * 18), f"{i + 1:02d}/01 IFOOD *RESTAURANTE EXEMPLO R$ {i + 10},90", fontsize=9)
+    return pagina.get_pixmap(matrix=fitz.Matrix(2, 2), colorspace=fitz.csGRAY)
+
+def pixmap_digitalizado(texto: "fitz.Pixmap") -> "fitz.Pixmap":
+    """
+    A mesma página com ruído e desfoque de scanner.
+    """
+    imagem = Image.frombytes("L", (texto.width, texto.height), texto.samples)
+    imagem = Image.blend(imagem, Image.effect_noise(imagem.size, 20), 0.15).filter(ImageFilter.GaussianBlur(0.8))
+    return fitz.Pixmap(fitz.csGRAY, texto.width, texto.height, imagem.tobytes(), False)
+
+def testar_casos():
+    """
+    Testa a escolha do formato para texto e para digitalização, com e sem WebP.
+    """
+    print("🧪 TESTANDO CODIFICAÇÃO DAS PÁGINAS RENDERIZADAS\n")
+    texto = pixmap_texto()
+    digitalizado = pixmap_digitalizado(texto)
+
+    # Teste 1: Texto renderizado vai em PNG
+    print("Teste 1: Página de texto")
+    mime_type, dados = codificar_pixmap(texto)
+    print(f"Resultado: {mime_type}, {len(dados) // 1024} KB")
+    assert mime_type == "image/png" and dados.startswith(b"\x89PNG")
+    print("✅ Passou\n")
+
+    # Teste 2: Digitalização (meios-tons) vai em JPEG, ou WebP com RASTER_WEBP
+    print("Teste 2: Página digitalizada")
+    mime_type, dados = codificar_pixmap(digitalizado)
+    rasterizacao.RASTER_WEBP = True
+    try:
+        mime_webp, dados_webp = codificar_pixmap(digitalizado)
+    finally:
+        rasterizacao.RASTER_WEBP = False
+    print(f"Resultado: {mime_type} {len(dados) // 1024} KB, {mime_webp} {len(dados_webp) // 1024} KB "
+          f"(meios-tons {fracao_meios_tons(Image.frombytes('L', (digitalizado.width, digitalizado.height), digitalizado.samples)):.2f})")
+    assert mime_type == "image/jpeg" and dados.startswith(b"\xff\xd8")
+    assert mime_webp == "image/webp" and dados_webp[8:12] == b"WEBP"
+    assert len(dados) < len(digitalizado.tobytes("png")), "o JPEG escolhido é menor que o PNG da digitalização"
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
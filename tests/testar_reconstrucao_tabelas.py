@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para a reconstrução de tabelas por coordenadas e o parser determinístico.
+"""
+import sys
+import os
+import fitz
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from documento_pdf import DocumentHandle
+from reconstrucao_tabelas import reconstruir_pagina, resultado_deterministico, dividir_colunas, CABECALHO_COMPACTO
+
+def gerar_pdf(cabecalho: str, colunas: list[list[tuple[str, str, str]]], rodape: list[str] = ()) -> bytes:
+    """
+    Gera uma página com os lançamentos em uma ou mais colunas lado a lado
+    (data, descrição e valor em posições x separadas, como nas faturas).
+    """
+    pdf = fitz.open()
+    pagina = pdf.new_page(width=595, height=842)
+    pagina.insert_text((50, 50), cabecalho, fontsize=10)
+    largura_coluna = 500 / len(colunas)
+    for c, lancamentos in enumerate(colunas):
+        x = 50 + c * largura_coluna
+        for l, (data, descricao, valor) in enumerate(lancamentos):
+            y = 100 + l * 14
+            pagina.insert_text((x, y), data, fontsize=8)
+            pagina.insert_text((x + 50, y), descricao, fontsize=8)
+            pagina.insert_text((x + largura_coluna - 70, y), valor, fontsize=8)
+    for l, texto in enumerate(rodape):
+        pagina.insert_text((50, 780 + l * 12), texto, fontsize=8)
+    dados = pdf.tobytes()
+    pdf.close()
+    return dados
+
+def reconstruir(pdf_bytes: bytes):
+    with DocumentHandle.abrir(pdf_bytes) as doc:
+        return reconstruir_pagina(doc.palavras(0), doc.plumber.pages[0].width)
+
+def testar_casos():
+    """
+    Testa colunas lado a lado, formato compacto e os critérios do parser determinístico.
+    """
+    print("🧪 TESTANDO RECONSTRUÇÃO DE TABELAS\n")
+
+    esquerda = [("05/01", "IFOOD RESTAURANTE", "R$ 58,90"), ("06/01", "POSTO IPIRANGA", "R$ 200,00"),
+                ("07/01", "LOJA X PARC 02/10", "R$ 99,90")]
+    direita = [("15/01", "DROGASIL 0456", "R$ 45,10"), ("16/01", "PAGAMENTO RECEBIDO", "-R$ 1.500,00"),
+               ("17/01", "SPOTIFY", "R$ 21,90")]
+
+    # Teste 1: Colunas lado a lado não se intercalam
+    print("Teste 1: Duas colunas de lançamentos")
+    texto, linhas = reconstruir(gerar_pdf("FATURA DO CARTAO - BANCO EXEMPLO", [esquerda, direita], ["Total da fatura R$ 1.000,00"]))
+    print(texto)
+    linhas_texto = texto.splitlines()
+    assert linhas_texto[0] == CABECALHO_COMPACTO
+    assert "05/01|IFOOD RESTAURANTE|58,90" in linhas_texto
+    assert "16/01|PAGAMENTO RECEBIDO|-1.500,00" in linhas_texto
+    assert linhas_texto.index("07/01|LOJA X PARC 02/10|99,90") < linhas_texto.index("15/01|DROGASIL 0456|45,10")
+    print("✅ Passou\n")
+
+    # Teste 2: As colunas data/descrição/valor de uma mesma tabela não são separadas
+    print("Teste 2: Tabela única")
+    with DocumentHandle.abrir(gerar_pdf("FATURA DO CARTAO", [esquerda + direita])) as doc:
+        blocos = dividir_colunas(doc.palavras(0), doc.plumber.pages[0].width)
+    assert len(blocos) == 1
+    print("✅ Passou\n")
+
+    # Teste 3: Parser determinístico de fatura
+    print("Teste 3: Parser determinístico (fatura)")
+    resultado = resultado_deterministico(linhas, texto, 1)
+    print(f"Resultado: {resultado['document_type']}, {len(resultado['transactions'])} transações")
+    assert resultado["document_type"] == "credit-card-statement"
+    assert len(resultado["transactions"]) == 6, "O total da fatura não é transação"
+    por_descricao = {t["descricao"]: t for t in resultado["transactions"]}
+    assert por_descricao["IFOOD RESTAURANTE"] == {"data": "2025-01-05", "descricao": "IFOOD RESTAURANTE", "valor": 58.9,
+                                                  "tipo": "despesa", "parcelado": False, "pagina": 1}
+    assert por_descricao["PAGAMENTO RECEBIDO"]["tipo"] == "receita"
+    assert por_descricao["LOJA X"]["numero_parcelas"] == 2 and por_descricao["LOJA X"]["total_parcelas"] == 10
+    print("✅ Passou\n")
+
+    # Teste 4: Páginas ambíguas ficam para a LLM
+    print("Teste 4: Casos ambíguos")
+    sem_data = esquerda + [("", "ANUIDADE", "R$ 12,00")]
+    texto, linhas = reconstruir(gerar_pdf("FATURA DO CARTAO", [sem_data]))
+    assert resultado_deterministico(linhas, texto, 1) is None, "Valor sem data"
+    texto, linhas = reconstruir(gerar_pdf("DOCUMENTO", [esquerda]))
+    assert resultado_deterministico(linhas, texto, 1) is None, "Tipo de documento desconhecido"
+    texto, linhas = reconstruir(gerar_pdf("EXTRATO CONTA CORRENTE", [esquerda]))
+    assert resultado_deterministico(linhas, texto, 1) is None, "Extrato sem sinais de crédito/débito"
+    print("✅ Passou\n")
+
+    # Teste 5: Extrato com sinais
+    print("Teste 5: Parser determinístico (extrato)")
+    extrato = [("02/01/2025", "PIX RECEBIDO FULANO", "1.200,00 C"), ("03/01/2025", "PIX ENVIADO CICLANO", "-150,00"),
+               ("03/01/2025", "SALDO DO DIA", "1.050,00"), ("04/01/2025", "TARIFA PACOTE", "35,00 D")]
+    texto, linhas = reconstruir(gerar_pdf("EXTRATO CONTA CORRENTE", [extrato]))
+    resultado = resultado_deterministico(linhas, texto, 2)
+    tipos = [(t["descricao"], t["tipo"], t["valor"]) for t in resultado["transactions"]]
+    print(f"Resultado: {tipos}")
+    assert tipos == [("PIX RECEBIDO FULANO", "receita", 1200.0), ("PIX ENVIADO CICLANO", "despesa", 150.0),
+                     ("TARIFA PACOTE", "despesa", 35.0)]
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Teste unitário para o contrato de saída tabular (VERSAO_PROMPT = "v2").
+"""
+import sys
+import os
+
+# Adiciona o diretório pai ao path para importar o módulo
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from saida_tabular import interpretar_saida_tabular, interpretar_categorias_tabular, CODIGOS_SUBCATEGORIAS
+from prompt_e_schema import CATEGORIAS_CODIFICADAS, PROMPT_SISTEMA_TABULAR
+
+def esperar_erro(texto: str, com_categoria: bool, motivo: str):
+    try:
+        interpretar_saida_tabular(texto, com_categoria)
+    except ValueError as e:
+        print(f"   {motivo}: {e}")
+        return
+    raise AssertionError(f"Deveria rejeitar: {motivo}")
+
+def testar_casos():
+    """
+    Testa a expansão para o JSON v1, a tolerância a "|" na descrição e a rejeição de saídas malformadas.
+    """
+    print("🧪 TESTANDO SAÍDA TABULAR\n")
+
+    # Teste 1: Saída completa (com código de subcategoria) volta ao formato v1
+    print("Teste 1: Extração + categorização")
+    saida = """```
+BANCO|Nubank|C
+pag|data|descricao|valor|tipo|parcela|cat
+1|2025-01-05|IFOOD *RESTAURANTE|58.90|D||3.2
+2|2025-01-07|LOJAS RENNER|99.90|D|2/10|6.1
+2|2025-01-10|PAGAMENTO RECEBIDO|1500|R||9.5
+```"""
+    resultado = interpretar_saida_tabular(saida, com_categoria=True)
+    print(f"Resultado: {resultado['bank_name']}, {resultado['document_type']}, {len(resultado['transactions'])} transações")
+    assert resultado["success"] and resultado["bank_name"] == "Nubank"
+    assert resultado["document_type"] == "credit-card-statement"
+    assert resultado["transactions"][0] == {
+        "uuid": "1", "data": "2025-01-05", "descricao": "IFOOD *RESTAURANTE", "valor": 58.9, "tipo": "despesa",
+        "parcelado": False, "categoria": "ALIMENTACAO", "subcategoria": "Refeições em restaurante", "pagina": 1,
+    }
+    parcelada = resultado["transactions"][1]
+    assert parcelada["parcelado"] and parcelada["numero_parcelas"] == 2 and parcelada["total_parcelas"] == 10
+    assert parcelada["categoria"] == "CUIDADO_PESSOAL" and parcelada["pagina"] == 2
+    assert resultado["transactions"][2]["tipo"] == "receita" and resultado["transactions"][2]["valor"] == 1500.0
+    print("✅ Passou\n")
+
+    # Teste 2: Só extração, "|" na descrição e código desconhecido
+    print("Teste 2: Extração e casos tolerados")
+    resultado = interpretar_saida_tabular("BANCO|TBD|E\nPAG|DATA|DESCRICAO|VALOR|TIPO|PARCELA\n1|2025-02-01|PIX | FULANO|10.5|D|", False)
+    transacao = resultado["transactions"][0]
+    assert resultado["bank_name"] == "TBD" and resultado["document_type"] == "bank-statement"
+    assert transacao["descricao"] == "PIX | FULANO" and "categoria" not in transacao and "uuid" not in transacao
+    resultado = interpretar_saida_tabular("BANCO|X|U\npag|data|descricao|valor|tipo|parcela|cat\n1|2025-02-01|LOJA|10.00|D||99.9", True)
+    assert (resultado["transactions"][0]["categoria"], resultado["transactions"][0]["subcategoria"]) == ("DIVERSOS", "Outros")
+    resultado = interpretar_saida_tabular("BANCO|Inter|C\nNENHUMA", True)
+    assert not resultado["success"] and resultado["transactions"] == [] and resultado["error_message"]
+    print("✅ Passou\n")
+
+    # Teste 3: Saídas malformadas levantam ValueError (o pacote é dividido e reenviado)
+    print("Teste 3: Rejeição estrita")
+    esperar_erro('{"success": true, "transactions": []}', True, "JSON no lugar das linhas")
+    esperar_erro("BANCO|X|C\npag|data|descricao|valor|tipo\n1|2025-01-01|A|1.00|D", True, "cabeçalho errado")
+    esperar_erro("BANCO|X|C\npag|data|descricao|valor|tipo|parcela|cat\n1|2025-01-01|A|1.00|D", True, "campos faltando")
+    esperar_erro("BANCO|X|C\npag|data|descricao|valor|tipo|parcela|cat\n1|05/01/2025|A|1.00|D||3.2", True, "data fora do padrão")
+    esperar_erro("BANCO|X|C\npag|data|descricao|valor|tipo|parcela|cat\n1|2025-01-05|A|1.234,56|D||3.2", True, "valor com vírgula")
+    esperar_erro("BANCO|X|C\npag|data|descricao|valor|tipo|parcela|cat\n1|2025-01-05|A|1.00|X||3.2", True, "tipo inválido")
+    esperar_erro("BANCO|X|Z\nNENHUMA", True, "tipo de documento inválido")
+    print("✅ Passou\n")
+
+    # Teste 4: Categorias em lote
+    print("Teste 4: Categorias em lote (id|cat)")
+    categorias = interpretar_categorias_tabular("id|cat\n1|3.2\n2|[4.9]\n3|77.7")
+    print(f"Resultado: {categorias}")
+    assert categorias == {1: {"categoria": "ALIMENTACAO", "subcategoria": "Refeições em restaurante"},
+                          2: {"categoria": "TRANSPORTE", "subcategoria": "Uber"}}
+    try:
+        interpretar_categorias_tabular('{"categorias": []}')
+        assert False, "Deveria rejeitar JSON"
+    except ValueError:
+        pass
+    print("✅ Passou\n")
+
+    # Teste 5: Todos os códigos aparecem no prompt
+    print("Teste 5: Códigos no prompt")
+    for codigo, (_, subcategoria) in CODIGOS_SUBCATEGORIAS.items():
+        assert f"[{codigo}] {subcategoria}" in CATEGORIAS_CODIFICADAS, codigo
+    assert "pag|data|descricao|valor|tipo|parcela|cat" in PROMPT_SISTEMA_TABULAR
+    print(f"Resultado: {len(CODIGOS_SUBCATEGORIAS)} códigos")
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()
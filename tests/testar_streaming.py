@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Teste do processamento em streaming (eventos por página + resumo final),
+com o Gemini substituído por respostas fixas: página extraída avisada
+assim que fica pronta e documento/admissão liberados mesmo sem leitura.
+"""
+import sys
+import os
+import re
+import json
+import asyncio
+
+import fitz
+
+# Adiciona o diretório pai ao path para importar a API
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TOKENFILE_LIMIT", "100000")
+os.environ.setdefault("GOOGLE_API_KEY", "teste")
+
+from apoio import resposta_categorias, resposta_extracao, criar_pdf_teste
+import api_rapida
+
+def gemini_falso(model=None, contents=None, **kwargs):
+    """
+    Devolve uma transação por página pedida (extração) ou a mesma categoria para todo o lote.
+    """
+    categorias = resposta_categorias(contents)
+    if categorias is not None:
+        return categorias
+    paginas = [int(n) for n in re.findall(r"=== PÁGINA (\d+) ===", contents)] or [1]
+    transacoes = [{"data": "2025-01-05", "descricao": "IFOOD *RESTAURANTE", "valor": 10.0, "tipo": "despesa",
+                   "parcelado": False, "pagina": p} for p in paginas]
+    return resposta_extracao(transacoes)
+
+def pdf_restaurante(paginas: int, com_texto: bool = True) -> bytes:
+    linhas = [f"{i + 1:02d}/01 IFOOD *RESTAURANTE R$ {i + 10},90" for i in range(20)] if com_texto else []
+    return criar_pdf_teste([linhas] * paginas)
+
+async def coletar(pdf_bytes: bytes, formato: str = "ndjson") -> tuple[object, list[str]]:
+    resposta = await api_rapida._processar_bytes_stream(pdf_bytes, None, None, "duas_etapas", formato)
+    if not hasattr(resposta, "body_iterator"):
+        return resposta, []
+    return resposta, [parte async for parte in resposta.body_iterator]
+
+async def ocr_esperando_nativa(doc, paginas: list[dict]) -> list[dict]:
+    """
+    OCR que só termina depois que o consumidor recebeu a página nativa (ou em 2 s, se ela só vier depois do OCR).
+    """
+    try:
+        await asyncio.wait_for(NATIVA_EMITIDA[0].wait(), 2)
+        ORDEM.append("nativa antes do OCR")
+    except TimeoutError:
+        ORDEM.append("OCR antes da nativa")
+    linhas = "\n".join(f"{i + 1:02d}/02 IFOOD *RESTAURANTE R$ {i + 10},90" for i in range(20))
+    return [{"pagina": p["pagina"], "sucesso": True, "texto": linhas} for p in paginas]
+
+NATIVA_EMITIDA = []
+ORDEM = []
+
+async def coletar_avisando(pdf_bytes: bytes) -> list[dict]:
+    NATIVA_EMITIDA[:] = [asyncio.Event()]
+    resposta = await api_rapida._processar_bytes_stream(pdf_bytes, None, None, "duas_etapas")
+    eventos = []
+    async for linha in resposta.body_iterator:
+        eventos.append(json.loads(linha))
+        if eventos[-1]["evento"] == "pagina_extraida" and eventos[-1]["pagina"] == 1:
+            NATIVA_EMITIDA[0].set()
+    return eventos
+
+async def cliente_desconectado(pdf_bytes: bytes) -> int:
+    """
+    Envia a resposta para um cliente que já desconectou: o corpo nunca é lido. Retorna as admissões ativas depois.
+    """
+    resposta = await api_rapida._processar_bytes_stream(pdf_bytes, None, None, "duas_etapas")
+    async def enviar(mensagem):
+        raise OSError("cliente desconectou")
+    async def receber():
+        return {"type": "http.disconnect"}
+    try:
+        await resposta({"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}}, receber, enviar)
+    except Exception:
+        pass
+    return api_rapida.controle_admissao.metricas()["ativas"]
+
+def pdf_nativa_e_digitalizada() -> bytes:
+    doc = fitz.open(stream=pdf_restaurante(1), filetype="pdf")
+    imagem = doc[0].get_pixmap(matrix=fitz.Matrix(1, 1))
+    pagina = doc.new_page()
+    pagina.insert_image(pagina.rect, stream=imagem.tobytes("png"))
+    pdf_bytes = doc.tobytes()
+    doc.close()
+    return pdf_bytes
+
+def testar_casos():
+    """
+    Testa a ordem dos eventos, o resumo consolidado, o formato SSE e os erros de entrada.
+    """
+    print("🧪 TESTANDO STREAMING\n")
+    api_rapida.gemini_client.models.generate_content = gemini_falso
+    api_rapida.CATEGORIZACAO_SEPARADA = True
+    pdf_bytes = pdf_restaurante(3)
+
+    # Teste 1: NDJSON com início, páginas extraídas, páginas categorizadas e resumo
+    print("Teste 1: Eventos em NDJSON")
+    resposta, linhas = asyncio.run(coletar(pdf_bytes))
+    eventos = [json.loads(linha) for linha in linhas]
+    tipos = [e["evento"] for e in eventos]
+    print(f"Resultado: {tipos}")
+    assert resposta.media_type == "application/x-ndjson"
+    assert all(linha.endswith("\n") for linha in linhas)
+    assert tipos[0] == "inicio" and eventos[0]["paginas"] == 3
+    assert tipos[-1] == "resumo" and tipos.count("pagina_extraida") == 3 and tipos.count("pagina_categorizada") == 3
+    assert tipos.index("pagina_extraida") < tipos.index("pagina_categorizada")
+    paginas = [e for e in eventos if e["evento"] == "pagina_categorizada"]
+    assert sorted(e["pagina"] for e in paginas) == [1, 2, 3]
+    assert all(t["categoria"] == "ALIMENTACAO" for e in paginas for t in e["transactions"])
+    print("✅ Passou\n")
+
+    # Teste 2: O resumo é o resultado consolidado (deduplicado, com banco e meses)
+    print("Teste 2: Resumo final")
+    resumo = eventos[-1]
+    print(f"Resultado: {resumo['bank_name']}, {resumo['start_month']}..{resumo['end_month']}, {resumo['transactions_count']} transações")
+    assert resumo["success"] and resumo["bank_name"] == "Exemplo"
+    assert resumo["start_month"] == resumo["end_month"] == "2025-01"
+    assert resumo["transactions_count"] == len(resumo["transactions"]) == 1, "as 3 páginas repetem a mesma transação"
+    print("✅ Passou\n")
+
+    # Teste 3: SSE
+    print("Teste 3: Server-Sent Events")
+    resposta, mensagens = asyncio.run(coletar(pdf_bytes, "sse"))
+    assert resposta.media_type == "text/event-stream"
+    assert mensagens[0].startswith("event: inicio\ndata: {") and mensagens[0].endswith("\n\n")
+    assert mensagens[-1].startswith("event: resumo\n")
+    print(f"Resultado: {len(mensagens)} mensagens")
+    print("✅ Passou\n")
+
+    # Teste 4: Erros de entrada voltam como JSON com o status HTTP
+    print("Teste 4: Erros antes do streaming")
+    resposta, _ = asyncio.run(coletar(pdf_bytes, "xml"))
+    assert resposta.status_code == 400
+    resposta, _ = asyncio.run(coletar(b"nao e pdf"))
+    assert resposta.status_code == 400
+    print("✅ Passou\n")
+
+    # Teste 5: Documento sem texto termina com o evento "erro" (o status HTTP já foi enviado)
+    print("Teste 5: Evento de erro")
+    resposta, linhas = asyncio.run(coletar(pdf_restaurante(1, com_texto=False)))
+    final = json.loads(linhas[-1])
+    print(f"Resultado: {final}")
+    assert resposta.status_code == 200 and final["evento"] == "erro" and final["status_code"] == 400
+    print("✅ Passou\n")
+
+    # Teste 6: A página nativa é avisada assim que fica pronta, sem esperar o OCR da digitalizada
+    print("Teste 6: Página extraída avisada por página")
+    ocr_pacote_renderizado = api_rapida.ocr_pacote_renderizado
+    api_rapida.ocr_pacote_renderizado = ocr_esperando_nativa
+    try:
+        eventos = asyncio.run(coletar_avisando(pdf_nativa_e_digitalizada()))
+    finally:
+        api_rapida.ocr_pacote_renderizado = ocr_pacote_renderizado
+    extraidas = [(e["pagina"], e["estrategia"]) for e in eventos if e["evento"] == "pagina_extraida"]
+    print(f"Resultado: {ORDEM}; páginas extraídas {extraidas}")
+    assert ORDEM == ["nativa antes do OCR"] and extraidas == [(1, "nativo"), (2, "ocr")]
+    print("✅ Passou\n")
+
+    # Teste 7: Cliente que desconecta antes de ler o corpo não prende a admissão
+    print("Teste 7: Liberação sem leitura do corpo")
+    ativas = asyncio.run(cliente_desconectado(pdf_bytes))
+    print(f"Resultado: {ativas} admissões ativas")
+    assert ativas == 0
+    print("✅ Passou\n")
+
+    print("🎉 TODOS OS TESTES PASSARAM!")
+
+if __name__ == "__main__":
+    testar_casos()